@@ -4,7 +4,7 @@ Central configuration management for the application
 """
 from pydantic_settings import BaseSettings
 from functools import lru_cache
-from typing import Optional
+from typing import Optional, Dict, List
 
 
 class Settings(BaseSettings):
@@ -61,7 +61,118 @@ class Settings(BaseSettings):
     max_tokens_story_bible: int = 400
     max_tokens_story_bible_update: int = 300
     max_tokens_import_story: int = 2000
-    
+
+    # Prefix-stable continuation prompts (Ollama /api/chat with KV-cache reuse)
+    prompt_prefix_stable_layout: bool = True
+    ollama_keep_alive: str = "30m"  # How long Ollama keeps the model and its KV cache loaded
+
+    # Ollama node pool (spread calls over several Ollama servers)
+    ollama_nodes: List[str] = []  # e.g. ["http://10.0.0.5:11434", "http://10.0.0.6:11434"]; empty uses OLLAMA_BASE_URL
+    ollama_node_models: Dict[str, List[str]] = {}  # Pin a node's models instead of discovering them via /api/tags
+    ollama_sticky_routing: bool = True  # Keep a story on one node so its KV cache is reused
+    ollama_sticky_max_imbalance: int = 1  # Leave the sticky node once it has this many more requests in flight
+    ollama_health_check_seconds: float = 15.0  # 0 disables active health checks
+    ollama_node_eject_failures: int = 3  # Consecutive connection errors/5xx before a node is ejected
+    ollama_node_eject_seconds: float = 30.0
+
+    # Model lifecycle (preloading, keep-alive refresh, warm model switches)
+    model_preload_on_startup: bool = True  # Load the generation and embedding models at startup
+    model_keepalive_refresh_seconds: float = 600.0  # Re-send keep_alive well before it runs out; 0 disables
+    model_unload_previous_on_switch: bool = False  # Evict the old model after PATCH /settings/model
+
+    # Context packing (prompt context is fitted to each model's context window)
+    llm_default_context_window: int = 8192  # Context budget; sent to Ollama as num_ctx for prompts that need it
+    ollama_model_default_context: int = 2048  # Context Ollama loads a model with when no num_ctx is sent
+    ollama_always_send_num_ctx: bool = False  # Send num_ctx on every call instead of only when a prompt needs it
+    llm_context_windows: Dict[str, int] = {}  # Per-model overrides, e.g. {"qwen2.5": 32768}
+    context_tokenizer: str = "estimate"  # "estimate" (per-script calibrated) or "tiktoken"
+
+    # Streaming generation
+    stream_disconnect_poll_seconds: float = 1.0  # How often a streaming client is checked for disconnects
+    stream_partial_output_policy: str = "discard"  # "discard" or "save" output of abandoned streams
+    stream_resume_grace_seconds: float = 15.0  # How long an unwatched stream waits for a reconnect
+    draft_checkpoint_tokens: int = 64  # Checkpoint a streaming draft every N chunks...
+    draft_checkpoint_seconds: float = 2.0  # ...or every N seconds, whichever comes first
+    draft_heartbeat_seconds: float = 10.0  # Streaming drafts silent for 3 heartbeats are marked interrupted
+    stream_sse_protocol: str = "legacy"  # "legacy" (plain data: frames) or "events" (typed JSON events); ?protocol= overrides
+    sse_coalesce_window_ms: int = 40  # Tokens arriving within this window share one frame
+    sse_coalesce_max_bytes: int = 512  # Flush early once a frame reaches this size
+    sse_heartbeat_seconds: float = 15.0  # Comment frame sent when the stream is idle
+    branch_deadline_seconds: float = 120.0  # Branch generations still running after this are cancelled
+
+    # Throughput tracking and deadline-sized generations
+    throughput_ewma_alpha: float = 0.2  # Weight of the newest sample in the per-model averages
+    throughput_min_samples: int = 3  # Samples before measured speed replaces the defaults below
+    throughput_default_tokens_per_second: float = 9.0  # CPU Ollama with a 7B model
+    throughput_default_prompt_tokens_per_second: float = 60.0
+    deadline_safety_factor: float = 0.85  # Share of the remaining budget spent on output tokens
+    deadline_min_tokens: int = 64  # Never shrink num_predict below this
+
+    # Shared HTTP client pool (per-backend connection limits)
+    http_ollama_max_connections: int = 16
+    http_ollama_max_keepalive: int = 8
+    http_external_max_connections: int = 20
+    http_external_max_keepalive: int = 10
+    http_sd_max_connections: int = 4
+    http_keepalive_expiry: float = 60.0
+    http2_external_providers: bool = True  # Requires the optional 'h2' package
+
+    # Per-route HTTP timeouts (seconds)
+    timeout_ollama_generate: float = 600.0  # 10 minutes for large generations on CPU
+    timeout_ollama_embeddings: float = 120.0
+    timeout_ollama_import: float = 120.0
+    timeout_ollama_metadata: float = 10.0
+    timeout_ollama_load: float = 300.0  # Cold model load from disk
+    timeout_external_generate: float = 120.0
+    timeout_sd_generate: float = 300.0
+    timeout_sd_status: float = 5.0
+
+    # LLM request scheduler (priority classes: interactive, batch, background)
+    llm_max_concurrency_ollama: int = 2  # Per Ollama node
+    llm_max_concurrency_external: int = 8
+    llm_interactive_reserved_slots: int = 1  # Slots batch/background work may not take
+    llm_coalesce_identical_requests: bool = True  # Share one upstream call for identical in-flight requests
+
+    # Persistent response cache for low-temperature analytical calls
+    llm_cache_enabled: bool = True
+    llm_cache_path: str = "./llm_cache/responses.sqlite3"
+    llm_cache_ttl_seconds: int = 7 * 24 * 3600  # 1 week
+    llm_cache_max_entries: int = 5000
+    llm_cache_max_temperature: float = 0.4  # Higher temperatures are never cached
+
+    # Provider resilience (circuit breakers, fallback order, hedging)
+    provider_fallback_order: List[str] = ["ollama"]  # Tried in order after the user's provider fails or is open
+    circuit_window_seconds: float = 60.0  # Rolling window for the error rate
+    circuit_latency_window_seconds: float = 600.0  # Rolling window for latency percentiles
+    circuit_min_calls: int = 5  # Calls in the window before the breaker may open
+    circuit_error_threshold: float = 0.5  # Error rate that opens the breaker
+    circuit_open_seconds: float = 30.0  # Cool-off before a probe call is let through
+    hedge_to_ollama: bool = False  # Also ask local Ollama once an external call is slower than usual
+    hedge_percentile: float = 0.95  # "Slower than usual": this percentile of the provider's recent latency
+    hedge_min_samples: int = 20  # Latency samples needed before hedging starts
+
+    # Per-story generation context snapshots (characters, plotlines, bible, user AI settings)
+    story_context_cache_enabled: bool = True
+    story_context_ttl_seconds: float = 600.0  # Upper bound on staleness for writes that skip the version bump
+    story_context_max_stories: int = 500
+
+    # Generation history (batched write-behind of every generation)
+    generation_history_enabled: bool = True
+    generation_history_batch_size: int = 50  # Pending rows that trigger an early flush
+    generation_history_flush_seconds: float = 2.0  # Longest a row waits before it is written
+    generation_history_max_pending: int = 5000  # Oldest rows are dropped beyond this (database down)
+    generation_history_store_text: bool = True  # Keep prompt and output text, not just their sizes
+    analytics_admin_emails: List[str] = []  # Users whose generation analytics cover every user, not just themselves
+
+    # Chapter revision history (compressed full snapshots and reverse deltas)
+    revision_history_enabled: bool = True
+    revision_coalesce_seconds: float = 60.0  # Saves closer together than this share one revision
+    revision_snapshot_every: int = 200  # Longest run of deltas before a full snapshot (bounds restore work)
+    revision_compression_level: int = 6  # zlib level, 1 (fast) to 9 (small)
+    # [age, spacing] in seconds: revisions older than age are kept at most one per spacing
+    revision_thinning: List[List[float]] = [[3600, 600], [86400, 3600], [7 * 86400, 86400]]
+    revision_thin_interval_seconds: float = 600.0  # How often a chapter's history is thinned
+
     # Story Settings
     max_chapters_per_story: int = 100
     max_characters_per_story: int = 50
@@ -4,10 +4,20 @@ Async SQLAlchemy setup with PostgreSQL and pgvector support
 """
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import MetaData, text
+from sqlalchemy import MetaData, text, inspect
 from contextlib import asynccontextmanager
+from pathlib import Path
+import logging
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
+# Schema migrations (run from backend/: alembic upgrade head)
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+
 # Naming convention for constraints
 convention = {
     "ix": "ix_%(column_0_label)s",
@@ -71,8 +81,30 @@ async def get_async_session() -> AsyncSession:
 async def init_db():
     """Initialize database tables"""
     async with engine.begin() as conn:
+        fresh = not await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table("stories"))
         # Create all tables (skip pgvector extension - handled separately)
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_check_schema_version, fresh)
+
+
+def _check_schema_version(connection, fresh: bool) -> None:
+    """
+    A database create_all just built is at the latest migration and is
+    stamped so. An existing one only gets new tables from create_all, not
+    new columns or indexes; warn when its migrations are behind.
+    """
+    script = ScriptDirectory.from_config(Config(str(ALEMBIC_INI)))
+    head = script.get_current_head()
+    context = MigrationContext.configure(connection)
+    if fresh:
+        context.stamp(script, head)
+        return
+    current = context.get_current_revision()
+    if current != head:
+        logger.warning(
+            f"Database schema is at migration {current or 'none'}, latest is {head}; "
+            "run 'alembic upgrade head' in backend/"
+        )
 
 
 async def close_db():
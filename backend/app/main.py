@@ -2,7 +2,7 @@
 NarrativeFlow - Main FastAPI Application
 Interactive AI Story Co-Writing Platform
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
@@ -11,6 +11,21 @@ from pathlib import Path
 
 from app.config import settings
 from app.database import init_db, close_db
+from app.services.http_client import http_pool
+from app.services.llm_scheduler import llm_scheduler
+from app.services.request_coalescer import request_coalescer
+from app.services.response_cache import response_cache
+from app.services.gemini_service import get_prefix_cache_stats
+from app.services.structured_output import structured_output_stats
+from app.services.throughput_tracker import throughput_tracker
+from app.services.generation_drafts import draft_manager
+from app.services.model_lifecycle import model_lifecycle
+from app.services.ollama_pool import ollama_pool
+from app.services.circuit_breaker import provider_breakers
+from app.services.story_context import story_context_cache
+from app.services.revision_store import revision_store
+from app.services.story_service import story_languages
+from app.services.generation_history import generation_recorder, set_call_site
 import app.models  # ensure all models are registered before init_db creates tables
 from app.routes import (
     auth,
@@ -26,7 +41,8 @@ from app.routes import (
     images,
     import_routes,
     user_settings,
-    audiobook
+    audiobook,
+    analytics
 )
 
 # Configure logging
@@ -45,16 +61,36 @@ async def lifespan(app: FastAPI):
     try:
         await init_db()
         logger.info("Database initialized successfully")
+        interrupted = await draft_manager.mark_interrupted()
+        if interrupted:
+            logger.info(f"Marked {interrupted} unfinished generation drafts as interrupted")
     except Exception as e:
         logger.warning(f"Database initialization skipped: {e}")
+    ollama_pool.start()
+    model_lifecycle.start()
+    generation_recorder.start()
+    draft_manager.start_heartbeat()
     
     yield
     
     # Shutdown
     logger.info("Shutting down NarrativeFlow API...")
+    await draft_manager.stop_heartbeat()
+    await model_lifecycle.stop()
+    await generation_recorder.stop()
+    await ollama_pool.stop()
+    await http_pool.aclose()
     await close_db()
 
 
+async def label_generation_call_site(request: Request) -> None:
+    """Record generations made while handling a request under its route, ids replaced by their names"""
+    path = request.url.path
+    for name, value in request.path_params.items():
+        path = path.replace(f"/{value}", f"/{{{name}}}", 1)
+    set_call_site(f"{request.method} {path}")
+
+
 # Create FastAPI application
 app = FastAPI(
     title="NarrativeFlow API",
@@ -74,7 +110,8 @@ app = FastAPI(
     - Image prompt generation
     """,
     version=settings.app_version,
-    lifespan=lifespan
+    lifespan=lifespan,
+    dependencies=[Depends(label_generation_call_site)]
 )
 
 # CORS Configuration - Must be before routes
@@ -112,6 +149,7 @@ app.include_router(images.router, prefix="/api/images", tags=["Image Gallery"])
 app.include_router(import_routes.router, prefix="/api", tags=["Import"])
 app.include_router(user_settings.router, prefix="/api/settings", tags=["User Settings"])
 app.include_router(audiobook.router, prefix="/api/audiobook", tags=["Audiobook"])
+app.include_router(analytics.router, prefix="/api/analytics", tags=["Analytics"])
 
 
 @app.get("/", tags=["Health"])
@@ -136,7 +174,21 @@ async def health_check():
             "database": "connected",
             "ai_engine": "ready",
             "vector_memory": "active"
-        }
+        },
+        "http_pool": http_pool.get_stats(),
+        "ollama_nodes": ollama_pool.get_stats(),
+        "providers": provider_breakers.get_stats(),
+        "llm_scheduler": llm_scheduler.get_stats(),
+        "request_coalescing": request_coalescer.get_stats(),
+        "response_cache": response_cache.get_stats(),
+        "prompt_prefix_cache": get_prefix_cache_stats(),
+        "structured_output": structured_output_stats.get_stats(),
+        "throughput": throughput_tracker.get_stats(),
+        "models": model_lifecycle.get_status(),
+        "story_context": story_context_cache.get_stats(),
+        "generation_history": generation_recorder.get_stats(),
+        "revision_history": revision_store.get_stats(),
+        "story_languages": story_languages.get_stats()
     }
 
 
@@ -1,12 +1,12 @@
 # Models Package
 from app.models.user import User
 from app.models.story import Story, StoryGenre, StoryTone
-from app.models.chapter import Chapter, ChapterStatus
+from app.models.chapter import Chapter, ChapterStatus, ChapterRevision
 from app.models.character import Character, CharacterRole
 from app.models.plotline import Plotline, PlotlineStatus
 from app.models.story_bible import StoryBible, WorldRule
 from app.models.embedding import StoryEmbedding
-from app.models.generation import GenerationHistory, WritingMode
+from app.models.generation import GenerationHistory, WritingMode, GenerationDraft, DraftStatus
 from app.models.image import GeneratedImage, ImageType
 from app.models.user_ai_settings import UserAiSettings
 from app.models.user_api_keys import UserApiKeys
@@ -14,12 +14,12 @@ from app.models.user_api_keys import UserApiKeys
 __all__ = [
     "User",
     "Story", "StoryGenre", "StoryTone",
-    "Chapter", "ChapterStatus",
+    "Chapter", "ChapterStatus", "ChapterRevision",
     "Character", "CharacterRole",
     "Plotline", "PlotlineStatus",
     "StoryBible", "WorldRule",
     "StoryEmbedding",
-    "GenerationHistory", "WritingMode",
+    "GenerationHistory", "WritingMode", "GenerationDraft", "DraftStatus",
     "GeneratedImage", "ImageType",
     "UserAiSettings",
     "UserApiKeys",
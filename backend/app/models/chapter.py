@@ -1,9 +1,9 @@
 """
 Chapter Model - Story chapters/sections
 """
-from sqlalchemy import Column, String, Text, Boolean, DateTime, Integer, ForeignKey, Enum
+from sqlalchemy import Column, String, Text, Boolean, DateTime, Integer, ForeignKey, Enum, LargeBinary, UniqueConstraint, Index
 from sqlalchemy.dialects.postgresql import UUID, JSONB
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 import uuid
 import enum
@@ -22,6 +22,9 @@ class ChapterStatus(str, enum.Enum):
 class Chapter(Base):
     """Chapter model for story sections"""
     __tablename__ = "chapters"
+    __table_args__ = (
+        Index("ix_chapters_story_order", "story_id", "order"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     story_id = Column(UUID(as_uuid=True), ForeignKey("stories.id", ondelete="CASCADE"), nullable=False)
@@ -32,7 +35,8 @@ class Chapter(Base):
     order = Column(Integer, nullable=False)  # Order for sorting
     
     # Content
-    content = Column(Text, default="")  # Main chapter content
+    # Main chapter content. Deferred: queries load it only with undefer(Chapter.content)
+    content = deferred(Column(Text, default=""), raiseload=True)
     summary = Column(Text, nullable=True)  # AI-generated chapter summary
     notes = Column(Text, nullable=True)  # Author notes
     
@@ -45,7 +49,7 @@ class Chapter(Base):
     is_locked = Column(Boolean, default=False)  # Prevent AI modifications
     
     # POV tracking
-    pov_character_id = Column(UUID(as_uuid=True), ForeignKey("characters.id", ondelete="SET NULL"), nullable=True)
+    pov_character_id = Column(UUID(as_uuid=True), ForeignKey("characters.id", ondelete="SET NULL"), nullable=True, index=True)
     
     # Scene information
     scene_count = Column(Integer, default=1)
@@ -55,6 +59,7 @@ class Chapter(Base):
     word_count = Column(Integer, default=0)
     target_word_count = Column(Integer, nullable=True)
     reading_time_minutes = Column(Integer, default=0)
+    revision = Column(Integer, default=0, server_default="0", nullable=False)  # Bumped on every content write; auto-save patches name their base
     
     # AI generation metadata
     last_ai_summary = Column(Text, nullable=True)
@@ -93,3 +98,32 @@ class Chapter(Base):
             self.word_count = count_words(self.content, language)
             self.reading_time_minutes = get_reading_time(self.word_count, language)
         return self.word_count
+
+
+class ChapterRevision(Base):
+    """
+    One kept revision of a chapter's text (see app.services.revision_store).
+    A "delta" row turns the text of next_revision back into this revision's;
+    a "snapshot" row holds the whole text. Both are compressed.
+    """
+    __tablename__ = "chapter_revisions"
+    __table_args__ = (
+        UniqueConstraint("chapter_id", "revision", name="uq_chapter_revision"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    chapter_id = Column(UUID(as_uuid=True), ForeignKey("chapters.id", ondelete="CASCADE"), nullable=False)
+    revision = Column(Integer, nullable=False)  # Chapter.revision this text had
+    next_revision = Column(Integer, nullable=True)  # The newer revision a delta applies to
+    kind = Column(String(10), nullable=False)  # snapshot, delta
+    data = Column(LargeBinary, nullable=False)
+
+    # What the revision looked like, for listing without rebuilding it
+    length = Column(Integer, nullable=False)  # Characters
+    word_count = Column(Integer, nullable=True)
+
+    saved_at = Column(DateTime, nullable=True)  # When this text was saved
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ChapterRevision {self.chapter_id} r{self.revision} ({self.kind})>"
@@ -1,7 +1,7 @@
 """
 Generation History Model - Track AI generation history and writing modes
 """
-from sqlalchemy import Column, String, Text, DateTime, Integer, ForeignKey, Float, Enum, Boolean
+from sqlalchemy import Column, String, Text, DateTime, Integer, ForeignKey, Float, Enum, Boolean, Index
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -35,14 +35,19 @@ class GenerationType(str, enum.Enum):
 class GenerationHistory(Base):
     """Track all AI generations for history and learning"""
     __tablename__ = "generation_history"
+    __table_args__ = (
+        Index("ix_generation_history_story_created", "story_id", "created_at"),  # Per-story analytics
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    story_id = Column(UUID(as_uuid=True), ForeignKey("stories.id", ondelete="CASCADE"), nullable=False)
-    chapter_id = Column(UUID(as_uuid=True), ForeignKey("chapters.id", ondelete="SET NULL"), nullable=True)
+    story_id = Column(UUID(as_uuid=True), ForeignKey("stories.id", ondelete="CASCADE"), nullable=True)
+    chapter_id = Column(UUID(as_uuid=True), ForeignKey("chapters.id", ondelete="SET NULL"), nullable=True, index=True)
+    user_id = Column(UUID(as_uuid=True), nullable=True, index=True)  # No FK: rows outlive their user
     
     # Generation type
-    generation_type = Column(Enum(GenerationType), nullable=False)
+    generation_type = Column(Enum(GenerationType), nullable=True)
     writing_mode = Column(Enum(WritingMode), nullable=False)
+    call_site = Column(String(200), nullable=True)  # Route that asked, e.g. "POST /api/ai/generate"
     
     # Input/Output
     prompt = Column(Text, nullable=False)  # The prompt sent to AI
@@ -60,13 +65,20 @@ class GenerationHistory(Base):
     feedback = Column(Text, nullable=True)  # User feedback
     
     # AI model info
+    provider = Column(String(50), nullable=True)  # ollama, openai, anthropic, gemini
     model_used = Column(String(100), nullable=False)
     temperature = Column(Float, nullable=True)
     max_tokens = Column(Integer, nullable=True)
     
     # Performance metrics
-    generation_time_ms = Column(Integer, nullable=True)
+    generation_time_ms = Column(Integer, nullable=True)  # Includes queue_time_ms
+    queue_time_ms = Column(Integer, nullable=True)  # Waiting for a scheduler slot
+    time_to_first_token_ms = Column(Integer, nullable=True)  # Streams only
     tokens_used = Column(Integer, nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)  # Estimated size of the full prompt
+    completion_tokens = Column(Integer, nullable=True)
+    streamed = Column(Boolean, default=False)
+    cache_hit = Column(Boolean, default=False)  # Answered by the response cache or a coalesced call
     
     # Context retrieval (RAG)
     retrieved_chunks = Column(JSONB, default=list)  # IDs of retrieved embeddings
@@ -74,16 +86,18 @@ class GenerationHistory(Base):
     
     # Error tracking
     had_error = Column(Boolean, default=False)
+    cancelled = Column(Boolean, default=False)  # Client left mid-stream; neither success nor failure
     error_message = Column(Text, nullable=True)
     
     # Timestamps
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     
     # Relationships
     story = relationship("Story", back_populates="generations")
 
     def __repr__(self):
-        return f"<Generation {self.generation_type.value} at {self.created_at}>"
+        kind = self.generation_type.value if self.generation_type else self.call_site
+        return f"<Generation {kind} at {self.created_at}>"
 
 
 class AISession(Base):
@@ -91,8 +105,8 @@ class AISession(Base):
     __tablename__ = "ai_sessions"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    story_id = Column(UUID(as_uuid=True), ForeignKey("stories.id", ondelete="CASCADE"), nullable=False)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    story_id = Column(UUID(as_uuid=True), ForeignKey("stories.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     
     # Session info
     writing_mode = Column(Enum(WritingMode), nullable=False)
@@ -112,3 +126,39 @@ class AISession(Base):
 
     def __repr__(self):
         return f"<AISession {self.writing_mode.value} started {self.started_at}>"
+
+
+class DraftStatus(str, enum.Enum):
+    """Lifecycle of a streamed generation draft"""
+    STREAMING = "streaming"  # Tokens are still arriving
+    FINALIZED = "finalized"  # Appended to the chapter
+    FAILED = "failed"  # Upstream error; partial text kept in the draft
+    ABANDONED = "abandoned"  # Client left and the partial text was discarded
+    INTERRUPTED = "interrupted"  # Worker stopped mid-stream; can be finalized manually
+
+
+class GenerationDraft(Base):
+    """Write-behind buffer for a streamed generation before it lands in the chapter"""
+    __tablename__ = "generation_drafts"
+    __table_args__ = (
+        Index("ix_generation_drafts_status_updated", "status", "updated_at"),  # Stale-draft sweep
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    story_id = Column(UUID(as_uuid=True), ForeignKey("stories.id", ondelete="CASCADE"), nullable=False, index=True)
+    chapter_id = Column(UUID(as_uuid=True), ForeignKey("chapters.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
+    
+    status = Column(Enum(DraftStatus), default=DraftStatus.STREAMING, nullable=False)
+    content = Column(Text, default="", nullable=False)  # Checkpointed text so far
+    token_count = Column(Integer, default=0)  # Streamed chunks checkpointed
+    model_used = Column(String(100), nullable=True)
+    error_message = Column(Text, nullable=True)
+    
+    # Timestamps
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finalized_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<GenerationDraft {self.status.value} ({self.token_count} chunks)>"
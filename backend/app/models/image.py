@@ -1,7 +1,7 @@
 """
 Generated Image Model - Store metadata for AI-generated images
 """
-from sqlalchemy import Column, String, Text, DateTime, Integer, ForeignKey, Enum
+from sqlalchemy import Column, String, Text, DateTime, Integer, ForeignKey, Enum, Index
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -23,10 +23,13 @@ class ImageType(str, enum.Enum):
 class GeneratedImage(Base):
     """Model for storing generated image metadata"""
     __tablename__ = "generated_images"
+    __table_args__ = (
+        Index("ix_generated_images_story_created", "story_id", "created_at"),  # Gallery, newest first
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     story_id = Column(UUID(as_uuid=True), ForeignKey("stories.id", ondelete="CASCADE"), nullable=False)
-    character_id = Column(UUID(as_uuid=True), ForeignKey("characters.id", ondelete="SET NULL"), nullable=True)
+    character_id = Column(UUID(as_uuid=True), ForeignKey("characters.id", ondelete="SET NULL"), nullable=True, index=True)
     
     # Image details
     image_type = Column(Enum(ImageType), default=ImageType.SCENE)
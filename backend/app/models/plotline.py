@@ -37,7 +37,7 @@ class Plotline(Base):
     __tablename__ = "plotlines"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    story_id = Column(UUID(as_uuid=True), ForeignKey("stories.id", ondelete="CASCADE"), nullable=False)
+    story_id = Column(UUID(as_uuid=True), ForeignKey("stories.id", ondelete="CASCADE"), nullable=False, index=True)
     
     # Basic info
     title = Column(String(500), nullable=False)
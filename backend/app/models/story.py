@@ -1,7 +1,7 @@
 """
 Story Model - Main story/project container
 """
-from sqlalchemy import Column, String, Text, Boolean, DateTime, Integer, ForeignKey, Enum
+from sqlalchemy import Column, String, Text, Boolean, DateTime, Integer, ForeignKey, Enum, Index
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -58,6 +58,9 @@ class StoryStatus(str, enum.Enum):
 class Story(Base):
     """Main story container model"""
     __tablename__ = "stories"
+    __table_args__ = (
+        Index("ix_stories_author_updated", "author_id", "updated_at"),  # Library, newest first
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     author_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -95,6 +98,9 @@ class Story(Base):
     word_count = Column(Integer, default=0)
     chapter_count = Column(Integer, default=0)
     
+    # Bumped by character, plotline, bible and story writes (see story_context)
+    context_version = Column(Integer, default=0, server_default="0", nullable=False)
+    
     # Metadata
     tags = Column(JSONB, default=list)
     custom_metadata = Column(JSONB, default=dict)
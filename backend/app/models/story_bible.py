@@ -113,7 +113,7 @@ class WorldRule(Base):
     __tablename__ = "world_rules"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    story_bible_id = Column(UUID(as_uuid=True), ForeignKey("story_bibles.id", ondelete="CASCADE"), nullable=False)
+    story_bible_id = Column(UUID(as_uuid=True), ForeignKey("story_bibles.id", ondelete="CASCADE"), nullable=False, index=True)
     
     # Rule definition
     title = Column(String(200), nullable=False)
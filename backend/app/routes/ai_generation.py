@@ -1,21 +1,26 @@
 """
 AI Generation Routes - Endpoints for AI story generation
 """
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request, Query
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from sqlalchemy.orm import selectinload
 from pydantic import BaseModel, Field
 from typing import Optional, List
 from uuid import UUID
 from enum import Enum
 import logging
 import asyncio
+import re
 
 from app.database import get_db
 from app.config import settings
 from app.services.gemini_service import GeminiService
+from app.services.llm_scheduler import Priority
+from app.services.streaming import iterate_until_disconnect, ClientDisconnected, SSEEncoder
+from app.services.structured_output import BRANCH_SCHEMA
+from app.services.generation_drafts import draft_manager, MANUAL_FINALIZE_FROM
+from app.services.ollama_pool import set_story_affinity
 from app.services.prompt_builder import PromptBuilder
 from app.services.memory_service import MemoryService
 from app.services.story_service import StoryService
@@ -24,10 +29,10 @@ from app.services.character_service import CharacterService
 from app.services.image_service import image_service
 from app.services.tts_service import tts_service
 from app.services.ghibli_image_service import ghibli_service
-from app.services.token_settings import get_user_token_limits, get_user_ai_config
-from app.models.generation import WritingMode, GenerationType
-from app.models.plotline import Plotline, PlotlineStatus
-from app.models.story_bible import StoryBible
+from app.services.token_settings import get_user_token_limits
+from app.services.story_context import story_context_cache
+from app.models.generation import WritingMode, GenerationType, GenerationDraft, DraftStatus
+from app.runtime_settings import get_runtime_model_name
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -41,24 +46,11 @@ chapter_service = ChapterService()
 character_service = CharacterService()
 
 
-# Helper functions for async data fetching
-async def get_active_plotlines(db: AsyncSession, story_id: UUID) -> List:
-    """Fetch active plotlines (not resolved or abandoned) for a story"""
-    query = select(Plotline).where(
-        Plotline.story_id == story_id,
-        Plotline.status.notin_([PlotlineStatus.RESOLVED, PlotlineStatus.ABANDONED])
-    )
-    result = await db.execute(query)
-    return result.scalars().all()
-
-
-async def get_story_bible(db: AsyncSession, story_id: UUID):
-    """Fetch story bible for a story with world_rules eagerly loaded"""
-    query = select(StoryBible).where(StoryBible.story_id == story_id).options(
-        selectinload(StoryBible.world_rules)
-    )
-    result = await db.execute(query)
-    return result.scalar_one_or_none()
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"
+}
 
 
 class WritingModeEnum(str, Enum):
@@ -74,6 +66,8 @@ class GenerateRequest(BaseModel):
     user_direction: Optional[str] = None
     word_target: int = Field(default=500, ge=50, le=3000)
     temperature: Optional[float] = Field(default=None, ge=0.0, le=1.0)
+    # Latency budget for /generate: output length is cut to what the model can produce in time
+    deadline_seconds: Optional[float] = Field(default=None, ge=5, le=600)
 
 
 class RewriteRequest(BaseModel):
@@ -112,6 +106,7 @@ class BranchingRequest(BaseModel):
     num_branches: int = Field(default=3, ge=2, le=5)
     word_target: int = Field(default=150, ge=50, le=400)  # Words per branch preview
     writing_mode: WritingModeEnum = WritingModeEnum.CO_AUTHOR
+    deadline_seconds: Optional[float] = Field(default=None, ge=5, le=600)  # Defaults to BRANCH_DEADLINE_SECONDS
 
 
 class ImageToStoryRequest(BaseModel):
@@ -152,26 +147,23 @@ async def generate_continuation(
     db: AsyncSession = Depends(get_db)
 ):
     """Generate story continuation"""
-    # Get story and chapter
-    story = await story_service.get_story(db, request.story_id)
+    # Get story and its cached generation context (characters, plotlines, bible, user settings)
+    story, context = await story_context_cache.load(db, request.story_id)
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
-    token_limits, user_ai_config = await asyncio.gather(
-        get_user_token_limits(db, story.author_id),
-        get_user_ai_config(db, story.author_id),
-    )
+    set_story_affinity(request.story_id)
+    token_limits, user_ai_config = context.token_limits, context.ai_config()
     
-    chapter = await chapter_service.get_chapter(db, request.chapter_id)
+    chapter = await chapter_service.get_chapter(db, request.chapter_id, include_content=False)
     if not chapter:
         raise HTTPException(status_code=404, detail="Chapter not found")
     
-    # Get characters, plotlines, and story bible using async queries
-    characters = await character_service.get_characters_by_story(db, request.story_id)
-    active_plotlines = await get_active_plotlines(db, request.story_id)
-    story_bible = await get_story_bible(db, request.story_id)
+    characters = list(context.characters)
+    active_plotlines = list(context.active_plotlines)
+    story_bible = context.story_bible
     
-    # Get recent content
-    recent_content = chapter.content[-2000:] if chapter.content else ""
+    # Get recent content (only the tail leaves the database)
+    recent_content = await chapter_service.get_chapter_tail(db, request.chapter_id, 2000)
     
     # Get character IDs for context retrieval
     character_ids = [str(c.id) for c in characters] if characters else []
@@ -210,7 +202,12 @@ async def generate_continuation(
                    f"{len(all_context.get('characters', []))} character entries, "
                    f"{len(all_context.get('bible', []))} bible entries")
     
-    # Build prompt
+    # Build prompt, packing context into the selected model's context window
+    max_tokens = min(int(request.word_target * 1.3), token_limits["max_tokens_story_generation"])
+    if user_ai_config.get("provider", "ollama") == "ollama":
+        model_name = get_runtime_model_name()
+    else:
+        model_name = user_ai_config.get("model")
     prompt_parts = prompt_builder.build_continuation_prompt(
         story=story,
         chapter=chapter,
@@ -221,7 +218,10 @@ async def generate_continuation(
         retrieved_context=retrieved_context,
         writing_mode=WritingMode(request.writing_mode.value),
         user_direction=request.user_direction,
-        word_target=request.word_target
+        word_target=request.word_target,
+        prefix_stable=settings.prompt_prefix_stable_layout,
+        model=model_name,
+        max_output_tokens=max_tokens
     )
     
     # Generate content (routes to Ollama or external provider based on user's settings)
@@ -231,19 +231,21 @@ async def generate_continuation(
         system_prompt=prompt_parts["system_prompt"],
         writing_mode=WritingMode(request.writing_mode.value),
         context=prompt_parts["context"],
-        max_tokens=min(int(request.word_target * 1.3), token_limits["max_tokens_story_generation"])
+        max_tokens=max_tokens,
+        user_id=story.author_id,
+        prefix_stable=settings.prompt_prefix_stable_layout,
+        deadline_seconds=request.deadline_seconds
     )
     
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error", "Generation failed"))
     
-    # Update chapter content and save
-    if chapter.content:
-        chapter.content += "\n\n" + result["content"]
-    else:
-        chapter.content = result["content"]
-    
-    chapter.word_count = len(chapter.content.split())
+    # Append to the chapter in one UPDATE and save
+    appended = await chapter_service.append_content(
+        db, request.chapter_id, result["content"], story.language or "English", return_content=True
+    )
+    if appended is None:
+        raise HTTPException(status_code=404, detail="Chapter not found")
     await db.commit()
     
     # Embed the chapter for semantic search (in background, non-blocking)
@@ -252,7 +254,7 @@ async def generate_continuation(
             db=db,
             story_id=str(request.story_id),
             chapter_id=str(request.chapter_id),
-            content=chapter.content,
+            content=appended["content"],
             chapter_metadata={
                 "title": chapter.title,
                 "number": chapter.number,
@@ -267,6 +269,10 @@ async def generate_continuation(
         "content": result["content"],
         "tokens_used": result.get("tokens_used"),
         "generation_time_ms": result.get("generation_time_ms"),
+        "prompt_eval_count": result.get("prompt_eval_count"),
+        "prompt_tokens_cached": result.get("prompt_tokens_cached"),
+        "deadline": result.get("deadline"),
+        "context_report": prompt_parts["context_report"],
         "writing_mode": request.writing_mode.value
     }
 
@@ -274,25 +280,27 @@ async def generate_continuation(
 @router.post("/generate/stream")
 async def generate_continuation_stream(
     request: GenerateRequest,
+    http_request: Request,
+    protocol: Optional[str] = Query(default=None, pattern="^(events|legacy)$"),
     db: AsyncSession = Depends(get_db)
 ):
     """Generate story continuation with streaming response (Server-Sent Events)"""
-    # Get story and chapter
-    story = await story_service.get_story(db, request.story_id)
+    # Get story and its cached generation context (characters, plotlines, bible, user settings)
+    story, context = await story_context_cache.load(db, request.story_id)
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
-    token_limits = await get_user_token_limits(db, story.author_id)
+    set_story_affinity(request.story_id)
+    token_limits, user_ai_config = context.token_limits, context.ai_config()
     
-    chapter = await chapter_service.get_chapter(db, request.chapter_id)
+    chapter = await chapter_service.get_chapter(db, request.chapter_id, include_content=False)
     if not chapter:
         raise HTTPException(status_code=404, detail="Chapter not found")
     
-    # Get characters, plotlines, and story bible using async queries
-    characters = await character_service.get_characters_by_story(db, request.story_id)
-    active_plotlines = await get_active_plotlines(db, request.story_id)
-    story_bible = await get_story_bible(db, request.story_id)
+    characters = list(context.characters)
+    active_plotlines = list(context.active_plotlines)
+    story_bible = context.story_bible
     
-    recent_content = chapter.content[-2000:] if chapter.content else ""
+    recent_content = await chapter_service.get_chapter_tail(db, request.chapter_id, 2000)
     character_ids = [str(c.id) for c in characters] if characters else []
     
     # RAG retrieval for context
@@ -320,7 +328,12 @@ async def generate_continuation_stream(
         except Exception as e:
             logger.warning(f"RAG retrieval failed: {e}")
     
-    # Build prompt
+    # Build prompt, packing context into the selected model's context window
+    max_tokens = min(int(request.word_target * 1.3), token_limits["max_tokens_story_generation"])
+    if user_ai_config.get("provider", "ollama") == "ollama":
+        model_name = get_runtime_model_name()
+    else:
+        model_name = user_ai_config.get("model")
     prompt_parts = prompt_builder.build_continuation_prompt(
         story=story,
         chapter=chapter,
@@ -331,81 +344,200 @@ async def generate_continuation_stream(
         retrieved_context=retrieved_context,
         writing_mode=WritingMode(request.writing_mode.value),
         user_direction=request.user_direction,
-        word_target=request.word_target
+        word_target=request.word_target,
+        prefix_stable=settings.prompt_prefix_stable_layout,
+        model=model_name,
+        max_output_tokens=max_tokens
     )
     
+    logger.info(f"Packed continuation context: {prompt_parts['context_report']}")
+    
     # Store references for saving after generation
     story_id = str(request.story_id)
     chapter_id = str(request.chapter_id)
     character_names = [c.name for c in characters] if characters else []
     chapter_title = chapter.title
     chapter_number = chapter.number
-    existing_content = chapter.content or ""
+    author_id = story.author_id
+    
+    async def embed_after_finalize(content: str):
+        """Re-embed the chapter once the generated text has been appended"""
+        from app.database import get_async_session
+        async with get_async_session() as embed_db:
+            await memory_service.embed_chapter(
+                db=embed_db,
+                story_id=story_id,
+                chapter_id=chapter_id,
+                content=content,
+                chapter_metadata={
+                    "title": chapter_title,
+                    "number": chapter_number,
+                    "characters": character_names
+                }
+            )
+        logger.info(f"✓ Auto-embedded chapter {chapter_id} after streaming generation")
+    
+    # Generation runs as a draft-backed background producer (checkpointed as it streams,
+    # appended to the chapter once at the end); this response and any reconnect follow it
+    stream_stats = {}
+    live = await draft_manager.start(
+        story_id=request.story_id,
+        chapter_id=request.chapter_id,
+        user_id=author_id,
+        language=story.language or "English",
+        # Routes to Ollama or the user's external provider
+        source=gemini_service.generate_story_content_stream_routed(
+            user_config=user_ai_config,
+            prompt=prompt_parts["user_prompt"],
+            system_prompt=prompt_parts["system_prompt"],
+            writing_mode=WritingMode(request.writing_mode.value),
+            context=prompt_parts.get("context"),
+            max_tokens=max_tokens,
+            priority=Priority.INTERACTIVE,
+            user_id=author_id,
+            prefix_stable=settings.prompt_prefix_stable_layout,
+            stream_stats=stream_stats
+        ),
+        on_finalized=embed_after_finalize,
+        stats=stream_stats
+    )
     
-    async def generate_sse():
-        """Generate Server-Sent Events for streaming"""
-        generated_text = []
+    return StreamingResponse(
+        stream_draft_sse(http_request, live, protocol=protocol),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+async def stream_draft_sse(http_request: Request, live, offset: int = 0, protocol: Optional[str] = None):
+    """Server-Sent Events for a live generation draft (coalesced token frames, typed events)"""
+    encoder = SSEEncoder(protocol=protocol)
+    draft_frame = encoder.event("draft", {"draft_id": str(live.id), "offset": offset})
+    if draft_frame:
+        yield draft_frame
+    
+    try:
+        tokens = iterate_until_disconnect(http_request, draft_manager.subscribe(live, offset))
+        async for frame in encoder.encode_tokens(tokens):
+            yield frame
+        
+        if live.stats.get("error"):
+            yield encoder.event("error", {"message": live.stats["error"]})
+            return
+        
+        usage_frame = encoder.event("usage", {
+            **live.stats,
+            "frames_sent": encoder.frames_sent,
+            "chunks": encoder.tokens_seen
+        })
+        if usage_frame:
+            yield usage_frame
+        
+        # Send completion signal
+        yield encoder.event("done", {"chapter_id": str(live.chapter_id), "draft_id": str(live.id)})
+        logger.info(f"Streaming generation finished: {live.stats}")
         
+    except ClientDisconnected:
+        # The draft manager cancels upstream work unless the client reconnects in time
+        logger.info(f"Client disconnected from draft {live.id} after {len(live.chunks)} chunks")
+    except Exception as e:
+        logger.error(f"Streaming generation error: {e}")
+        yield encoder.event("error", {"message": str(e)})
+
+
+@router.get("/generate/stream/{draft_id}")
+async def resume_generation_stream(
+    draft_id: UUID,
+    http_request: Request,
+    offset: int = Query(default=0, ge=0),
+    protocol: Optional[str] = Query(default=None, pattern="^(events|legacy)$"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Reconnect to a streamed generation.
+    offset is the number of characters the client already received.
+    """
+    live = draft_manager.get_live(draft_id)
+    if live:
+        return StreamingResponse(
+            stream_draft_sse(http_request, live, offset, protocol),
+            media_type="text/event-stream",
+            headers=SSE_HEADERS
+        )
+    
+    # Not streaming on this worker: replay what was checkpointed, and while
+    # another worker is still streaming it, follow its checkpoints until it ends
+    draft = await db.get(GenerationDraft, draft_id)
+    if not draft:
+        raise HTTPException(status_code=404, detail="Draft not found")
+    chapter_id = draft.chapter_id
+    
+    async def replay_sse():
+        encoder = SSEEncoder(protocol=protocol)
+        draft_frame = encoder.event("draft", {"draft_id": str(draft_id), "offset": offset})
+        if draft_frame:
+            yield draft_frame
+        state = {}
         try:
-            async for chunk in gemini_service.generate_story_content_stream(
-                prompt=prompt_parts["user_prompt"],
-                system_prompt=prompt_parts["system_prompt"],
-                writing_mode=WritingMode(request.writing_mode.value),
-                context=prompt_parts.get("context"),
-                max_tokens=min(int(request.word_target * 1.3), token_limits["max_tokens_story_generation"])
-            ):
-                generated_text.append(chunk)
-                # SSE format: data: <content>\n\n
-                yield f"data: {chunk}\n\n"
-            
-            # Send completion signal
-            yield f"data: [DONE]\n\n"
-            
-            # After streaming is complete, save the content
-            full_text = "".join(generated_text)
-            if full_text.strip():
-                # Update chapter content in database
-                from app.database import get_async_session
-                async with get_async_session() as save_db:
-                    chap = await chapter_service.get_chapter(save_db, UUID(chapter_id))
-                    if chap:
-                        if chap.content:
-                            chap.content += "\n\n" + full_text
-                        else:
-                            chap.content = full_text
-                        chap.word_count = len(chap.content.split())
-                        await save_db.commit()
-                        
-                        # Embed the updated chapter
-                        try:
-                            await memory_service.embed_chapter(
-                                db=save_db,
-                                story_id=story_id,
-                                chapter_id=chapter_id,
-                                content=chap.content,
-                                chapter_metadata={
-                                    "title": chapter_title,
-                                    "number": chapter_number,
-                                    "characters": character_names
-                                }
-                            )
-                            logger.info(f"✓ Auto-embedded chapter {chapter_id} after streaming generation")
-                        except Exception as e:
-                            logger.warning(f"Failed to embed chapter after streaming: {e}")
-                
-        except Exception as e:
-            logger.error(f"Streaming generation error: {e}")
-            yield f"data: [ERROR] {str(e)}\n\n"
+            tokens = iterate_until_disconnect(http_request, draft_manager.follow(draft_id, offset, state))
+            async for frame in encoder.encode_tokens(tokens):
+                yield frame
+        except ClientDisconnected:
+            return
+        
+        status = state.get("status")
+        if status is None or status == DraftStatus.FAILED:
+            yield encoder.event("error", {"message": state.get("error") or "Generation failed"})
+        else:
+            yield encoder.event("done", {
+                "chapter_id": str(chapter_id),
+                "draft_id": str(draft_id),
+                "status": status.value
+            })
     
-    return StreamingResponse(
-        generate_sse(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"
-        }
+    return StreamingResponse(replay_sse(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.post("/generate/drafts/{draft_id}/finalize")
+async def finalize_generation_draft(
+    draft_id: UUID,
+    db: AsyncSession = Depends(get_db)
+):
+    """Append an interrupted, abandoned or failed draft to its chapter"""
+    draft = await db.get(GenerationDraft, draft_id)
+    if not draft:
+        raise HTTPException(status_code=404, detail="Draft not found")
+    if draft_manager.get_live(draft_id):
+        raise HTTPException(status_code=409, detail="Draft is still streaming")
+    
+    story = await story_service.get_story(db, draft.story_id)
+    result = await draft_manager.append_to_chapter(
+        draft.id, draft.chapter_id, (story.language if story else None) or "English", MANUAL_FINALIZE_FROM
     )
+    if not result["success"]:
+        if result["error"] == "chapter_not_found":
+            raise HTTPException(status_code=404, detail="Chapter not found")
+        if result["error"] == "empty":
+            raise HTTPException(status_code=400, detail="Draft is empty")
+        status_now = await draft_manager.get_status(draft.id)
+        if status_now == DraftStatus.FINALIZED:
+            raise HTTPException(status_code=409, detail="Draft already added to the chapter")
+        raise HTTPException(status_code=409, detail="Draft is still streaming")
+    content = result["content"]
+    
+    chapter = await chapter_service.get_chapter(db, draft.chapter_id, include_content=False)
+    try:
+        await memory_service.embed_chapter(
+            db=db,
+            story_id=str(draft.story_id),
+            chapter_id=str(draft.chapter_id),
+            content=content,
+            chapter_metadata={"title": chapter.title, "number": chapter.number} if chapter else {}
+        )
+    except Exception as e:
+        logger.warning(f"Failed to embed chapter after finalizing draft: {e}")
+    
+    return {"draft_id": str(draft.id), "chapter_id": str(draft.chapter_id), "status": DraftStatus.FINALIZED.value}
 
 
 @router.post("/rewrite")
@@ -414,15 +546,12 @@ async def rewrite_text(
     db: AsyncSession = Depends(get_db)
 ):
     """Rewrite text based on instructions"""
-    story = await story_service.get_story(db, request.story_id)
+    story, context = await story_context_cache.load(db, request.story_id)
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
-
-    token_limits, user_ai_config, characters = await asyncio.gather(
-        get_user_token_limits(db, story.author_id),
-        get_user_ai_config(db, story.author_id),
-        character_service.get_characters_by_story(db, request.story_id),
-    )
+    set_story_affinity(request.story_id)
+    token_limits, user_ai_config = context.token_limits, context.ai_config()
+    characters = list(context.characters)
     
     prompt_parts = prompt_builder.build_rewrite_prompt(
         story=story,
@@ -457,23 +586,18 @@ async def generate_dialogue(
     db: AsyncSession = Depends(get_db)
 ):
     """Generate character dialogue"""
-    character = await character_service.get_character(db, request.character_id)
-    if not character:
-        raise HTTPException(status_code=404, detail="Character not found")
-    story = await story_service.get_story(db, character.story_id)
+    story, context = await story_context_cache.load(db, request.story_id)
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
-    token_limits, user_ai_config = await asyncio.gather(
-        get_user_token_limits(db, story.author_id),
-        get_user_ai_config(db, story.author_id),
-    )
+    character = context.character(request.character_id)
+    if not character:
+        raise HTTPException(status_code=404, detail="Character not found")
+    set_story_affinity(request.story_id)
+    token_limits, user_ai_config = context.token_limits, context.ai_config()
     
-    other_characters = []
-    if request.other_character_ids:
-        for char_id in request.other_character_ids:
-            char = await character_service.get_character(db, char_id)
-            if char:
-                other_characters.append(char)
+    other_characters = [
+        char for char in map(context.character, request.other_character_ids or []) if char
+    ]
     
     prompt_parts = prompt_builder.build_dialogue_prompt(
         character=character,
@@ -506,13 +630,11 @@ async def brainstorm_ideas(
     db: AsyncSession = Depends(get_db)
 ):
     """Brainstorm creative ideas"""
-    story = await story_service.get_story(db, request.story_id)
+    story, context = await story_context_cache.load(db, request.story_id)
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
-    token_limits, user_ai_config = await asyncio.gather(
-        get_user_token_limits(db, story.author_id),
-        get_user_ai_config(db, story.author_id),
-    )
+    set_story_affinity(request.story_id)
+    token_limits, user_ai_config = context.token_limits, context.ai_config()
     
     prompt_parts = prompt_builder.build_brainstorm_prompt(
         story=story,
@@ -559,6 +681,149 @@ async def generate_image_prompt(request: ImagePromptRequest):
 # BRANCHING & CHOICE-BASED STORYTELLING
 # ============================================================
 
+BRANCH_TONES = ["tense", "romantic", "mysterious", "action", "emotional", "dark", "hopeful"]
+
+
+async def load_branch_setup(db: AsyncSession, request: BranchingRequest) -> dict:
+    """Story, limits and prompts shared by the blocking and streaming branch endpoints"""
+    story, context = await story_context_cache.load(db, request.story_id)
+    if not story:
+        raise HTTPException(status_code=404, detail="Story not found")
+    set_story_affinity(request.story_id)
+    
+    recent_content = await chapter_service.get_chapter_tail(db, request.chapter_id, 2000)
+    if recent_content is None:
+        raise HTTPException(status_code=404, detail="Chapter not found")
+    
+    token_limits, user_ai_config = context.token_limits, context.ai_config()
+    preview_words = min(request.word_target, 150)  # Further reduced for speed
+    max_tokens = min(int((preview_words / 0.75) + 120), token_limits["max_tokens_branching"])
+    
+    return {
+        "story": story,
+        "story_language": story.language or "English",
+        "recent_content": recent_content,
+        "preview_words": preview_words,
+        "max_tokens": max_tokens,
+        "user_ai_config": user_ai_config,
+    }
+
+
+def build_branch_prompts(setup: dict, num_branches: int, output_format: str = "json") -> tuple:
+    """
+    System prompt, shared context and one short instruction per branch.
+    Everything up to the final "Write branch N" line is identical for every
+    branch, so with prefix-stable calls Ollama evaluates the story context once
+    and reuses its KV cache for the remaining branches.
+    output_format "json" asks for a JSON object; "text" asks for TITLE /
+    DESCRIPTION header lines followed by the preview, which can be streamed.
+    """
+    story = setup["story"]
+    story_language = setup["story_language"]
+    recent_content = setup["recent_content"]
+    preview_words = setup["preview_words"]
+    
+    if output_format == "json":
+        system_prompt = f"""You are a creative writer. Write story content in {story_language}. Output valid JSON."""
+        format_instructions = f"""Output this JSON with ALL fields in {story_language}:
+{{
+  "title": "Short title in {story_language}",
+  "description": "Brief description in {story_language}",
+  "preview": "Write actual story continuation here (~{preview_words} words in {story_language})"
+}}
+
+IMPORTANT: The "preview" field must contain actual story text in {story_language}, not a description."""
+    else:
+        system_prompt = f"""You are a creative writer. Write story content in {story_language}. Follow the output format exactly."""
+        format_instructions = f"""Output exactly this format, with ALL text in {story_language}:
+TITLE: Short title in {story_language}
+DESCRIPTION: One-sentence description in {story_language}
+PREVIEW:
+Actual story continuation (~{preview_words} words in {story_language})
+
+IMPORTANT: The text after PREVIEW: must be actual story text in {story_language}, not a description."""
+    
+    context = f"""Story: "{story.title}" in {story_language}
+Recent content: {recent_content[-300:] if recent_content else 'Story beginning'}
+
+{format_instructions}"""
+    
+    prompts = [
+        f"Write branch {i+1} with {BRANCH_TONES[i % len(BRANCH_TONES)]} tone."
+        for i in range(num_branches)
+    ]
+    return system_prompt, context, prompts
+
+
+def fallback_branch(setup: dict, i: int) -> dict:
+    """Placeholder for a branch that failed or missed the deadline"""
+    recent_content = setup["recent_content"]
+    # Use recent content snippet as preview instead of English fallback
+    return {
+        "id": i+1,
+        "title": f"Branch {i+1}",
+        "description": "Alternative story direction",
+        "tone": BRANCH_TONES[i % len(BRANCH_TONES)],
+        "preview": recent_content[:setup["preview_words"]] if recent_content else "..."
+    }
+
+
+class BranchPreviewParser:
+    """
+    Incremental parser for the streamed TITLE / DESCRIPTION / PREVIEW format.
+    feed() returns the part of each chunk that belongs to the preview, so the
+    preview can be forwarded while the header lines are still being collected.
+    """
+    
+    # Matched case-insensitively on the original text: str.upper() can change
+    # the length of a string (ß -> SS), so its indexes don't map back
+    MARKER = re.compile(r"PREVIEW:", re.IGNORECASE)
+    
+    def __init__(self):
+        self.head = ""
+        self.in_preview = False
+        self.preview_parts: List[str] = []
+    
+    @property
+    def preview(self) -> str:
+        return "".join(self.preview_parts).strip()
+    
+    def feed(self, chunk: str) -> str:
+        if not self.in_preview:
+            self.head += chunk
+            match = self.MARKER.search(self.head)
+            if not match:
+                return ""
+            self.in_preview = True
+            chunk = self.head[match.end():]
+            self.head = self.head[:match.start()]
+        if not self.preview_parts:
+            # Drop the newline and any markdown emphasis that follows the marker
+            chunk = chunk.lstrip(" \t\r\n*")
+            if not chunk:
+                return ""
+        self.preview_parts.append(chunk)
+        return chunk
+    
+    def _field(self, name: str) -> str:
+        for line in self.head.splitlines():
+            cleaned = line.strip().lstrip("*#- ").replace("**", "")
+            match = re.match(rf"{name}:", cleaned, re.IGNORECASE)
+            if match:
+                return cleaned[match.end():].strip()
+        return ""
+    
+    def result(self) -> dict:
+        preview = self.preview
+        if not self.in_preview:
+            # No marker: treat whatever isn't a header line as the preview
+            preview = "\n".join(
+                line for line in self.head.splitlines()
+                if not line.strip().lstrip("*#- ").upper().startswith(("TITLE:", "DESCRIPTION:"))
+            ).strip()
+        return {"title": self._field("TITLE"), "description": self._field("DESCRIPTION"), "preview": preview}
+
+
 @router.post("/branches")
 async def generate_story_branches(
     request: BranchingRequest,
@@ -568,161 +833,84 @@ async def generate_story_branches(
     Generate multiple possible story directions for the user to choose from.
     Returns 2-5 branching options with titles and preview text.
     Supports multi-language stories.
+    Branches still running at the deadline are cancelled and returned as placeholders.
     """
     try:
-        story = await story_service.get_story(db, request.story_id)
-        if not story:
-            raise HTTPException(status_code=404, detail="Story not found")
-        
-        chapter = await chapter_service.get_chapter(db, request.chapter_id)
-        if not chapter:
-            raise HTTPException(status_code=404, detail="Chapter not found")
-        
-        # Get context
-        characters = await character_service.get_characters_by_story(db, request.story_id)
-        active_plotlines = await get_active_plotlines(db, request.story_id)
-        story_bible = await get_story_bible(db, request.story_id)
-        recent_content = chapter.content[-2000:] if chapter.content else ""
-        
-        # Language support
-        story_language = story.language or "English"
-        if story_language != "English":
-            language_instruction = f"\n\nIMPORTANT: This story is written in {story_language}. Generate all branch previews in {story_language}. Preserve the language, style, and cultural context of the original story."
-        else:
-            language_instruction = ""
-        
-        # Build branching prompt
-        character_names = [c.name for c in characters[:5]] if characters else []
-        plotline_names = [p.title for p in active_plotlines[:3]] if active_plotlines else []
-        
-        # Safely get genre and tone
-        story_genre = story.genre.value if story.genre else "general"
-        story_tone = story.tone.value if story.tone else "balanced"
-        
-        # NEW APPROACH: Generate each branch individually for reliability
-        import json
-        import re
-        
-        preview_words = min(request.word_target, 150)  # Further reduced for speed
+        setup = await load_branch_setup(db, request)
+        story = setup["story"]
+        story_language = setup["story_language"]
+        recent_content = setup["recent_content"]
+        preview_words = setup["preview_words"]
+        system_prompt, context, prompts = build_branch_prompts(setup, request.num_branches)
+        deadline = request.deadline_seconds or settings.branch_deadline_seconds
         
         logger.info(f"Generating {request.num_branches} branches IN PARALLEL for story in {story_language}")
         
-        tones = ["tense", "romantic", "mysterious", "action", "emotional", "dark", "hopeful"]
-        
         # Create async function for generating a single branch
         async def generate_single_branch(i: int) -> dict:
-            branch_tone = tones[i % len(tones)]
-            
-            system_prompt = f"""You are a creative writer. Write story content in {story_language}. Output valid JSON."""
-            
-            prompt = f"""Story: "{story.title}" in {story_language}
-Recent content: {recent_content[-300:] if recent_content else 'Story beginning'}
-
-Write branch {i+1} with {branch_tone} tone.
-
-Output this JSON with ALL fields in {story_language}:
-{{
-  "id": {i+1},
-  "title": "Short title in {story_language}",
-  "description": "Brief description in {story_language}",
-  "tone": "{branch_tone}",
-  "preview": "Write actual story continuation here (~{preview_words} words in {story_language})"
-}}
-
-IMPORTANT: The "preview" field must contain actual story text in {story_language}, not a description."""
+            branch_tone = BRANCH_TONES[i % len(BRANCH_TONES)]
             
             try:
-                # Reduced tokens for speed
-                branch_max_tokens = int((preview_words / 0.75) + 120)
-                branch_max_tokens = min(branch_max_tokens, token_limits["max_tokens_branching"])
-                
-                result = await gemini_service.generate_story_content(
-                    prompt=prompt,
+                result = await gemini_service.generate_structured(
+                    prompt=prompts[i],
                     system_prompt=system_prompt,
+                    schema=BRANCH_SCHEMA,
+                    call_site="branches",
+                    context=context,
+                    max_tokens=setup["max_tokens"],
                     writing_mode=WritingMode.CO_AUTHOR,
-                    max_tokens=branch_max_tokens,
-                    temperature_override=0.4
+                    temperature_override=0.4,
+                    priority=Priority.INTERACTIVE,  # The user is waiting; BATCH leaves one slot per node
+                    user_id=story.author_id,
+                    cacheable=False,
+                    prefix_stable=True
                 )
                 
                 if not result.get("success"):
                     raise Exception("Generation failed")
+                if not result["parsed"]:
+                    raise Exception("Branch output did not match the schema")
                 
-                content = result["content"].strip()
-                
-                # Quick cleaning
-                if "```json" in content:
-                    match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
-                    if match:
-                        content = match.group(1).strip()
-                elif "```" in content:
-                    match = re.search(r'```\s*(.*?)\s*```', content, re.DOTALL)
-                    if match:
-                        content = match.group(1).strip()
-                
-                # Remove quotes
-                for _ in range(2):
-                    if content.startswith('"') and content.endswith('"'):
-                        content = content[1:-1].replace('\\"', '"').replace('\\n', '\n')
-                
-                # Extract JSON
-                if not content.startswith('{'):
-                    json_match = re.search(r'(\{.*?"preview".*?\})', content, re.DOTALL)
-                    if json_match:
-                        content = json_match.group(1)
-                
-                # Parse
-                try:
-                    branch_data = json.loads(content)
-                except json.JSONDecodeError:
-                    # Try fixing
-                    fixed = re.sub(r',(\s*[}\]])', r'\1', content).replace("'", '"')
-                    branch_data = json.loads(fixed)
-                
-                # Extract and validate preview
-                preview_text = branch_data.get("preview", "")
+                branch_data = result["data"]
+                preview_text = branch_data["preview"].strip()
                 
                 # Log what we got
-                logger.info(f"Branch {i+1}: title='{branch_data.get('title', 'N/A')[:30]}', preview_length={len(preview_text)}")
+                logger.info(f"Branch {i+1}: title='{branch_data.get('title', '')[:30]}', preview_length={len(preview_text)}")
                 
-                # If preview is empty or just placeholder text, try to extract from content
-                if not preview_text or len(preview_text.strip()) < 20 or "story text" in preview_text.lower():
+                # If preview is empty or just placeholder text, fall back to recent content
+                if len(preview_text) < 20 or "story text" in preview_text.lower():
                     logger.warning(f"Branch {i+1} preview invalid or too short: '{preview_text[:50]}'")
-                    
-                    # Try to find any substantial text in the response
-                    text_match = re.search(r'"preview"\s*:\s*"([^"]{30,})"', content, re.DOTALL)
-                    if text_match:
-                        preview_text = text_match.group(1).strip()
-                        logger.info(f"Extracted better preview: {len(preview_text)} chars")
-                    else:
-                        # Use first part of recent content as context
-                        preview_text = recent_content[:preview_words] if recent_content else f"Story continues..."
-                        logger.warning(f"Using fallback preview")
+                    preview_text = recent_content[:preview_words] if recent_content else f"Story continues..."
                 
                 return {
-                    "id": branch_data.get("id", i+1),
-                    "title": branch_data.get("title", f"Branch {i+1}"),
-                    "description": branch_data.get("description", "A new story direction"),
-                    "tone": branch_data.get("tone", branch_tone),
+                    "id": i+1,
+                    "title": branch_data.get("title") or f"Branch {i+1}",
+                    "description": branch_data.get("description") or "A new story direction",
+                    "tone": branch_tone,
                     "preview": preview_text
                 }
                 
             except Exception as e:
                 logger.error(f"Branch {i+1} generation failed: {str(e)[:150]}")
-                # Use recent content snippet as preview instead of English fallback
-                fallback_preview = recent_content[:preview_words] if recent_content else "..."
-                return {
-                    "id": i+1,
-                    "title": f"Branch {i+1}",
-                    "description": "Alternative story direction",
-                    "tone": branch_tone,
-                    "preview": fallback_preview
-                }
+                return fallback_branch(setup, i)
         
-        # Generate all branches in parallel
-        tasks = [generate_single_branch(i) for i in range(request.num_branches)]
-        all_branches = await asyncio.gather(*tasks)
+        # Generate all branches in parallel, collecting them as they finish
+        tasks = [asyncio.ensure_future(generate_single_branch(i)) for i in range(request.num_branches)]
+        completed = {}
+        try:
+            for next_done in asyncio.as_completed(tasks, timeout=deadline):
+                branch = await next_done
+                completed[branch["id"]] = branch
+        except asyncio.TimeoutError:
+            logger.warning(f"Branch deadline of {deadline}s reached with {len(completed)}/{request.num_branches} done")
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        
+        all_branches = [completed.get(i+1) or fallback_branch(setup, i) for i in range(request.num_branches)]
         
-        logger.info(f"✓ Generated {len(all_branches)}/{request.num_branches} branches in parallel")
+        logger.info(f"✓ Generated {len(completed)}/{request.num_branches} branches in parallel")
         
         return {
             "branches": all_branches,
@@ -730,6 +918,8 @@ IMPORTANT: The "preview" field must contain actual story text in {story_language
             "chapter_id": str(request.chapter_id)
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in branch generation: {e}")
         import traceback
@@ -737,6 +927,211 @@ IMPORTANT: The "preview" field must contain actual story text in {story_language
         raise HTTPException(status_code=500, detail=f"Failed to generate branches: {str(e)}")
 
 
+@router.post("/branches/stream")
+async def stream_story_branches(
+    request: BranchingRequest,
+    http_request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Streaming variant of /branches.
+    Preview text of every branch streams as `branch_token` events while the
+    branches generate concurrently, and each branch is sent as a complete
+    `branch` event as soon as it finishes instead of waiting for the slowest.
+    Branches still running at the deadline are cancelled (`branch_timeout`).
+    """
+    setup = await load_branch_setup(db, request)
+    deadline = request.deadline_seconds or settings.branch_deadline_seconds
+    
+    logger.info(
+        f"Streaming {request.num_branches} branches for story in {setup['story_language']} "
+        f"(deadline {deadline}s)"
+    )
+    
+    return StreamingResponse(
+        stream_branches_sse(http_request, request, setup, deadline),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+async def stream_branches_sse(http_request: Request, request: BranchingRequest, setup: dict, deadline: float):
+    """Server-Sent Events for concurrently generated branches"""
+    encoder = SSEEncoder(protocol="events")
+    story = setup["story"]
+    system_prompt, context, prompts = build_branch_prompts(setup, request.num_branches, output_format="text")
+    parsers = [BranchPreviewParser() for _ in range(request.num_branches)]
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def run_branch(i: int) -> dict:
+        stats = {}
+        source = gemini_service.generate_story_content_stream_routed(
+            user_config=setup["user_ai_config"],
+            prompt=prompts[i],
+            system_prompt=system_prompt,
+            writing_mode=WritingMode.CO_AUTHOR,
+            context=context,
+            max_tokens=setup["max_tokens"],
+            temperature_override=0.4,
+            priority=Priority.INTERACTIVE,  # The user is waiting; BATCH leaves one slot per node
+            user_id=story.author_id,
+            prefix_stable=True,
+            stream_stats=stats
+        )
+        try:
+            async for chunk in source:
+                text = parsers[i].feed(chunk)
+                if text:
+                    queue.put_nowait(("token", i, text))
+        finally:
+            await source.aclose()
+        if stats.get("error"):
+            raise RuntimeError(stats["error"])
+        
+        branch = parsers[i].result()
+        if not branch["preview"]:
+            raise RuntimeError("Empty branch preview")
+        return {
+            "id": i+1,
+            "title": branch["title"] or f"Branch {i+1}",
+            "description": branch["description"] or "A new story direction",
+            "tone": BRANCH_TONES[i % len(BRANCH_TONES)],
+            "preview": branch["preview"],
+            "time_to_first_token_ms": stats.get("time_to_first_token_ms"),
+            "total_time_ms": stats.get("total_time_ms")
+        }
+    
+    async def events():
+        loop = asyncio.get_running_loop()
+        deadline_at = loop.time() + deadline
+        tasks = {}
+        for i in range(request.num_branches):
+            task = asyncio.ensure_future(run_branch(i))
+            task.add_done_callback(lambda t, i=i: queue.put_nowait(("finished", i, t)))
+            tasks[i] = task
+        
+        yield encoder.event("start", {
+            "branches": [{"id": i+1, "tone": BRANCH_TONES[i % len(BRANCH_TONES)]} for i in tasks],
+            "deadline_seconds": deadline
+        })
+        
+        outcome = {"completed": [], "failed": [], "timed_out": []}
+        token_buffers = {}  # branch index -> coalesced preview text
+        
+        reported = set()  # branch indexes that got their final event
+        
+        def flush_tokens(i: int):
+            text = "".join(token_buffers.pop(i, []))
+            return encoder.event("branch_token", {"id": i+1, "text": text}) if text else ""
+        
+        def report(i: int, task: asyncio.Task):
+            """Frames for a finished branch: its last preview text, then branch or branch_error"""
+            reported.add(i)
+            frame = flush_tokens(i)
+            if frame:
+                yield frame
+            error = asyncio.CancelledError("Branch generation was cancelled") if task.cancelled() else task.exception()
+            if error is not None:
+                logger.error(f"Branch {i+1} generation failed: {str(error)[:150]}")
+                outcome["failed"].append(i+1)
+                yield encoder.event("branch_error", {"id": i+1, "message": str(error)})
+            else:
+                outcome["completed"].append(i+1)
+                yield encoder.event("branch", task.result())
+        
+        pending = None
+        try:
+            while len(reported) < len(tasks):
+                timeout = deadline_at - loop.time()
+                if timeout <= 0:
+                    break
+                if pending is None:
+                    pending = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({pending}, timeout=min(timeout, encoder.heartbeat))
+                if not done:
+                    if loop.time() < deadline_at:
+                        yield encoder.HEARTBEAT
+                    continue
+                item, pending = pending.result(), None
+                
+                # Coalesce tokens from all branches that arrive within one SSE window
+                batch = [item]
+                if item[0] == "token" and encoder.window > 0:
+                    await asyncio.sleep(encoder.window)
+                while not queue.empty():
+                    batch.append(queue.get_nowait())
+                
+                for kind, i, payload in batch:
+                    if kind == "token":
+                        token_buffers.setdefault(i, []).append(payload)
+                    elif i not in reported:
+                        for frame in report(i, payload):
+                            yield frame
+                
+                for i in list(token_buffers):
+                    frame = flush_tokens(i)
+                    if frame:
+                        yield frame
+            
+            # Deadline reached. Branches may have finished without their "finished"
+            # item being handled yet (still queued, in the pending get, or the done
+            # callback not run); report those from the task itself
+            if pending is not None:
+                if pending.done():
+                    kind, i, payload = pending.result()
+                    if kind == "token":
+                        token_buffers.setdefault(i, []).append(payload)
+                else:
+                    pending.cancel()
+                pending = None
+            while not queue.empty():
+                kind, i, payload = queue.get_nowait()
+                if kind == "token":
+                    token_buffers.setdefault(i, []).append(payload)
+            for i, task in tasks.items():
+                if i in reported:
+                    continue
+                if task.done():
+                    for frame in report(i, task):
+                        yield frame
+                else:
+                    # Cancel what is still running and hand over the partial preview
+                    reported.add(i)
+                    token_buffers.pop(i, None)
+                    task.cancel()
+                    outcome["timed_out"].append(i+1)
+                    yield encoder.event("branch_timeout", {
+                        "id": i+1,
+                        "tone": BRANCH_TONES[i % len(BRANCH_TONES)],
+                        "partial_preview": parsers[i].preview
+                    })
+            
+            logger.info(
+                f"✓ Streamed {len(outcome['completed'])}/{request.num_branches} branches "
+                f"({len(outcome['timed_out'])} timed out, {len(outcome['failed'])} failed)"
+            )
+            yield encoder.event("done", {
+                **outcome,
+                "story_id": str(request.story_id),
+                "chapter_id": str(request.chapter_id)
+            })
+        finally:
+            if pending is not None:
+                pending.cancel()
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+    
+    try:
+        async for frame in iterate_until_disconnect(http_request, events()):
+            yield frame
+    except ClientDisconnected:
+        logger.info("Client disconnected from branch stream; cancelled remaining branches")
+    except Exception as e:
+        logger.error(f"Error in branch streaming: {e}")
+        yield encoder.event("error", {"message": str(e)})
+
+
 @router.post("/branches/select")
 async def select_story_branch(
     story_id: UUID,
@@ -747,17 +1142,15 @@ async def select_story_branch(
     """
     User selects a branch - the preview becomes canon and is added to the chapter.
     """
-    chapter = await chapter_service.get_chapter(db, chapter_id)
+    chapter = await chapter_service.get_chapter(db, chapter_id, include_content=False)
     if not chapter:
         raise HTTPException(status_code=404, detail="Chapter not found")
+    story = await story_service.get_story(db, story_id)
     
-    # Append the selected branch preview to the chapter
-    if chapter.content:
-        chapter.content += "\n\n" + branch_preview
-    else:
-        chapter.content = branch_preview
-    
-    chapter.word_count = len(chapter.content.split())
+    # Append the selected branch preview to the chapter in one UPDATE
+    appended = await chapter_service.append_content(
+        db, chapter_id, branch_preview, (story.language if story else None) or "English", return_content=True
+    )
     await db.commit()
     
     # Embed the updated chapter
@@ -766,7 +1159,7 @@ async def select_story_branch(
             db=db,
             story_id=str(story_id),
             chapter_id=str(chapter_id),
-            content=chapter.content,
+            content=appended["content"],
             chapter_metadata={
                 "title": chapter.title,
                 "number": chapter.number
@@ -778,7 +1171,7 @@ async def select_story_branch(
     return {
         "success": True,
         "chapter_id": str(chapter_id),
-        "new_word_count": chapter.word_count
+        "new_word_count": appended["word_count"]
     }
 
 
@@ -798,6 +1191,7 @@ async def generate_story_from_image(
     story = await story_service.get_story(db, request.story_id)
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
+    set_story_affinity(request.story_id)
     
     # Get story context
     characters = await character_service.get_characters_by_story(db, request.story_id)
@@ -853,7 +1247,7 @@ Write the story content in {story_language}:"""
     }
     
     if request.chapter_id:
-        chapter = await chapter_service.get_chapter(db, request.chapter_id)
+        chapter = await chapter_service.get_chapter(db, request.chapter_id, include_content=False)
         if chapter:
             response_data["chapter_id"] = str(request.chapter_id)
     
@@ -876,6 +1270,7 @@ async def generate_image_from_story(
     story = await story_service.get_story(db, request.story_id)
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
+    set_story_affinity(request.story_id)
     token_limits = await get_user_token_limits(db, story.author_id)
     
     # Get additional context based on image type
@@ -16,12 +16,15 @@ from app.database import get_db
 from app.config import settings
 from app.routes.auth import get_current_user
 from app.services.gemini_service import GeminiService
+from app.services.llm_scheduler import Priority
+from app.services.structured_output import GRAMMAR_CHECK_SCHEMA
 from app.services.prompt_builder import PromptBuilder
 from app.services.consistency_engine import ConsistencyEngine
 from app.services.story_service import StoryService
 from app.services.chapter_service import ChapterService
 from app.services.character_service import CharacterService
 from app.services.token_settings import get_user_token_limits
+from app.services.story_context import story_context_cache
 from app.models.plotline import Plotline, PlotlineStatus
 from app.models.story_bible import StoryBible
 
@@ -80,15 +83,15 @@ async def generate_story_recap(
     db: AsyncSession = Depends(get_db)
 ):
     """Generate comprehensive story recap"""
-    story = await story_service.get_story(db, request.story_id)
+    story, context = await story_context_cache.load(db, request.story_id)
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
-    token_limits = await get_user_token_limits(db, story.author_id)
+    token_limits = context.token_limits
     
-    # Get all chapters, characters, and plotlines
+    # Chapter metadata (the recap uses summaries); characters and plotlines come from the story's context snapshot
     chapters = await chapter_service.get_chapters_by_story(db, request.story_id)
-    characters = await character_service.get_characters_by_story(db, request.story_id)
-    plotlines = await get_all_plotlines(db, request.story_id)
+    characters = list(context.characters)
+    plotlines = list(context.plotlines)
     
     # Build recap prompt
     prompt_parts = prompt_builder.build_recap_prompt(
@@ -164,53 +167,42 @@ Provide detailed, actionable feedback. Focus on:
 """
     
     try:
-        result = await gemini_service.generate_story_content(
+        result = await gemini_service.generate_structured(
             prompt=prompt,
             system_prompt=system_prompt,
-            writing_mode="user_lead",
-            max_tokens=token_limits["max_tokens_grammar"]
+            schema=GRAMMAR_CHECK_SCHEMA,
+            call_site="grammar_check",
+            max_tokens=token_limits["max_tokens_grammar"],
+            priority=Priority.INTERACTIVE,
+            user_id=story.author_id
         )
         
         if not result.get("success"):
             raise HTTPException(status_code=500, detail="Grammar check generation failed")
         
-        response_text = result["content"]
-        
-        # Parse JSON response
-        import json
-        import re
-        
-        # Extract JSON from markdown code blocks if present
-        json_match = re.search(r'```(?:json)?\s*(\{[^`]+\})\s*```', response_text, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(1)
-        else:
-            # Try to find JSON object in the response
-            json_match = re.search(r'\{[\s\S]*"overall_quality"[\s\S]*\}', response_text)
-            if json_match:
-                json_str = json_match.group(0)
-            else:
-                json_str = response_text
+        if not result["parsed"]:
+            logger.error(f"Grammar check JSON parsing failed. Response: {result.get('content', '')[:500]}")
+            # Return a fallback response
+            return {
+                "score": 7,
+                "summary": "Grammar check completed but detailed analysis unavailable",
+                "issues": [],
+                "strengths": ["Analysis completed"],
+                "has_critical_issues": False
+            }
         
-        parsed_result = json.loads(json_str)
+        parsed_result = result["data"]
         
         return {
             "score": parsed_result.get("overall_quality", 8),
             "summary": parsed_result.get("summary", "Analysis complete"),
             "issues": parsed_result.get("issues", []),
             "strengths": parsed_result.get("strengths", []),
-            "has_critical_issues": any(issue.get("severity") == "high" for issue in parsed_result.get("issues", []))
-        }
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON parsing error: {e}\nResponse: {response_text}")
-        # Return a fallback response
-        return {
-            "score": 7,
-            "summary": "Grammar check completed but detailed analysis unavailable",
-            "issues": [],
-            "strengths": ["Analysis completed"],
-            "has_critical_issues": False
+            "has_critical_issues": any(issue.get("severity") == "high" for issue in parsed_result.get("issues", [])),
+            "cache_hit": result.get("cache_hit", False)
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Grammar check error: {e}")
         raise HTTPException(status_code=500, detail=f"Grammar check failed: {str(e)}")
@@ -266,7 +258,8 @@ async def summarize_content(
     
     return {
         "summary": result["content"],
-        "type": request.summary_type
+        "type": request.summary_type,
+        "cache_hit": result.get("cache_hit", False)
     }
 
 
@@ -329,7 +322,7 @@ async def get_story_analysis_stats(
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
     
-    chapters = await chapter_service.get_story_chapters(db, story_id)
+    chapters = await chapter_service.get_chapters_by_story(db, story_id)
     characters = await character_service.get_characters_by_story(db, story_id)
     plotlines = await get_all_plotlines(db, story_id)
     
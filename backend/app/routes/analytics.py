@@ -0,0 +1,151 @@
+"""
+Analytics Routes - Generation performance from generation_history
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, case, and_, cast, Float
+from typing import Optional
+from uuid import UUID
+from datetime import datetime, timedelta
+from enum import Enum
+
+from app.config import settings
+from app.database import get_db
+from app.routes.auth import get_current_user
+from app.models.generation import GenerationHistory
+from app.models.story import Story
+from app.models.user import User
+from app.services.generation_history import generation_recorder
+
+router = APIRouter()
+
+
+class GroupBy(str, Enum):
+    MODEL = "model"
+    PROVIDER = "provider"
+    CALL_SITE = "call_site"
+    USER = "user"
+    DAY = "day"
+
+
+_GROUP_COLUMNS = {
+    GroupBy.MODEL: [GenerationHistory.provider, GenerationHistory.model_used],
+    GroupBy.PROVIDER: [GenerationHistory.provider],
+    GroupBy.CALL_SITE: [GenerationHistory.call_site],
+    GroupBy.USER: [GenerationHistory.user_id],
+    GroupBy.DAY: [func.date_trunc("day", GenerationHistory.created_at)],
+}
+
+
+def _performance_columns():
+    """Aggregates over one group; latency and speed only count calls that did upstream work"""
+    gh = GenerationHistory
+    measured = and_(gh.had_error.is_(False), gh.cancelled.is_(False), gh.cache_hit.is_(False))
+    latency = case((measured, gh.generation_time_ms))
+    queue = case((measured, gh.queue_time_ms))
+    first_token = case((and_(measured, gh.streamed.is_(True)), gh.time_to_first_token_ms))
+    decode_ms = case((measured, gh.generation_time_ms - func.coalesce(gh.queue_time_ms, 0)))
+    finished = func.count().filter(gh.cancelled.is_(False))
+    return [
+        func.count().label("calls"),
+        func.count().filter(gh.had_error.is_(True)).label("failures"),
+        func.count().filter(gh.cancelled.is_(True)).label("cancelled"),
+        func.count().filter(gh.cache_hit.is_(True)).label("cache_hits"),
+        (
+            cast(func.count().filter(gh.had_error.is_(True)), Float) / cast(func.nullif(finished, 0), Float)
+        ).label("failure_rate"),
+        func.percentile_cont(0.5).within_group(latency).label("p50_latency_ms"),
+        func.percentile_cont(0.95).within_group(latency).label("p95_latency_ms"),
+        func.percentile_cont(0.95).within_group(queue).label("p95_queue_ms"),
+        func.percentile_cont(0.5).within_group(first_token).label("p50_time_to_first_token_ms"),
+        (
+            cast(func.sum(case((measured, gh.completion_tokens))), Float)
+            / cast(func.nullif(func.sum(decode_ms), 0), Float) * 1000
+        ).label("tokens_per_second"),
+        func.avg(gh.prompt_tokens).label("avg_prompt_tokens"),
+        func.avg(gh.completion_tokens).label("avg_completion_tokens"),
+        func.avg(func.jsonb_array_length(gh.retrieved_chunks)).label("avg_retrieved_chunks"),
+        func.sum(gh.tokens_used).label("tokens_used"),
+    ]
+
+
+def _row_to_dict(row, keys) -> dict:
+    data = {}
+    for key in keys:
+        value = getattr(row, key)
+        if value is not None and not isinstance(value, int):
+            # Percentiles are floats, averages come back as Decimal
+            value = round(float(value), 3 if key == "failure_rate" else 1)
+        data[key] = value
+    return data
+
+
+@router.get("/generations")
+async def get_generation_analytics(
+    group_by: GroupBy = GroupBy.MODEL,
+    hours: int = Query(24, ge=1, le=24 * 90),
+    story_id: Optional[UUID] = None,
+    user_id: Optional[UUID] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    p50/p95 latency, tokens/sec, failure rate and prompt/retrieval sizes of
+    recorded generations, grouped by model, provider, call site, user or day.
+    Latency and tokens/sec only include successful calls that went upstream
+    (no cache hits, coalesced or cancelled calls); latency includes the
+    scheduler queue wait, tokens/sec does not.
+    Only users listed in ANALYTICS_ADMIN_EMAILS see other users' generations;
+    everyone else gets their own.
+    """
+    is_admin = current_user.email in settings.analytics_admin_emails
+    if not is_admin:
+        if user_id and user_id != current_user.id:
+            raise HTTPException(status_code=403, detail="Not authorized")
+        user_id = current_user.id
+    if story_id:
+        story = await db.get(Story, story_id)
+        if not story:
+            raise HTTPException(status_code=404, detail="Story not found")
+        if story.author_id != current_user.id and not is_admin:
+            raise HTTPException(status_code=403, detail="Not authorized")
+
+    since = datetime.utcnow() - timedelta(hours=hours)
+    filters = [GenerationHistory.created_at >= since]
+    if story_id:
+        filters.append(GenerationHistory.story_id == story_id)
+    if user_id:
+        filters.append(GenerationHistory.user_id == user_id)
+
+    group_columns = _GROUP_COLUMNS[group_by]
+    metrics = _performance_columns()
+    metric_keys = [column.name for column in metrics]
+
+    query = (
+        select(*(c.label(f"group_{i}") for i, c in enumerate(group_columns)), *metrics)
+        .where(*filters)
+        .group_by(*group_columns)
+        .order_by(func.count().desc())
+        .limit(limit)
+    )
+    rows = (await db.execute(query)).all()
+    totals = (await db.execute(select(*metrics).where(*filters))).one()
+
+    groups = []
+    for row in rows:
+        key = [getattr(row, f"group_{i}") for i in range(len(group_columns))]
+        key = [str(k) if isinstance(k, (UUID, datetime)) else k for k in key]
+        if group_by == GroupBy.MODEL:
+            label = {"provider": key[0], "model": key[1]}
+        else:
+            label = {group_by.value: key[0]}
+        groups.append({**label, **_row_to_dict(row, metric_keys)})
+
+    return {
+        "group_by": group_by.value,
+        "since": since.isoformat(),
+        "totals": _row_to_dict(totals, metric_keys),
+        "groups": groups,
+        "recorder": generation_recorder.get_stats(),
+    }
@@ -110,7 +110,7 @@ async def get_audiobook_manifest(
     chapter_list: List[AudiobookChapterInfo] = []
     for ch in chapters:
         ap = _audio_path(story_id, ch.id)
-        wc = ch.word_count or len((ch.content or "").split())
+        wc = ch.word_count or 0
         chapter_list.append(AudiobookChapterInfo(
             id=str(ch.id),
             title=ch.title,
@@ -297,7 +297,7 @@ async def export_audiobook_zip(
     if not story or str(story.author_id) != str(current_user.id):
         raise HTTPException(status_code=404, detail="Story not found")
 
-    chapters = await chapter_service.get_chapters_by_story(db, story_id)
+    chapters = await chapter_service.get_chapters_by_story(db, story_id, include_content=True)
     chapters_with_content = [c for c in chapters if c.content and c.content.strip()]
 
     if not chapters_with_content:
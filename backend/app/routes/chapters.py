@@ -1,8 +1,8 @@
 """
 Chapters Routes - CRUD operations for chapters
 """
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Query
+from pydantic import BaseModel, Field
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from typing import Optional, List
@@ -16,9 +16,12 @@ from app.models.chapter import Chapter, ChapterStatus
 from app.services.chapter_service import ChapterService
 from app.services.story_service import StoryService
 from app.services.gemini_service import GeminiService
+from app.services.llm_scheduler import Priority
 from app.services.memory_service import MemoryService
 from app.services.character_service import CharacterService
 from app.services.token_settings import get_user_token_limits
+from app.services.story_context import story_context_cache
+from app.services.revision_store import revision_store, diff_texts
 from app.routes.auth import get_current_user
 
 logger = logging.getLogger(__name__)
@@ -69,6 +72,7 @@ class ChapterResponse(BaseModel):
     word_count: int
     target_word_count: Optional[int]
     reading_time_minutes: int
+    revision: int
     pov_character_id: Optional[UUID]
     created_at: datetime
     updated_at: datetime
@@ -85,6 +89,7 @@ class ChapterListResponse(BaseModel):
     content: str  # Include content so editor can display it
     status: ChapterStatus
     word_count: int
+    revision: int
     summary: Optional[str]
     updated_at: datetime
 
@@ -92,11 +97,84 @@ class ChapterListResponse(BaseModel):
         from_attributes = True
 
 
+class ChapterMetaResponse(BaseModel):
+    id: UUID
+    title: str
+    number: int
+    order: int
+    status: ChapterStatus
+    word_count: int
+    revision: int
+    summary: Optional[str]
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class ChapterPageResponse(BaseModel):
+    chapters: List[ChapterMetaResponse]
+    next_after: Optional[int]  # Pass as ?after=&after_id= for the next page; both None on the last page
+    next_after_id: Optional[UUID]
+
+
+class ChapterContentResponse(BaseModel):
+    id: UUID
+    story_id: UUID
+    content: str
+    word_count: int
+    revision: int
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
 class ContentUpdate(BaseModel):
     content: str
     append: bool = False
 
 
+class TextOperation(BaseModel):
+    op: str = Field(..., pattern="^(insert|delete)$")
+    pos: int = Field(ge=0)  # Offset in code points into the text as left by the previous operation
+    text: str = ""  # insert
+    count: int = Field(0, ge=0)  # delete
+
+
+class ContentPatch(BaseModel):
+    """Auto-save delta against base_revision: either ops or a diff-match-patch patch (patch_toText, UTF-16 offsets as the JavaScript library makes them)"""
+    base_revision: int
+    ops: Optional[List[TextOperation]] = None
+    patch: Optional[str] = None
+
+
+class ContentPatchResponse(BaseModel):
+    id: UUID
+    revision: int
+    word_count: int
+    reading_time_minutes: int
+    updated_at: datetime
+    changed: dict  # {"start", "end", "removed"}: new text[start:end] replaced `removed` characters
+    content: Optional[str] = None  # Only with ?return_content=true
+
+
+class RevisionResponse(BaseModel):
+    revision: int
+    saved_at: Optional[datetime]
+    length: int  # Characters
+    word_count: Optional[int]
+    kind: str  # snapshot, delta
+    stored_bytes: int
+
+
+class RevisionListResponse(BaseModel):
+    chapter_id: UUID
+    current_revision: int
+    revisions: List[RevisionResponse]  # Kept revisions, newest first
+    stored_bytes: int
+
+
 class ReorderRequest(BaseModel):
     chapter_order: List[UUID]
 
@@ -123,21 +201,11 @@ async def trigger_story_bible_update(story_id: UUID):
                 return
             token_limits = await get_user_token_limits(db, story.author_id)
             
-            # Get all chapters
+            # Get chapter metadata; the text is fetched below only for the chapters that are read
             chapters = await chapter_service.get_chapters_by_story(db, story_id)
             if not chapters:
                 return
             
-            # Calculate total content
-            total_content = ""
-            for chapter in chapters:
-                if chapter.content:
-                    total_content += chapter.content + " "
-            
-            # Need at least 100 chars to do anything meaningful
-            if len(total_content.strip()) < 100:
-                return
-            
             # Check if Story Bible exists
             query = (
                 select(StoryBible)
@@ -151,6 +219,16 @@ async def trigger_story_bible_update(story_id: UUID):
             if not bible or (not bible.world_name and not bible.primary_locations and not bible.central_themes):
                 logger.info(f"📖 Auto-generating initial Story Bible for story {story_id}")
                 
+                # Calculate total content
+                total_content = ""
+                for chapter in await chapter_service.get_chapters_by_ids(db, [c.id for c in chapters]):
+                    if chapter.content:
+                        total_content += chapter.content + " "
+                
+                # Need at least 100 chars to do anything meaningful
+                if len(total_content.strip()) < 100:
+                    return
+                
                 # Create bible if needed
                 if not bible:
                     bible = StoryBible(story_id=story_id)
@@ -174,7 +252,9 @@ async def trigger_story_bible_update(story_id: UUID):
                     story_tone=story.tone.value if story.tone else "neutral",
                     existing_characters=characters_str,
                     language=story.language or "English",
-                    max_tokens=token_limits["max_tokens_story_bible"]
+                    max_tokens=token_limits["max_tokens_story_bible"],
+                    priority=Priority.BACKGROUND,
+                    user_id=story.author_id
                 )
                 
                 if result.get("success") and result.get("parsed") and result.get("bible_data"):
@@ -237,7 +317,7 @@ async def trigger_story_bible_update(story_id: UUID):
                 
                 # Get recent content (last 2 chapters)
                 recent_content = ""
-                for chapter in chapters[-2:]:
+                for chapter in await chapter_service.get_chapters_by_ids(db, [c.id for c in chapters[-2:]]):
                     if chapter.content:
                         recent_content += f"\n\n{chapter.content}"
                 
@@ -257,7 +337,9 @@ async def trigger_story_bible_update(story_id: UUID):
                         existing_bible=existing_bible,
                         story_genre=story.genre.value if story.genre else "general",
                         language=story.language or "English",
-                        max_tokens=token_limits["max_tokens_story_bible_update"]
+                        max_tokens=token_limits["max_tokens_story_bible_update"],
+                        priority=Priority.BACKGROUND,
+                        user_id=story.author_id
                     )
                     
                     if result.get("success") and result.get("parsed"):
@@ -323,6 +405,7 @@ async def trigger_story_bible_update(story_id: UUID):
             except Exception as e:
                 logger.warning(f"Failed to embed story bible: {e}")
             
+            await story_context_cache.bump(db, story_id)
             await db.commit()
             
     except Exception as e:
@@ -379,7 +462,8 @@ async def create_chapter(
         title=chapter_data.title,
         content=chapter_data.content,
         outline=chapter_data.outline,
-        notes=chapter_data.notes
+        notes=chapter_data.notes,
+        language=story.language or "English"
     )
     
     return ChapterResponse.model_validate(chapter)
@@ -397,10 +481,64 @@ async def list_chapters(
     if not story or story.author_id != current_user.id:
         raise HTTPException(status_code=404, detail="Story not found")
     
-    chapters = await chapter_service.get_chapters_by_story(db, story_id)
+    chapters = await chapter_service.get_chapters_by_story(db, story_id, include_content=True)
     return [ChapterListResponse.model_validate(c) for c in chapters]
 
 
+@router.get("/story/{story_id}/meta", response_model=ChapterPageResponse)
+async def list_chapter_metadata(
+    story_id: UUID,
+    after: Optional[int] = Query(None, description="order of the last chapter already received"),
+    after_id: Optional[UUID] = Query(None, description="id of the last chapter already received"),
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """List a story's chapters without their text, one page at a time"""
+    # Verify story ownership
+    story = await story_service.get_story(db, story_id)
+    if not story or story.author_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Story not found")
+    
+    if (after is None) != (after_id is None):
+        raise HTTPException(status_code=400, detail="after and after_id must be given together")
+    
+    chapters = await chapter_service.list_chapters_page(
+        db, story_id, (after, after_id) if after is not None else None, limit
+    )
+    last = chapters[-1] if len(chapters) == limit else None
+    return ChapterPageResponse(
+        chapters=[ChapterMetaResponse.model_validate(c) for c in chapters],
+        next_after=last.order if last else None,
+        next_after_id=last.id if last else None
+    )
+
+
+@router.get("", response_model=List[ChapterContentResponse])
+async def get_chapter_contents(
+    ids: List[str] = Query(..., description="Chapter ids, comma-separated or repeated"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Fetch the text of several chapters in one request, in the order given"""
+    try:
+        chapter_ids = list(dict.fromkeys(UUID(i.strip()) for value in ids for i in value.split(",") if i.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be chapter UUIDs")
+    if len(chapter_ids) > 100:
+        raise HTTPException(status_code=400, detail="At most 100 chapters per request")
+    
+    chapters = await chapter_service.get_chapters_by_ids(db, chapter_ids)
+    
+    # Verify story ownership
+    for story_id in {c.story_id for c in chapters}:
+        story = await story_service.get_story(db, story_id)
+        if not story or story.author_id != current_user.id:
+            raise HTTPException(status_code=403, detail="Not authorized")
+    
+    return [ChapterContentResponse.model_validate(c) for c in chapters]
+
+
 @router.get("/{chapter_id}", response_model=ChapterResponse)
 async def get_chapter(
     chapter_id: UUID,
@@ -444,12 +582,9 @@ async def update_chapter(
         raise HTTPException(status_code=400, detail="Chapter is locked")
     
     updated = await chapter_service.update_chapter(
-        db, chapter_id, updates.model_dump(exclude_unset=True)
+        db, chapter_id, updates.model_dump(exclude_unset=True), language=story.language or "English"
     )
     
-    # Update story word count
-    await story_service.update_word_count(db, story.id)
-    
     # Auto-embed chapter content if content was changed
     if updates.content is not None and len(updates.content) > 100:
         try:
@@ -484,7 +619,7 @@ async def update_chapter_content(
     db: AsyncSession = Depends(get_db)
 ):
     """Update chapter content specifically (for auto-save)"""
-    chapter = await chapter_service.get_chapter(db, chapter_id)
+    chapter = await chapter_service.get_chapter(db, chapter_id, include_content=not content_update.append)
     
     if not chapter:
         raise HTTPException(status_code=404, detail="Chapter not found")
@@ -498,12 +633,9 @@ async def update_chapter_content(
         raise HTTPException(status_code=400, detail="Chapter is locked")
     
     updated = await chapter_service.update_chapter_content(
-        db, chapter_id, content_update.content, content_update.append
+        db, chapter_id, content_update.content, content_update.append, language=story.language or "English"
     )
     
-    # Update story word count
-    await story_service.update_word_count(db, story.id)
-    
     # Auto-embed chapter content
     if len(content_update.content) > 100:
         try:
@@ -527,7 +659,196 @@ async def update_chapter_content(
     # Schedule Story Bible update if there's substantial content
     if len(content_update.content) > 200:
         schedule_story_bible_update(story.id, delay_seconds=120)
-    
+
+    return ChapterResponse.model_validate(updated)
+
+
+@router.patch("/{chapter_id}/content", response_model=ContentPatchResponse)
+async def patch_chapter_content(
+    chapter_id: UUID,
+    content_patch: ContentPatch,
+    return_content: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Auto-save with a delta instead of the whole chapter. The patch is made
+    against base_revision (the revision returned by the last save or read);
+    if the chapter has moved on since, nothing is written and 409 carries
+    the current revision so the client can reload and re-diff.
+    """
+    if (content_patch.ops is None) == (content_patch.patch is None):
+        raise HTTPException(status_code=400, detail="Send exactly one of 'ops' or 'patch'")
+
+    chapter = await chapter_service.get_chapter(db, chapter_id, include_content=False)
+
+    if not chapter:
+        raise HTTPException(status_code=404, detail="Chapter not found")
+
+    # Verify story ownership
+    story = await story_service.get_story(db, chapter.story_id)
+    if not story or story.author_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    if chapter.is_locked:
+        raise HTTPException(status_code=400, detail="Chapter is locked")
+
+    result = await chapter_service.patch_content(
+        db,
+        chapter_id,
+        content_patch.base_revision,
+        operations=[op.model_dump() for op in content_patch.ops] if content_patch.ops is not None else None,
+        patch_text=content_patch.patch,
+        language=story.language or "English"
+    )
+    if result is None:
+        raise HTTPException(status_code=404, detail="Chapter not found")
+    if not result["success"]:
+        if result["error"] == "revision_conflict":
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Chapter was changed by another save", "revision": result["revision"]}
+            )
+        raise HTTPException(status_code=422, detail=result["error"])
+
+    changed = result["changed"]
+    content = result["content"]
+    if changed["end"] > changed["start"] or changed["removed"]:
+        # Re-embed the chapter; chunks outside the edit keep their vectors
+        if len(content) > 100:
+            try:
+                characters = await character_service.get_characters_by_story(db, story.id)
+                await memory_service.update_embeddings_for_edit(
+                    db=db,
+                    story_id=str(story.id),
+                    chapter_id=str(chapter_id),
+                    content=content,
+                    chapter_metadata={
+                        "title": chapter.title,
+                        "number": chapter.number,
+                        "characters": [c.name for c in characters] if characters else []
+                    },
+                    changed=changed
+                )
+            except Exception as e:
+                logger.warning(f"Failed to auto-embed chapter: {e}")
+
+        # Schedule Story Bible update if there's substantial content
+        if len(content) > 200:
+            schedule_story_bible_update(story.id, delay_seconds=120)
+
+    return ContentPatchResponse(
+        id=chapter_id,
+        revision=result["revision"],
+        word_count=result["word_count"] or 0,
+        reading_time_minutes=result["reading_time_minutes"] or 0,
+        updated_at=result["updated_at"],
+        changed=changed,
+        content=content if return_content else None
+    )
+
+
+async def get_owned_chapter(db: AsyncSession, chapter_id: UUID, user: User) -> Chapter:
+    """The chapter without its text, after the 404 and ownership checks"""
+    chapter = await chapter_service.get_chapter(db, chapter_id, include_content=False)
+    if not chapter:
+        raise HTTPException(status_code=404, detail="Chapter not found")
+    story = await story_service.get_story(db, chapter.story_id)
+    if not story or story.author_id != user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return chapter
+
+
+@router.get("/{chapter_id}/revisions", response_model=RevisionListResponse)
+async def list_revisions(
+    chapter_id: UUID,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Kept revisions of a chapter's text (recent saves are coalesced, old ones thinned)"""
+    chapter = await get_owned_chapter(db, chapter_id, current_user)
+    revisions = await revision_store.list_revisions(db, chapter_id)
+    return RevisionListResponse(
+        chapter_id=chapter_id,
+        current_revision=chapter.revision,
+        revisions=revisions,
+        stored_bytes=sum(r["stored_bytes"] for r in revisions)
+    )
+
+
+@router.get("/{chapter_id}/revisions/{revision}")
+async def get_revision(
+    chapter_id: UUID,
+    revision: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Text of one revision"""
+    await get_owned_chapter(db, chapter_id, current_user)
+    content = await revision_store.get_text(db, chapter_id, revision)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return {"chapter_id": chapter_id, "revision": revision, "content": content}
+
+
+@router.get("/{chapter_id}/revisions/{revision}/diff")
+async def diff_revision(
+    chapter_id: UUID,
+    revision: int,
+    against: Optional[int] = Query(None, description="Revision to compare with; defaults to the current text"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Word-level changes from `revision` to `against`"""
+    chapter = await get_owned_chapter(db, chapter_id, current_user)
+    against = chapter.revision if against is None else against
+    old = await revision_store.get_text(db, chapter_id, revision)
+    new = await revision_store.get_text(db, chapter_id, against)
+    if old is None or new is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return {
+        "chapter_id": chapter_id,
+        "from_revision": revision,
+        "to_revision": against,
+        "ops": diff_texts(old, new),
+    }
+
+
+@router.post("/{chapter_id}/revisions/{revision}/restore", response_model=ChapterResponse)
+async def restore_revision(
+    chapter_id: UUID,
+    revision: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Make an old revision the chapter's text; the text it replaces is kept as a revision too"""
+    chapter = await get_owned_chapter(db, chapter_id, current_user)
+    if chapter.is_locked:
+        raise HTTPException(status_code=400, detail="Chapter is locked")
+
+    content = await revision_store.get_text(db, chapter_id, revision)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+
+    updated = await chapter_service.update_chapter_content(db, chapter_id, content)
+
+    if len(content) > 100:
+        try:
+            characters = await character_service.get_characters_by_story(db, chapter.story_id)
+            await memory_service.embed_chapter(
+                db=db,
+                story_id=str(chapter.story_id),
+                chapter_id=str(chapter_id),
+                content=content,
+                chapter_metadata={
+                    "title": updated.title,
+                    "number": updated.number,
+                    "characters": [c.name for c in characters] if characters else []
+                }
+            )
+        except Exception as e:
+            logger.warning(f"Failed to auto-embed chapter: {e}")
+
     return ChapterResponse.model_validate(updated)
 
 
@@ -538,7 +859,7 @@ async def delete_chapter(
     db: AsyncSession = Depends(get_db)
 ):
     """Delete a chapter"""
-    chapter = await chapter_service.get_chapter(db, chapter_id)
+    chapter = await chapter_service.get_chapter(db, chapter_id, include_content=False)
     
     if not chapter:
         raise HTTPException(status_code=404, detail="Chapter not found")
@@ -551,7 +872,7 @@ async def delete_chapter(
     await chapter_service.delete_chapter(db, chapter_id)
 
 
-@router.post("/story/{story_id}/reorder", response_model=List[ChapterListResponse])
+@router.post("/story/{story_id}/reorder", response_model=List[ChapterMetaResponse])
 async def reorder_chapters(
     story_id: UUID,
     reorder: ReorderRequest,
@@ -565,7 +886,7 @@ async def reorder_chapters(
         raise HTTPException(status_code=404, detail="Story not found")
     
     chapters = await chapter_service.reorder_chapters(db, story_id, reorder.chapter_order)
-    return [ChapterListResponse.model_validate(c) for c in chapters]
+    return [ChapterMetaResponse.model_validate(c) for c in chapters]
 
 
 @router.get("/{chapter_id}/context")
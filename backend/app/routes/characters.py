@@ -18,6 +18,7 @@ from app.services.memory_service import MemoryService
 from app.services.gemini_service import GeminiService
 from app.services.chapter_service import ChapterService
 from app.services.token_settings import get_user_token_limits
+from app.services.story_context import story_context_cache
 from app.routes.auth import get_current_user
 import logging
 
@@ -189,6 +190,7 @@ async def create_character(
         db=db,
         **character_data.model_dump()
     )
+    await story_context_cache.bump(db, character.story_id)
     
     # Embed character for semantic search (RAG)
     try:
@@ -279,6 +281,7 @@ async def update_character(
     updated = await character_service.update_character(
         db, character_id, updates.model_dump(exclude_unset=True)
     )
+    await story_context_cache.bump(db, character.story_id)
     
     # Re-embed character with updated data (RAG)
     try:
@@ -328,6 +331,7 @@ async def update_character_state(
     updated = await character_service.update_character_state(
         db, character_id, **state.model_dump(exclude_unset=True)
     )
+    await story_context_cache.bump(db, character.story_id)
     
     return CharacterResponse.model_validate(updated)
 
@@ -362,6 +366,7 @@ async def add_relationship(
         relationship.relationship_type,
         relationship.description
     )
+    await story_context_cache.bump(db, character.story_id)
     
     return CharacterResponse.model_validate(updated)
 
@@ -384,6 +389,7 @@ async def delete_character(
         raise HTTPException(status_code=403, detail="Not authorized")
     
     await character_service.delete_character(db, character_id)
+    await story_context_cache.bump(db, character.story_id)
 
 
 # Map string roles to CharacterRole enum
@@ -424,7 +430,7 @@ async def extract_characters_from_story(
             raise HTTPException(status_code=403, detail="Not authorized")
         
         # Get all chapters content
-        chapters = await chapter_service.get_chapters_by_story(db, story_id)
+        chapters = await chapter_service.get_chapters_by_story(db, story_id, include_content=True)
         if not chapters:
             raise HTTPException(
                 status_code=400, 
@@ -463,7 +469,8 @@ async def extract_characters_from_story(
             story_genre=story.genre.value if story.genre else "general",
             existing_character_names=[c.name for c in existing_characters],
             language=story.language or "English",
-            max_tokens=token_limits["max_tokens_character_extraction"]
+            max_tokens=token_limits["max_tokens_character_extraction"],
+            user_id=current_user.id
         )
         
         logger.info(f"AI extraction result: success={result.get('success')}, parsed={result.get('parsed')}")
@@ -564,6 +571,8 @@ async def extract_characters_from_story(
                 logger.warning(f"Failed to create character {char_name}: {e}")
                 skipped.append(char_name)
         
+        if created_characters:
+            await story_context_cache.bump(db, story_id)
         await db.commit()
         
         logger.info(f"✓ Character extraction complete: {len(created_characters)} created, {len(skipped)} skipped")
@@ -573,7 +582,8 @@ async def extract_characters_from_story(
             "message": f"Extracted {len(created_characters)} new characters from your story",
             "created": created_characters,
             "skipped": skipped,
-            "total_analyzed": result.get("total_found", 0)
+            "total_analyzed": result.get("total_found", 0),
+            "cache_hit": result.get("cache_hit", False)
         }
     
     except HTTPException:
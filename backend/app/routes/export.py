@@ -237,7 +237,7 @@ async def export_markdown(
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
     
-    chapters = await chapter_service.get_chapters_by_story(db, story_id)
+    chapters = await chapter_service.get_chapters_by_story(db, story_id, include_content=True)
     
     # Build markdown content
     md_content = f"# {story.title}\n\n"
@@ -289,7 +289,7 @@ async def export_plain_text(
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
     
-    chapters = await chapter_service.get_chapters_by_story(db, story_id)
+    chapters = await chapter_service.get_chapters_by_story(db, story_id, include_content=True)
     
     # Build plain text content
     text_content = f"{story.title.upper()}\n"
@@ -333,7 +333,7 @@ async def export_docx(
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
     
-    chapters = await chapter_service.get_chapters_by_story(db, story_id)
+    chapters = await chapter_service.get_chapters_by_story(db, story_id, include_content=True)
     
     # Create a new Document
     doc = Document()
@@ -502,7 +502,7 @@ async def export_epub(
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
     
-    chapters = await chapter_service.get_chapters_by_story(db, story_id)
+    chapters = await chapter_service.get_chapters_by_story(db, story_id, include_content=True)
     
     # Create EPUB book
     book = epub.EpubBook()
@@ -633,7 +633,7 @@ async def export_pdf(
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
     
-    chapters = await chapter_service.get_chapters_by_story(db, story_id)
+    chapters = await chapter_service.get_chapters_by_story(db, story_id, include_content=True)
     
     # Create PDF buffer
     buffer = io.BytesIO()
@@ -803,7 +803,7 @@ async def export_json(
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
     
-    chapters = await chapter_service.get_chapters_by_story(db, story_id)
+    chapters = await chapter_service.get_chapters_by_story(db, story_id, include_content=True)
     
     export_data = {
         "title": story.title,
@@ -869,7 +869,7 @@ async def export_outline(
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
     
-    chapters = await chapter_service.get_chapters_by_story(db, story_id)
+    chapters = await chapter_service.get_chapters_by_story(db, story_id, include_content=True)
     
     # Load characters and plotlines using direct queries
     char_result = await db.execute(
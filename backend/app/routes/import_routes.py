@@ -103,7 +103,7 @@ async def import_story(
             'themes': []
         }
     else:
-        extractor = StoryExtractor()
+        extractor = StoryExtractor(user_id=current_user.id)
         try:
             token_limits = await get_user_token_limits(db, current_user.id)
             max_tokens = token_limits.get("max_tokens_import_story", settings.max_tokens_import_story)
@@ -77,7 +77,7 @@ async def embed_all_chapters(
     db: AsyncSession = Depends(get_db)
 ):
     """Embed all chapters in a story"""
-    chapters = await chapter_service.get_story_chapters(db, request.story_id)
+    chapters = await chapter_service.get_chapters_by_story(db, request.story_id, include_content=True)
     
     if not chapters:
         return {"message": "No chapters found", "count": 0}
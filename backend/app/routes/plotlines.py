@@ -13,6 +13,7 @@ from app.database import get_db
 from app.models.user import User
 from app.models.plotline import Plotline, PlotlineType, PlotlineStatus
 from app.services.story_service import StoryService
+from app.services.story_context import story_context_cache
 from app.routes.auth import get_current_user
 
 router = APIRouter()
@@ -136,6 +137,7 @@ async def create_plotline(
     
     db.add(plotline)
     await db.flush()
+    await story_context_cache.bump(db, plotline.story_id)
     
     return PlotlineResponse.model_validate(plotline)
 
@@ -216,6 +218,7 @@ async def update_plotline(
     
     plotline.updated_at = datetime.utcnow()
     await db.flush()
+    await story_context_cache.bump(db, plotline.story_id)
     
     return PlotlineResponse.model_validate(plotline)
 
@@ -245,6 +248,7 @@ async def add_plot_point(
     plotline.plot_points = sorted(plot_points, key=lambda x: x["order"])
     plotline.updated_at = datetime.utcnow()
     await db.flush()
+    await story_context_cache.bump(db, plotline.story_id)
     
     return PlotlineResponse.model_validate(plotline)
 
@@ -269,6 +273,7 @@ async def add_open_question(
     plotline.open_questions = questions
     
     await db.flush()
+    await story_context_cache.bump(db, plotline.story_id)
     
     return {"message": "Question added", "questions": questions}
 
@@ -288,3 +293,4 @@ async def delete_plotline(
         raise HTTPException(status_code=403, detail="Not authorized")
     
     await db.delete(plotline)
+    await story_context_cache.bump(db, plotline.story_id)
@@ -19,6 +19,7 @@ from app.services.gemini_service import GeminiService
 from app.services.chapter_service import ChapterService
 from app.services.character_service import CharacterService
 from app.services.token_settings import get_user_token_limits
+from app.services.story_context import story_context_cache
 from app.routes.auth import get_current_user
 import logging
 import traceback
@@ -168,6 +169,7 @@ async def get_or_create_story_bible(db: AsyncSession, story_id: UUID) -> StoryBi
         bible = StoryBible(story_id=story_id)
         db.add(bible)
         await db.flush()
+        await story_context_cache.bump(db, story_id)
         await db.refresh(bible)
     
     return bible
@@ -333,6 +335,7 @@ async def update_story_bible(
     
     bible.updated_at = datetime.utcnow()
     await db.flush()
+    await story_context_cache.bump(db, story_id)
     
     # Refresh to get rules
     await db.refresh(bible)
@@ -375,6 +378,7 @@ async def create_world_rule(
     
     db.add(rule)
     await db.flush()
+    await story_context_cache.bump(db, story_id)
     
     return WorldRuleResponse.model_validate(rule)
 
@@ -431,6 +435,7 @@ async def update_world_rule(
     
     rule.updated_at = datetime.utcnow()
     await db.flush()
+    await story_context_cache.bump(db, bible.story_id)
     
     return WorldRuleResponse.model_validate(rule)
 
@@ -459,6 +464,7 @@ async def delete_world_rule(
         raise HTTPException(status_code=403, detail="Not authorized")
     
     await db.delete(rule)
+    await story_context_cache.bump(db, bible.story_id)
 
 
 @router.post("/story/{story_id}/locations")
@@ -488,6 +494,7 @@ async def add_location(
     bible.updated_at = datetime.utcnow()
     
     await db.flush()
+    await story_context_cache.bump(db, story_id)
     
     return {"message": "Location added", "locations": locations}
 
@@ -514,6 +521,7 @@ async def add_glossary_term(
     bible.updated_at = datetime.utcnow()
     
     await db.flush()
+    await story_context_cache.bump(db, story_id)
     
     return {"message": "Term added", "glossary": glossary}
 
@@ -551,7 +559,7 @@ async def _do_generate_story_bible(
         raise HTTPException(status_code=404, detail="Story not found")
     
     # Get all chapters content
-    chapters = await chapter_service.get_chapters_by_story(db, story_id)
+    chapters = await chapter_service.get_chapters_by_story(db, story_id, include_content=True)
     if not chapters:
         raise HTTPException(
             status_code=400, 
@@ -598,7 +606,8 @@ async def _do_generate_story_bible(
         story_content=all_content,
         story_title=story.title,
         story_genre=enum_val(story.genre, "general"),
-        max_tokens=token_limits["max_tokens_story_bible"]
+        max_tokens=token_limits["max_tokens_story_bible"],
+        user_id=current_user.id
     )
 
     # If parse failed, try the full prompt with even shorter content (300 chars)
@@ -612,7 +621,8 @@ async def _do_generate_story_bible(
             story_tone=enum_val(story.tone, "neutral"),
             existing_characters=characters_str,
             language=story.language or "English",
-            max_tokens=token_limits["max_tokens_story_bible"]
+            max_tokens=token_limits["max_tokens_story_bible"],
+            user_id=current_user.id
         )
 
     if not result.get("success"):
@@ -627,28 +637,19 @@ async def _do_generate_story_bible(
             detail=f"Failed to generate Story Bible: {error_msg}"
         )
 
-    # If still no valid JSON, try harder before falling back to minimal bible
+    # Schema-constrained output already went through JSON repair; fall back to a minimal bible
     if not result.get("parsed") or not result.get("bible_data"):
-        raw = result.get("content", "")
-        # Last-chance: attempt to parse the raw content directly
-        # (handles case where simple prompt succeeded but parser missed it)
-        last_chance = gemini_service._parse_json_from_text(raw) if raw else None
-        if last_chance and isinstance(last_chance, dict):
-            logger.info(f"Story Bible last-chance JSON parse succeeded for story {story_id}")
-            result["bible_data"] = last_chance
-            result["parsed"] = True
-        else:
-            logger.warning(f"Story Bible JSON parse failed for story {story_id}. Building minimal bible.")
-            # Don't put raw JSON text into world_description
-            bible_data = {
-                "world_description": "Generated from story content. Edit to add details.",
-                "world_type": enum_val(story.genre, "general"),
-                "central_themes": [],
-                "quick_facts": [],
-                "glossary": [],
-                "world_rules": [],
-                "primary_locations": [],
-            }
+        logger.warning(f"Story Bible JSON parse failed for story {story_id}. Building minimal bible.")
+        # Don't put raw JSON text into world_description
+        bible_data = {
+            "world_description": "Generated from story content. Edit to add details.",
+            "world_type": enum_val(story.genre, "general"),
+            "central_themes": [],
+            "quick_facts": [],
+            "glossary": [],
+            "world_rules": [],
+            "primary_locations": [],
+        }
 
     if result.get("parsed") and result.get("bible_data"):
         bible_data = result["bible_data"]
@@ -725,6 +726,7 @@ async def _do_generate_story_bible(
     
     bible.updated_at = datetime.utcnow()
     await db.flush()
+    await story_context_cache.bump(db, story_id)
     await db.commit()
 
     # Reload bible with world_rules eagerly loaded (db.refresh doesn't load relationships)
@@ -767,10 +769,11 @@ async def update_story_bible_from_new_content(
     # Get existing bible
     bible = await get_or_create_story_bible(db, story_id)
     
-    # Get recent chapter content (last 2 chapters)
+    # Get recent chapter content (last 2 chapters); only their text is fetched
     chapters = await chapter_service.get_chapters_by_story(db, story_id)
+    recent_chapters = await chapter_service.get_chapters_by_ids(db, [c.id for c in chapters[-2:]])
     recent_content = ""
-    for chapter in chapters[-2:]:
+    for chapter in recent_chapters:
         if chapter.content:
             recent_content += f"\n\n{chapter.content}"
     
@@ -794,7 +797,8 @@ async def update_story_bible_from_new_content(
         existing_bible=existing_bible,
         story_genre=story.genre.value if story.genre else "general",
         language=story.language or "English",
-        max_tokens=token_limits["max_tokens_story_bible_update"]
+        max_tokens=token_limits["max_tokens_story_bible_update"],
+        user_id=current_user.id
     )
     
     if not result.get("success") or not result.get("parsed"):
@@ -860,6 +864,7 @@ async def update_story_bible_from_new_content(
     if added_items:
         bible.updated_at = datetime.utcnow()
         await db.flush()
+        await story_context_cache.bump(db, story_id)
         
         # Re-embed story bible
         try:
@@ -2,7 +2,6 @@
 User Settings Routes - per-user AI token limits
 """
 from fastapi import APIRouter, Depends, HTTPException
-import httpx
 from pydantic import BaseModel, Field
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
@@ -15,8 +14,10 @@ from app.models.user import User
 from app.models.user_ai_settings import UserAiSettings
 from app.models.user_api_keys import UserApiKeys
 from app.services.token_settings import TOKEN_LIMIT_FIELDS, get_default_token_limits
-from app.runtime_settings import get_runtime_model_name, set_runtime_model_name
-from app.config import settings
+from app.services.model_lifecycle import model_lifecycle
+from app.services.ollama_pool import ollama_pool
+from app.services.story_context import story_context_cache
+from app.runtime_settings import get_runtime_model_name
 
 router = APIRouter()
 
@@ -54,6 +55,7 @@ class ModelListResponse(BaseModel):
 
 class ModelResponse(BaseModel):
     current_model: str
+    pending_model: Optional[str] = None  # Being loaded; becomes current_model once ready
 
 
 def build_response(defaults: Dict[str, int], overrides: Optional[UserAiSettings]) -> AiTokenSettingsResponse:
@@ -104,6 +106,7 @@ async def update_ai_token_settings(
     for field, value in update_data.items():
         setattr(settings_row, field, value)
 
+    await story_context_cache.bump_author(db, current_user.id)
     await db.commit()
     await db.refresh(settings_row)
 
@@ -115,12 +118,7 @@ async def list_available_models(
     current_user: User = Depends(get_current_user)
 ):
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(f"{settings.ollama_base_url}/api/tags")
-            response.raise_for_status()
-            data = response.json()
-            models = [m.get("name") for m in data.get("models", []) if m.get("name")]
-            return ModelListResponse(models=models)
+        return ModelListResponse(models=await ollama_pool.list_models())
     except Exception as exc:
         raise HTTPException(status_code=502, detail=f"Failed to fetch Ollama models: {exc}")
 
@@ -129,7 +127,7 @@ async def list_available_models(
 async def get_current_model(
     current_user: User = Depends(get_current_user)
 ):
-    return ModelResponse(current_model=get_runtime_model_name())
+    return ModelResponse(current_model=get_runtime_model_name(), pending_model=model_lifecycle.get_pending_model())
 
 
 @router.patch("/model", response_model=ModelResponse)
@@ -139,21 +137,18 @@ async def update_current_model(
 ):
     # Validate against Ollama model list when possible
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(f"{settings.ollama_base_url}/api/tags")
-            response.raise_for_status()
-            data = response.json()
-            available = {m.get("name") for m in data.get("models", []) if m.get("name")}
-            if available and update.model not in available:
-                raise HTTPException(status_code=400, detail="Model not found in Ollama")
+        available = set(await ollama_pool.list_models())
+        if available and update.model not in available:
+            raise HTTPException(status_code=400, detail="Model not found in Ollama")
     except HTTPException:
         raise
     except Exception:
         # If Ollama is unreachable, allow switching and let generation errors surface later.
         pass
 
-    set_runtime_model_name(update.model)
-    return ModelResponse(current_model=get_runtime_model_name())
+    # Requests keep using the current model until the new one is loaded
+    pending = model_lifecycle.switch_model(update.model)
+    return ModelResponse(current_model=get_runtime_model_name(), pending_model=pending)
 
 
 # ─── External API provider routes ─────────────────────────────────────────────
@@ -266,6 +261,7 @@ async def save_api_key(
         )
         db.add(row)
 
+    await story_context_cache.bump_author(db, current_user.id)
     await db.commit()
     return {"ok": True, "provider": req.provider}
 
@@ -287,6 +283,7 @@ async def delete_api_key(
         raise HTTPException(status_code=404, detail="Key not found")
 
     await db.delete(row)
+    await story_context_cache.bump_author(db, current_user.id)
     await db.commit()
     return {"ok": True}
 
@@ -309,6 +306,7 @@ async def update_provider_model(
         raise HTTPException(status_code=404, detail="No key saved for this provider")
 
     row.preferred_model = update.model
+    await story_context_cache.bump_author(db, current_user.id)
     await db.commit()
     return {"ok": True, "model": update.model}
 
@@ -334,6 +332,7 @@ async def activate_provider(
             raise HTTPException(status_code=404, detail=f"No key saved for {req.provider}")
         target.is_active = True
 
+    await story_context_cache.bump_author(db, current_user.id)
     await db.commit()
     return {"ok": True, "active_provider": req.provider}
 async def reset_ai_token_settings(
@@ -346,6 +345,7 @@ async def reset_ai_token_settings(
 
     if settings_row:
         await db.delete(settings_row)
+        await story_context_cache.bump_author(db, current_user.id)
         await db.commit()
 
     return build_response(defaults, None)
@@ -455,6 +455,7 @@ async def upsert_api_key(
         )
         db.add(row)
 
+    await story_context_cache.bump_author(db, current_user.id)
     await db.commit()
     return {"ok": True, "provider": body.provider, "model": model}
 
@@ -476,6 +477,7 @@ async def delete_api_key(
     if not row:
         raise HTTPException(status_code=404, detail="No key found for this provider")
     await db.delete(row)
+    await story_context_cache.bump_author(db, current_user.id)
     await db.commit()
     return {"ok": True}
 
@@ -501,6 +503,7 @@ async def update_provider_model(
     if not model:
         raise HTTPException(status_code=400, detail="model is required")
     row.preferred_model = model
+    await story_context_cache.bump_author(db, current_user.id)
     await db.commit()
     return {"ok": True, "model": model}
 
@@ -543,6 +546,7 @@ async def activate_provider(
             )
         row.is_active = True
 
+    await story_context_cache.bump_author(db, current_user.id)
     await db.commit()
     return {"ok": True, "active_provider": body.provider}
 
@@ -1,15 +1,25 @@
 """
 Chapter Service - Business logic for chapter management
 """
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from uuid import UUID
 from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select, update, func, case, literal, tuple_
+from sqlalchemy.orm import selectinload, undefer
+from sqlalchemy.orm.attributes import set_committed_value
 
 from app.models.chapter import Chapter, ChapterStatus
 from app.models.story import Story
+from app.services.text_utils import count_words, get_reading_time, reading_speed, continues_word
+from app.services.content_patch import (
+    PatchError, apply_operations, apply_dmp_patch, changed_span, word_count_delta
+)
+from app.services.revision_store import revision_store
+from app.services.story_service import StoryService, story_languages
+
+
+story_service = StoryService()
 
 
 class ChapterService:
@@ -22,9 +32,10 @@ class ChapterService:
         title: str,
         content: str = "",
         outline: Optional[str] = None,
-        notes: Optional[str] = None
+        notes: Optional[str] = None,
+        language: Optional[str] = None
     ) -> Chapter:
-        """Create a new chapter"""
+        """Create a new chapter; language defaults to the story's"""
         # Get next chapter number
         next_number = await self._get_next_chapter_number(db, story_id)
         
@@ -39,70 +50,130 @@ class ChapterService:
             status=ChapterStatus.DRAFT
         )
         
-        # Get story language for word counting
-        story_query = select(Story).where(Story.id == story_id)
-        story_result = await db.execute(story_query)
-        story = story_result.scalar_one_or_none()
-        language = story.language if story else "English"
-        
-        # Calculate word count with language
+        # Calculate word count with the story language
+        language = language or await story_languages.get(db, story_id)
         chapter.calculate_word_count(language)
         
         db.add(chapter)
         await db.flush()
         
-        # Update story chapter count
+        # Update story chapter count and word count
         await self._update_story_chapter_count(db, story_id)
+        if chapter.word_count:
+            await story_service.adjust_word_count(db, story_id, chapter.word_count)
         
         return chapter
     
     async def get_chapter(
         self,
         db: AsyncSession,
-        chapter_id: UUID
+        chapter_id: UUID,
+        include_content: bool = True,
+        for_update: bool = False
     ) -> Optional[Chapter]:
-        """Get a chapter by ID"""
+        """
+        Get a chapter by ID; include_content=False leaves the text in the database.
+        for_update locks the row until the transaction ends and re-reads it
+        even if the chapter is already loaded in this session.
+        """
         query = select(Chapter).where(Chapter.id == chapter_id)
+        if include_content:
+            query = query.options(undefer(Chapter.content))
+        if for_update:
+            query = query.with_for_update().execution_options(populate_existing=True)
+        result = await db.execute(query)
+        return result.scalar_one_or_none()
+    
+    async def get_chapter_tail(
+        self,
+        db: AsyncSession,
+        chapter_id: UUID,
+        chars: int = 2000
+    ) -> Optional[str]:
+        """
+        Last `chars` characters of a chapter, cut in SQL so the full text is
+        never fetched. None if the chapter does not exist.
+        """
+        query = select(func.right(func.coalesce(Chapter.content, ""), chars)).where(Chapter.id == chapter_id)
         result = await db.execute(query)
         return result.scalar_one_or_none()
     
     async def get_chapters_by_story(
         self,
         db: AsyncSession,
-        story_id: UUID
+        story_id: UUID,
+        include_content: bool = False
     ) -> List[Chapter]:
-        """Get all chapters for a story, ordered"""
+        """Get all chapters for a story, ordered; the text is only loaded with include_content"""
         query = (
             select(Chapter)
             .where(Chapter.story_id == story_id)
             .order_by(Chapter.order)
         )
+        if include_content:
+            query = query.options(undefer(Chapter.content))
         result = await db.execute(query)
         return list(result.scalars().all())
     
+    async def list_chapters_page(
+        self,
+        db: AsyncSession,
+        story_id: UUID,
+        after: Optional[Tuple[int, UUID]] = None,
+        limit: int = 50
+    ) -> List[Chapter]:
+        """
+        One page of a story's chapters without their text. Keyset pagination:
+        pass (order, id) of the last chapter of the previous page as after.
+        order alone is not unique, so id breaks ties.
+        """
+        query = select(Chapter).where(Chapter.story_id == story_id)
+        if after is not None:
+            query = query.where(tuple_(Chapter.order, Chapter.id) > tuple_(*after))
+        query = query.order_by(Chapter.order, Chapter.id).limit(limit)
+        result = await db.execute(query)
+        return list(result.scalars().all())
+    
+    async def get_chapters_by_ids(
+        self,
+        db: AsyncSession,
+        chapter_ids: List[UUID]
+    ) -> List[Chapter]:
+        """Chapters with their text in one query, in the order of chapter_ids (missing ids are skipped)"""
+        if not chapter_ids:
+            return []
+        query = select(Chapter).where(Chapter.id.in_(chapter_ids)).options(undefer(Chapter.content))
+        result = await db.execute(query)
+        by_id = {c.id: c for c in result.scalars().all()}
+        return [by_id[i] for i in chapter_ids if i in by_id]
+    
     async def update_chapter(
         self,
         db: AsyncSession,
         chapter_id: UUID,
-        updates: Dict[str, Any]
+        updates: Dict[str, Any],
+        language: Optional[str] = None
     ) -> Optional[Chapter]:
-        """Update chapter fields"""
-        chapter = await self.get_chapter(db, chapter_id)
+        """Update chapter fields; language defaults to the story's"""
+        # A content write computes its revision delta from the current text, so
+        # concurrent saves are serialized on the row
+        chapter = await self.get_chapter(db, chapter_id, for_update="content" in updates)
         if not chapter:
             return None
+        previous = (chapter.content, chapter.revision or 0, chapter.updated_at, chapter.word_count)
         
         for key, value in updates.items():
             if hasattr(chapter, key):
                 setattr(chapter, key, value)
         
-        # Recalculate word count if content changed
+        # Recount words in the edited span if content changed
         if "content" in updates:
-            # Get story language
-            story_query = select(Story).where(Story.id == chapter.story_id)
-            story_result = await db.execute(story_query)
-            story = story_result.scalar_one_or_none()
-            language = story.language if story else "English"
-            chapter.calculate_word_count(language)
+            chapter.revision = (chapter.revision or 0) + 1
+            language = language or await story_languages.get(db, chapter.story_id)
+            delta = self._recount_words(chapter, previous[0], previous[3], language)
+            await self._record_revision(db, chapter, *previous)
+            if delta:
+                await story_service.adjust_word_count(db, chapter.story_id, delta)
         
         chapter.updated_at = datetime.utcnow()
         await db.flush()
@@ -114,41 +185,255 @@ class ChapterService:
         db: AsyncSession,
         chapter_id: UUID,
         content: str,
-        append: bool = False
+        append: bool = False,
+        language: Optional[str] = None
     ) -> Optional[Chapter]:
-        """Update chapter content specifically"""
-        chapter = await self.get_chapter(db, chapter_id)
+        """
+        Update chapter content specifically; language defaults to the story's.
+        A full save locks the row first, so two concurrent saves each get their
+        own revision and delta instead of both writing revision N+1.
+        """
+        chapter = await self.get_chapter(db, chapter_id, include_content=not append, for_update=not append)
         if not chapter:
             return None
         
-        if append:
-            chapter.content = (chapter.content or "") + content
-        else:
-            chapter.content = content
+        language = language or await story_languages.get(db, chapter.story_id)
         
-        # Get story language
-        story_query = select(Story).where(Story.id == chapter.story_id)
-        story_result = await db.execute(story_query)
-        story = story_result.scalar_one_or_none()
-        language = story.language if story else "English"
+        if append:
+            appended = await self.append_content(db, chapter_id, content, language, separator="", return_content=True)
+            for key, value in appended.items():
+                set_committed_value(chapter, key, value)
+            return chapter
         
-        chapter.calculate_word_count(language)
+        previous = (chapter.content, chapter.revision or 0, chapter.updated_at, chapter.word_count)
+        chapter.content = content
+        delta = self._recount_words(chapter, previous[0], previous[3], language)
+        chapter.revision = (chapter.revision or 0) + 1
+        await self._record_revision(db, chapter, *previous)
         chapter.updated_at = datetime.utcnow()
+        if delta:
+            await story_service.adjust_word_count(db, chapter.story_id, delta)
         
         await db.flush()
         return chapter
     
+    async def append_content(
+        self,
+        db: AsyncSession,
+        chapter_id: UUID,
+        text: str,
+        language: str = "English",
+        separator: str = "\n\n",
+        return_content: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Append text in one UPDATE (content = content || separator || text,
+        no separator on an empty chapter). word_count and reading time are
+        advanced by the appended text only, and the story word count with
+        them. Returns the new word_count,
+        reading_time_minutes, revision and updated_at, plus content if return_content;
+        None if the chapter does not exist. Chapter objects already in the
+        session are not updated.
+        """
+        # The row as it was, for the revision history; read by the same statement
+        old = (
+            select(
+                Chapter.id, Chapter.word_count, Chapter.updated_at,
+                func.char_length(func.coalesce(Chapter.content, "")).label("length")
+            )
+            .where(Chapter.id == chapter_id)
+            .subquery("old")
+        )
+        existing = func.coalesce(Chapter.content, "")
+        word_count = func.coalesce(Chapter.word_count, 0) + count_words(text, language)
+        if not separator and continues_word(text, language):
+            # The first appended word extends the chapter's last word
+            word_count = word_count - case((existing.regexp_match(r"\S$"), 1), else_=0)
+        
+        returning = [Chapter.word_count, Chapter.reading_time_minutes, Chapter.revision, Chapter.updated_at]
+        if return_content:
+            returning.append(Chapter.content)
+        returning += [
+            Chapter.story_id,
+            old.c.word_count.label("old_word_count"),
+            old.c.updated_at.label("old_updated_at"),
+            old.c.length.label("old_length"),
+            func.char_length(Chapter.content).label("new_length"),
+        ]
+        result = await db.execute(
+            update(Chapter)
+            .where(Chapter.id == old.c.id)
+            .values(
+                content=case(
+                    (existing == "", literal(text)),
+                    else_=existing + separator + literal(text)
+                ),
+                word_count=word_count,
+                reading_time_minutes=func.greatest(1, word_count // reading_speed(language)),
+                revision=Chapter.revision + 1,
+                updated_at=datetime.utcnow()
+            )
+            .returning(*returning)
+            .execution_options(synchronize_session=False)
+        )
+        row = result.one_or_none()
+        if row is None:
+            return None
+        appended = dict(row._mapping)
+        history = {
+            key: appended.pop(key)
+            for key in ("story_id", "old_word_count", "old_updated_at", "old_length", "new_length")
+        }
+        await revision_store.record_append(
+            db, chapter_id,
+            old_revision=appended["revision"] - 1,
+            new_revision=appended["revision"],
+            old_length=history["old_length"],
+            new_length=history["new_length"],
+            saved_at=history["old_updated_at"],
+            word_count=history["old_word_count"]
+        )
+        delta = (appended["word_count"] or 0) - (history["old_word_count"] or 0)
+        if delta:
+            await story_service.adjust_word_count(db, history["story_id"], delta)
+        return appended
+
+    async def patch_content(
+        self,
+        db: AsyncSession,
+        chapter_id: UUID,
+        base_revision: int,
+        operations: Optional[List[Dict[str, Any]]] = None,
+        patch_text: Optional[str] = None,
+        language: str = "English"
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Apply an auto-save delta (insert/delete operations or a
+        diff-match-patch patch) made against base_revision. The write only
+        lands if the chapter is still at that revision; word_count moves by
+        the change within the edited span, and the story word count with it.
+        Returns a result dict with
+        "success"; on a conflict "error" is "revision_conflict" and
+        "revision" the current one. None if the chapter does not exist.
+        """
+        current = (await db.execute(
+            select(
+                Chapter.content, Chapter.word_count, Chapter.reading_time_minutes,
+                Chapter.revision, Chapter.updated_at, Chapter.story_id
+            ).where(Chapter.id == chapter_id)
+        )).one_or_none()
+        if current is None:
+            return None
+        old_content = current.content or ""
+        if current.revision != base_revision:
+            return {"success": False, "error": "revision_conflict", "revision": current.revision}
+
+        try:
+            if patch_text is not None:
+                new_content = apply_dmp_patch(old_content, patch_text)
+            else:
+                new_content = apply_operations(old_content, operations or [])
+        except PatchError as e:
+            return {"success": False, "error": str(e), "revision": current.revision}
+
+        span = changed_span(old_content, new_content)
+        start, old_end, new_end = span
+        changed = {"start": start, "end": new_end, "removed": old_end - start}
+        if old_end == start and new_end == start:
+            # Nothing changed: no write, no new revision
+            unchanged = {k: v for k, v in current._mapping.items() if k not in ("content", "story_id")}
+            return {"success": True, **unchanged, "changed": changed, "content": new_content}
+
+        delta = word_count_delta(old_content, new_content, span, language)
+        word_count = func.coalesce(Chapter.word_count, 0) + delta
+        result = await db.execute(
+            update(Chapter)
+            .where(Chapter.id == chapter_id, Chapter.revision == base_revision)
+            .values(
+                content=new_content,
+                word_count=word_count,
+                reading_time_minutes=func.greatest(1, word_count // reading_speed(language)),
+                revision=Chapter.revision + 1,
+                updated_at=datetime.utcnow()
+            )
+            .returning(Chapter.word_count, Chapter.reading_time_minutes, Chapter.revision, Chapter.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+        row = result.one_or_none()
+        if row is None:
+            # Another save landed between the read and the write
+            revision = (await db.execute(select(Chapter.revision).where(Chapter.id == chapter_id))).scalar_one_or_none()
+            if revision is None:
+                return None
+            return {"success": False, "error": "revision_conflict", "revision": revision}
+        await revision_store.record(
+            db, chapter_id,
+            old_revision=base_revision,
+            new_revision=row.revision,
+            old_text=old_content,
+            new_text=new_content,
+            saved_at=current.updated_at,
+            word_count=current.word_count
+        )
+        if delta:
+            await story_service.adjust_word_count(db, current.story_id, delta)
+        return {"success": True, **row._mapping, "changed": changed, "content": new_content}
+
+    def _recount_words(
+        self,
+        chapter: Chapter,
+        old_content: Optional[str],
+        old_word_count: Optional[int],
+        language: str
+    ) -> int:
+        """
+        Set word_count and reading time for chapter.content after a save,
+        counting only the changed span against old_content. Returns the
+        change in word_count.
+        """
+        old_content = old_content or ""
+        new_content = chapter.content or ""
+        if old_word_count is None:
+            word_count = count_words(new_content, language)
+        else:
+            span = changed_span(old_content, new_content)
+            word_count = old_word_count + word_count_delta(old_content, new_content, span, language)
+        chapter.word_count = word_count
+        chapter.reading_time_minutes = get_reading_time(word_count, language)
+        return word_count - (old_word_count or 0)
+
+    async def _record_revision(
+        self,
+        db: AsyncSession,
+        chapter: Chapter,
+        old_content: Optional[str],
+        old_revision: int,
+        old_updated_at: Optional[datetime],
+        old_word_count: Optional[int]
+    ) -> None:
+        """Keep the text a full save replaces in the revision history"""
+        await revision_store.record(
+            db, chapter.id,
+            old_revision=old_revision,
+            new_revision=chapter.revision,
+            old_text=old_content,
+            new_text=chapter.content or "",
+            saved_at=old_updated_at,
+            word_count=old_word_count
+        )
+
     async def delete_chapter(
         self,
         db: AsyncSession,
         chapter_id: UUID
     ) -> bool:
         """Delete a chapter"""
-        chapter = await self.get_chapter(db, chapter_id)
+        chapter = await self.get_chapter(db, chapter_id, include_content=False)
         if not chapter:
             return False
         
         story_id = chapter.story_id
+        word_count = chapter.word_count or 0
         
         await db.delete(chapter)
         await db.flush()
@@ -156,6 +441,8 @@ class ChapterService:
         # Renumber remaining chapters
         await self._renumber_chapters(db, story_id)
         await self._update_story_chapter_count(db, story_id)
+        if word_count:
+            await story_service.adjust_word_count(db, story_id, -word_count)
         
         return True
     
@@ -165,7 +452,7 @@ class ChapterService:
         story_id: UUID,
         chapter_order: List[UUID]
     ) -> List[Chapter]:
-        """Reorder chapters in a story"""
+        """Reorder chapters in a story; returns them in the new order, without their text"""
         chapters = await self.get_chapters_by_story(db, story_id)
         chapter_map = {c.id: c for c in chapters}
         
@@ -215,6 +502,7 @@ class ChapterService:
                 .where(Chapter.order < chapter.order)
                 .order_by(Chapter.order.desc())
                 .limit(include_previous)
+                .options(undefer(Chapter.content))
             )
             result = await db.execute(query)
             previous = list(result.scalars().all())
@@ -240,13 +528,10 @@ class ChapterService:
     
     async def _update_story_chapter_count(self, db: AsyncSession, story_id: UUID) -> None:
         """Update the chapter count on the story"""
-        query = select(func.count(Chapter.id)).where(Chapter.story_id == story_id)
-        result = await db.execute(query)
-        count = result.scalar() or 0
-        
-        story_query = select(Story).where(Story.id == story_id)
-        story_result = await db.execute(story_query)
-        story = story_result.scalar_one_or_none()
-        
-        if story:
-            story.chapter_count = count
+        count = select(func.count(Chapter.id)).where(Chapter.story_id == story_id).scalar_subquery()
+        await db.execute(
+            update(Story)
+            .where(Story.id == story_id)
+            .values(chapter_count=count)
+            .execution_options(synchronize_session=False)
+        )
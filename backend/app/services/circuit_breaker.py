@@ -0,0 +1,146 @@
+"""
+Circuit Breakers - Per-provider failure and latency tracking
+Each model provider (ollama, openai, anthropic, gemini) gets a breaker with a
+rolling window of recent calls. Once the error rate in the window crosses the
+threshold the breaker opens and calls skip the provider (going to the next one
+in PROVIDER_FALLBACK_ORDER) instead of waiting out its timeout; after a cool-off
+one probe call is let through to decide whether it closes again. The latency
+window also gives the percentile after which a request is hedged.
+"""
+from collections import deque
+from typing import Optional, Dict, Any, Deque, Tuple
+import logging
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# Failures that say nothing about the provider's health (bad key, bad request)
+_CLIENT_ERRORS = frozenset(range(400, 500)) - {408, 429}
+
+
+def counts_as_failure(result: Dict[str, Any]) -> bool:
+    """Whether a failed result should count against the provider's breaker"""
+    return not result.get("success") and result.get("status_code") not in _CLIENT_ERRORS
+
+
+class CircuitBreaker:
+    """Rolling-window breaker for one provider"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self._calls: Deque[Tuple[float, bool]] = deque()
+        self._latencies: Deque[Tuple[float, float]] = deque()
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self.times_opened = 0
+        self.rejected = 0
+
+    def _trim(self, now: float) -> None:
+        horizon = now - settings.circuit_window_seconds
+        while self._calls and self._calls[0][0] < horizon:
+            self._calls.popleft()
+        latency_horizon = now - settings.circuit_latency_window_seconds
+        while self._latencies and self._latencies[0][0] < latency_horizon:
+            self._latencies.popleft()
+
+    def allow(self) -> bool:
+        """Whether a call may go to this provider now; half-open lets a single probe through"""
+        now = time.monotonic()
+        if self.state == OPEN:
+            if now - self._opened_at < settings.circuit_open_seconds:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self._probe_started = None
+        if self.state == HALF_OPEN:
+            # A probe that never reported back (e.g. cancelled) is replaced after the cool-off
+            if self._probe_started is not None and now - self._probe_started < settings.circuit_open_seconds:
+                self.rejected += 1
+                return False
+            self._probe_started = now
+        return True
+
+    def record(self, success: bool, latency: Optional[float] = None) -> None:
+        """Report a finished call; latency is only given for complete non-streaming calls"""
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            self._probe_started = None
+            if success:
+                logger.info(f"Circuit for {self.name} closed after a successful probe")
+                self.state = CLOSED
+                self._calls.clear()
+            else:
+                self._open(now)
+                return
+        self._calls.append((now, success))
+        if success and latency is not None:
+            self._latencies.append((now, latency))
+        self._trim(now)
+
+        if self.state == CLOSED and len(self._calls) >= settings.circuit_min_calls:
+            failures = sum(1 for _, ok in self._calls if not ok)
+            if failures / len(self._calls) >= settings.circuit_error_threshold:
+                self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self._opened_at = now
+        self.times_opened += 1
+        logger.warning(f"Circuit for {self.name} opened for {settings.circuit_open_seconds:.0f}s")
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Recent successful-call latency at percentile (0-1), or None without enough samples"""
+        self._trim(time.monotonic())
+        if len(self._latencies) < settings.hedge_min_samples:
+            return None
+        ordered = sorted(latency for _, latency in self._latencies)
+        return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+    def get_stats(self) -> Dict[str, Any]:
+        self._trim(time.monotonic())
+        calls = len(self._calls)
+        failures = sum(1 for _, ok in self._calls if not ok)
+
+        def ms(value: Optional[float]) -> Optional[int]:
+            return int(value * 1000) if value is not None else None
+
+        ordered = sorted(latency for _, latency in self._latencies)
+        return {
+            "state": self.state,
+            "window_calls": calls,
+            "window_error_rate": round(failures / calls, 3) if calls else 0.0,
+            "p50_latency_ms": ms(ordered[len(ordered) // 2]) if ordered else None,
+            "p95_latency_ms": ms(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]) if ordered else None,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class CircuitBreakerRegistry:
+    """Breakers by provider name, plus fallback and hedging counters"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.stats = {"fallbacks": 0, "hedged": 0, "hedge_wins": 0}
+
+    def get(self, provider: str) -> CircuitBreaker:
+        breaker = self._breakers.get(provider)
+        if breaker is None:
+            breaker = self._breakers[provider] = CircuitBreaker(provider)
+        return breaker
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "fallback_order": settings.provider_fallback_order,
+            "breakers": {name: breaker.get_stats() for name, breaker in self._breakers.items()},
+        }
+
+
+# Global breaker registry shared by every GeminiService
+provider_breakers = CircuitBreakerRegistry()
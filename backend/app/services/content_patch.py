@@ -0,0 +1,162 @@
+"""
+Content Patch - Apply editor deltas to chapter text
+Auto-save sends what changed instead of the whole chapter: a list of
+insert/delete operations at character offsets, or a diff-match-patch patch.
+The changed span of the result is what word counting and indexing look at.
+Operation offsets count Unicode code points (Array.from(text) in JavaScript,
+not String.length). diff-match-patch patches use the UTF-16 offsets the
+JavaScript library produces, and are applied in UTF-16 units.
+"""
+from typing import List, Dict, Any, Tuple
+
+from app.services.text_utils import count_words
+
+try:
+    from diff_match_patch import diff_match_patch
+    DMP_AVAILABLE = True
+except ImportError:
+    DMP_AVAILABLE = False
+
+
+class PatchError(ValueError):
+    """The operations or patch do not apply to the text"""
+
+
+def apply_operations(text: str, operations: List[Dict[str, Any]]) -> str:
+    """
+    Apply operations in order, each against the result of the previous one:
+    {"op": "insert", "pos": int, "text": str} or {"op": "delete", "pos": int, "count": int}
+    """
+    for i, operation in enumerate(operations):
+        op = operation.get("op")
+        pos = operation.get("pos", 0)
+        if not isinstance(pos, int) or pos < 0 or pos > len(text):
+            raise PatchError(f"Operation {i}: position {pos} is outside the text (length {len(text)})")
+        if op == "insert":
+            text = text[:pos] + (operation.get("text") or "") + text[pos:]
+        elif op == "delete":
+            count = operation.get("count", 0)
+            if not isinstance(count, int) or count < 0 or pos + count > len(text):
+                raise PatchError(f"Operation {i}: cannot delete {count} characters at {pos}")
+            text = text[:pos] + text[pos + count:]
+        else:
+            raise PatchError(f"Operation {i}: unknown op {op!r}")
+    return text
+
+
+def _to_utf16_units(text: str) -> str:
+    """text with every character outside the BMP split into its surrogate pair, one str item per UTF-16 unit"""
+    if text.isascii() or max(map(ord, text)) < 0x10000:
+        return text
+    units = []
+    for char in text:
+        code = ord(char)
+        if code < 0x10000:
+            units.append(char)
+        else:
+            code -= 0x10000
+            units.append(chr(0xD800 + (code >> 10)) + chr(0xDC00 + (code & 0x3FF)))
+    return "".join(units)
+
+
+def _from_utf16_units(units: str) -> str:
+    """Join surrogate pairs back into characters; a lone surrogate means a hunk split one"""
+    try:
+        return units.encode("utf-16-le", "surrogatepass").decode("utf-16-le")
+    except UnicodeDecodeError:
+        raise PatchError("Patch splits a surrogate pair")
+
+
+def apply_dmp_patch(text: str, patch_text: str) -> str:
+    """
+    Apply a diff-match-patch patch (patch_toText output); every hunk must apply.
+    Hunk offsets and lengths are UTF-16 units, as the JavaScript library
+    counts them (an emoji is 2), so the patch is applied to the text in UTF-16
+    units and converted back. Text without characters outside the BMP is the
+    same in both.
+    """
+    if not DMP_AVAILABLE:
+        raise PatchError("diff-match-patch payloads need the 'diff-match-patch' package")
+    dmp = diff_match_patch()
+    dmp.Match_Threshold = 0.0  # The base revision matches exactly; no fuzzy placement
+    try:
+        patches = dmp.patch_fromText(patch_text)
+    except ValueError as e:
+        raise PatchError(f"Invalid patch: {e}")
+    for patch in patches:
+        patch.diffs = [(op, _to_utf16_units(data)) for op, data in patch.diffs]
+    new_units, applied = dmp.patch_apply(patches, _to_utf16_units(text))
+    if not all(applied):
+        raise PatchError(f"{applied.count(False)} of {len(applied)} patch hunks did not apply")
+    return _from_utf16_units(new_units)
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    """Length of the common prefix, by binary search over slice comparisons"""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[:mid] == b[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def changed_span(old: str, new: str) -> Tuple[int, int, int]:
+    """
+    (start, old_end, new_end): old[start:old_end] was replaced by
+    new[start:new_end], and everything around it is unchanged.
+    """
+    start = _common_prefix_length(old, new)
+    max_suffix = min(len(old), len(new)) - start
+    suffix = _common_prefix_length(old[::-1][:max_suffix], new[::-1][:max_suffix])
+    return start, len(old) - suffix, len(new) - suffix
+
+
+def _expand_left(text: str, pos: int) -> int:
+    """Move pos back to the start of the word (tags included) it is in"""
+    tag_open = text.rfind("<", 0, pos)
+    if tag_open > text.rfind(">", 0, pos):
+        pos = tag_open  # Inside a tag
+    while pos > 0 and not text[pos - 1].isspace():
+        if text[pos - 1] == ">":
+            tag_open = text.rfind("<", 0, pos - 1)
+            if tag_open == -1:
+                break
+            pos = tag_open
+        else:
+            pos -= 1
+    return pos
+
+
+def _expand_right(text: str, pos: int) -> int:
+    """Move pos forward to the end of the word (tags included) it is in"""
+    tag_close = text.find(">", pos)
+    tag_open = text.find("<", pos)
+    if tag_close != -1 and (tag_open == -1 or tag_close < tag_open):
+        pos = tag_close + 1  # Inside a tag
+    while pos < len(text) and not text[pos].isspace():
+        if text[pos] == "<":
+            tag_close = text.find(">", pos)
+            pos = len(text) if tag_close == -1 else tag_close + 1
+        else:
+            pos += 1
+    return pos
+
+
+def word_count_delta(old: str, new: str, span: Tuple[int, int, int], language: str = "English") -> int:
+    """
+    Change in count_words(new) - count_words(old), counted only over the
+    changed span widened to whole words. Tags do not separate words in
+    count_words, so the window also grows across them. Exact for well-formed
+    markup (what the editor saves); a stray "<" in the text can make
+    count_words itself pair tags differently, and the delta may drift by a word.
+    """
+    start, old_end, new_end = span
+    left = min(_expand_left(old, start), _expand_left(new, start))
+    right_from_end = min(len(old) - _expand_right(old, old_end), len(new) - _expand_right(new, new_end))
+    return (
+        count_words(new[left:len(new) - right_from_end], language)
+        - count_words(old[left:len(old) - right_from_end], language)
+    )
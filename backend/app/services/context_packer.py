@@ -0,0 +1,226 @@
+"""
+Context Packer - Fits prompt context sections into a model's token budget
+Replaces fixed character cut-offs with token estimates that account for the
+script being written (CJK text costs far more tokens per character than
+English), so every model gets as much context as its window actually allows.
+"""
+from typing import Optional, List, Dict, Any
+from dataclasses import dataclass, field
+from functools import lru_cache
+import logging
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+
+# Calibrated tokens-per-character by script, for Qwen/Llama-style BPE vocabularies
+_SCRIPT_TOKEN_RATES = (
+    # (first codepoint, last codepoint, tokens per character)
+    (0x3040, 0x30FF, 1.0),    # Japanese kana
+    (0x3400, 0x4DBF, 1.0),    # CJK extension A
+    (0x4E00, 0x9FFF, 0.9),    # CJK unified ideographs
+    (0xAC00, 0xD7AF, 0.9),    # Hangul syllables
+    (0xFF00, 0xFFEF, 1.0),    # Full-width forms
+    (0x0E00, 0x0E7F, 0.6),    # Thai
+    (0x0900, 0x0DFF, 0.6),    # Indic scripts (Devanagari ... Malayalam)
+    (0x0600, 0x06FF, 0.45),   # Arabic
+    (0x0370, 0x03FF, 0.4),    # Greek
+    (0x0400, 0x04FF, 0.35),   # Cyrillic
+)
+_DEFAULT_TOKEN_RATE = 0.26  # Latin scripts: ~4 characters per token
+_SAFETY_MARGIN = 64  # Tokens kept free for chat template / role markers
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def _char_rate(ch: str) -> float:
+    cp = ord(ch)
+    if cp < 0x0370:
+        return _DEFAULT_TOKEN_RATE
+    for first, last, rate in _SCRIPT_TOKEN_RATES:
+        if first <= cp <= last:
+            return rate
+    return _DEFAULT_TOKEN_RATE
+
+
+def _count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if settings.context_tokenizer == "tiktoken" and TIKTOKEN_AVAILABLE:
+        return len(_get_encoding().encode(text, disallowed_special=()))
+    if text.isascii():
+        return int(len(text) * _DEFAULT_TOKEN_RATE) + 1
+    return int(sum(_char_rate(ch) for ch in text)) + 1
+
+
+@lru_cache(maxsize=4096)
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the token count of text.
+    Uses tiktoken when CONTEXT_TOKENIZER=tiktoken and it is installed,
+    otherwise the per-script calibrated estimator. Results are memoized since
+    the same character and bible blocks are packed on every continuation.
+    """
+    return _count_tokens(text)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens, preferring a whitespace boundary"""
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # Shrink proportionally until the estimate fits
+    cut = int(len(text) * max_tokens / estimate_tokens(text))
+    while cut > 0 and _count_tokens(text[:cut]) > max_tokens:
+        cut = int(cut * 0.9)
+    truncated = text[:cut]
+    boundary = truncated.rfind(" ")
+    if boundary > cut * 0.8:
+        truncated = truncated[:boundary]
+    return truncated.rstrip() + "…"
+
+
+def get_context_window(model: Optional[str]) -> int:
+    """Context window (num_ctx) for a model, from LLM_CONTEXT_WINDOWS or the default"""
+    if model:
+        windows = settings.llm_context_windows
+        if model in windows:
+            return windows[model]
+        # Allow family entries such as "qwen2.5" to match "qwen2.5:7b"
+        base = model.split(":")[0]
+        if base in windows:
+            return windows[base]
+    return settings.llm_default_context_window
+
+
+def get_context_budget(
+    model: Optional[str],
+    max_output_tokens: int,
+    fixed_prompt_tokens: int = 0
+) -> int:
+    """Tokens left for packed context once output and fixed prompt parts are reserved"""
+    return max(0, get_context_window(model) - max_output_tokens - fixed_prompt_tokens - _SAFETY_MARGIN)
+
+
+@dataclass
+class ContextSection:
+    """One block of prompt context, its candidate items and how much it matters"""
+    name: str
+    items: List[str]  # In preference order; earlier items are packed first
+    weight: float = 1.0  # Share of the budget relative to other sections
+    header: str = ""
+    required: bool = False  # Packed before any weighted sharing (e.g. story overview)
+    max_tokens: Optional[int] = None
+    truncate_items: bool = True  # Cut the item that overflows instead of dropping it
+    min_item_tokens: int = 24  # Don't bother with fragments smaller than this
+    stable_order: bool = False  # Emit selected items sorted, for prefix-stable prompts
+
+
+@dataclass
+class PackedContext:
+    """Packed context text plus per-section accounting"""
+    text: str
+    budget: int
+    used_tokens: int
+    sections: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    def report(self) -> Dict[str, Any]:
+        return {"budget": self.budget, "used_tokens": self.used_tokens, "sections": self.sections}
+
+
+class ContextPacker:
+    """
+    Greedy, priority-weighted packer.
+
+    Required sections are filled first. Each remaining section then gets a
+    share of the budget proportional to its weight (capped by max_tokens)
+    and packs items in order; budget left over by sections that needed less
+    than their share is handed out to the others in weight order.
+    Sections are emitted in the order given, so the caller controls layout.
+    """
+
+    SEPARATOR = "\n\n"
+
+    def pack(self, sections: List[ContextSection], budget: int) -> PackedContext:
+        state = {s.name: {"chosen": [], "tokens": 0, "next": 0} for s in sections}
+        remaining = budget
+
+        def fill(section: ContextSection, allowance: int) -> int:
+            """Pack items from section into allowance tokens; returns tokens spent"""
+            entry = state[section.name]
+            if section.max_tokens is not None:
+                allowance = min(allowance, section.max_tokens - entry["tokens"])
+            spent = 0
+            while entry["next"] < len(section.items):
+                # The header is only paid for once the section gets its first item
+                overhead = estimate_tokens(section.header) if section.header and not entry["chosen"] else 0
+                room = allowance - spent - overhead
+                item = section.items[entry["next"]]
+                cost = estimate_tokens(item) + 1
+                if cost <= room:
+                    entry["chosen"].append(item)
+                elif section.truncate_items and room >= section.min_item_tokens:
+                    entry["chosen"].append(truncate_to_tokens(item, room - 1))
+                    cost = room
+                else:
+                    break
+                entry["next"] += 1
+                spent += cost + overhead
+            entry["tokens"] += spent
+            return spent
+
+        for section in sections:
+            if section.required:
+                remaining -= fill(section, max(0, remaining))
+
+        weighted = [s for s in sections if not s.required and s.items]
+        total_weight = sum(s.weight for s in weighted) or 1.0
+        pool = max(0, remaining)
+        for section in weighted:
+            share = int(pool * section.weight / total_weight)
+            remaining -= fill(section, max(0, min(share, remaining)))
+
+        # Spill unused budget to sections that still have items, highest weight first
+        for section in sorted(weighted, key=lambda s: s.weight, reverse=True):
+            if remaining <= 0:
+                break
+            if state[section.name]["next"] < len(section.items):
+                remaining -= fill(section, remaining)
+
+        blocks = []
+        report = {}
+        used = 0
+        for section in sections:
+            entry = state[section.name]
+            chosen = sorted(entry["chosen"]) if section.stable_order else entry["chosen"]
+            report[section.name] = {
+                "tokens": entry["tokens"],
+                "items": len(chosen),
+                "dropped": len(section.items) - entry["next"],
+            }
+            if chosen:
+                used += entry["tokens"]
+                body = "\n".join(chosen)
+                blocks.append(f"{section.header}\n{body}" if section.header else body)
+
+        return PackedContext(
+            text=self.SEPARATOR.join(blocks),
+            budget=budget,
+            used_tokens=used,
+            sections=report,
+        )
+
+
+# Global packer instance
+context_packer = ContextPacker()
@@ -2,10 +2,12 @@
 External AI Service - Routes generation requests to OpenAI, Anthropic, or Google Gemini.
 Called when the user has configured an external provider instead of local Ollama.
 """
-import httpx
+import json
 import logging
 import time
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator
+
+from app.services.http_client import http_pool, get_timeout
 
 logger = logging.getLogger(__name__)
 
@@ -54,20 +56,27 @@ async def generate_external(
     max_tokens: int = 800,
     temperature: float = 0.7,
     request_timeout: float = 120.0,
+    json_schema: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Any]:
     """
     Call an external AI provider and return a normalised result dict
     matching GeminiService.generate_story_content output format.
+    json_schema switches on the provider's native JSON output: OpenAI JSON mode,
+    a forced Anthropic tool call whose input_schema is the schema, or Gemini's
+    application/json response type. content is then the JSON text.
     """
     start_time = time.time()
 
     try:
         if provider == "openai":
-            result = await _call_openai(api_key, model, prompt, system_prompt, max_tokens, temperature, request_timeout)
+            result = await _call_openai(api_key, model, prompt, system_prompt, max_tokens, temperature,
+                                        request_timeout, json_schema)
         elif provider == "anthropic":
-            result = await _call_anthropic(api_key, model, prompt, system_prompt, max_tokens, temperature, request_timeout)
+            result = await _call_anthropic(api_key, model, prompt, system_prompt, max_tokens, temperature,
+                                           request_timeout, json_schema)
         elif provider == "gemini":
-            result = await _call_gemini(api_key, model, prompt, system_prompt, max_tokens, temperature, request_timeout)
+            result = await _call_gemini(api_key, model, prompt, system_prompt, max_tokens, temperature,
+                                        request_timeout, json_schema)
         else:
             return {"content": "", "error": f"Unknown provider: {provider}", "success": False,
                     "generation_time_ms": 0}
@@ -76,6 +85,7 @@ async def generate_external(
         return {
             "content": result["text"],
             "tokens_used": result.get("tokens_used", 0),
+            "completion_tokens": result.get("completion_tokens", 0),
             "generation_time_ms": generation_time,
             "model": model,
             "provider": provider,
@@ -88,84 +98,280 @@ async def generate_external(
         return {
             "content": "",
             "error": err_str,
+            "status_code": _status_code(e),
             "success": False,
             "generation_time_ms": int((time.time() - start_time) * 1000),
         }
 
 
+def _status_code(error: Exception) -> Optional[int]:
+    """HTTP status of a failed provider call, None for timeouts and connection errors"""
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+async def stream_external(
+    provider: str,
+    api_key: str,
+    model: str,
+    prompt: str,
+    system_prompt: str,
+    max_tokens: int = 800,
+    temperature: float = 0.7,
+    request_timeout: float = 120.0,
+    stream_stats: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[str]:
+    """
+    Stream text deltas from an external AI provider.
+    Same contract as GeminiService.generate_story_content_stream: yields text
+    chunks; token usage reported by the provider is written into stream_stats.
+    Failures are reported as stream_stats["error"] when stream_stats is given,
+    otherwise as a trailing "[Error: ...]" chunk.
+    """
+    stats = stream_stats if stream_stats is not None else {}
+    streamers = {
+        "openai": _stream_openai,
+        "anthropic": _stream_anthropic,
+        "gemini": _stream_gemini,
+    }
+    streamer = streamers.get(provider)
+    if streamer is None:
+        if stream_stats is not None:
+            stream_stats["error"] = f"Unknown provider: {provider}"
+        else:
+            yield f"\n[Error: Unknown provider: {provider}]"
+        return
+
+    try:
+        async for chunk in streamer(api_key, model, prompt, system_prompt, max_tokens, temperature,
+                                    request_timeout, stats):
+            yield chunk
+    except Exception as e:
+        err_str = f"{type(e).__name__}: {e}"
+        logger.error(f"External AI streaming error ({provider}/{model}): {err_str}")
+        if stream_stats is not None:
+            stream_stats["error"] = err_str
+            stream_stats["status_code"] = _status_code(e)
+        else:
+            yield f"\n[Error: {err_str}]"
+
+
+async def _iter_sse_data(response) -> AsyncIterator[str]:
+    """Yield the payload of each `data:` line of a Server-Sent Events response"""
+    async for line in response.aiter_lines():
+        if line.startswith("data:"):
+            yield line[5:].strip()
+
+
 # ─── Provider implementations ─────────────────────────────────────────────────
 
-async def _call_openai(api_key, model, prompt, system_prompt, max_tokens, temperature, timeout):
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        response = await client.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": model,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt},
-                ],
-                "max_tokens": max_tokens,
-                "temperature": temperature,
-            },
-        )
-        response.raise_for_status()
-        data = response.json()
-        text = data["choices"][0]["message"]["content"]
-        tokens = data.get("usage", {}).get("total_tokens", 0)
-        return {"text": text, "tokens_used": tokens}
-
-
-async def _call_anthropic(api_key, model, prompt, system_prompt, max_tokens, temperature, timeout):
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        response = await client.post(
-            "https://api.anthropic.com/v1/messages",
-            headers={
-                "x-api-key": api_key,
-                "anthropic-version": "2023-06-01",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": model,
-                "system": system_prompt,
-                "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": max_tokens,
-                "temperature": temperature,
-            },
-        )
-        response.raise_for_status()
-        data = response.json()
+async def _call_openai(api_key, model, prompt, system_prompt, max_tokens, temperature, timeout, json_schema=None):
+    client = http_pool.get_client("openai")
+    body = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt},
+        ],
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+    }
+    if json_schema:
+        # JSON mode is available on every listed model; the prompt carries the shape
+        body["response_format"] = {"type": "json_object"}
+    response = await client.post(
+        "https://api.openai.com/v1/chat/completions",
+        headers={
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        },
+        json=body,
+        timeout=get_timeout("external.generate", timeout),
+    )
+    response.raise_for_status()
+    data = response.json()
+    text = data["choices"][0]["message"]["content"]
+    usage = data.get("usage", {})
+    return {"text": text, "tokens_used": usage.get("total_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0)}
+
+
+async def _call_anthropic(api_key, model, prompt, system_prompt, max_tokens, temperature, timeout, json_schema=None):
+    client = http_pool.get_client("anthropic")
+    body = {
+        "model": model,
+        "system": system_prompt,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+    }
+    # Tool input schemas must be objects; other shapes fall back to plain text
+    use_tool = bool(json_schema) and json_schema.get("type") == "object"
+    if use_tool:
+        body["tools"] = [{
+            "name": "respond",
+            "description": "Return the response as structured data.",
+            "input_schema": json_schema,
+        }]
+        body["tool_choice"] = {"type": "tool", "name": "respond"}
+    response = await client.post(
+        "https://api.anthropic.com/v1/messages",
+        headers={
+            "x-api-key": api_key,
+            "anthropic-version": "2023-06-01",
+            "Content-Type": "application/json",
+        },
+        json=body,
+        timeout=get_timeout("external.generate", timeout),
+    )
+    response.raise_for_status()
+    data = response.json()
+    if use_tool:
+        tool_input = next(block["input"] for block in data["content"] if block.get("type") == "tool_use")
+        text = json.dumps(tool_input, ensure_ascii=False)
+    else:
         text = data["content"][0]["text"]
-        usage = data.get("usage", {})
-        tokens = usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
-        return {"text": text, "tokens_used": tokens}
+    usage = data.get("usage", {})
+    tokens = usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+    return {"text": text, "tokens_used": tokens, "completion_tokens": usage.get("output_tokens", 0)}
 
 
-async def _call_gemini(api_key, model, prompt, system_prompt, max_tokens, temperature, timeout):
+async def _call_gemini(api_key, model, prompt, system_prompt, max_tokens, temperature, timeout, json_schema=None):
     url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}"
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        response = await client.post(
-            url,
-            headers={"Content-Type": "application/json"},
-            json={
-                "system_instruction": {"parts": [{"text": system_prompt}]},
-                "contents": [{"parts": [{"text": prompt}]}],
-                "generationConfig": {
-                    "maxOutputTokens": max_tokens,
-                    "temperature": temperature,
-                },
+    client = http_pool.get_client("gemini")
+    generation_config = {
+        "maxOutputTokens": max_tokens,
+        "temperature": temperature,
+    }
+    if json_schema:
+        # responseSchema only takes an OpenAPI subset, so only the MIME type is forced
+        generation_config["responseMimeType"] = "application/json"
+    response = await client.post(
+        url,
+        headers={"Content-Type": "application/json"},
+        json={
+            "system_instruction": {"parts": [{"text": system_prompt}]},
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": generation_config,
+        },
+        timeout=get_timeout("external.generate", timeout),
+    )
+    response.raise_for_status()
+    data = response.json()
+    text = data["candidates"][0]["content"]["parts"][0]["text"]
+    usage = data.get("usageMetadata", {})
+    tokens = usage.get("totalTokenCount", 0)
+    return {"text": text, "tokens_used": tokens, "completion_tokens": usage.get("candidatesTokenCount", 0)}
+
+
+# ─── Streaming provider implementations ───────────────────────────────────────
+
+async def _stream_openai(api_key, model, prompt, system_prompt, max_tokens, temperature, timeout, stats):
+    client = http_pool.get_client("openai")
+    async with client.stream(
+        "POST",
+        "https://api.openai.com/v1/chat/completions",
+        headers={
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        },
+        json={
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt},
+            ],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        },
+        timeout=get_timeout("external.generate", timeout),
+    ) as response:
+        response.raise_for_status()
+        async for payload in _iter_sse_data(response):
+            if payload == "[DONE]":
+                break
+            data = json.loads(payload)
+            if data.get("usage"):
+                stats["tokens_used"] = data["usage"].get("total_tokens", 0)
+                stats["completion_tokens"] = data["usage"].get("completion_tokens", 0)
+            for choice in data.get("choices", []):
+                text = choice.get("delta", {}).get("content")
+                if text:
+                    yield text
+
+
+async def _stream_anthropic(api_key, model, prompt, system_prompt, max_tokens, temperature, timeout, stats):
+    client = http_pool.get_client("anthropic")
+    input_tokens = 0
+    async with client.stream(
+        "POST",
+        "https://api.anthropic.com/v1/messages",
+        headers={
+            "x-api-key": api_key,
+            "anthropic-version": "2023-06-01",
+            "Content-Type": "application/json",
+        },
+        json={
+            "model": model,
+            "system": system_prompt,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True,
+        },
+        timeout=get_timeout("external.generate", timeout),
+    ) as response:
+        response.raise_for_status()
+        async for payload in _iter_sse_data(response):
+            data = json.loads(payload)
+            event_type = data.get("type")
+            if event_type == "message_start":
+                input_tokens = data.get("message", {}).get("usage", {}).get("input_tokens", 0)
+            elif event_type == "content_block_delta":
+                text = data.get("delta", {}).get("text")
+                if text:
+                    yield text
+            elif event_type == "message_delta":
+                stats["completion_tokens"] = data.get("usage", {}).get("output_tokens", 0)
+                stats["tokens_used"] = input_tokens + stats["completion_tokens"]
+            elif event_type == "message_stop":
+                break
+            elif event_type == "error":
+                raise RuntimeError(data.get("error", {}).get("message", "stream error"))
+
+
+async def _stream_gemini(api_key, model, prompt, system_prompt, max_tokens, temperature, timeout, stats):
+    url = (
+        f"https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent"
+        f"?alt=sse&key={api_key}"
+    )
+    client = http_pool.get_client("gemini")
+    async with client.stream(
+        "POST",
+        url,
+        headers={"Content-Type": "application/json"},
+        json={
+            "system_instruction": {"parts": [{"text": system_prompt}]},
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {
+                "maxOutputTokens": max_tokens,
+                "temperature": temperature,
             },
-        )
+        },
+        timeout=get_timeout("external.generate", timeout),
+    ) as response:
         response.raise_for_status()
-        data = response.json()
-        text = data["candidates"][0]["content"]["parts"][0]["text"]
-        usage = data.get("usageMetadata", {})
-        tokens = usage.get("totalTokenCount", 0)
-        return {"text": text, "tokens_used": tokens}
+        async for payload in _iter_sse_data(response):
+            data = json.loads(payload)
+            if data.get("usageMetadata"):
+                stats["tokens_used"] = data["usageMetadata"].get("totalTokenCount", 0)
+                stats["completion_tokens"] = data["usageMetadata"].get("candidatesTokenCount", 0)
+            for candidate in data.get("candidates", []):
+                for part in candidate.get("content", {}).get("parts", []):
+                    if part.get("text"):
+                        yield part["text"]
 
 
 async def validate_api_key(provider: str, api_key: str) -> Dict[str, Any]:
@@ -2,20 +2,50 @@
 AI Service - Core AI integration for NarrativeFlow
 Handles all communication with Ollama API
 """
-import httpx
 from typing import Optional, List, Dict, Any, AsyncGenerator
 import asyncio
 import logging
 import time
 import json
-import re
 
 from app.config import settings
+from app.services.http_client import http_pool, get_timeout
+from app.services.ollama_pool import ollama_pool
+from app.services.circuit_breaker import provider_breakers, counts_as_failure
+from app.services.llm_scheduler import llm_scheduler, Priority
+from app.services.request_coalescer import request_coalescer, make_request_key
+from app.services.response_cache import response_cache, make_cache_key, is_cacheable_options
+from app.services.context_packer import estimate_tokens, get_context_window
+from app.services.json_repair import extract_json
+from app.services.throughput_tracker import throughput_tracker
+from app.services.generation_history import generation_recorder
+from app.services.structured_output import (
+    prune_invalid,
+    structured_output_stats,
+    STORY_BIBLE_SIMPLE_SCHEMA,
+    STORY_BIBLE_SCHEMA,
+    STORY_BIBLE_UPDATE_SCHEMA,
+    CHARACTER_EXTRACTION_SCHEMA,
+)
 from app.runtime_settings import get_runtime_model_name, get_runtime_vision_model_name
 from app.models.generation import WritingMode, GenerationType
 
 logger = logging.getLogger(__name__)
 
+# Prompt-prefix reuse across every GeminiService instance (prefix-stable /api/chat calls)
+prefix_cache_stats = {"requests": 0, "prompt_tokens_estimated": 0, "prompt_tokens_evaluated": 0}
+
+
+def get_prefix_cache_stats() -> Dict[str, Any]:
+    """Share of prompt tokens Ollama did not have to re-evaluate"""
+    estimated = prefix_cache_stats["prompt_tokens_estimated"]
+    cached = max(0, estimated - prefix_cache_stats["prompt_tokens_evaluated"])
+    return {
+        **prefix_cache_stats,
+        "prompt_tokens_cached": cached,
+        "reuse_ratio": round(cached / estimated, 3) if estimated else 0.0,
+    }
+
 
 class GeminiService:
     """
@@ -24,10 +54,10 @@ class GeminiService:
     """
     
     def __init__(self):
-        self.base_url = settings.ollama_base_url
         self.model_name = settings.ollama_model
         self.vision_model_name = settings.ollama_model
-        self.client = httpx.AsyncClient(timeout=600.0)  # 10 minute timeout for large generations
+        self.client = http_pool.get_client("ollama")
+        self.scheduler = llm_scheduler
         
         # Generation settings by mode
         self.mode_settings = {
@@ -47,7 +77,7 @@ class GeminiService:
                 "top_k": 30,
             }
         }
-        logger.info(f"Ollama API configured with model: {self.model_name} at {self.base_url}")
+        logger.info(f"Ollama API configured with model: {self.model_name} at {', '.join(ollama_pool.urls())}")
     
     def _get_generation_options(
         self,
@@ -76,6 +106,18 @@ class GeminiService:
             "num_predict": max_tokens or settings.max_tokens_per_generation,
         }
     
+    def _ollama_options(self, model: str, generation_options: Dict[str, Any], prompt_text: str) -> Dict[str, Any]:
+        """
+        Options for an Ollama call. num_ctx is only sent when prompt plus output
+        would not fit the context Ollama loads models with
+        (OLLAMA_MODEL_DEFAULT_CONTEXT): a different num_ctx makes Ollama reload
+        the model with a larger KV cache.
+        """
+        needed = estimate_tokens(prompt_text) + generation_options.get("num_predict", 0)
+        if settings.ollama_always_send_num_ctx or needed > settings.ollama_model_default_context:
+            return {**generation_options, "num_ctx": get_context_window(model)}
+        return generation_options
+    
     async def generate_story_content(
         self,
         prompt: str,
@@ -84,48 +126,203 @@ class GeminiService:
         context: Optional[str] = None,
         max_tokens: Optional[int] = None,
         temperature_override: Optional[float] = None,
-        request_timeout: Optional[float] = None
+        request_timeout: Optional[float] = None,
+        priority: Priority = Priority.INTERACTIVE,
+        user_id: Optional[Any] = None,
+        cacheable: bool = False,
+        prefix_stable: bool = False,
+        response_format: Optional[Dict[str, Any]] = None,
+        deadline_seconds: Optional[float] = None
     ) -> Dict[str, Any]:
         """
         Generate story content based on prompt and mode
         
+        Args:
+            cacheable: Allow the persistent response cache to answer this call.
+                Only honoured for low-temperature (deterministic) generations.
+            prefix_stable: Send the prompt as /api/chat messages with keep_alive so
+                Ollama can reuse the KV cache of a previous call sharing the same
+                prefix. Pair with PromptBuilder's prefix-stable layout.
+            response_format: JSON schema sent as Ollama's `format`, constraining
+                decoding to matching JSON (see generate_structured).
+            deadline_seconds: Latency budget from this call, scheduler queue wait
+                included. Once the call has its slot, num_predict is lowered (never
+                raised) from the model's measured throughput so prompt evaluation
+                plus generation fits the time that is left.
+        
         Returns:
-            Dict with 'content', 'tokens_used', 'generation_time_ms'
+            Dict with 'content', 'tokens_used', 'generation_time_ms', 'queue_time_ms'
+            and 'cache_hit' for cacheable calls; prefix-stable calls also report
+            'prompt_eval_count' and 'prompt_tokens_cached'; deadline calls report
+            'deadline' (the plan with predicted and actual seconds)
         """
-        start_time = time.time()
-        
-        # Build full prompt with system instructions and context
-        full_prompt = self._build_full_prompt(system_prompt, context, prompt)
-        
         # Get generation options for mode
         generation_options = self._get_generation_options(writing_mode, max_tokens, temperature_override)
+        model = get_runtime_model_name()
         
-        try:
-            # Call Ollama API
-            post_kwargs = {
-                "json": {
-                    "model": get_runtime_model_name(),
-                    "prompt": full_prompt,
-                    "stream": False,
-                    "options": generation_options
-                }
+        if prefix_stable:
+            messages = self._build_chat_messages(system_prompt, context, prompt)
+            full_prompt = json.dumps(messages, ensure_ascii=False)
+        else:
+            # Build full prompt with system instructions and context
+            full_prompt = self._build_full_prompt(system_prompt, context, prompt)
+        
+        deadline = None
+        if deadline_seconds:
+            # The budget starts now, so time spent queued for a slot counts against it
+            deadline = {
+                "started": time.monotonic(),
+                "seconds": deadline_seconds,
+                "prompt_tokens": estimate_tokens(full_prompt)
             }
-            if request_timeout is not None:
-                post_kwargs["timeout"] = request_timeout
-            response = await self.client.post(
-                f"{self.base_url}/api/generate",
-                **post_kwargs
+        
+        if prefix_stable:
+            call = lambda: self._call_chat(
+                model, messages, generation_options, request_timeout, priority, user_id, response_format, deadline
             )
-            response.raise_for_status()
+        else:
+            call = lambda: self._call_generate(
+                model, full_prompt, generation_options, request_timeout, priority, user_id, response_format, deadline
+            )
+        # The schema changes the output, so it is part of the cache and coalescing keys
+        key_options = {**generation_options, "format": response_format} if response_format else generation_options
+        
+        use_cache = cacheable and settings.llm_cache_enabled and is_cacheable_options(generation_options)
+        if use_cache:
+            lookup_start = time.time()
+            cache_key = make_cache_key(model, full_prompt, key_options)
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                result = {
+                    **cached,
+                    "generation_time_ms": int((time.time() - lookup_start) * 1000),
+                    "queue_time_ms": 0,
+                    "cache_hit": True,
+                    "cache_key": cache_key,
+                    "success": True
+                }
+                self._record_history("ollama", model, writing_mode, prompt, full_prompt, result,
+                                     user_id, generation_options)
+                return result
+        
+        if not settings.llm_coalesce_identical_requests:
+            result = await call()
+        else:
+            # Identical concurrent requests (double-clicks, retries) share one upstream call
+            key = make_request_key(model, full_prompt, key_options)
+            result, coalesced = await request_coalescer.run(key, call)
+            # Callers annotate the result dict, so each one gets its own copy
+            result = dict(result)
+            result["coalesced"] = coalesced
+        
+        if use_cache:
+            result["cache_hit"] = False
+            result["cache_key"] = cache_key
+            if result.get("success") and result.get("content") and not result.get("coalesced"):
+                await response_cache.set(cache_key, model, {
+                    "content": result["content"],
+                    "tokens_used": result.get("tokens_used", 0),
+                    "model": model
+                })
+        
+        deadline_plan = result.pop("deadline_plan", None)
+        if deadline_plan is not None and result.get("success"):
+            actual = time.monotonic() - deadline["started"]
+            if not result.get("coalesced") and not result.get("cache_hit"):
+                throughput_tracker.record_deadline(model, deadline_plan, actual)
+            result["deadline"] = {**deadline_plan, "actual_seconds": round(actual, 2)}
+        self._record_history("ollama", model, writing_mode, prompt, full_prompt, result, user_id, generation_options)
+        return result
+
+    def _plan_deadline(self, model: str, payload: Dict[str, Any], deadline: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Once the call has its slot, lower num_predict to what fits the time left before the deadline"""
+        if deadline is None:
+            return None
+        queued = time.monotonic() - deadline["started"]
+        plan = throughput_tracker.plan(
+            model, deadline["seconds"] - queued, deadline["prompt_tokens"], payload["options"]["num_predict"]
+        )
+        payload["options"] = {**payload["options"], "num_predict": plan["num_predict"]}
+        return {
+            **plan,
+            "deadline_seconds": deadline["seconds"],
+            "queue_seconds": round(queued, 2),
+            "predicted_seconds": round(queued + plan["predicted_seconds"], 2),
+        }
+
+    def _record_history(
+        self,
+        provider: str,
+        model: Optional[str],
+        writing_mode: WritingMode,
+        prompt: str,
+        full_prompt: str,
+        result: Dict[str, Any],
+        user_id: Optional[Any],
+        generation_options: Dict[str, Any],
+        streamed: bool = False,
+        cancelled: bool = False
+    ) -> None:
+        """Queue a generation_history row for this call (see generation_history)"""
+        generation_recorder.record(
+            provider=provider,
+            model=model,
+            writing_mode=writing_mode,
+            prompt=prompt,
+            prompt_tokens=estimate_tokens(full_prompt),
+            result=result,
+            user_id=user_id,
+            max_tokens=generation_options.get("num_predict"),
+            temperature=generation_options.get("temperature"),
+            streamed=streamed,
+            cancelled=cancelled,
+        )
+
+    async def _call_generate(
+        self,
+        model: str,
+        full_prompt: str,
+        generation_options: Dict[str, Any],
+        request_timeout: Optional[float],
+        priority: Priority,
+        user_id: Optional[Any],
+        response_format: Optional[Dict[str, Any]] = None,
+        deadline: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Single non-streaming call to Ollama /api/generate"""
+        start_time = time.time()
+        payload = {
+            "model": model,
+            "prompt": full_prompt,
+            "stream": False,
+            "options": self._ollama_options(model, generation_options, full_prompt),
+            "keep_alive": settings.ollama_keep_alive
+        }
+        if response_format:
+            payload["format"] = response_format
+        
+        try:
+            # Wait for a scheduler slot, then call Ollama API on the picked node
+            async with self.scheduler.slot(priority, user_id) as queue_seconds:
+                deadline_plan = self._plan_deadline(model, payload, deadline)
+                response = await ollama_pool.post(
+                    self.client, "/api/generate", model, user_id,
+                    json=payload,
+                    timeout=get_timeout("ollama.generate", request_timeout)
+                )
             result = response.json()
+            throughput_tracker.record(model, result)
             
             generation_time = int((time.time() - start_time) * 1000)
             
             return {
                 "content": result.get("response", ""),
                 "tokens_used": result.get("eval_count", 0) + result.get("prompt_eval_count", 0),
+                "completion_tokens": result.get("eval_count", 0),
                 "generation_time_ms": generation_time,
-                "model": get_runtime_model_name(),
+                "queue_time_ms": int(queue_seconds * 1000),
+                "model": model,
+                "deadline_plan": deadline_plan,
                 "success": True
             }
             
@@ -140,6 +337,83 @@ class GeminiService:
                 "generation_time_ms": int((time.time() - start_time) * 1000)
             }
 
+    async def _call_chat(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        generation_options: Dict[str, Any],
+        request_timeout: Optional[float],
+        priority: Priority,
+        user_id: Optional[Any],
+        response_format: Optional[Dict[str, Any]] = None,
+        deadline: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Single non-streaming call to Ollama /api/chat, keeping the model (and its KV cache) loaded"""
+        start_time = time.time()
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": False,
+            "options": self._ollama_options(model, generation_options, json.dumps(messages, ensure_ascii=False)),
+            "keep_alive": settings.ollama_keep_alive
+        }
+        if response_format:
+            payload["format"] = response_format
+        
+        try:
+            async with self.scheduler.slot(priority, user_id) as queue_seconds:
+                deadline_plan = self._plan_deadline(model, payload, deadline)
+                response = await ollama_pool.post(
+                    self.client, "/api/chat", model, user_id,
+                    json=payload,
+                    timeout=get_timeout("ollama.generate", request_timeout)
+                )
+            result = response.json()
+            throughput_tracker.record(model, result)
+            
+            generation_time = int((time.time() - start_time) * 1000)
+            
+            return {
+                "content": result.get("message", {}).get("content", ""),
+                "tokens_used": result.get("eval_count", 0) + result.get("prompt_eval_count", 0),
+                "completion_tokens": result.get("eval_count", 0),
+                "generation_time_ms": generation_time,
+                "queue_time_ms": int(queue_seconds * 1000),
+                "model": model,
+                "deadline_plan": deadline_plan,
+                **self._record_prefix_reuse(messages, result),
+                "success": True
+            }
+            
+        except Exception as e:
+            err_str = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            logger.error(f"Chat generation error: {err_str}")
+            return {
+                "content": "",
+                "error": err_str,
+                "success": False,
+                "generation_time_ms": int((time.time() - start_time) * 1000)
+            }
+
+    def _record_prefix_reuse(self, messages: List[Dict[str, str]], data: Dict[str, Any]) -> Dict[str, int]:
+        """
+        Compare the tokens Ollama actually evaluated against the prompt size.
+        Ollama only reports evaluated tokens, so the total is estimated and the
+        difference is what the KV cache served.
+        """
+        estimated = self._estimate_tokens("".join(m["content"] for m in messages), "")
+        evaluated = data.get("prompt_eval_count", 0)
+        prefix_cache_stats["requests"] += 1
+        prefix_cache_stats["prompt_tokens_estimated"] += estimated
+        prefix_cache_stats["prompt_tokens_evaluated"] += min(evaluated, estimated)
+        cached = max(0, estimated - evaluated)
+        logger.info(f"Prompt prefix reuse: evaluated {evaluated} of ~{estimated} prompt tokens ({cached} cached)")
+        return {
+            "prompt_eval_count": evaluated,
+            "prompt_tokens_estimated": estimated,
+            "prompt_tokens_cached": cached,
+        }
+
     async def generate_story_content_routed(
         self,
         user_config: Dict[str, Any],
@@ -150,43 +424,225 @@ class GeminiService:
         max_tokens: Optional[int] = None,
         temperature_override: Optional[float] = None,
         request_timeout: Optional[float] = None,
+        priority: Priority = Priority.INTERACTIVE,
+        user_id: Optional[Any] = None,
+        prefix_stable: bool = False,
+        cacheable: bool = False,
+        response_format: Optional[Dict[str, Any]] = None,
+        deadline_seconds: Optional[float] = None,
     ) -> Dict[str, Any]:
         """
         Dispatch generation to Ollama or an external provider based on user_config.
-        user_config shape: {"provider": str, "api_key": str|None, "model": str}
+        user_config shape: {"provider": str, "api_key": str|None, "model": str,
+        "fallbacks": [configs]} (see get_user_ai_config).
         Falls back to Ollama if provider is 'ollama' or unknown.
+        prefix_stable, cacheable and deadline_seconds only affect Ollama (see generate_story_content);
+        response_format uses the provider's native JSON mode for external calls.
+        
+        Providers whose circuit breaker is open are skipped and a failed call moves
+        on to the next fallback, so a failing upstream costs one timeout rather
+        than one per request. With HEDGE_TO_OLLAMA, an external call that runs
+        past its usual latency percentile is raced against local Ollama.
+        The result names the 'provider' that answered, plus 'providers_tried'
+        when more than one was used.
         """
-        provider = user_config.get("provider", "ollama")
+        request = dict(
+            prompt=prompt,
+            system_prompt=system_prompt,
+            writing_mode=writing_mode,
+            context=context,
+            max_tokens=max_tokens,
+            temperature_override=temperature_override,
+            request_timeout=request_timeout,
+            priority=priority,
+            user_id=user_id,
+            prefix_stable=prefix_stable,
+            cacheable=cacheable,
+            response_format=response_format,
+            deadline_seconds=deadline_seconds,
+        )
+        tried = []
+        result = None
+        for config in [user_config, *user_config.get("fallbacks", [])]:
+            provider = config.get("provider", "ollama")
+            if not provider_breakers.get(provider).allow():
+                continue
+            if tried:
+                logger.warning(f"Falling back from {tried[-1]} to {provider}: {result.get('error')}")
+            hedge_delay = self._hedge_delay(provider)
+            if hedge_delay is not None:
+                result = await self._generate_hedged(config, request, hedge_delay)
+            else:
+                result = await self._generate_on(config, request)
+            tried.append(provider)
+            if result.get("success"):
+                break
+
+        if result is None:
+            # Every breaker is open: the user's own provider still gets the call
+            result = await self._generate_on(user_config, request)
+            tried.append(user_config.get("provider", "ollama"))
+        if len(tried) > 1:
+            result["providers_tried"] = tried
+            if result.get("success"):
+                provider_breakers.stats["fallbacks"] += 1
+        return result
+
+    async def _generate_on(self, config: Dict[str, Any], request: Dict[str, Any]) -> Dict[str, Any]:
+        """One generation on one provider, reported to its circuit breaker"""
+        provider = config.get("provider", "ollama")
+        start = time.monotonic()
 
         if provider == "ollama":
-            return await self.generate_story_content(
-                prompt=prompt,
-                system_prompt=system_prompt,
-                writing_mode=writing_mode,
-                context=context,
-                max_tokens=max_tokens,
-                temperature_override=temperature_override,
-                request_timeout=request_timeout,
+            result = await self.generate_story_content(**request)
+        else:
+            from app.services.external_ai_service import generate_external
+            full_prompt = self._build_full_prompt(request["system_prompt"], request["context"], request["prompt"])
+            generation_options = self._get_generation_options(
+                request["writing_mode"], request["max_tokens"], request["temperature_override"]
+            )
+            max_tokens = request["max_tokens"] or generation_options.get("num_predict", 800)
+            async with self.scheduler.slot(request["priority"], request["user_id"], backend=provider) as queue_seconds:
+                result = await generate_external(
+                    provider=provider,
+                    api_key=config.get("api_key", ""),
+                    model=config.get("model", ""),
+                    prompt=full_prompt,
+                    system_prompt="",   # already embedded in full_prompt
+                    max_tokens=max_tokens,
+                    temperature=generation_options.get("temperature", 0.7),
+                    request_timeout=request["request_timeout"] or settings.timeout_external_generate,
+                    json_schema=request["response_format"],
+                )
+            result["queue_time_ms"] = int(queue_seconds * 1000)
+            # History latency includes the queue wait, as it does for Ollama
+            self._record_history(
+                provider, config.get("model"), request["writing_mode"], request["prompt"], full_prompt,
+                {**result, "generation_time_ms": result.get("generation_time_ms", 0) + result["queue_time_ms"]},
+                request["user_id"], {**generation_options, "num_predict": max_tokens}
             )
 
-        # External provider
-        from app.services.external_ai_service import generate_external
-        full_prompt = self._build_full_prompt(system_prompt, context, prompt)
-        generation_options = self._get_generation_options(writing_mode, max_tokens, temperature_override)
-        temperature = generation_options.get("temperature", 0.7)
-        tokens = max_tokens or generation_options.get("num_predict", 800)
-        timeout = request_timeout or 120.0
+        # Cached answers say nothing about the provider's health or speed
+        if not result.get("cache_hit"):
+            latency = time.monotonic() - start - result.get("queue_time_ms", 0) / 1000
+            provider_breakers.get(provider).record(
+                not counts_as_failure(result), latency if result.get("success") else None
+            )
+        result.setdefault("provider", provider)
+        return result
 
-        return await generate_external(
-            provider=provider,
-            api_key=user_config.get("api_key", ""),
-            model=user_config.get("model", ""),
-            prompt=full_prompt,
-            system_prompt="",   # already embedded in full_prompt
-            max_tokens=tokens,
-            temperature=temperature,
-            request_timeout=timeout,
+    def _hedge_delay(self, provider: str) -> Optional[float]:
+        """Seconds after which an external call is hedged, or None to not hedge"""
+        if provider == "ollama" or not settings.hedge_to_ollama:
+            return None
+        return provider_breakers.get(provider).latency_percentile(settings.hedge_percentile)
+
+    async def _generate_hedged(
+        self,
+        config: Dict[str, Any],
+        request: Dict[str, Any],
+        delay: float
+    ) -> Dict[str, Any]:
+        """Start the external call; if it is still running after delay, race it against Ollama"""
+        tasks = [asyncio.ensure_future(self._generate_on(config, request))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not provider_breakers.get("ollama").allow():
+                return await tasks[0]
+
+            provider_breakers.stats["hedged"] += 1
+            logger.info(f"{config.get('provider')} slower than {delay:.1f}s; hedging with Ollama")
+            ollama_config = {"provider": "ollama", "api_key": None, "model": get_runtime_model_name()}
+            tasks.append(asyncio.ensure_future(self._generate_on(ollama_config, request)))
+            pending = set(tasks)
+            result = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result.get("success"):
+                        if task is tasks[1]:
+                            provider_breakers.stats["hedge_wins"] += 1
+                        result["hedged"] = True
+                        return result
+            return result
+        finally:
+            # The losing call is cancelled, which closes its upstream request
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def generate_structured(
+        self,
+        prompt: str,
+        system_prompt: str,
+        schema: Dict[str, Any],
+        call_site: str,
+        context: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        writing_mode: WritingMode = WritingMode.USER_LEAD,
+        temperature_override: Optional[float] = None,
+        request_timeout: Optional[float] = None,
+        priority: Priority = Priority.BATCH,
+        user_id: Optional[Any] = None,
+        cacheable: bool = True,
+        prefix_stable: bool = False,
+        user_config: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Generate JSON that matches schema.
+        Ollama decodes under the schema (`format`), external providers use their
+        native JSON modes, so the output is parsed once with json.loads;
+        _parse_json_from_text is only a fallback for truncated output. Outcomes
+        are counted per call_site (see structured_output_stats).
+        
+        Returns:
+            The generation result plus 'data' (the validated object with any
+            invalid parts dropped, or None), 'parsed', and 'validation_errors'
+            when the JSON did not fully match schema
+        """
+        config = user_config or {"provider": "ollama"}
+        provider = config.get("provider", "ollama")
+        result = await self.generate_story_content_routed(
+            user_config=config,
+            prompt=prompt,
+            system_prompt=system_prompt,
+            writing_mode=writing_mode,
+            context=context,
+            max_tokens=max_tokens,
+            temperature_override=temperature_override,
+            request_timeout=request_timeout,
+            priority=priority,
+            user_id=user_id,
+            prefix_stable=prefix_stable,
+            cacheable=cacheable,
+            response_format=schema,
         )
+        
+        data = None
+        if not result.get("success"):
+            outcome = "failed"
+        else:
+            content = result.get("content", "")
+            try:
+                data = json.loads(content)
+                outcome = "parsed"
+            except json.JSONDecodeError:
+                data = self._parse_json_from_text(content, "[" if schema.get("type") == "array" else "{")
+                outcome = "repaired" if data is not None else "unparseable"
+            if data is not None:
+                data, errors = prune_invalid(data, schema)
+                if errors:
+                    logger.warning(f"{call_site} output does not match schema: {errors[:3]}")
+                    result["validation_errors"] = errors[:10]
+                    outcome = "invalid" if data is None else "partial"
+            if data is None:
+                await self.discard_cached_result(result)
+        
+        structured_output_stats.record(call_site, outcome, provider, cache_hit=bool(result.get("cache_hit")))
+        result["data"] = data
+        result["parsed"] = data is not None
+        return result
 
     async def generate_story_content_stream(
         self,
@@ -194,46 +650,268 @@ class GeminiService:
         system_prompt: str,
         writing_mode: WritingMode,
         context: Optional[str] = None,
-        max_tokens: Optional[int] = None
+        max_tokens: Optional[int] = None,
+        priority: Priority = Priority.INTERACTIVE,
+        user_id: Optional[Any] = None,
+        prefix_stable: bool = False,
+        temperature_override: Optional[float] = None,
+        stream_stats: Optional[Dict[str, Any]] = None
     ) -> AsyncGenerator[str, None]:
         """
         Generate story content with streaming response
         Yields chunks of text as they are generated
+        prefix_stable streams from /api/chat with keep_alive (see generate_story_content)
+        stream_stats, when given, receives token usage once the stream completes,
+        and failures are reported as stream_stats["error"] instead of an in-band
+        "[Error: ...]" chunk
         """
-        # Build full prompt with system instructions and context
-        full_prompt = self._build_full_prompt(system_prompt, context, prompt)
-        
         # Get generation options for mode
-        generation_options = self._get_generation_options(writing_mode, max_tokens)
+        generation_options = self._get_generation_options(writing_mode, max_tokens, temperature_override)
         
+        model = get_runtime_model_name()
+        if prefix_stable:
+            messages = self._build_chat_messages(system_prompt, context, prompt)
+            endpoint = "/api/chat"
+            payload = {
+                "model": model,
+                "messages": messages,
+                "stream": True,
+                "options": self._ollama_options(model, generation_options, json.dumps(messages, ensure_ascii=False)),
+                "keep_alive": settings.ollama_keep_alive
+            }
+        else:
+            # Build full prompt with system instructions and context
+            endpoint = "/api/generate"
+            full_prompt = self._build_full_prompt(system_prompt, context, prompt)
+            payload = {
+                "model": model,
+                "prompt": full_prompt,
+                "stream": True,
+                "options": self._ollama_options(model, generation_options, full_prompt),
+                "keep_alive": settings.ollama_keep_alive
+            }
+        
+        # Kept for the generation_history row
+        start_time = time.time()
+        chunks: List[str] = []
+        record = {"success": True}
+        cancelled = False
         try:
-            # Call Ollama API with streaming
-            async with self.client.stream(
-                "POST",
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": get_runtime_model_name(),
-                    "prompt": full_prompt,
-                    "stream": True,
-                    "options": generation_options
-                }
-            ) as response:
+            # Hold a scheduler slot for the whole stream, then call Ollama API with streaming
+            async with self.scheduler.slot(priority, user_id) as queue_seconds, \
+                    ollama_pool.stream(
+                        self.client, "POST", endpoint, payload["model"], user_id,
+                        json=payload,
+                        timeout=get_timeout("ollama.generate")
+                    ) as response:
+                record["queue_time_ms"] = int(queue_seconds * 1000)
                 response.raise_for_status()
                 async for line in response.aiter_lines():
                     if line:
                         try:
                             data = json.loads(line)
-                            if "response" in data:
-                                yield data["response"]
+                            text = data.get("response") or data.get("message", {}).get("content")
+                            if text:
+                                if not chunks:
+                                    record["time_to_first_token_ms"] = int((time.time() - start_time) * 1000)
+                                chunks.append(text)
+                                yield text
                             if data.get("done", False):
+                                throughput_tracker.record(payload["model"], data)
+                                record["tokens_used"] = data.get("eval_count", 0) + data.get("prompt_eval_count", 0)
+                                record["completion_tokens"] = data.get("eval_count", 0)
+                                if stream_stats is not None:
+                                    stream_stats["tokens_used"] = (
+                                        data.get("eval_count", 0) + data.get("prompt_eval_count", 0)
+                                    )
+                                if prefix_stable:
+                                    reuse = self._record_prefix_reuse(messages, data)
+                                    if stream_stats is not None:
+                                        stream_stats.update(reuse)
                                 break
                         except json.JSONDecodeError:
                             continue
                             
+        except (GeneratorExit, asyncio.CancelledError):
+            cancelled = True
+            raise
         except Exception as e:
             logger.error(f"Streaming generation error: {e}")
-            yield f"\n[Error: {str(e)}]"
+            record.update(success=False, error=str(e))
+            if stream_stats is not None:
+                stream_stats["error"] = str(e)
+            else:
+                yield f"\n[Error: {str(e)}]"
+        finally:
+            record.update(content="".join(chunks), generation_time_ms=int((time.time() - start_time) * 1000))
+            self._record_history(
+                "ollama", payload["model"], writing_mode, prompt, payload.get("prompt") or json.dumps(messages, ensure_ascii=False),
+                record, user_id, generation_options, streamed=True, cancelled=cancelled
+            )
     
+    async def generate_story_content_stream_routed(
+        self,
+        user_config: Dict[str, Any],
+        prompt: str,
+        system_prompt: str,
+        writing_mode: WritingMode,
+        context: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        temperature_override: Optional[float] = None,
+        request_timeout: Optional[float] = None,
+        priority: Priority = Priority.INTERACTIVE,
+        user_id: Optional[Any] = None,
+        prefix_stable: bool = False,
+        stream_stats: Optional[Dict[str, Any]] = None,
+    ) -> AsyncGenerator[str, None]:
+        """
+        Streaming counterpart of generate_story_content_routed.
+        Yields text chunks from Ollama or the user's external provider.
+        stream_stats, when given, is filled with provider, model,
+        time_to_first_token_ms, total_time_ms, tokens_used (when reported) and
+        error on failure.
+        Open circuit breakers are skipped, and a provider that fails before its
+        first chunk falls back like the non-streaming call; once text has been
+        sent a failure is final.
+        """
+        stats = stream_stats if stream_stats is not None else {}
+        start_time = time.time()
+        request = dict(
+            prompt=prompt,
+            system_prompt=system_prompt,
+            writing_mode=writing_mode,
+            context=context,
+            max_tokens=max_tokens,
+            temperature_override=temperature_override,
+            request_timeout=request_timeout,
+            priority=priority,
+            user_id=user_id,
+            prefix_stable=prefix_stable,
+        )
+        candidates = [user_config, *user_config.get("fallbacks", [])]
+        tried = []
+        for config in candidates:
+            provider = config.get("provider", "ollama")
+            if not provider_breakers.get(provider).allow():
+                if config is not candidates[-1] or tried:
+                    continue
+                config = user_config  # Every breaker is open: the user's own provider still gets the call
+                provider = config.get("provider", "ollama")
+            if tried:
+                logger.warning(f"Falling back from {tried[-1]} to {provider}: {stats.get('error')}")
+                stats.pop("error", None)
+                stats.pop("status_code", None)
+            tried.append(provider)
+
+            sent = False
+            async for chunk in self._track_first_token(self._stream_on(config, request, stats), stats, start_time):
+                sent = True
+                yield chunk
+            failed = "error" in stats
+            provider_breakers.get(provider).record(
+                not counts_as_failure({"success": not failed, "status_code": stats.get("status_code")})
+            )
+            if not failed or sent:
+                break
+
+        if len(tried) > 1:
+            stats["providers_tried"] = tried
+            if "error" not in stats:
+                provider_breakers.stats["fallbacks"] += 1
+
+    async def _stream_on(
+        self,
+        config: Dict[str, Any],
+        request: Dict[str, Any],
+        stats: Dict[str, Any]
+    ) -> AsyncGenerator[str, None]:
+        """Stream one generation from one provider; failures land in stats["error"]"""
+        provider = config.get("provider", "ollama")
+
+        if provider == "ollama":
+            stats.update({"provider": "ollama", "model": get_runtime_model_name()})
+            async for chunk in self.generate_story_content_stream(
+                prompt=request["prompt"],
+                system_prompt=request["system_prompt"],
+                writing_mode=request["writing_mode"],
+                context=request["context"],
+                max_tokens=request["max_tokens"],
+                priority=request["priority"],
+                user_id=request["user_id"],
+                prefix_stable=request["prefix_stable"],
+                temperature_override=request["temperature_override"],
+                stream_stats=stats,
+            ):
+                yield chunk
+            return
+
+        # External provider
+        from app.services.external_ai_service import stream_external
+        full_prompt = self._build_full_prompt(request["system_prompt"], request["context"], request["prompt"])
+        generation_options = self._get_generation_options(
+            request["writing_mode"], request["max_tokens"], request["temperature_override"]
+        )
+        model = config.get("model", "")
+        stats.update({"provider": provider, "model": model})
+        max_tokens = request["max_tokens"] or generation_options.get("num_predict", 800)
+
+        start_time = time.time()
+        chunks: List[str] = []
+        record = {}
+        cancelled = False
+        try:
+            async with self.scheduler.slot(request["priority"], request["user_id"], backend=provider) as queue_seconds:
+                stats["queue_time_ms"] = int(queue_seconds * 1000)
+                async for chunk in stream_external(
+                    provider=provider,
+                    api_key=config.get("api_key", ""),
+                    model=model,
+                    prompt=full_prompt,
+                    system_prompt="",   # already embedded in full_prompt
+                    max_tokens=max_tokens,
+                    temperature=generation_options.get("temperature", 0.7),
+                    request_timeout=request["request_timeout"] or settings.timeout_external_generate,
+                    stream_stats=stats,
+                ):
+                    if not chunks:
+                        record["time_to_first_token_ms"] = int((time.time() - start_time) * 1000)
+                    chunks.append(chunk)
+                    yield chunk
+        except (GeneratorExit, asyncio.CancelledError):
+            cancelled = True
+            raise
+        finally:
+            record.update(
+                content="".join(chunks),
+                success="error" not in stats,
+                error=stats.get("error"),
+                tokens_used=stats.get("tokens_used"),
+                completion_tokens=stats.get("completion_tokens"),
+                queue_time_ms=stats.get("queue_time_ms"),
+                generation_time_ms=int((time.time() - start_time) * 1000),
+            )
+            self._record_history(
+                provider, model, request["writing_mode"], request["prompt"], full_prompt, record,
+                request["user_id"], {**generation_options, "num_predict": max_tokens}, streamed=True,
+                cancelled=cancelled
+            )
+
+    async def _track_first_token(
+        self,
+        source: AsyncGenerator[str, None],
+        stats: Dict[str, Any],
+        start_time: float
+    ) -> AsyncGenerator[str, None]:
+        """Pass chunks through, recording time-to-first-token and total stream time"""
+        try:
+            async for chunk in source:
+                if "time_to_first_token_ms" not in stats:
+                    stats["time_to_first_token_ms"] = int((time.time() - start_time) * 1000)
+                yield chunk
+        finally:
+            stats["total_time_ms"] = int((time.time() - start_time) * 1000)
+            await source.aclose()
+
     async def generate_continuation_stream(
         self,
         story_context: str,
@@ -344,7 +1022,8 @@ SUMMARY:"""
             prompt=prompt,
             system_prompt=system_prompt,
             writing_mode=WritingMode.USER_LEAD,  # Use precise mode for summaries
-            max_tokens=max_tokens or settings.max_tokens_summary
+            max_tokens=max_tokens or settings.max_tokens_summary,
+            cacheable=True
         )
     
     async def generate_story_recap(
@@ -527,25 +1206,28 @@ IMAGE PROMPT:"""
             
             # Call Ollama API with image
             # Note: Requires a vision-capable model like llava, bakllava, or moondream
-            response = await self.client.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": get_runtime_vision_model_name(),
-                    "prompt": full_prompt,
-                    "images": [image_base64],
-                    "stream": False,
-                    "options": generation_options
-                }
-            )
-            response.raise_for_status()
+            vision_model = get_runtime_vision_model_name()
+            async with self.scheduler.slot(Priority.INTERACTIVE):
+                response = await ollama_pool.post(
+                    self.client, "/api/generate", vision_model,
+                    json={
+                        "model": vision_model,
+                        "prompt": full_prompt,
+                        "images": [image_base64],
+                        "stream": False,
+                        "options": self._ollama_options(vision_model, generation_options, full_prompt)
+                    },
+                    timeout=get_timeout("ollama.generate")
+                )
             result = response.json()
             
             generation_time = int((time.time() - start_time) * 1000)
             
-            return {
+            result = {
                 "content": result.get("response", ""),
                 "image_description": "Image analyzed successfully",
                 "tokens_used": result.get("eval_count", 0) + result.get("prompt_eval_count", 0),
+                "completion_tokens": result.get("eval_count", 0),
                 "generation_time_ms": generation_time,
                 "model": get_runtime_vision_model_name(),
                 "success": True
@@ -555,12 +1237,16 @@ IMAGE PROMPT:"""
             logger.error(f"Image analysis error: {e}")
             # Fallback: If vision model fails, generate based on prompt alone
             logger.info("Falling back to text-only generation")
-            return {
+            result = {
                 "content": "",
                 "error": f"Vision analysis failed: {str(e)}. Make sure you have a vision-capable model (like llava) installed in Ollama.",
                 "success": False,
                 "generation_time_ms": int((time.time() - start_time) * 1000)
             }
+        self._record_history(
+            "ollama", get_runtime_vision_model_name(), writing_mode, prompt, full_prompt, result, None, generation_options
+        )
+        return result
     
     async def brainstorm_ideas(
         self,
@@ -598,16 +1284,16 @@ Generate 5 different creative options, ranging from safe to bold:"""
         full_prompt = self._build_full_prompt(system_prompt, None, prompt)
         generation_options = self._get_generation_options(writing_mode)
         
-        async with self.client.stream(
-            "POST",
-            f"{self.base_url}/api/generate",
+        model = get_runtime_model_name()
+        async with self.scheduler.slot(Priority.INTERACTIVE), ollama_pool.stream(
+            self.client, "POST", "/api/generate", model,
             json={
-                "model": get_runtime_model_name(),
+                "model": model,
                 "prompt": full_prompt,
                 "stream": True,
-                "options": generation_options
+                "options": self._ollama_options(model, generation_options, full_prompt)
             },
-            timeout=300.0
+            timeout=get_timeout("ollama.generate", 300.0)
         ) as response:
             async for line in response.aiter_lines():
                 if line.strip():
@@ -634,6 +1320,19 @@ Generate 5 different creative options, ranging from safe to bold:"""
         
         return "\n".join(parts)
     
+    def _build_chat_messages(
+        self,
+        system_prompt: str,
+        context: Optional[str],
+        user_prompt: str
+    ) -> List[Dict[str, str]]:
+        """Chat messages for prefix-stable calls: stable context leads the user turn"""
+        content = f"CONTEXT:\n{context}\n\n{user_prompt}" if context else user_prompt
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": content},
+        ]
+    
     def _get_continuation_system_prompt(
         self,
         writing_mode: WritingMode,
@@ -661,110 +1360,17 @@ Generate 5 different creative options, ranging from safe to bold:"""
         return base_prompt
     
     def _estimate_tokens(self, prompt: str, response: str) -> int:
-        """Estimate token count (rough approximation)"""
-        # Rough estimate: ~4 characters per token
-        total_chars = len(prompt) + len(response)
-        return total_chars // 4
+        """Estimate token count (per-script calibrated, see context_packer)"""
+        return estimate_tokens(prompt) + estimate_tokens(response)
 
-    def _parse_json_from_text(self, text: str) -> Optional[Dict[str, Any]]:
-        """Best-effort JSON extraction from model output, including truncated JSON recovery."""
-        cleaned = text.strip()
+    async def discard_cached_result(self, result: Dict[str, Any]) -> None:
+        """Evict a cached response whose content could not be used (e.g. unparseable JSON)"""
+        if result.get("cache_key"):
+            await response_cache.delete(result["cache_key"])
 
-        def try_load(candidate: str) -> Optional[Dict[str, Any]]:
-            try:
-                return json.loads(candidate)
-            except json.JSONDecodeError:
-                return None
-
-        def fix_and_load(candidate: str) -> Optional[Dict[str, Any]]:
-            # Fix trailing commas before ] or }
-            fixed = re.sub(r",\s*([}\]])", r"\1", candidate)
-            result = try_load(fixed)
-            if result is not None:
-                return result
-            # Try to repair truncated JSON by closing open braces/brackets
-            return self._recover_truncated_json(fixed)
-
-        # 1. Try direct parse
-        direct = try_load(cleaned)
-        if direct is not None:
-            return direct
-
-        # 2. Strip markdown fences that weren't caught upstream
-        stripped = re.sub(r"^```(?:json)?\s*", "", cleaned, flags=re.IGNORECASE)
-        stripped = re.sub(r"\s*```$", "", stripped).strip()
-        direct2 = try_load(stripped)
-        if direct2 is not None:
-            return direct2
-
-        # 3. Extract first JSON object
-        match = re.search(r"\{.*\}", stripped, re.DOTALL)
-        if not match:
-            match = re.search(r"\{.*\}", cleaned, re.DOTALL)
-        if not match:
-            return None
-
-        return fix_and_load(match.group(0))
-
-    def _recover_truncated_json(self, text: str) -> Optional[Dict[str, Any]]:
-        """Attempt to close open braces/brackets in truncated JSON and parse it."""
-        # Remove trailing incomplete string/value by truncating at last complete value
-        # Strategy: find the deepest position where we can cleanly close
-        stack = []
-        in_string = False
-        escape_next = False
-        last_safe_pos = 0
-
-        for i, ch in enumerate(text):
-            if escape_next:
-                escape_next = False
-                continue
-            if ch == '\\' and in_string:
-                escape_next = True
-                continue
-            if ch == '"':
-                in_string = not in_string
-                continue
-            if in_string:
-                continue
-            if ch in ('{', '['):
-                stack.append(ch)
-            elif ch in ('}', ']'):
-                if stack:
-                    stack.pop()
-                if not stack:
-                    last_safe_pos = i + 1  # complete top-level object
-
-        if last_safe_pos > 0:
-            # The JSON was complete up to last_safe_pos
-            candidate = text[:last_safe_pos]
-            candidate = re.sub(r",\s*([}\]])", r"\1", candidate)
-            try:
-                return json.loads(candidate)
-            except json.JSONDecodeError:
-                pass
-
-        if not stack:
-            return None  # nothing to close
-
-        # Truncate at last comma or colon at top level to remove partial value
-        truncated = text.rstrip()
-        # Remove trailing incomplete tokens (partial strings, dangling comma, etc.)
-        truncated = re.sub(r',\s*$', '', truncated)  # trailing comma
-        truncated = re.sub(r'"[^"]*$', '', truncated)  # unclosed string
-        truncated = re.sub(r',\s*$', '', truncated)  # another trailing comma
-        truncated = re.sub(r':\s*$', '', truncated)  # dangling colon
-        truncated = truncated.rstrip()
-
-        # Close remaining open brackets/braces in reverse order
-        closers = {'[': ']', '{': '}'}
-        closing = ''.join(closers[ch] for ch in reversed(stack))
-        candidate = truncated + closing
-        candidate = re.sub(r",\s*([}\]])", r"\1", candidate)
-        try:
-            return json.loads(candidate)
-        except json.JSONDecodeError:
-            return None
+    def _parse_json_from_text(self, text: str, roots: str = "{") -> Optional[Any]:
+        """Best-effort JSON extraction from model output, including truncated JSON recovery (see json_repair)"""
+        return extract_json(text, roots)
     
     async def generate_story_bible_simple(
         self,
@@ -772,6 +1378,8 @@ Generate 5 different creative options, ranging from safe to bold:"""
         story_title: str,
         story_genre: str,
         max_tokens: Optional[int] = None,
+        priority: Priority = Priority.BATCH,
+        user_id: Optional[Any] = None,
     ) -> Dict[str, Any]:
         """
         Simplified Story Bible generation with a minimal JSON schema.
@@ -784,20 +1392,18 @@ Generate 5 different creative options, ranging from safe to bold:"""
 Return ONLY this JSON (no other text):
 {{"world_description":"...","world_type":"{story_genre}","time_period":"...","central_themes":["..."],"quick_facts":["..."],"primary_locations":[{{"name":"...","description":"..."}}]}}"""
 
-        result = await self.generate_story_content(
+        result = await self.generate_structured(
             prompt=prompt,
             system_prompt="Return ONLY valid JSON. No markdown, no explanation, no extra text.",
-            writing_mode=WritingMode.USER_LEAD,
+            schema=STORY_BIBLE_SIMPLE_SCHEMA,
+            call_site="story_bible_simple",
             max_tokens=min(max_tokens or 350, 350),  # 350 tokens to avoid mid-JSON truncation
             request_timeout=120.0,  # 2 min: covers ~(120-prompt-tokens + 350 output) / 9 tok/s
+            priority=priority,
+            user_id=user_id,
         )
-        if result.get("success"):
-            bible_data = self._parse_json_from_text(result.get("content", ""))
-            if bible_data is not None:
-                result["bible_data"] = bible_data
-                result["parsed"] = True
-            else:
-                result["parsed"] = False
+        if result["parsed"]:
+            result["bible_data"] = result["data"]
         return result
 
     async def generate_story_bible(
@@ -808,7 +1414,9 @@ Return ONLY this JSON (no other text):
         story_tone: str,
         existing_characters: Optional[str] = None,
         language: str = "English",
-        max_tokens: Optional[int] = None
+        max_tokens: Optional[int] = None,
+        priority: Priority = Priority.BATCH,
+        user_id: Optional[Any] = None
     ) -> Dict[str, Any]:
         """
         Auto-generate Story Bible by analyzing story content.
@@ -877,37 +1485,23 @@ Extract and generate the following as a JSON object:
 Analyze carefully and be comprehensive. For a {story_tone} tone {story_genre} story.
 Respond with ONLY the JSON object:"""
 
-        result = await self.generate_story_content(
+        result = await self.generate_structured(
             prompt=prompt,
             system_prompt=system_prompt,
-            writing_mode=WritingMode.USER_LEAD,  # Precise mode for analysis
+            schema=STORY_BIBLE_SCHEMA,
+            call_site="story_bible",
             max_tokens=max_tokens or settings.max_tokens_story_bible,
-            request_timeout=300.0  # 5 min for full prompt on CPU Ollama (~9 tok/s)
+            request_timeout=300.0,  # 5 min for full prompt on CPU Ollama (~9 tok/s)
+            priority=priority,
+            user_id=user_id
         )
         
-        if result.get("success"):
-            # Try to parse the JSON response
-            try:
-                content = result["content"].strip()
-                # Handle potential markdown code blocks
-                if content.startswith("```json"):
-                    content = content[7:]
-                if content.startswith("```"):
-                    content = content[3:]
-                if content.endswith("```"):
-                    content = content[:-3]
-                content = content.strip()
-                
-                bible_data = self._parse_json_from_text(content)
-                if bible_data is None:
-                    logger.warning(f"Story Bible JSON parse failed. Raw content ({len(content)} chars): {content[:500]}")
-                    raise json.JSONDecodeError("Failed to parse JSON", content, 0)
-                result["bible_data"] = bible_data
-                result["parsed"] = True
-            except json.JSONDecodeError as e:
-                logger.warning(f"Failed to parse Story Bible JSON: {e}")
-                result["parsed"] = False
-                result["parse_error"] = str(e)
+        if result["parsed"]:
+            result["bible_data"] = result["data"]
+        elif result.get("success"):
+            content = result.get("content", "")
+            logger.warning(f"Story Bible JSON parse failed. Raw content ({len(content)} chars): {content[:500]}")
+            result["parse_error"] = "; ".join(result.get("validation_errors", [])) or "Failed to parse JSON"
         
         return result
     
@@ -917,7 +1511,9 @@ Respond with ONLY the JSON object:"""
         existing_bible: Dict[str, Any],
         story_genre: str,
         language: str = "English",
-        max_tokens: Optional[int] = None
+        max_tokens: Optional[int] = None,
+        priority: Priority = Priority.BATCH,
+        user_id: Optional[Any] = None
     ) -> Dict[str, Any]:
         """
         Update Story Bible incrementally based on new content.
@@ -961,30 +1557,20 @@ Return ONLY NEW elements to add (not duplicates of existing):
 
 Only include sections that have new items. Respond with JSON only:"""
 
-        result = await self.generate_story_content(
+        result = await self.generate_structured(
             prompt=prompt,
             system_prompt=system_prompt,
-            writing_mode=WritingMode.USER_LEAD,
-            max_tokens=max_tokens or settings.max_tokens_story_bible_update
+            schema=STORY_BIBLE_UPDATE_SCHEMA,
+            call_site="story_bible_update",
+            max_tokens=max_tokens or settings.max_tokens_story_bible_update,
+            priority=priority,
+            user_id=user_id
         )
         
-        if result.get("success"):
-            try:
-                content = result["content"].strip()
-                if content.startswith("```json"):
-                    content = content[7:]
-                if content.startswith("```"):
-                    content = content[3:]
-                if content.endswith("```"):
-                    content = content[:-3]
-                content = content.strip()
-                
-                updates = json.loads(content)
-                result["updates"] = updates
-                result["parsed"] = True
-            except json.JSONDecodeError as e:
-                logger.warning(f"Failed to parse Story Bible update JSON: {e}")
-                result["parsed"] = False
+        if result["parsed"]:
+            result["updates"] = result["data"]
+        elif result.get("success"):
+            logger.warning("Failed to parse Story Bible update JSON")
         
         return result
 
@@ -995,7 +1581,9 @@ Only include sections that have new items. Respond with JSON only:"""
         story_genre: str,
         existing_character_names: List[str] = None,
         language: str = "English",
-        max_tokens: Optional[int] = None
+        max_tokens: Optional[int] = None,
+        priority: Priority = Priority.BATCH,
+        user_id: Optional[Any] = None
     ) -> Dict[str, Any]:
         """
         Extract characters from story content using AI analysis.
@@ -1073,32 +1661,21 @@ Be thorough - include ALL characters, even those briefly mentioned.
 Skip any characters already in the existing list.
 Respond with ONLY the JSON object:"""
 
-        result = await self.generate_story_content(
+        result = await self.generate_structured(
             prompt=prompt,
             system_prompt=system_prompt,
-            writing_mode=WritingMode.USER_LEAD,  # Precise mode for analysis
-            max_tokens=max_tokens or settings.max_tokens_character_extraction
+            schema=CHARACTER_EXTRACTION_SCHEMA,
+            call_site="character_extraction",
+            max_tokens=max_tokens or settings.max_tokens_character_extraction,
+            priority=priority,
+            user_id=user_id
         )
         
-        if result.get("success"):
-            try:
-                content = result["content"].strip()
-                # Handle potential markdown code blocks
-                if content.startswith("```json"):
-                    content = content[7:]
-                if content.startswith("```"):
-                    content = content[3:]
-                if content.endswith("```"):
-                    content = content[:-3]
-                content = content.strip()
-                
-                character_data = json.loads(content)
-                result["characters"] = character_data.get("characters", [])
-                result["total_found"] = len(result["characters"])
-                result["parsed"] = True
-            except json.JSONDecodeError as e:
-                logger.warning(f"Failed to parse character extraction JSON: {e}")
-                result["parsed"] = False
-                result["parse_error"] = str(e)
+        if result["parsed"]:
+            result["characters"] = result["data"].get("characters", [])
+            result["total_found"] = len(result["characters"])
+        elif result.get("success"):
+            logger.warning("Failed to parse character extraction JSON")
+            result["parse_error"] = "; ".join(result.get("validation_errors", [])) or "Failed to parse JSON"
         
         return result
@@ -0,0 +1,434 @@
+"""
+Generation Drafts - Write-behind persistence for streamed generations
+The upstream stream runs as its own task that checkpoints small appends to a
+generation_drafts row every few tokens/seconds, so a crash loses at most one
+checkpoint interval. When the stream ends the text is appended to the chapter
+in a single UPDATE. SSE clients subscribe to the live draft and can reconnect
+with the draft id and the number of characters they already received.
+Workers refresh updated_at on their streaming drafts as a heartbeat; a
+streaming draft whose heartbeat stops belonged to a worker that stopped.
+"""
+from typing import Optional, List, Dict, Any, AsyncIterator, Awaitable, Callable
+from datetime import datetime, timedelta
+from uuid import UUID
+import asyncio
+import logging
+import time
+
+from sqlalchemy import update, select, func
+
+from app.config import settings
+from app.database import get_async_session
+from app.models.generation import GenerationDraft, DraftStatus
+from app.services.chapter_service import ChapterService
+
+logger = logging.getLogger(__name__)
+
+chapter_service = ChapterService()
+
+
+class LiveDraft:
+    """In-memory view of a draft that is still streaming on this worker"""
+
+    def __init__(self, draft_id: UUID, story_id: UUID, chapter_id: UUID, language: str):
+        self.id = draft_id
+        self.story_id = story_id
+        self.chapter_id = chapter_id
+        self.language = language
+        self.chunks: List[str] = []
+        self.stats: Dict[str, Any] = {}
+        self.done = False
+        self.status = DraftStatus.STREAMING
+        self.subscribers = 0
+        self.producer: Optional[asyncio.Task] = None
+        self.grace_handle: Optional[asyncio.TimerHandle] = None
+        self._cond = asyncio.Condition()
+
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+    async def publish(self, chunk: str) -> None:
+        async with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    async def close(self) -> None:
+        async with self._cond:
+            self.done = True
+            self._cond.notify_all()
+
+    async def follow(self, offset: int = 0) -> AsyncIterator[str]:
+        """Text from character offset onwards, then live chunks until the stream ends"""
+        snapshot = self.text
+        index = len(self.chunks)
+        if offset < len(snapshot):
+            yield snapshot[offset:]
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(lambda: len(self.chunks) > index or self.done)
+                new_chunks = self.chunks[index:]
+                index = len(self.chunks)
+                finished = self.done
+            for chunk in new_chunks:
+                yield chunk
+            if finished and index == len(self.chunks):
+                return
+
+
+class _CheckpointWriter:
+    """Batches streamed chunks into `content = content || :delta` appends, one write in flight"""
+
+    def __init__(self, draft_id: UUID):
+        self.draft_id = draft_id
+        self.pending: List[str] = []
+        self.pending_chunks = 0
+        self.last_flush = time.monotonic()
+        self.checkpoints = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, chunk: str) -> None:
+        self.pending.append(chunk)
+        self.pending_chunks += 1
+        due = (
+            self.pending_chunks >= settings.draft_checkpoint_tokens
+            or time.monotonic() - self.last_flush >= settings.draft_checkpoint_seconds
+        )
+        if due and (self._task is None or self._task.done()):
+            self._start_flush()
+
+    def _start_flush(self) -> None:
+        delta, count = "".join(self.pending), self.pending_chunks
+        self.pending, self.pending_chunks = [], 0
+        self.last_flush = time.monotonic()
+        self._task = asyncio.ensure_future(self._write(delta, count))
+
+    async def _write(self, delta: str, count: int) -> None:
+        try:
+            async with get_async_session() as db:
+                await db.execute(
+                    update(GenerationDraft)
+                    .where(GenerationDraft.id == self.draft_id)
+                    .values(
+                        content=GenerationDraft.content + delta,
+                        token_count=GenerationDraft.token_count + count,
+                        updated_at=datetime.utcnow()
+                    )
+                )
+                await db.commit()
+            self.checkpoints += 1
+        except Exception as e:
+            # Keep the delta so the next checkpoint retries it, in order
+            logger.warning(f"Draft checkpoint failed for {self.draft_id}: {e}")
+            self.pending.insert(0, delta)
+            self.pending_chunks += count
+
+    async def close(self) -> None:
+        """Wait for the in-flight write and flush whatever is left"""
+        if self._task is not None:
+            await self._task
+        if self.pending:
+            self._start_flush()
+            await self._task
+
+
+# A draft can only be finalized once, from one of these states: by its own
+# stream when it ends, or manually once no stream is writing it
+STREAM_FINALIZE_FROM = (DraftStatus.STREAMING, DraftStatus.FAILED, DraftStatus.INTERRUPTED)
+MANUAL_FINALIZE_FROM = (DraftStatus.INTERRUPTED, DraftStatus.ABANDONED, DraftStatus.FAILED)
+
+
+class GenerationDraftManager:
+    """Starts, tracks and finalizes streamed generations"""
+
+    def __init__(self):
+        self._live: Dict[UUID, LiveDraft] = {}
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    def start_heartbeat(self) -> None:
+        """Refresh this worker's streaming drafts and flag orphaned ones, every DRAFT_HEARTBEAT_SECONDS"""
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.ensure_future(self._heartbeat_loop())
+
+    async def stop_heartbeat(self) -> None:
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.draft_heartbeat_seconds)
+            try:
+                await self.heartbeat()
+                interrupted = await self.mark_interrupted()
+                if interrupted:
+                    logger.info(f"Marked {interrupted} orphaned generation drafts as interrupted")
+            except Exception as e:
+                logger.warning(f"Draft heartbeat failed: {e}")
+
+    async def heartbeat(self) -> None:
+        """Touch updated_at on the drafts streaming on this worker"""
+        draft_ids = [draft_id for draft_id, live in self._live.items() if not live.done]
+        if not draft_ids:
+            return
+        async with get_async_session() as db:
+            await db.execute(
+                update(GenerationDraft)
+                .where(GenerationDraft.id.in_(draft_ids), GenerationDraft.status == DraftStatus.STREAMING)
+                .values(updated_at=datetime.utcnow())
+            )
+            await db.commit()
+
+    def get_live(self, draft_id: UUID) -> Optional[LiveDraft]:
+        return self._live.get(draft_id)
+
+    async def start(
+        self,
+        story_id: UUID,
+        chapter_id: UUID,
+        user_id: Optional[UUID],
+        language: str,
+        source: AsyncIterator[str],
+        on_finalized: Optional[Callable[[str], Awaitable[None]]] = None,
+        stats: Optional[Dict[str, Any]] = None
+    ) -> LiveDraft:
+        """
+        Create the draft row and start pulling from source in the background.
+        stats is the dict the source reports usage/errors into (stream_stats).
+        """
+        async with get_async_session() as db:
+            draft = GenerationDraft(story_id=story_id, chapter_id=chapter_id, user_id=user_id)
+            db.add(draft)
+            await db.commit()
+            draft_id = draft.id
+
+        live = LiveDraft(draft_id, story_id, chapter_id, language)
+        if stats is not None:
+            live.stats = stats
+        self._live[draft_id] = live
+        live.producer = asyncio.ensure_future(self._produce(live, source, on_finalized))
+        return live
+
+    async def subscribe(self, live: LiveDraft, offset: int = 0) -> AsyncIterator[str]:
+        """
+        Follow a live draft. When the last subscriber leaves, the upstream
+        generation is cancelled after STREAM_RESUME_GRACE_SECONDS unless a
+        client reconnects first.
+        """
+        live.subscribers += 1
+        if live.grace_handle is not None:
+            live.grace_handle.cancel()
+            live.grace_handle = None
+        try:
+            async for chunk in live.follow(offset):
+                yield chunk
+        finally:
+            live.subscribers -= 1
+            if live.subscribers == 0 and not live.done:
+                self._schedule_abandon(live)
+
+    def _schedule_abandon(self, live: LiveDraft) -> None:
+        def abandon():
+            live.grace_handle = None
+            if live.subscribers == 0 and live.producer is not None and not live.producer.done():
+                logger.info(f"No client for draft {live.id}; cancelling upstream generation")
+                live.producer.cancel()
+
+        grace = settings.stream_resume_grace_seconds
+        if grace <= 0:
+            abandon()
+        else:
+            live.grace_handle = asyncio.get_running_loop().call_later(grace, abandon)
+
+    async def _produce(
+        self,
+        live: LiveDraft,
+        source: AsyncIterator[str],
+        on_finalized: Optional[Callable[[str], Awaitable[None]]]
+    ) -> None:
+        writer = _CheckpointWriter(live.id)
+        try:
+            async for chunk in source:
+                await live.publish(chunk)
+                writer.add(chunk)
+            await writer.close()
+            # Let subscribers finish before the chapter write
+            await live.close()
+
+            if live.stats.get("error"):
+                await self._set_status(live, DraftStatus.FAILED, error=live.stats["error"])
+                await self._apply_partial_policy(live, on_finalized, "upstream error")
+            elif live.text.strip():
+                await self._finalize(live, on_finalized)
+            else:
+                await self._set_status(live, DraftStatus.ABANDONED)
+        except asyncio.CancelledError:
+            # Unwind the source so its upstream HTTP stream is closed
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            await writer.close()
+            await live.close()
+            await self._apply_partial_policy(live, on_finalized, "client disconnected")
+            raise
+        except Exception as e:
+            logger.error(f"Draft {live.id} failed: {e}")
+            live.stats.setdefault("error", str(e))
+            await live.close()
+            await self._set_status(live, DraftStatus.FAILED, error=str(e))
+        finally:
+            self._live.pop(live.id, None)
+
+    async def _apply_partial_policy(
+        self,
+        live: LiveDraft,
+        on_finalized: Optional[Callable[[str], Awaitable[None]]],
+        reason: str
+    ) -> None:
+        logger.info(
+            f"Stream for chapter {live.chapter_id} ended early ({reason}) after {len(live.chunks)} chunks; "
+            f"partial output policy: {settings.stream_partial_output_policy}"
+        )
+        if settings.stream_partial_output_policy == "save" and live.text.strip():
+            await self._finalize(live, on_finalized)
+        elif live.status == DraftStatus.STREAMING:
+            await self._set_status(live, DraftStatus.ABANDONED)
+
+    async def _set_status(self, live: LiveDraft, status: DraftStatus, error: Optional[str] = None) -> None:
+        live.status = status
+        try:
+            async with get_async_session() as db:
+                await db.execute(
+                    update(GenerationDraft)
+                    .where(GenerationDraft.id == live.id, GenerationDraft.status != DraftStatus.FINALIZED)
+                    .values(status=status, error_message=error, updated_at=datetime.utcnow())
+                )
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"Could not update draft {live.id} status: {e}")
+
+    async def _finalize(
+        self,
+        live: LiveDraft,
+        on_finalized: Optional[Callable[[str], Awaitable[None]]]
+    ) -> None:
+        result = await self.append_to_chapter(
+            live.id, live.chapter_id, live.language, STREAM_FINALIZE_FROM, text=live.text
+        )
+        if not result["success"]:
+            logger.warning(f"Draft {live.id} not added to chapter {live.chapter_id}: {result['error']}")
+            return
+        content = result["content"]
+        live.status = DraftStatus.FINALIZED
+        if on_finalized is not None:
+            try:
+                await on_finalized(content)
+            except Exception as e:
+                logger.warning(f"Post-finalize hook failed for draft {live.id}: {e}")
+
+    async def append_to_chapter(
+        self,
+        draft_id: UUID,
+        chapter_id: UUID,
+        language: str,
+        from_statuses: tuple,
+        text: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Mark the draft finalized if it is in one of from_statuses and append
+        text (default: the draft's checkpointed content) to the chapter, in
+        one transaction. The status flip is a conditional UPDATE, so of two
+        concurrent finalizes only one appends. Returns a result dict with the
+        new chapter "content"; "error" is "not_finalizable", "empty" or
+        "chapter_not_found".
+        """
+        async with get_async_session() as db:
+            result = await db.execute(
+                update(GenerationDraft)
+                .where(GenerationDraft.id == draft_id, GenerationDraft.status.in_(from_statuses))
+                .values(
+                    status=DraftStatus.FINALIZED,
+                    finalized_at=datetime.utcnow(),
+                    updated_at=datetime.utcnow()
+                )
+                .returning(GenerationDraft.content)
+            )
+            row = result.one_or_none()
+            if row is None:
+                await db.rollback()
+                return {"success": False, "error": "not_finalizable"}
+            text = row.content if text is None else text
+            if not (text or "").strip():
+                await db.rollback()
+                return {"success": False, "error": "empty"}
+            appended = await chapter_service.append_content(db, chapter_id, text, language, return_content=True)
+            if appended is None:
+                await db.rollback()
+                return {"success": False, "error": "chapter_not_found"}
+            await db.commit()
+        return {"success": True, "content": appended["content"]}
+
+    async def follow(
+        self,
+        draft_id: UUID,
+        offset: int = 0,
+        state: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Text of a draft from offset as its checkpoints land, until it is no
+        longer streaming; for following a draft that streams on another
+        worker. state receives the final "status" (None if the draft is gone)
+        and "error".
+        """
+        state = {} if state is None else state
+        while True:
+            async with get_async_session() as db:
+                row = (await db.execute(
+                    select(
+                        GenerationDraft.status,
+                        GenerationDraft.error_message,
+                        func.substr(GenerationDraft.content, offset + 1).label("tail")
+                    ).where(GenerationDraft.id == draft_id)
+                )).one_or_none()
+            if row is None:
+                state.update(status=None, error="Draft not found")
+                return
+            state.update(status=row.status, error=row.error_message)
+            if row.tail:
+                offset += len(row.tail)
+                yield row.tail
+            if row.status != DraftStatus.STREAMING:
+                return
+            await asyncio.sleep(settings.draft_checkpoint_seconds)
+
+    async def get_status(self, draft_id: UUID) -> Optional[DraftStatus]:
+        async with get_async_session() as db:
+            result = await db.execute(select(GenerationDraft.status).where(GenerationDraft.id == draft_id))
+            return result.scalar_one_or_none()
+
+    async def mark_interrupted(self) -> int:
+        """
+        Flag drafts left streaming by a worker that stopped: rows whose
+        heartbeat is more than three DRAFT_HEARTBEAT_SECONDS old. Workers that
+        are still streaming refresh theirs, so they are unaffected.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.draft_heartbeat_seconds * 3)
+        async with get_async_session() as db:
+            result = await db.execute(
+                update(GenerationDraft)
+                .where(
+                    GenerationDraft.status == DraftStatus.STREAMING,
+                    GenerationDraft.updated_at < cutoff
+                )
+                .values(status=DraftStatus.INTERRUPTED)
+            )
+            await db.commit()
+        return result.rowcount or 0
+
+
+# Global draft manager
+draft_manager = GenerationDraftManager()
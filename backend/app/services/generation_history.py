@@ -0,0 +1,208 @@
+"""
+Generation History - Batched write-behind of every generation
+Each Ollama or external call (streaming or not) becomes a generation_history
+row with its provider, model, latency, token counts, prompt size and the RAG
+chunks retrieved for the request. Rows are queued in memory and written in one
+multi-row INSERT per flush, so recording never adds a database round trip to
+the generation itself. The rows feed the analytics endpoints.
+"""
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Deque
+from uuid import UUID
+import asyncio
+import logging
+import uuid
+
+from sqlalchemy import insert
+
+from app.config import settings
+from app.database import get_async_session
+from app.models.generation import GenerationHistory, WritingMode
+from app.services.context_packer import estimate_tokens
+from app.services.ollama_pool import story_affinity
+from app.services.text_utils import count_words
+
+logger = logging.getLogger(__name__)
+
+# Route handling the current request, e.g. "POST /api/ai/generate"
+call_site: ContextVar[Optional[str]] = ContextVar("generation_call_site", default=None)
+# RAG chunks retrieved for the current request: (ids, scores)
+_retrieval: ContextVar[Optional[tuple]] = ContextVar("generation_retrieval", default=None)
+
+
+def set_call_site(name: Optional[str]) -> None:
+    """Label generations made by the current request"""
+    call_site.set(name)
+
+
+def note_retrieval(chunks: List[Dict[str, Any]]) -> None:
+    """Attach retrieved chunks (dicts with 'id' and 'score') to later generations of this request"""
+    ids = [c.get("id") for c in chunks]
+    scores = [round(float(c.get("score", 0.0)), 4) for c in chunks]
+    _retrieval.set((ids, scores))
+
+
+def _as_uuid(value: Any) -> Optional[UUID]:
+    if value is None or isinstance(value, UUID):
+        return value
+    try:
+        return UUID(str(value))
+    except ValueError:
+        return None
+
+
+class GenerationRecorder:
+    """
+    Queues generation rows and flushes them in batches from a background
+    task: every GENERATION_HISTORY_FLUSH_SECONDS, or sooner once
+    GENERATION_HISTORY_BATCH_SIZE rows are waiting. A failed flush drops its
+    batch rather than retrying into a database that is down.
+    """
+
+    def __init__(self):
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._lock = asyncio.Lock()
+        self.stats = {"recorded": 0, "written": 0, "dropped": 0, "batches": 0, "failed_batches": 0}
+        self._last_error: Optional[str] = None
+
+    def record(
+        self,
+        provider: str,
+        model: Optional[str],
+        writing_mode: Any,
+        prompt: str,
+        prompt_tokens: int,
+        result: Dict[str, Any],
+        user_id: Optional[Any] = None,
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+        streamed: bool = False,
+        cancelled: bool = False
+    ) -> None:
+        """
+        Queue one generation. result is a generation result dict (content,
+        success, error, tokens_used, completion_tokens, generation_time_ms,
+        queue_time_ms, time_to_first_token_ms, cache_hit, coalesced).
+        Never raises and never waits.
+        """
+        if not settings.generation_history_enabled:
+            return
+        try:
+            content = result.get("content") or ""
+            success = bool(result.get("success")) or cancelled
+            served_elsewhere = bool(result.get("cache_hit") or result.get("coalesced"))
+            completion_tokens = result.get("completion_tokens")
+            if not completion_tokens and content:
+                completion_tokens = estimate_tokens(content)
+            retrieved_ids, retrieval_scores = _retrieval.get() or ([], [])
+            error = result.get("error")
+            row = {
+                "id": uuid.uuid4(),
+                "story_id": _as_uuid(story_affinity.get()),
+                "chapter_id": None,
+                "user_id": _as_uuid(user_id),
+                "generation_type": None,
+                "writing_mode": WritingMode(writing_mode),
+                "call_site": call_site.get(),
+                "prompt": prompt if settings.generation_history_store_text else "",
+                "system_prompt": None,
+                "context_provided": None,
+                "output": content if settings.generation_history_store_text else "",
+                "output_word_count": count_words(content) if content else 0,
+                "provider": provider,
+                "model_used": (model or "unknown")[:100],
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "generation_time_ms": result.get("generation_time_ms"),
+                "queue_time_ms": result.get("queue_time_ms"),
+                "time_to_first_token_ms": result.get("time_to_first_token_ms"),
+                "tokens_used": result.get("tokens_used"),
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens or 0,
+                "streamed": streamed,
+                "cache_hit": served_elsewhere,
+                "retrieved_chunks": retrieved_ids,
+                "retrieval_scores": retrieval_scores,
+                "had_error": not success,
+                "cancelled": cancelled,
+                "error_message": str(error)[:2000] if error and not success else None,
+                "created_at": datetime.utcnow(),
+            }
+        except Exception as e:
+            logger.warning(f"Could not record generation: {e}")
+            return
+
+        if len(self._pending) >= settings.generation_history_max_pending:
+            self._pending.popleft()
+            self.stats["dropped"] += 1
+        self._pending.append(row)
+        self.stats["recorded"] += 1
+        if self._wake is not None and len(self._pending) >= settings.generation_history_batch_size:
+            self._wake.set()
+
+    async def flush(self) -> int:
+        """Write every pending row in one INSERT; returns the number written"""
+        async with self._lock:
+            if not self._pending:
+                return 0
+            rows = list(self._pending)
+            self._pending.clear()
+            try:
+                async with get_async_session() as session:
+                    await session.execute(insert(GenerationHistory), rows)
+                    await session.commit()
+            except asyncio.CancelledError:
+                self._pending.extendleft(reversed(rows))  # Shutdown: the final flush writes them
+                raise
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+                # Log the first failure of a streak; the rest only at debug level
+                log = logger.debug if self._last_error else logger.warning
+                log(f"Dropped {len(rows)} generation history rows: {error}")
+                self._last_error = error
+                self.stats["failed_batches"] += 1
+                self.stats["dropped"] += len(rows)
+                return 0
+            self._last_error = None
+            self.stats["batches"] += 1
+            self.stats["written"] += len(rows)
+            return len(rows)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=settings.generation_history_flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if settings.generation_history_enabled and self._flush_task is None:
+            self._wake = asyncio.Event()
+            self._flush_task = asyncio.ensure_future(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Stop the flush loop and write whatever is still pending"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+            self._wake = None
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "enabled": settings.generation_history_enabled,
+            "pending": len(self._pending),
+            "last_error": self._last_error,
+        }
+
+
+# Global recorder shared by every GeminiService
+generation_recorder = GenerationRecorder()
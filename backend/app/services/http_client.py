@@ -0,0 +1,181 @@
+"""
+HTTP Client Pool - Shared, tuned httpx clients for all model backends
+One long-lived AsyncClient per backend so TCP/TLS connections are reused
+across requests instead of being set up on every call.
+"""
+import httpx
+import logging
+from typing import Dict, Any, Optional
+
+from app.config import settings
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Backends that talk to third-party HTTPS APIs (eligible for HTTP/2)
+EXTERNAL_BACKENDS = ("openai", "anthropic", "gemini")
+
+# Per-route timeouts; the connect timeout is kept short everywhere so an
+# unreachable host fails fast instead of eating the whole read budget.
+ROUTE_TIMEOUTS = {
+    "ollama.generate": settings.timeout_ollama_generate,
+    "ollama.embeddings": settings.timeout_ollama_embeddings,
+    "ollama.import": settings.timeout_ollama_import,
+    "ollama.metadata": settings.timeout_ollama_metadata,
+    "ollama.load": settings.timeout_ollama_load,
+    "external.generate": settings.timeout_external_generate,
+    "sd.generate": settings.timeout_sd_generate,
+    "sd.status": settings.timeout_sd_status,
+}
+
+CONNECT_TIMEOUT = 5.0
+
+
+def get_timeout(route: str, override: Optional[float] = None) -> httpx.Timeout:
+    """Build an httpx.Timeout for a named route, optionally overriding the read budget"""
+    total = override if override is not None else ROUTE_TIMEOUTS.get(route, settings.timeout_ollama_generate)
+    return httpx.Timeout(total, connect=min(CONNECT_TIMEOUT, total))
+
+
+class CountingTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps a backend's transport to keep its usage counters. A request is in
+    flight until its response headers arrive or it fails; connect errors,
+    timeouts and cancellation count as errors.
+    """
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport, stats: Dict[str, int]):
+        self.transport = transport
+        self.stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats["requests_total"] += 1
+        self.stats["in_flight"] += 1
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            self.stats["errors_total"] += 1
+            raise
+        finally:
+            self.stats["in_flight"] -= 1
+        self.stats["responses_total"] += 1
+        if response.status_code >= 400:
+            self.stats["errors_total"] += 1
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+    def connection_counts(self) -> Optional[Dict[str, int]]:
+        """Open and idle connections, if the httpcore pool exposes them"""
+        connections = getattr(getattr(self.transport, "_pool", None), "connections", None)
+        if connections is None:
+            return None
+        return {
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+        }
+
+
+class HttpClientPool:
+    """
+    Lazily creates and caches one httpx.AsyncClient per backend
+    (ollama, stable_diffusion, openai, anthropic, gemini) and keeps
+    lightweight usage counters for the /health endpoint.
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._transports: Dict[str, CountingTransport] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _limits_for(self, backend: str) -> httpx.Limits:
+        if backend == "ollama":
+            max_connections = settings.http_ollama_max_connections
+            max_keepalive = settings.http_ollama_max_keepalive
+        elif backend == "stable_diffusion":
+            max_connections = settings.http_sd_max_connections
+            max_keepalive = settings.http_sd_max_connections
+        else:
+            max_connections = settings.http_external_max_connections
+            max_keepalive = settings.http_external_max_keepalive
+        return httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=settings.http_keepalive_expiry,
+        )
+
+    def _default_route(self, backend: str) -> str:
+        if backend == "ollama":
+            return "ollama.generate"
+        if backend == "stable_diffusion":
+            return "sd.generate"
+        return "external.generate"
+
+    def get_client(self, backend: str) -> httpx.AsyncClient:
+        """Return the shared client for a backend, creating it on first use"""
+        client = self._clients.get(backend)
+        if client is not None and not client.is_closed:
+            return client
+
+        use_http2 = (
+            backend in EXTERNAL_BACKENDS
+            and settings.http2_external_providers
+            and HTTP2_AVAILABLE
+        )
+        stats = self._stats.setdefault(backend, {
+            "requests_total": 0,
+            "responses_total": 0,
+            "errors_total": 0,
+            "in_flight": 0,
+        })
+        transport = CountingTransport(
+            httpx.AsyncHTTPTransport(limits=self._limits_for(backend), http2=use_http2),
+            stats,
+        )
+
+        client = httpx.AsyncClient(
+            timeout=get_timeout(self._default_route(backend)),
+            transport=transport,
+        )
+        self._clients[backend] = client
+        self._transports[backend] = transport
+        logger.info(f"HTTP client pool: created '{backend}' client (http2={use_http2})")
+        return client
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-backend usage stats, including live connection counts when available"""
+        result = {}
+        for backend, client in self._clients.items():
+            limits = self._limits_for(backend)
+            entry = {
+                **self._stats.get(backend, {}),
+                "max_connections": limits.max_connections,
+                "max_keepalive_connections": limits.max_keepalive_connections,
+                "http2": backend in EXTERNAL_BACKENDS and settings.http2_external_providers and HTTP2_AVAILABLE,
+                "closed": client.is_closed,
+            }
+            connections = self._transports[backend].connection_counts()
+            if connections is not None:
+                entry.update(connections)
+            result[backend] = entry
+        return result
+
+    async def aclose(self) -> None:
+        """Close all pooled clients (called on application shutdown)"""
+        for backend, client in list(self._clients.items()):
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Failed to close HTTP client '{backend}': {e}")
+        self._clients.clear()
+        self._transports.clear()
+
+
+# Global pool instance
+http_pool = HttpClientPool()
@@ -11,6 +11,7 @@ import uuid
 import os
 
 from app.config import settings
+from app.services.http_client import http_pool, get_timeout
 
 logger = logging.getLogger(__name__)
 
@@ -32,7 +33,7 @@ class ImageGenerationService:
         self.base_url = getattr(settings, 'sd_base_url', 'http://localhost:7860')
         self.output_dir = Path('static/generated_images')
         self.output_dir.mkdir(parents=True, exist_ok=True)
-        self.client = httpx.AsyncClient(timeout=300.0)  # 5 min timeout for image generation
+        self.client = http_pool.get_client("stable_diffusion")
         
         # Default generation settings
         self.default_settings = {
@@ -49,7 +50,7 @@ class ImageGenerationService:
     async def check_availability(self) -> Dict[str, Any]:
         """Check if Stable Diffusion WebUI is available and running."""
         try:
-            response = await self.client.get(f"{self.base_url}/sdapi/v1/sd-models", timeout=5.0)
+            response = await self.client.get(f"{self.base_url}/sdapi/v1/sd-models", timeout=get_timeout("sd.status"))
             if response.status_code == 200:
                 models = response.json()
                 return {
@@ -132,7 +133,7 @@ class ImageGenerationService:
             response = await self.client.post(
                 f"{self.base_url}/sdapi/v1/txt2img",
                 json=payload,
-                timeout=300.0
+                timeout=get_timeout("sd.generate")
             )
             
             if response.status_code != 200:
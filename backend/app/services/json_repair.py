@@ -0,0 +1,300 @@
+"""
+JSON Repair - Single-pass tolerant JSON extraction from model output
+Finds the first top-level JSON value in free-form text (markdown fences,
+preambles and trailing chatter are skipped) and repairs the usual model
+mistakes while scanning: trailing commas, missing commas, single-quoted
+strings, raw newlines in strings, bare words such as `1-10` or `None`, and
+output that was cut off by num_predict. Text can be fed incrementally, so a
+partial object can be read while tokens are still arriving.
+"""
+from typing import Optional, List, Any
+import json
+import re
+
+# Runs of ordinary string characters are copied in one step
+_DOUBLE_QUOTED_RUN = re.compile(r'[^"\\]+')
+_SINGLE_QUOTED_RUN = re.compile(r"[^'\"\\]+")
+_WHITESPACE_RUN = re.compile(r"[ \t\r\n]+")
+_SCALAR_RUN = re.compile(r"[^,}\]: \t\r\n]+")
+_NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+_LITERALS = {
+    "true": "true", "false": "false", "null": "null",
+    "True": "true", "False": "false", "None": "null",
+}
+_SCALAR_END = frozenset(",}]: \t\r\n")
+_WHITESPACE = frozenset(" \t\r\n")
+_CLOSERS = {"{": "}", "[": "]"}
+_VALID_ESCAPES = frozenset('"\\/bfnrtu')
+
+_decoder = json.JSONDecoder(strict=False)
+
+# Frame states: where the container is in its grammar
+_KEY, _COLON, _VALUE, _AFTER = "key", "colon", "value", "after"
+
+
+class _Frame:
+    __slots__ = ("kind", "state", "key_start")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.state = _KEY if kind == "{" else _VALUE
+        self.key_start = 0
+
+
+def _scalar_json(token: str) -> Optional[str]:
+    """Canonical JSON for a bare token, or None if it is not a literal/number"""
+    if token in _LITERALS:
+        return _LITERALS[token]
+    if _NUMBER.fullmatch(token):
+        return token
+    return None
+
+
+class TolerantJSONParser:
+    """
+    Incremental, single-pass JSON scanner.
+
+    feed() consumes text and rewrites it into valid JSON as it goes; each
+    character is looked at once and repairs are applied in place. snapshot()
+    closes whatever is still open (dropping a half-written key or bare word)
+    and returns the value parsed so far, which is how partial output is read
+    while streaming. Characters after the first top-level value are ignored.
+
+    roots limits which opening characters may start the value, e.g. "{" so a
+    "[Note]" preamble is not mistaken for an array.
+    """
+
+    def __init__(self, roots: str = "{["):
+        self.roots = roots
+        self.complete = False
+        self._out: List[str] = []
+        self._stack: List[_Frame] = []
+        self._started = False
+        self._quote: Optional[str] = None  # Quote char of the open string
+        self._escape = False
+        self._string_is_key = False
+        self._scalar: Optional[int] = None  # Output index where a bare word began
+        self._scalar_is_key = False
+
+    # ─── Scanning ─────────────────────────────────────────────────────────────
+
+    def feed(self, chunk: str) -> bool:
+        """Consume chunk; returns True once the top-level value is complete"""
+        i = 0
+        n = len(chunk)
+        out = self._out
+        while i < n and not self.complete:
+            if not self._started:
+                positions = [p for p in (chunk.find(c, i) for c in self.roots) if p >= 0]
+                if not positions:
+                    return False
+                i = min(positions)
+                self._open(chunk[i])
+                self._started = True
+                i += 1
+                continue
+
+            c = chunk[i]
+            if self._quote is not None:
+                i = self._scan_string(chunk, i)
+                continue
+
+            if self._scalar is not None:
+                if c not in _SCALAR_END:
+                    run = _SCALAR_RUN.match(chunk, i)
+                    out.append(run.group())
+                    i = run.end()
+                    continue
+                self._end_scalar()
+
+            if c in _WHITESPACE:
+                i = _WHITESPACE_RUN.match(chunk, i).end()
+                continue
+            elif c == '"' or c == "'":
+                self._start_string(c)
+            elif c == "{" or c == "[":
+                if self._begin_value():
+                    self._open(c)
+            elif c == "}" or c == "]":
+                self._close()
+            elif c == ",":
+                frame = self._stack[-1]
+                if frame.state == _AFTER:
+                    out.append(",")
+                    frame.state = _KEY if frame.kind == "{" else _VALUE
+            elif c == ":":
+                frame = self._stack[-1]
+                if frame.state == _COLON:
+                    out.append(":")
+                    frame.state = _VALUE
+            else:
+                self._start_scalar(c)
+                run = _SCALAR_RUN.match(chunk, i + 1)
+                if run:
+                    out.append(run.group())
+                    i = run.end()
+                    continue
+            i += 1
+        return self.complete
+
+    def _scan_string(self, chunk: str, i: int) -> int:
+        out = self._out
+        if self._escape:
+            self._escape = False
+            c = chunk[i]
+            # Invalid escapes such as \' or \x keep only the character
+            out.append("\\" + c if c in _VALID_ESCAPES else c)
+            return i + 1
+        run = (_DOUBLE_QUOTED_RUN if self._quote == '"' else _SINGLE_QUOTED_RUN).match(chunk, i)
+        if run:
+            out.append(run.group())
+            return run.end()
+        c = chunk[i]
+        if c == "\\":
+            self._escape = True
+        elif c == self._quote:
+            out.append('"')
+            self._quote = None
+            if self._string_is_key:
+                self._stack[-1].state = _COLON
+            else:
+                self._value_done()
+        else:
+            # A double quote inside a single-quoted string
+            out.append('\\"')
+        return i + 1
+
+    def _start_string(self, quote: str) -> None:
+        self._string_is_key = self._begin_key_or_value()
+        self._out.append('"')
+        self._quote = quote
+
+    def _start_scalar(self, c: str) -> None:
+        self._scalar_is_key = self._begin_key_or_value()
+        self._scalar = len(self._out)
+        self._out.append(c)
+
+    def _begin_key_or_value(self) -> bool:
+        """Prepare for the next token; True if it is an object key"""
+        frame = self._stack[-1]
+        if frame.kind == "{" and frame.state in (_KEY, _AFTER):
+            if frame.state == _AFTER:
+                self._out.append(",")  # Missing comma between members
+            frame.state = _KEY
+            frame.key_start = len(self._out)
+            return True
+        self._begin_value()
+        return False
+
+    def _begin_value(self) -> bool:
+        """Prepare the current container for a value; False if one can't go here"""
+        frame = self._stack[-1]
+        if frame.kind == "[":
+            if frame.state == _AFTER:
+                self._out.append(",")  # Missing comma between elements
+            frame.state = _VALUE
+        elif frame.state == _COLON:
+            self._out.append(":")  # Missing colon after a key
+            frame.state = _VALUE
+        return frame.state == _VALUE
+
+    def _value_done(self) -> None:
+        if self._stack:
+            self._stack[-1].state = _AFTER
+        else:
+            self.complete = True
+
+    def _end_scalar(self) -> None:
+        token = "".join(self._out[self._scalar:])
+        if self._scalar_is_key:
+            # Unquoted key
+            self._out[self._scalar:] = [json.dumps(token, ensure_ascii=False)]
+            self._stack[-1].state = _COLON
+        else:
+            canonical = _scalar_json(token)
+            # Bare words such as `1-10` or `high` become strings
+            self._out[self._scalar:] = [canonical if canonical is not None else json.dumps(token, ensure_ascii=False)]
+            self._value_done()
+        self._scalar = None
+
+    def _open(self, kind: str) -> None:
+        self._stack.append(_Frame(kind))
+        self._out.append(kind)
+
+    def _close(self) -> None:
+        frame = self._stack.pop()
+        out = self._out
+        if frame.kind == "{" and frame.state in (_COLON, _VALUE):
+            del out[frame.key_start:]  # Key without a value
+        if out and out[-1] == ",":
+            out.pop()  # Trailing comma
+        out.append(_CLOSERS[frame.kind])
+        self._value_done()
+
+    # ─── Results ──────────────────────────────────────────────────────────────
+
+    def text(self) -> Optional[str]:
+        """The repaired JSON text so far, with open strings and containers closed"""
+        if not self._started:
+            return None
+        out = list(self._out)
+        states = [(f.kind, f.state, f.key_start) for f in self._stack]
+
+        if self._quote is not None:
+            kind, state, key_start = states[-1]
+            if self._string_is_key:
+                del out[key_start:]  # Half-written key
+                states[-1] = (kind, _KEY, key_start)
+            else:
+                out.append('"')
+                states[-1] = (kind, _AFTER, key_start)
+        elif self._scalar is not None:
+            token = "".join(out[self._scalar:])
+            canonical = None if self._scalar_is_key else _scalar_json(token)
+            kind, state, key_start = states[-1]
+            if canonical is not None:
+                out[self._scalar:] = [canonical]
+                states[-1] = (kind, _AFTER, key_start)
+            else:
+                # Probably a literal or number cut short; drop it
+                del out[self._scalar:]
+
+        for depth, (kind, state, key_start) in enumerate(reversed(states)):
+            if depth:
+                state = _AFTER  # The parent's value is the container just closed
+            if kind == "{" and state in (_COLON, _VALUE):
+                del out[key_start:]
+            if out and out[-1] == ",":
+                out.pop()
+            out.append(_CLOSERS[kind])
+        return "".join(out)
+
+    def snapshot(self) -> Optional[Any]:
+        """Best-effort value of everything fed so far (None before the value starts)"""
+        text = self.text()
+        if text is None:
+            return None
+        try:
+            return _decoder.decode(text)
+        except json.JSONDecodeError:
+            return None
+
+
+def extract_json(text: str, roots: str = "{[") -> Optional[Any]:
+    """
+    First top-level JSON value in text, repaired if necessary.
+    Well-formed JSON is decoded directly by the C decoder; only malformed or
+    truncated output goes through the tolerant scan.
+    """
+    positions = [p for p in (text.find(c) for c in roots) if p >= 0]
+    if not positions:
+        return None
+    start = min(positions)
+    try:
+        value, _ = _decoder.raw_decode(text, start)
+        return value
+    except json.JSONDecodeError:
+        pass
+    parser = TolerantJSONParser(roots)
+    parser.feed(text[start:])
+    return parser.snapshot()
@@ -0,0 +1,237 @@
+"""
+LLM Scheduler - Priority-aware admission control in front of model backends
+Interactive requests (streaming continuations, rewrites) go ahead of batch work
+(branch fan-out, imports, extraction) and background refreshes (debounced
+Story Bible updates). Lower-priority work that is still queued is postponed
+while higher-priority work is waiting.
+"""
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Optional, Dict, Any, Deque, AsyncIterator
+import asyncio
+import logging
+import time
+
+from app.config import settings
+from app.services.ollama_pool import ollama_pool
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Scheduling classes; lower value is served first"""
+    INTERACTIVE = 0
+    BATCH = 1
+    BACKGROUND = 2
+
+
+class _Waiter:
+    __slots__ = ("future", "priority", "user_id", "enqueued_at")
+
+    def __init__(self, future: asyncio.Future, priority: Priority, user_id: str):
+        self.future = future
+        self.priority = priority
+        self.user_id = user_id
+        self.enqueued_at = time.monotonic()
+
+
+class _ClassMetrics:
+    __slots__ = ("dispatched", "total_wait", "max_wait", "recent_waits", "cancelled")
+
+    def __init__(self):
+        self.dispatched = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent_waits: Deque[float] = deque(maxlen=500)
+        self.cancelled = 0
+
+    def record(self, wait: float) -> None:
+        self.dispatched += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.recent_waits.append(wait)
+
+    def snapshot(self) -> Dict[str, Any]:
+        waits = sorted(self.recent_waits)
+
+        def pct(p: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(p * len(waits)))]
+
+        return {
+            "dispatched": self.dispatched,
+            "cancelled_while_queued": self.cancelled,
+            "avg_queue_ms": int(self.total_wait / self.dispatched * 1000) if self.dispatched else 0,
+            "p50_queue_ms": int(pct(0.50) * 1000),
+            "p95_queue_ms": int(pct(0.95) * 1000),
+            "max_queue_ms": int(self.max_wait * 1000),
+        }
+
+
+class _BackendState:
+    def __init__(self, max_concurrency: int, reserved_interactive: int):
+        self.max_concurrency = max(1, max_concurrency)
+        # Slots that only interactive work may use; always leave at least one for others
+        self.low_priority_limit = max(1, self.max_concurrency - max(0, reserved_interactive))
+        self.running = 0
+        self.running_by_priority: Dict[Priority, int] = {p: 0 for p in Priority}
+        # priority -> user_id -> FIFO of waiters (round-robin across users)
+        self.queues: Dict[Priority, "OrderedDict[str, Deque[_Waiter]]"] = {
+            p: OrderedDict() for p in Priority
+        }
+        self.metrics: Dict[Priority, _ClassMetrics] = {p: _ClassMetrics() for p in Priority}
+
+
+class LLMScheduler:
+    """
+    Async scheduler with priority classes, a per-backend concurrency cap and
+    per-user round-robin fairness inside each class.
+
+    Usage:
+        async with llm_scheduler.slot(Priority.BACKGROUND, user_id=...) as queue_seconds:
+            ...call the model...
+    """
+
+    def __init__(self):
+        self._backends: Dict[str, _BackendState] = {}
+
+    def _state(self, backend: str) -> _BackendState:
+        state = self._backends.get(backend)
+        if state is None:
+            if backend == "ollama":
+                cap = settings.llm_max_concurrency_ollama * len(ollama_pool.nodes)
+            else:
+                cap = settings.llm_max_concurrency_external
+            state = _BackendState(cap, settings.llm_interactive_reserved_slots)
+            self._backends[backend] = state
+        return state
+
+    def _has_capacity(self, state: _BackendState, priority: Priority) -> bool:
+        if state.running >= state.max_concurrency:
+            return False
+        if priority > Priority.INTERACTIVE and state.running >= state.low_priority_limit:
+            return False
+        return True
+
+    def _has_waiting(self, state: _BackendState, up_to: Priority) -> bool:
+        """True if any live waiter of equal or higher priority is queued"""
+        for priority in Priority:
+            if priority > up_to:
+                break
+            for waiters in state.queues[priority].values():
+                if any(not w.future.done() for w in waiters):
+                    return True
+        return False
+
+    def _pop_next(self, state: _BackendState, priority: Priority) -> Optional[_Waiter]:
+        users = state.queues[priority]
+        while users:
+            user_id, waiters = next(iter(users.items()))
+            waiter = None
+            while waiters:
+                candidate = waiters.popleft()
+                if not candidate.future.done():
+                    waiter = candidate
+                    break
+            if waiters:
+                users.move_to_end(user_id)  # next user gets the following turn
+            else:
+                del users[user_id]
+            if waiter is not None:
+                return waiter
+        return None
+
+    def _dispatch(self, state: _BackendState) -> None:
+        while True:
+            granted = False
+            for priority in Priority:
+                if not state.queues[priority]:
+                    continue
+                if not self._has_capacity(state, priority):
+                    # Lower classes stay postponed while this one is waiting
+                    return
+                waiter = self._pop_next(state, priority)
+                if waiter is None:
+                    continue
+                state.running += 1
+                state.running_by_priority[priority] += 1
+                waiter.future.set_result(time.monotonic() - waiter.enqueued_at)
+                granted = True
+                break
+            if not granted:
+                return
+
+    def _release(self, state: _BackendState, priority: Priority) -> None:
+        state.running = max(0, state.running - 1)
+        state.running_by_priority[priority] = max(0, state.running_by_priority[priority] - 1)
+        self._dispatch(state)
+
+    async def _acquire(self, state: _BackendState, priority: Priority, user_id: str) -> float:
+        if not self._has_waiting(state, priority) and self._has_capacity(state, priority):
+            state.running += 1
+            state.running_by_priority[priority] += 1
+            state.metrics[priority].record(0.0)
+            return 0.0
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(future, priority, user_id)
+        state.queues[priority].setdefault(user_id, deque()).append(waiter)
+
+        try:
+            wait = await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was granted just as we were cancelled; hand it back
+                self._release(state, priority)
+            else:
+                future.cancel()
+                state.metrics[priority].cancelled += 1
+            raise
+
+        state.metrics[priority].record(wait)
+        if wait > 1.0:
+            logger.info(f"LLM scheduler: {priority.name.lower()} request waited {wait:.1f}s for a slot")
+        return wait
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        priority: Priority = Priority.INTERACTIVE,
+        user_id: Optional[Any] = None,
+        backend: str = "ollama"
+    ) -> AsyncIterator[float]:
+        """Hold one backend slot for the duration of the block; yields queue time in seconds"""
+        state = self._state(backend)
+        wait = await self._acquire(state, priority, str(user_id) if user_id else "anonymous")
+        try:
+            yield wait
+        finally:
+            self._release(state, priority)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth, running counts and queue-time metrics per backend and class"""
+        stats = {}
+        for backend, state in self._backends.items():
+            classes = {}
+            for priority in Priority:
+                queued = sum(
+                    1 for waiters in state.queues[priority].values()
+                    for w in waiters if not w.future.done()
+                )
+                classes[priority.name.lower()] = {
+                    "queued": queued,
+                    "running": state.running_by_priority[priority],
+                    **state.metrics[priority].snapshot(),
+                }
+            stats[backend] = {
+                "max_concurrency": state.max_concurrency,
+                "running": state.running,
+                "classes": classes,
+            }
+        return stats
+
+
+# Global scheduler instance shared by every GeminiService
+llm_scheduler = LLMScheduler()
@@ -7,7 +7,6 @@ import asyncio
 import logging
 import hashlib
 import re
-import httpx
 from datetime import datetime
 import numpy as np
 
@@ -21,6 +20,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, delete
 
 from app.config import settings
+from app.services.http_client import http_pool, get_timeout
+from app.services.ollama_pool import ollama_pool
+from app.services.generation_history import note_retrieval
 from app.models.embedding import StoryEmbedding, CharacterEmbedding
 
 logger = logging.getLogger(__name__)
@@ -48,7 +50,6 @@ class MemoryService:
         self.chunk_overlap = settings.chunk_overlap
         self.embedding_model = settings.embedding_model
         self.embedding_dimension = settings.embedding_dimension
-        self.ollama_base_url = settings.ollama_base_url
         
         # Initialize ChromaDB client with new API
         if CHROMA_AVAILABLE:
@@ -65,8 +66,8 @@ class MemoryService:
             self.chroma_client = None
             logger.warning("ChromaDB not available - using fallback storage")
         
-        # HTTP client for Ollama
-        self.http_client = httpx.AsyncClient(timeout=120.0)
+        # Shared HTTP client for Ollama
+        self.http_client = http_pool.get_client("ollama")
     
     # ==========================================================================
     # CHAPTER EMBEDDING
@@ -86,14 +87,16 @@ class MemoryService:
         Process:
         1. Chunk the text into semantic units (paragraphs/scenes)
         2. Extract metadata for each chunk (characters, scene type, importance)
-        3. Generate embeddings using Ollama
+        3. Generate embeddings using Ollama (chunks whose text is unchanged
+           since the last embedding reuse their stored vector)
         4. Store in PostgreSQL and ChromaDB
         """
         if not content or not content.strip():
             logger.warning(f"Empty content for chapter {chapter_id}, skipping embedding")
             return []
         
-        # Clear existing embeddings for this chapter
+        # Keep the current vectors by chunk text, then clear existing embeddings for this chapter
+        previous = await self._get_chapter_vectors(db, chapter_id)
         await self._clear_chapter_embeddings(db, chapter_id)
         
         # Chunk the content with smart boundaries
@@ -115,8 +118,15 @@ class MemoryService:
                 **metadata
             })
         
-        # Generate embeddings using Ollama
-        embeddings = await self._generate_embeddings([c["text"] for c in enriched_chunks])
+        # Generate embeddings using Ollama, only for chunks without a stored vector
+        texts = [c["text"] for c in enriched_chunks]
+        missing = [t for t in dict.fromkeys(texts) if t not in previous]
+        generated = dict(zip(missing, await self._generate_embeddings(missing)))
+        embeddings = [previous[t] if t in previous else generated.get(t) for t in texts]
+        if any(e is None for e in embeddings):
+            embeddings = []
+        elif len(missing) < len(texts):
+            logger.debug(f"Chapter {chapter_id}: reused {len(texts) - len(missing)} of {len(texts)} chunk embeddings")
         
         if not embeddings:
             logger.error(f"Failed to generate embeddings for chapter {chapter_id}")
@@ -444,6 +454,7 @@ class MemoryService:
                         score = 1 - results["distances"][0][i] if results["distances"] else 0.5
                         metadata = results["metadatas"][0][i] if results["metadatas"] else {}
                         retrieved.append({
+                            "id": results["ids"][0][i] if results.get("ids") else None,
                             "content": doc,
                             "score": score,
                             "metadata": metadata,
@@ -490,6 +501,7 @@ class MemoryService:
                         score = 1 - results["distances"][0][i] if results["distances"] else 0.5
                         metadata = results["metadatas"][0][i] if results["metadatas"] else {}
                         retrieved.append({
+                            "id": results["ids"][0][i] if results.get("ids") else None,
                             "content": doc,
                             "score": score,
                             "metadata": metadata,
@@ -529,6 +541,7 @@ class MemoryService:
                         score = 1 - results["distances"][0][i] if results["distances"] else 0.5
                         metadata = results["metadatas"][0][i] if results["metadatas"] else {}
                         retrieved.append({
+                            "id": results["ids"][0][i] if results.get("ids") else None,
                             "content": doc,
                             "score": score,
                             "metadata": metadata,
@@ -596,6 +609,9 @@ class MemoryService:
         if isinstance(bible_results, list):
             results["bible"] = bible_results
         
+        # Stored with this request's generations (see generation_history)
+        note_retrieval(results["chapters"] + results["characters"] + results["bible"])
+        
         total = len(results["chapters"]) + len(results["characters"]) + len(results["bible"])
         logger.debug(f"Retrieved total {total} context items (chapters: {len(results['chapters'])}, characters: {len(results['characters'])}, bible: {len(results['bible'])})")
         
@@ -806,13 +822,16 @@ class MemoryService:
                     embeddings.append([0.0] * self.embedding_dimension)
                     continue
                 
-                # Call Ollama embedding endpoint
-                response = await self.http_client.post(
-                    f"{self.ollama_base_url}/api/embeddings",
+                # Call Ollama embedding endpoint on the least busy node with the model
+                response = await ollama_pool.post(
+                    self.http_client, "/api/embeddings", self.embedding_model,
+                    raise_for_status=False,
                     json={
                         "model": self.embedding_model,
-                        "prompt": clean_text
-                    }
+                        "prompt": clean_text,
+                        "keep_alive": settings.ollama_keep_alive
+                    },
+                    timeout=get_timeout("ollama.embeddings")
                 )
                 
                 if response.status_code == 200:
@@ -875,6 +894,17 @@ class MemoryService:
         except Exception as e:
             logger.error(f"ChromaDB storage failed: {e}")
     
+    async def _get_chapter_vectors(self, db: AsyncSession, chapter_id: str) -> Dict[str, List[float]]:
+        """Stored chunk vectors of a chapter by chunk text, for the current embedding model"""
+        result = await db.execute(
+            select(StoryEmbedding.content, StoryEmbedding.embedding).where(
+                StoryEmbedding.chapter_id == chapter_id,
+                StoryEmbedding.embedding_model == self.embedding_model
+            )
+        )
+        # Zero vectors are failed embeddings; let them be generated again
+        return {text: list(vector) for text, vector in result.all() if vector and any(vector)}
+    
     async def _clear_chapter_embeddings(self, db: AsyncSession, chapter_id: str) -> None:
         """Clear existing embeddings for a chapter"""
         await db.execute(
@@ -896,16 +926,24 @@ class MemoryService:
         db: AsyncSession,
         story_id: str,
         chapter_id: str,
-        old_content: str,
-        new_content: str
-    ) -> None:
-        """Update embeddings when content is edited"""
-        await self.embed_chapter(
+        content: str,
+        chapter_metadata: Dict[str, Any],
+        changed: Dict[str, int]
+    ) -> List[StoryEmbedding]:
+        """
+        Update embeddings after a patch save. changed is the edited span
+        ({"start", "end", "removed"}, see ChapterService.patch_content);
+        nothing is done when it is empty, and only chunks whose text changed
+        are sent to the embedding model.
+        """
+        if changed["end"] == changed["start"] and not changed["removed"]:
+            return []
+        return await self.embed_chapter(
             db=db,
             story_id=story_id,
             chapter_id=chapter_id,
-            content=new_content,
-            chapter_metadata={}
+            content=content,
+            chapter_metadata=chapter_metadata
         )
     
     @staticmethod
@@ -0,0 +1,228 @@
+"""
+Model Lifecycle - Preloading, keep-alive and warm model switches for Ollama
+Loading a 7B model from disk takes tens of seconds on CPU. Without this, the
+first request after startup (or after PATCH /settings/model) pays that cost
+inside the user's request, and an idle model is evicted once keep_alive runs
+out. Models are loaded with an empty request, kept resident on a schedule, and
+a new runtime model is only switched to once it has been loaded.
+"""
+from typing import Optional, Dict, Any
+import asyncio
+import logging
+import time
+
+from app.config import settings
+from app.services.http_client import http_pool, get_timeout
+from app.services.ollama_pool import ollama_pool, OllamaNode
+from app.runtime_settings import get_runtime_model_name, set_runtime_model_name
+
+logger = logging.getLogger(__name__)
+
+
+class ModelLifecycleManager:
+    """
+    Tracks which models Ollama has loaded and keeps the configured generation
+    and embedding models resident. State is per process and only used for
+    reporting; Ollama itself decides residency.
+    """
+
+    def __init__(self):
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self._pending_model: Optional[str] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._background: set = set()
+        self._last_residency_check: Optional[float] = None
+
+    def _entry(self, model: str, kind: str) -> Dict[str, Any]:
+        entry = self._models.get(model)
+        if entry is None:
+            entry = self._models[model] = {
+                "kind": kind, "status": "unknown", "load_seconds": None,
+                "warmed_at": None, "error": None, "nodes": {},
+            }
+        return entry
+
+    def _spawn(self, coro) -> asyncio.Task:
+        # Keep a reference so background tasks are not garbage collected mid-flight
+        task = asyncio.ensure_future(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    # ─── Loading ──────────────────────────────────────────────────────────────
+
+    async def _load_on(self, node: OllamaNode, model: str, kind: str, keep_alive: str) -> Optional[str]:
+        """Send an empty request for model to one node; returns an error string on failure"""
+        if kind == "embedding":
+            endpoint, payload = "/api/embeddings", {"model": model, "prompt": ""}
+        else:
+            endpoint, payload = "/api/generate", {"model": model, "prompt": ""}
+        payload["keep_alive"] = keep_alive
+        try:
+            client = http_pool.get_client("ollama")
+            response = await client.post(f"{node.url}{endpoint}", json=payload, timeout=get_timeout("ollama.load"))
+            response.raise_for_status()
+        except Exception as e:
+            return f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+        return None
+
+    async def preload(self, model: str, kind: str = "generation", keep_alive: Optional[str] = None) -> bool:
+        """
+        Load model on every node that has it (or refresh its keep_alive if it
+        is already loaded). An empty prompt makes Ollama load the model without
+        generating anything. True if at least one node loaded it.
+        """
+        entry = self._entry(model, kind)
+        if entry["status"] != "resident":
+            entry["status"] = "loading"
+        nodes = ollama_pool.nodes_for(model) or ollama_pool.nodes
+
+        start = time.monotonic()
+        errors = await asyncio.gather(
+            *(self._load_on(node, model, kind, keep_alive or settings.ollama_keep_alive) for node in nodes)
+        )
+        elapsed = time.monotonic() - start
+        for node, error in zip(nodes, errors):
+            if error is None:
+                entry["nodes"].setdefault(node.url, {"expires_at": None, "size_vram": None})
+            else:
+                entry["nodes"].pop(node.url, None)
+                logger.warning(f"Could not load {kind} model {model} on {node.url}: {error}")
+
+        failed = [e for e in errors if e is not None]
+        if len(failed) == len(nodes):
+            entry["status"] = "failed"
+            entry["error"] = failed[0]
+            return False
+        entry.update(status="resident", warmed_at=time.time(), error=failed[0] if failed else None)
+        # Only a cold load is worth reporting; refreshes of a resident model return instantly
+        if entry["load_seconds"] is None or elapsed > 1.0:
+            entry["load_seconds"] = round(elapsed, 2)
+        logger.info(f"{kind.capitalize()} model {model} ready on {len(nodes) - len(failed)} node(s) ({elapsed:.1f}s)")
+        return True
+
+    async def unload(self, model: str) -> None:
+        """Ask Ollama to evict model now (keep_alive 0)"""
+        kind = self._models.get(model, {}).get("kind", "generation")
+        if await self.preload(model, kind, keep_alive="0"):
+            self._models[model].update(status="unloaded", nodes={})
+
+    async def preload_configured(self) -> None:
+        """Load the runtime generation model and the embedding model concurrently"""
+        await asyncio.gather(
+            self.preload(get_runtime_model_name(), "generation"),
+            self.preload(settings.embedding_model, "embedding"),
+        )
+        await self.refresh_residency()
+
+    # ─── Model switch ─────────────────────────────────────────────────────────
+
+    def switch_model(self, model: str) -> Optional[str]:
+        """
+        Warm model in the background and make it the runtime model once it is
+        loaded. Requests keep using the current model meanwhile; a failed load
+        leaves it in place. Returns the pending model, or None if model is
+        already current.
+        """
+        if model == get_runtime_model_name():
+            self._pending_model = None
+            return None
+        self._pending_model = model
+        self._spawn(self._warm_and_switch(model))
+        return model
+
+    async def _warm_and_switch(self, model: str) -> None:
+        loaded = await self.preload(model, "generation")
+        if self._pending_model != model:
+            return  # A later switch superseded this one
+        self._pending_model = None
+        if not loaded:
+            logger.warning(f"Keeping {get_runtime_model_name()}: {model} failed to load")
+            return
+        previous = get_runtime_model_name()
+        set_runtime_model_name(model)
+        logger.info(f"Runtime model switched from {previous} to {model}")
+        if settings.model_unload_previous_on_switch and previous not in (model, settings.embedding_model):
+            await self.unload(previous)
+
+    def get_pending_model(self) -> Optional[str]:
+        return self._pending_model
+
+    # ─── Keep-alive refresh ───────────────────────────────────────────────────
+
+    async def _loaded_on(self, node: OllamaNode) -> Optional[Dict[str, Dict[str, Any]]]:
+        try:
+            client = http_pool.get_client("ollama")
+            response = await client.get(f"{node.url}/api/ps", timeout=get_timeout("ollama.metadata"))
+            response.raise_for_status()
+        except Exception as e:
+            logger.debug(f"Could not read loaded models on {node.url}: {e}")
+            return None
+        return {m.get("name"): m for m in response.json().get("models", []) if m.get("name")}
+
+    async def refresh_residency(self) -> None:
+        """Update residency from each node's list of loaded models (/api/ps)"""
+        nodes = ollama_pool.nodes
+        loaded_by_node = await asyncio.gather(*(self._loaded_on(node) for node in nodes))
+        if all(loaded is None for loaded in loaded_by_node):
+            return
+        self._last_residency_check = time.time()
+        for name, entry in self._models.items():
+            for node, loaded in zip(nodes, loaded_by_node):
+                if loaded is None:
+                    continue  # Unreachable node: keep what we knew
+                info = loaded.get(name) or loaded.get(f"{name}:latest")
+                if info is not None:
+                    entry["nodes"][node.url] = {"expires_at": info.get("expires_at"), "size_vram": info.get("size_vram")}
+                else:
+                    entry["nodes"].pop(node.url, None)
+            if entry["nodes"]:
+                entry["status"] = "resident"
+            elif entry["status"] == "resident":
+                entry["status"] = "evicted"
+
+    async def _refresh_loop(self) -> None:
+        interval = settings.model_keepalive_refresh_seconds
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.preload_configured()
+            except Exception as e:
+                logger.warning(f"Model keep-alive refresh failed: {e}")
+
+    def start(self) -> None:
+        """Preload configured models and start the keep-alive refresh, without blocking startup"""
+        if settings.model_preload_on_startup:
+            self._spawn(self.preload_configured())
+        if settings.model_keepalive_refresh_seconds > 0 and self._refresh_task is None:
+            self._refresh_task = asyncio.ensure_future(self._refresh_loop())
+
+    async def stop(self) -> None:
+        tasks = list(self._background)
+        if self._refresh_task is not None:
+            tasks.append(self._refresh_task)
+            self._refresh_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_status(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "current_model": get_runtime_model_name(),
+            "pending_model": self._pending_model,
+            "residency_checked_seconds_ago": (
+                round(now - self._last_residency_check, 1) if self._last_residency_check else None
+            ),
+            "models": {
+                name: {
+                    **{k: v for k, v in entry.items() if k != "warmed_at"},
+                    "warmed_seconds_ago": round(now - entry["warmed_at"], 1) if entry["warmed_at"] else None,
+                }
+                for name, entry in self._models.items()
+            },
+        }
+
+
+# Global lifecycle manager instance
+model_lifecycle = ModelLifecycleManager()
@@ -0,0 +1,311 @@
+"""
+Ollama Pool - Request routing across several Ollama nodes
+With OLLAMA_NODES set, generation, embedding and import calls are spread over
+every node that has the model, least outstanding requests first. Calls for the
+same story prefer the same node so its KV cache (the prefix-stable prompt) is
+reused. Nodes are health-checked through /api/tags, which also discovers which
+models each node has, and are ejected for a while after repeated failures.
+A request that could not connect (nothing was sent) is retried once on the
+next-best node.
+"""
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Optional, List, Dict, Any, Set, AsyncIterator
+import asyncio
+import hashlib
+import logging
+import time
+
+import httpx
+
+from app.config import settings
+from app.services.http_client import http_pool, get_timeout
+
+logger = logging.getLogger(__name__)
+
+# The request never reached the node, so it is safe to send elsewhere
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+# Story the current request works on; set by routes, read when picking a node
+story_affinity: ContextVar[Optional[str]] = ContextVar("story_affinity", default=None)
+
+
+def set_story_affinity(story_id: Any) -> None:
+    """Route this request's Ollama calls to the story's preferred node"""
+    story_affinity.set(str(story_id) if story_id else None)
+
+
+def _model_names(models: List[str]) -> Set[str]:
+    """Model names as Ollama lists them, plus the untagged form of ':latest' tags"""
+    names = set()
+    for name in models:
+        names.add(name)
+        if name.endswith(":latest"):
+            names.add(name[: -len(":latest")])
+    return names
+
+
+def _affinity_score(key: str, url: str) -> int:
+    # Rendezvous hashing: adding or removing a node only moves that node's stories
+    return int.from_bytes(hashlib.blake2b(f"{key}|{url}".encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class OllamaNode:
+    """One Ollama server and its routing state"""
+
+    def __init__(self, url: str, models: Optional[List[str]] = None):
+        self.url = url.rstrip("/")
+        # None until discovered: assume the node has every model
+        self.models: Optional[Set[str]] = _model_names(models) if models else None
+        self.static_models = models is not None
+        self.tags: List[str] = []  # Model names from the last /api/tags
+        self.healthy = True
+        self.ejected_until = 0.0
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+
+    def serves(self, model: Optional[str]) -> bool:
+        return model is None or self.models is None or model in self.models
+
+    def available(self, now: float) -> bool:
+        return self.healthy and self.ejected_until <= now
+
+
+class OllamaPool:
+    """
+    Picks a node per call and tracks outstanding requests, failures and
+    health. A single configured node behaves exactly like the plain
+    OLLAMA_BASE_URL setup.
+
+    Usage:
+        response = await ollama_pool.post(client, "/api/generate", model, affinity=user_id, json=...)
+
+        async with ollama_pool.stream(client, "POST", "/api/chat", model, json=...) as response:
+            async for line in response.aiter_lines(): ...
+
+    node() holds a node for calls that need more than one request.
+    """
+
+    def __init__(self, urls: Optional[List[str]] = None, node_models: Optional[Dict[str, List[str]]] = None):
+        urls = urls or settings.ollama_nodes or [settings.ollama_base_url]
+        node_models = settings.ollama_node_models if node_models is None else node_models
+        self.nodes: List[OllamaNode] = []
+        for url in dict.fromkeys(u.rstrip("/") for u in urls):
+            self.nodes.append(OllamaNode(url, node_models.get(url)))
+        self._turn = 0
+        self._health_task: Optional[asyncio.Task] = None
+
+    def urls(self) -> List[str]:
+        return [n.url for n in self.nodes]
+
+    def nodes_for(self, model: Optional[str]) -> List[OllamaNode]:
+        """Nodes that have model, healthy or not"""
+        return [n for n in self.nodes if n.serves(model)]
+
+    # ─── Routing ──────────────────────────────────────────────────────────────
+
+    def pick(
+        self,
+        model: Optional[str] = None,
+        affinity: Optional[Any] = None,
+        exclude: Optional[Set[str]] = None
+    ) -> OllamaNode:
+        """
+        Choose a node for model, other than the urls in exclude. The story
+        affinity of the current request wins over affinity (e.g. a user id);
+        a sticky node is only used while it is not much busier than the least
+        loaded one.
+        """
+        now = time.monotonic()
+        exclude = exclude or set()
+        serving = [n for n in self.nodes_for(model) if n.url not in exclude]
+        # Rather try a suspect node than fail outright
+        candidates = (
+            [n for n in serving if n.available(now)] or serving
+            or [n for n in self.nodes if n.url not in exclude] or self.nodes
+        )
+        least = min(n.outstanding for n in candidates)
+
+        key = story_affinity.get() or (str(affinity) if affinity else None)
+        if key and settings.ollama_sticky_routing and len(candidates) > 1:
+            preferred = max(candidates, key=lambda n: _affinity_score(key, n.url))
+            if preferred.outstanding - least <= settings.ollama_sticky_max_imbalance:
+                return preferred
+
+        idle = [n for n in candidates if n.outstanding == least]
+        self._turn += 1
+        return idle[self._turn % len(idle)]
+
+    @asynccontextmanager
+    async def node(
+        self,
+        model: Optional[str] = None,
+        affinity: Optional[Any] = None,
+        exclude: Optional[Set[str]] = None
+    ) -> AsyncIterator[OllamaNode]:
+        """Hold an outstanding request on the picked node; connection errors and 5xx count against it"""
+        node = self.pick(model, affinity, exclude)
+        node.outstanding += 1
+        node.requests += 1
+        try:
+            yield node
+        except httpx.HTTPStatusError as e:
+            status = e.response.status_code
+            if status >= 500:
+                self._record_failure(node, e)
+            elif status == 404 and model and node.models is not None and not node.static_models:
+                node.models.discard(model)  # Model was removed from the node
+            raise
+        except httpx.TransportError as e:
+            self._record_failure(node, e)
+            raise
+        else:
+            node.consecutive_failures = 0
+        finally:
+            node.outstanding -= 1
+
+    def _can_retry(self, model: Optional[str], failed: OllamaNode, tried: Set[str]) -> bool:
+        """One retry per request, and only if another node has the model"""
+        return not tried and any(n is not failed for n in self.nodes_for(model))
+
+    async def post(
+        self,
+        client: httpx.AsyncClient,
+        path: str,
+        model: Optional[str] = None,
+        affinity: Optional[Any] = None,
+        raise_for_status: bool = True,
+        **kwargs
+    ) -> httpx.Response:
+        """POST to path on the picked node; a connect error is retried once on the next-best node"""
+        tried: Set[str] = set()
+        while True:
+            node = None
+            try:
+                async with self.node(model, affinity, exclude=tried) as node:
+                    response = await client.post(f"{node.url}{path}", **kwargs)
+                    if raise_for_status:
+                        response.raise_for_status()
+                    return response
+            except CONNECT_ERRORS as e:
+                if node is None or not self._can_retry(model, node, tried):
+                    raise
+                logger.warning(f"Ollama node {node.url} unreachable ({type(e).__name__}); retrying on another node")
+                tried.add(node.url)
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        client: httpx.AsyncClient,
+        method: str,
+        path: str,
+        model: Optional[str] = None,
+        affinity: Optional[Any] = None,
+        **kwargs
+    ) -> AsyncIterator[httpx.Response]:
+        """
+        client.stream() on the picked node, with the same connect retry as
+        post(). Nothing is retried once the response has started.
+        """
+        tried: Set[str] = set()
+        while True:
+            node = None
+            connected = False
+            try:
+                async with self.node(model, affinity, exclude=tried) as node, \
+                        client.stream(method, f"{node.url}{path}", **kwargs) as response:
+                    connected = True
+                    yield response
+                return
+            except CONNECT_ERRORS as e:
+                if connected or node is None or not self._can_retry(model, node, tried):
+                    raise
+                logger.warning(f"Ollama node {node.url} unreachable ({type(e).__name__}); retrying on another node")
+                tried.add(node.url)
+
+    def _record_failure(self, node: OllamaNode, error: Exception) -> None:
+        node.failures += 1
+        node.consecutive_failures += 1
+        node.last_error = f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+        now = time.monotonic()
+        if node.consecutive_failures >= settings.ollama_node_eject_failures and len(self.nodes) > 1 \
+                and node.ejected_until <= now:
+            node.ejected_until = now + settings.ollama_node_eject_seconds
+            node.consecutive_failures = 0
+            logger.warning(
+                f"Ejected Ollama node {node.url} for {settings.ollama_node_eject_seconds:.0f}s: {node.last_error}"
+            )
+
+    # ─── Health checks ────────────────────────────────────────────────────────
+
+    async def check_node(self, node: OllamaNode) -> bool:
+        """Probe /api/tags; also refreshes the node's model list unless it is configured"""
+        try:
+            client = http_pool.get_client("ollama")
+            response = await client.get(f"{node.url}/api/tags", timeout=get_timeout("ollama.metadata"))
+            response.raise_for_status()
+            models = [m.get("name") for m in response.json().get("models", []) if m.get("name")]
+        except Exception as e:
+            if node.healthy:
+                logger.warning(f"Ollama node {node.url} failed its health check: {e}")
+            node.healthy = False
+            node.last_error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            return False
+        if not node.healthy:
+            logger.info(f"Ollama node {node.url} is healthy again")
+        node.healthy = True
+        node.tags = models
+        if not node.static_models:
+            node.models = _model_names(models)
+        return True
+
+    async def check_all(self) -> None:
+        await asyncio.gather(*(self.check_node(n) for n in self.nodes))
+
+    async def list_models(self) -> List[str]:
+        """Models installed on at least one reachable node"""
+        await self.check_all()
+        live = [n for n in self.nodes if n.healthy]
+        if not live:
+            raise RuntimeError(self.nodes[0].last_error or "No Ollama node reachable")
+        return sorted({name for node in live for name in node.tags})
+
+    async def _health_loop(self) -> None:
+        while True:
+            try:
+                await self.check_all()
+            except Exception as e:
+                logger.warning(f"Ollama health check failed: {e}")
+            await asyncio.sleep(settings.ollama_health_check_seconds)
+
+    def start(self) -> None:
+        if settings.ollama_health_check_seconds > 0 and self._health_task is None:
+            self._health_task = asyncio.ensure_future(self._health_loop())
+
+    async def stop(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            node.url: {
+                "healthy": node.healthy,
+                "ejected_seconds": round(node.ejected_until - now, 1) if node.ejected_until > now else 0,
+                "outstanding": node.outstanding,
+                "requests": node.requests,
+                "failures": node.failures,
+                "models": sorted(node.models) if node.models is not None else None,
+                "last_error": node.last_error,
+            }
+            for node in self.nodes
+        }
+
+
+# Global pool shared by every Ollama caller
+ollama_pool = OllamaPool()
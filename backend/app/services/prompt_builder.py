@@ -9,6 +9,9 @@ from app.models.chapter import Chapter
 from app.models.character import Character, CharacterRole
 from app.models.plotline import Plotline
 from app.models.story_bible import StoryBible
+from app.services.context_packer import (
+    context_packer, ContextSection, estimate_tokens, get_context_budget
+)
 
 
 class PromptBuilder:
@@ -17,13 +20,11 @@ class PromptBuilder:
     Handles context management and token optimization
     """
     
-    # Token budget allocation (approximate)
-    MAX_CONTEXT_TOKENS = 8000
-    SYSTEM_PROMPT_BUDGET = 500
+    # Relative section weights for the context packer (the absolute budget
+    # comes from the model's context window)
     CHARACTER_BUDGET = 1500
     PLOT_BUDGET = 1000
     WORLD_RULES_BUDGET = 800
-    RECENT_CONTENT_BUDGET = 2000
     RETRIEVED_CONTEXT_BUDGET = 2000
     
     def __init__(self):
@@ -41,51 +42,89 @@ class PromptBuilder:
         retrieved_context: List[str],
         writing_mode: WritingMode,
         user_direction: Optional[str] = None,
-        word_target: int = 500
-    ) -> Dict[str, str]:
+        word_target: int = 500,
+        prefix_stable: bool = False,
+        model: Optional[str] = None,
+        max_output_tokens: Optional[int] = None
+    ) -> Dict[str, Any]:
         """
         Build a complete prompt for story continuation
         
-        Returns dict with 'system_prompt', 'context', 'user_prompt'
+        Context sections are packed into the token budget left in the model's
+        context window after the system prompt, user prompt and output tokens.
+        
+        With prefix_stable=True sections are laid out from most to least stable
+        (system prompt, story overview, characters, plotlines, bible, chapter
+        header, retrieved context, recent text) and every list is in a
+        deterministic order, so consecutive continuations share a long prompt
+        prefix the model server can keep in its KV cache.
+        
+        Returns dict with 'system_prompt', 'context', 'user_prompt' and
+        'context_report' (per-section token usage)
         """
         # Build system prompt based on mode and story settings
         system_prompt = self._build_system_prompt(story, writing_mode)
         
-        # Build context sections
-        context_parts = []
-        
-        # Add story overview
-        context_parts.append(self._build_story_overview(story))
-        
-        # Add relevant characters
-        context_parts.append(self._build_character_context(characters, chapter))
-        
-        # Add active plotlines
-        context_parts.append(self._build_plotline_context(active_plotlines))
-        
-        # Add world rules if available
-        if story_bible:
-            context_parts.append(self._build_world_rules_context(story_bible))
-        
-        # Add retrieved semantic context
-        if retrieved_context:
-            context_parts.append(self._build_retrieved_context(retrieved_context))
-        
-        context = "\n\n".join(filter(None, context_parts))
-        
         # Build user prompt
         user_prompt = self._build_user_prompt_continuation(
             chapter=chapter,
             recent_content=recent_content,
             user_direction=user_direction,
             word_target=word_target,
-            writing_mode=writing_mode
+            writing_mode=writing_mode,
+            include_chapter_header=not prefix_stable
+        )
+        
+        budget = get_context_budget(
+            model,
+            max_output_tokens or int(word_target * 1.3),
+            estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
         )
         
+        # Context sections, in prompt order
+        sections = [
+            ContextSection("overview", [self._build_story_overview(story)], required=True),
+            ContextSection(
+                "characters", self._character_items(characters),
+                weight=self.CHARACTER_BUDGET, header="KEY CHARACTERS:"
+            ),
+            ContextSection(
+                "plotlines", self._plotline_items(active_plotlines),
+                weight=self.PLOT_BUDGET, header="ACTIVE PLOTLINES:"
+            ),
+        ]
+        
+        # Add world rules if available
+        if story_bible:
+            sections.append(ContextSection(
+                "world", self._world_items(story_bible), weight=self.WORLD_RULES_BUDGET / 2
+            ))
+            sections.append(ContextSection(
+                "world_rules", self._world_rule_items(story_bible),
+                weight=self.WORLD_RULES_BUDGET / 2, header="KEY RULES:"
+            ))
+        
+        # Chapter header changes less often than retrieval results
+        if prefix_stable:
+            sections.append(ContextSection("chapter", [self._build_chapter_header(chapter)], required=True))
+        
+        # Add retrieved semantic context; chunks arrive pre-labeled and in relevance order
+        # e.g., "[Previous Scene] ...", "[Character Info] ...", "[WORLD_RULE] ..."
+        sections.append(ContextSection(
+            "retrieved", list(retrieved_context or []),
+            weight=self.RETRIEVED_CONTEXT_BUDGET,
+            header="RETRIEVED MEMORY (Relevant story context for consistency):",
+            # Relevance order shifts between calls; a fixed order keeps shared chunks aligned
+            stable_order=prefix_stable
+        ))
+        
+        packed = context_packer.pack(sections, budget)
+        
         return {
             "system_prompt": system_prompt,
-            "context": context,
-            "user_prompt": user_prompt
+            "context": packed.text,
+            "user_prompt": user_prompt,
+            "context_report": packed.report()
         }
     
     def build_rewrite_prompt(
@@ -409,73 +448,64 @@ Maintain absolute consistency with established characters, events, and world rul
         if not characters:
             return ""
         
-        # Sort by importance and relevance
-        sorted_chars = sorted(characters, key=lambda c: c.importance, reverse=True)
-        
-        context = "KEY CHARACTERS:\n"
-        
-        for char in sorted_chars[:8]:  # Limit to top 8
-            context += f"\n{char.name}"
+        section = ContextSection("characters", self._character_items(characters), header="KEY CHARACTERS:")
+        return context_packer.pack([section], self.CHARACTER_BUDGET).text
+    
+    def _character_items(self, characters: List[Character]) -> List[str]:
+        """One block per character, most important first"""
+        # Sort by importance and relevance (name breaks ties so the order is stable)
+        sorted_chars = sorted(characters or [], key=lambda c: (-(c.importance or 0), c.name or ""))
+        
+        items = []
+        for char in sorted_chars:
+            block = f"\n{char.name}"
             if char.role:
-                context += f" ({char.role.value})"
-            context += ":\n"
+                block += f" ({char.role.value})"
+            block += ":"
             
             if char.personality_summary:
-                context += f"  Personality: {char.personality_summary[:150]}\n"
+                block += f"\n  Personality: {char.personality_summary}"
             if char.current_emotional_state:
-                context += f"  Current state: {char.current_emotional_state}\n"
+                block += f"\n  Current state: {char.current_emotional_state}"
             if char.speaking_style:
-                context += f"  Speech: {char.speaking_style[:100]}\n"
+                block += f"\n  Speech: {char.speaking_style}"
+            items.append(block)
         
-        return context
+        return items
     
-    def _build_plotline_context(self, plotlines: List[Plotline]) -> str:
-        """Build active plotlines context"""
-        if not plotlines:
-            return ""
-        
-        active = [p for p in plotlines if p.status.value not in ["resolved", "abandoned"]]
-        
-        if not active:
-            return ""
-        
-        context = "ACTIVE PLOTLINES:\n"
-        for plot in active[:5]:  # Limit to 5
-            context += f"\n- {plot.title} ({plot.status.value}): "
-            context += f"{plot.description[:150] if plot.description else 'No description'}\n"
-        
-        return context
+    def _plotline_items(self, plotlines: List[Plotline]) -> List[str]:
+        """Active plotlines in a stable order"""
+        active = [p for p in plotlines or [] if p.status.value not in ["resolved", "abandoned"]]
+        active.sort(key=lambda p: (p.title or "", str(p.id)))
+        
+        return [
+            f"- {plot.title} ({plot.status.value}): {plot.description or 'No description'}"
+            for plot in active
+        ]
     
-    def _build_world_rules_context(self, story_bible: StoryBible) -> str:
-        """Build world rules context"""
-        context_parts = []
-        
+    def _world_items(self, story_bible: StoryBible) -> List[str]:
+        """World description and magic system"""
+        items = []
         if story_bible.world_description:
-            context_parts.append(f"WORLD: {story_bible.world_description[:300]}")
-        
-        if story_bible.world_rules:
-            rules = "KEY RULES:\n"
-            for rule in story_bible.world_rules[:5]:
-                rules += f"- {rule.title}: {rule.description[:100]}\n"
-            context_parts.append(rules)
-        
+            items.append(f"WORLD: {story_bible.world_description}")
         if story_bible.magic_system:
-            context_parts.append(f"MAGIC SYSTEM: {story_bible.magic_system[:200]}")
-        
-        return "\n".join(context_parts) if context_parts else ""
+            items.append(f"MAGIC SYSTEM: {story_bible.magic_system}")
+        return items
     
-    def _build_retrieved_context(self, retrieved: List[str]) -> str:
-        """Build context from retrieved semantic chunks (RAG memory)"""
-        if not retrieved:
-            return ""
-        
-        context = "RETRIEVED MEMORY (Relevant story context for consistency):\n"
-        for chunk in retrieved[:8]:  # Allow more chunks for comprehensive context
-            # Chunks now come pre-labeled from ai_generation route
-            # e.g., "[Previous Scene] ...", "[Character Info] ...", "[WORLD_RULE] ..."
-            context += f"\n{chunk[:500]}\n"
-        
-        return context
+    def _world_rule_items(self, story_bible: StoryBible) -> List[str]:
+        """World rules, most important first"""
+        rules = sorted(
+            story_bible.world_rules or [],
+            key=lambda r: (-(r.importance or 0), r.title or "")
+        )
+        return [f"- {rule.title}: {rule.description}" for rule in rules]
+    
+    def _build_chapter_header(self, chapter: Chapter) -> str:
+        """Chapter title and outline"""
+        header = f"CHAPTER {chapter.number}: {chapter.title}\n"
+        if chapter.outline:
+            header += f"CHAPTER OUTLINE: {chapter.outline[:300]}\n"
+        return header
     
     def _build_detailed_character_profile(self, character: Character) -> str:
         """Build detailed character profile for dialogue generation"""
@@ -505,13 +535,16 @@ Maintain absolute consistency with established characters, events, and world rul
         recent_content: str,
         user_direction: Optional[str],
         word_target: int,
-        writing_mode: WritingMode
+        writing_mode: WritingMode,
+        include_chapter_header: bool = True
     ) -> str:
         """Build the user prompt for continuation"""
-        prompt = f"CHAPTER {chapter.number}: {chapter.title}\n\n"
+        prompt = ""
         
-        if chapter.outline:
-            prompt += f"CHAPTER OUTLINE: {chapter.outline[:300]}\n\n"
+        if include_chapter_header:
+            prompt += f"CHAPTER {chapter.number}: {chapter.title}\n\n"
+            if chapter.outline:
+                prompt += f"CHAPTER OUTLINE: {chapter.outline[:300]}\n\n"
         
         prompt += f"RECENT CONTENT:\n{recent_content}\n\n"
         
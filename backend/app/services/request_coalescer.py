@@ -0,0 +1,81 @@
+"""
+Request Coalescer - Single-flight de-duplication of identical in-flight calls
+Double-clicks and client retries that produce the exact same model request
+share one upstream generation instead of each running their own.
+"""
+from typing import Any, Awaitable, Callable, Dict, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def make_request_key(*parts: Any) -> str:
+    """Stable hash of the request identity (model, full prompt, options, ...)"""
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class RequestCoalescer:
+    """
+    Runs at most one upstream call per key at a time. Every caller awaits a
+    shielded view of the shared task, so one caller cancelling does not cancel
+    the others; the upstream call is only cancelled once nobody is waiting.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, _Flight] = {}
+        self.stats = {"leaders": 0, "followers": 0, "abandoned": 0}
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Await the shared result for `key`, starting it with `factory` if needed.
+
+        Returns:
+            (result, coalesced) where coalesced is True if another caller started the call
+        """
+        flight = self._inflight.get(key)
+        coalesced = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(factory()))
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda _t, k=key, f=flight: self._forget(k, f))
+            self.stats["leaders"] += 1
+        else:
+            self.stats["followers"] += 1
+            logger.info(f"Coalesced identical in-flight request {key[:12]}")
+
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Last interested caller left; stop the upstream work
+                flight.task.cancel()
+                self._forget(key, flight)
+                self.stats["abandoned"] += 1
+            raise
+        flight.waiters -= 1
+        return result, coalesced
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "in_flight": len(self._inflight)}
+
+
+# Global coalescer shared by every GeminiService
+request_coalescer = RequestCoalescer()
@@ -0,0 +1,156 @@
+"""
+Response Cache - Persistent cache for deterministic (low-temperature) LLM calls
+Grammar checks, summaries, Story Bible and character extraction are re-run on
+content that often hasn't changed; identical requests are answered from disk.
+Backed by a local SQLite file with TTL expiry and size-bounded LRU eviction.
+"""
+from typing import Optional, Dict, Any
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(model: str, prompt: str, options: Dict[str, Any]) -> str:
+    """Cache key from model, prompt hash and generation options"""
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    options_json = json.dumps(options, sort_keys=True, default=str)
+    return hashlib.sha256(f"{model}\x00{prompt_hash}\x00{options_json}".encode("utf-8")).hexdigest()
+
+
+def is_cacheable_options(options: Dict[str, Any]) -> bool:
+    """Only low-temperature generations are deterministic enough to reuse"""
+    return float(options.get("temperature", 1.0)) <= settings.llm_cache_max_temperature
+
+
+class ResponseCache:
+    """SQLite-backed key/value store; blocking work runs in a worker thread"""
+
+    def __init__(self, path: str, ttl_seconds: int, max_entries: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS llm_response_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL
+                )"""
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_llm_response_cache_last_accessed "
+                "ON llm_response_cache (last_accessed)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _get_sync(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT payload, created_at FROM llm_response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            payload, created_at = row
+            if now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM llm_response_cache WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE llm_response_cache SET last_accessed = ? WHERE key = ?", (now, key))
+            conn.commit()
+        entry = json.loads(payload)
+        entry["cached_at"] = datetime.utcfromtimestamp(created_at).isoformat()
+        return entry
+
+    def _set_sync(self, key: str, model: str, entry: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_response_cache (key, model, payload, created_at, last_accessed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, json.dumps(entry, ensure_ascii=False), now, now)
+            )
+            # Drop expired rows, then trim least-recently-used rows above the cap
+            conn.execute("DELETE FROM llm_response_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            (count,) = conn.execute("SELECT COUNT(*) FROM llm_response_cache").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM llm_response_cache WHERE key IN ("
+                    "SELECT key FROM llm_response_cache ORDER BY last_accessed ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self.stats["evictions"] += overflow
+            conn.commit()
+
+    def _delete_sync(self, key: str) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM llm_response_cache WHERE key = ?", (key,))
+            conn.commit()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            entry = await asyncio.to_thread(self._get_sync, key)
+        except Exception as e:
+            logger.warning(f"Response cache read failed: {e}")
+            return None
+        if entry is None:
+            self.stats["misses"] += 1
+        else:
+            self.stats["hits"] += 1
+        return entry
+
+    async def set(self, key: str, model: str, entry: Dict[str, Any]) -> None:
+        try:
+            await asyncio.to_thread(self._set_sync, key, model, entry)
+            self.stats["stores"] += 1
+        except Exception as e:
+            logger.warning(f"Response cache write failed: {e}")
+
+    async def delete(self, key: str) -> None:
+        """Drop an entry, e.g. when the cached output turned out to be unparseable"""
+        try:
+            await asyncio.to_thread(self._delete_sync, key)
+        except Exception as e:
+            logger.warning(f"Response cache delete failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "enabled": settings.llm_cache_enabled,
+        }
+
+
+# Global cache instance
+response_cache = ResponseCache(
+    path=settings.llm_cache_path,
+    ttl_seconds=settings.llm_cache_ttl_seconds,
+    max_entries=settings.llm_cache_max_entries,
+)
@@ -0,0 +1,493 @@
+"""
+Revision Store - Compressed history of chapter text
+Saves used to overwrite chapters.content with no way back. The store keeps
+one row per kept revision: most rows hold a reverse delta (how to turn the
+next newer text back into this one), and after every REVISION_SNAPSHOT_EVERY
+deltas a row holds the whole text, so rebuilding any revision applies a
+bounded number of deltas. Saves closer together than
+REVISION_COALESCE_SECONDS share one row, and older history is thinned to
+fewer revisions per hour and day (REVISION_THINNING), so storage follows the
+amount of editing rather than the number of auto-saves.
+"""
+from typing import Optional, List, Dict, Any, Tuple, Iterable, Set
+from datetime import datetime
+from uuid import UUID
+import difflib
+import logging
+import re
+import struct
+import time
+import zlib
+
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.config import settings
+from app.models.chapter import Chapter, ChapterRevision
+from app.services.content_patch import changed_span
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT = "snapshot"
+DELTA = "delta"
+
+_RAW = b"r"
+_ZLIB = b"z"
+_SPAN = struct.Struct("<III")  # start, end, replacement bytes
+
+
+# ─── Encoding ─────────────────────────────────────────────────────────────────
+
+def _pack(payload: bytes) -> bytes:
+    """zlib-compress unless that makes it bigger (short deltas); one marker byte says which"""
+    compressed = zlib.compress(payload, settings.revision_compression_level)
+    return _ZLIB + compressed if len(compressed) < len(payload) else _RAW + payload
+
+
+def _unpack(data: bytes) -> bytes:
+    return zlib.decompress(data[1:]) if data[:1] == _ZLIB else bytes(data[1:])
+
+
+def encode_snapshot(text: str) -> bytes:
+    return _pack(text.encode("utf-8"))
+
+
+def decode_snapshot(data: bytes) -> str:
+    return _unpack(data).decode("utf-8")
+
+
+_PARAGRAPH_END = re.compile(r"(?<=</p>)|(?<=\n)")
+_SMALL_SPAN = 2048  # Changed spans up to this size are stored as they are, without a paragraph diff
+
+
+def _delta_spans(newer: str, older: str) -> List[Tuple[int, int, str]]:
+    """
+    (start, end, replacement) spans, in newer's coordinates and in order,
+    that turn newer into older. Edits far apart (typing at the end and a
+    fix in the middle) become separate spans instead of one covering
+    everything between them.
+    """
+    start, newer_end, older_end = changed_span(newer, older)
+    if newer_end - start + older_end - start <= _SMALL_SPAN:
+        return [(start, newer_end, older[start:older_end])] if (newer_end > start or older_end > start) else []
+
+    # Diff paragraphs inside the changed window, then trim each changed block to characters
+    newer_parts = _PARAGRAPH_END.split(newer[start:newer_end])
+    older_parts = _PARAGRAPH_END.split(older[start:older_end])
+    matcher = difflib.SequenceMatcher(None, newer_parts, older_parts, autojunk=False)
+    spans = []
+    newer_pos = start
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        newer_block = "".join(newer_parts[i1:i2])
+        older_block = "".join(older_parts[j1:j2])
+        if tag != "equal":
+            offset, newer_block_end, older_block_end = changed_span(newer_block, older_block)
+            spans.append((newer_pos + offset, newer_pos + newer_block_end, older_block[offset:older_block_end]))
+        newer_pos += len(newer_block)
+    return spans
+
+
+def encode_delta(newer: str, older: str) -> bytes:
+    """Reverse delta: spans of newer to replace (see _delta_spans) to get older"""
+    payload = bytearray()
+    for start, end, replacement in _delta_spans(newer, older):
+        encoded = replacement.encode("utf-8")
+        payload += _SPAN.pack(start, end, len(encoded)) + encoded
+    return _pack(bytes(payload))
+
+
+def truncation_delta(length: int, newer_length: int) -> bytes:
+    """Reverse delta of an append: cut the newer text back to length characters"""
+    return _pack(_SPAN.pack(length, newer_length, 0))
+
+
+def apply_delta(newer: str, data: bytes) -> str:
+    payload = _unpack(data)
+    pieces, pos, offset = [], 0, 0
+    while offset < len(payload):
+        start, end, size = _SPAN.unpack_from(payload, offset)
+        offset += _SPAN.size
+        pieces.append(newer[pos:start])
+        pieces.append(payload[offset:offset + size].decode("utf-8"))
+        offset += size
+        pos = end
+    pieces.append(newer[pos:])
+    return "".join(pieces)
+
+
+def thinning_keep(
+    rows: Iterable[Tuple[int, Optional[datetime]]],
+    now: datetime,
+    tiers: List[List[float]]
+) -> Set[int]:
+    """
+    Revisions to keep from (revision, saved_at) rows, newest first: a row
+    older than a tier's age is kept only if it is at least that tier's
+    spacing older than the last kept row. The oldest row is always kept.
+    """
+    rows = list(rows)
+    tiers = sorted(tiers)
+    keep = set()
+    last_kept = None
+    for i, (revision, saved_at) in enumerate(rows):
+        if saved_at is None or last_kept is None or i == len(rows) - 1:
+            keep.add(revision)
+            last_kept = saved_at or last_kept
+            continue
+        age = (now - saved_at).total_seconds()
+        spacing = 0.0
+        for min_age, tier_spacing in tiers:
+            if age >= min_age:
+                spacing = tier_spacing
+        if (last_kept - saved_at).total_seconds() >= spacing:
+            keep.add(revision)
+            last_kept = saved_at
+    return keep
+
+
+_DIFF_TOKEN = re.compile(r"<[^>]+>|\s+|[^\s<]+|<")
+
+
+def diff_texts(old: str, new: str) -> List[Dict[str, Any]]:
+    """
+    Word-level diff as [{"op": "equal"|"insert"|"delete"|"replace", "old": str, "new": str}].
+    Tags and whitespace are tokens of their own; only the changed span is
+    handed to difflib.
+    """
+    start, old_end, new_end = changed_span(old, new)
+    # Widen to token boundaries so a word is never split between ops
+    while start > 0 and not old[start - 1].isspace() and old[start - 1] != ">":
+        start -= 1
+    while old_end < len(old) and new_end < len(new) and not old[old_end].isspace() and old[old_end] != "<":
+        old_end += 1
+        new_end += 1
+
+    ops = []
+    if start:
+        ops.append({"op": "equal", "old": old[:start], "new": old[:start]})
+    old_tokens = _DIFF_TOKEN.findall(old[start:old_end])
+    new_tokens = _DIFF_TOKEN.findall(new[start:new_end])
+    matcher = difflib.SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        ops.append({"op": tag, "old": "".join(old_tokens[i1:i2]), "new": "".join(new_tokens[j1:j2])})
+    if old_end < len(old):
+        ops.append({"op": "equal", "old": old[old_end:], "new": new[new_end:]})
+    return ops
+
+
+# ─── Store ────────────────────────────────────────────────────────────────────
+
+class RevisionStore:
+    """
+    Records the text a save replaces and rebuilds old revisions. Rows are
+    written in the caller's transaction. All database access goes through
+    the _chain/_insert/_update/_rows/_delete/_current methods.
+    """
+
+    def __init__(self):
+        self._last_thinned: Dict[UUID, float] = {}
+        self.stats = {
+            "recorded": 0, "snapshots": 0, "deltas": 0, "bytes_written": 0,
+            "thinned_rows": 0, "rebuilds": 0, "deltas_applied": 0, "unrecoverable": 0,
+        }
+
+    async def record(
+        self,
+        db: AsyncSession,
+        chapter_id: UUID,
+        old_revision: int,
+        new_revision: int,
+        old_text: Optional[str],
+        new_text: str,
+        saved_at: Optional[datetime],
+        word_count: Optional[int] = None
+    ) -> None:
+        """Keep old_text (saved at saved_at) as revision old_revision, now that new_text replaced it"""
+        old_text = old_text or ""
+        if not settings.revision_history_enabled or old_text == new_text:
+            return
+        rows, chain_rows, chain_bytes = await self._chain(db, chapter_id)
+        if not rows and not old_text:
+            return  # A new chapter's empty start is not worth a revision
+
+        kind, data = self._encode(new_text, old_text, chain_rows, chain_bytes)
+        await self._insert(db, {
+            "chapter_id": chapter_id,
+            "revision": old_revision,
+            "next_revision": new_revision,
+            "kind": kind,
+            "data": data,
+            "length": len(old_text),
+            "word_count": word_count,
+            "saved_at": saved_at,
+        })
+        self._count(kind, data)
+        self.stats["recorded"] += 1
+        await self._maybe_thin(db, chapter_id, new_text, new_revision)
+
+    async def record_append(
+        self,
+        db: AsyncSession,
+        chapter_id: UUID,
+        old_revision: int,
+        new_revision: int,
+        old_length: int,
+        new_length: int,
+        saved_at: Optional[datetime],
+        word_count: Optional[int] = None
+    ) -> None:
+        """
+        Keep the text before an append (see ChapterService.append_content),
+        which never leaves the database: its delta is a truncation. Appends
+        always get their own revision, so the text before a generated
+        continuation can be restored.
+        """
+        if not settings.revision_history_enabled or new_length == old_length:
+            return
+        rows, _, _ = await self._chain(db, chapter_id)
+        if not rows and not old_length:
+            return
+        data = truncation_delta(old_length, new_length)
+        await self._insert(db, {
+            "chapter_id": chapter_id,
+            "revision": old_revision,
+            "next_revision": new_revision,
+            "kind": DELTA,
+            "data": data,
+            "length": old_length,
+            "word_count": word_count,
+            "saved_at": saved_at,
+        })
+        self._count(DELTA, data)
+        self.stats["recorded"] += 1
+
+    def _needs_snapshot(self, older: str, chain_rows: int, chain_bytes: int) -> bool:
+        """
+        The deltas above the newest snapshot (plus the next one) are as big
+        as a compressed copy of the text would be (about a third of it), or
+        the chain is REVISION_SNAPSHOT_EVERY rows long
+        """
+        return chain_rows >= settings.revision_snapshot_every or chain_bytes >= len(older) // 3
+
+    def _encode(self, newer: str, older: str, chain_rows: int, chain_bytes: int) -> Tuple[str, bytes]:
+        data = encode_delta(newer, older)
+        if self._needs_snapshot(older, chain_rows, chain_bytes + len(data)):
+            return SNAPSHOT, encode_snapshot(older)
+        return DELTA, data
+
+    def _count(self, kind: str, data: bytes) -> None:
+        self.stats["snapshots" if kind == SNAPSHOT else "deltas"] += 1
+        self.stats["bytes_written"] += len(data)
+
+    # ─── Reading ──────────────────────────────────────────────────────────────
+
+    async def list_revisions(self, db: AsyncSession, chapter_id: UUID) -> List[Dict[str, Any]]:
+        """Kept revisions, newest first, without rebuilding any text"""
+        rows = await self._rows(db, chapter_id, with_data=False)
+        return [
+            {
+                "revision": row.revision,
+                "saved_at": row.saved_at,
+                "length": row.length,
+                "word_count": row.word_count,
+                "kind": row.kind,
+                "stored_bytes": row.stored_bytes,
+            }
+            for row in rows
+        ]
+
+    async def get_text(self, db: AsyncSession, chapter_id: UUID, revision: int) -> Optional[str]:
+        """
+        Text of a revision: the current one, or a kept one rebuilt from the
+        nearest snapshot above it. None if it was not kept or cannot be
+        rebuilt (a save that bypassed the store broke its chain).
+        """
+        current = await self._current(db, chapter_id)
+        if current is None:
+            return None
+        current_text, current_revision = current
+        if revision == current_revision:
+            return current_text
+        rows = await self._rows(db, chapter_id, from_revision=revision)
+        if not rows or rows[-1].revision != revision:
+            return None
+
+        self.stats["rebuilds"] += 1
+        text, text_revision = current_text, current_revision
+        for row in rows:
+            text = self._step(row, text, text_revision)
+            text_revision = row.revision
+        if text is None:
+            self.stats["unrecoverable"] += 1
+        return text
+
+    def _step(self, row, newer_text: Optional[str], newer_revision: int) -> Optional[str]:
+        """The text of row, given the text of the revision just above it"""
+        if row.kind == SNAPSHOT:
+            return decode_snapshot(row.data)
+        if newer_text is None or row.next_revision != newer_revision:
+            return None
+        self.stats["deltas_applied"] += 1
+        return apply_delta(newer_text, row.data)
+
+    # ─── Thinning ─────────────────────────────────────────────────────────────
+
+    async def _maybe_thin(self, db: AsyncSession, chapter_id: UUID, current_text: str, current_revision: int) -> None:
+        now = time.monotonic()
+        if now - self._last_thinned.get(chapter_id, 0.0) < settings.revision_thin_interval_seconds:
+            return
+        if len(self._last_thinned) > 10000:
+            self._last_thinned.clear()
+        self._last_thinned[chapter_id] = now
+        await self.thin(db, chapter_id, current_text, current_revision)
+
+    async def thin(
+        self,
+        db: AsyncSession,
+        chapter_id: UUID,
+        current_text: str,
+        current_revision: int,
+        now: Optional[datetime] = None
+    ) -> int:
+        """
+        Drop revisions the REVISION_THINNING tiers no longer keep and re-base
+        the deltas around them. current_text/current_revision are the text
+        the newest row applies to (the caller's, which may not be flushed yet).
+        Returns how many rows were dropped.
+        """
+        meta = await self._rows(db, chapter_id, with_data=False)
+        keep = thinning_keep(
+            ((row.revision, row.saved_at) for row in meta),
+            now or datetime.utcnow(),
+            [[0, settings.revision_coalesce_seconds], *settings.revision_thinning]
+        )
+        if len(keep) == len(meta):
+            return 0
+
+        rows = await self._rows(db, chapter_id)
+        drop, rewrite = [], []
+        text, text_revision = current_text, current_revision
+        base_text, base_revision = current_text, current_revision  # Nearest kept text above
+        chain_rows = chain_bytes = 0
+        for row in rows:
+            text = self._step(row, text, text_revision)
+            text_revision = row.revision
+            if text is None or row.revision not in keep:
+                drop.append(row.id)
+                continue
+            if row.next_revision == base_revision and (
+                row.kind == SNAPSHOT or not self._needs_snapshot(text, chain_rows, chain_bytes + row.stored_bytes)
+            ):
+                kind, size = row.kind, row.stored_bytes  # Unchanged base: the stored row is still right
+            else:
+                kind, data = self._encode(base_text, text, chain_rows, chain_bytes)
+                rewrite.append({"id": row.id, "kind": kind, "data": data, "next_revision": base_revision})
+                self._count(kind, data)
+                size = len(data)
+            chain_rows, chain_bytes = (0, 0) if kind == SNAPSHOT else (chain_rows + 1, chain_bytes + size)
+            base_text, base_revision = text, row.revision
+
+        await self._delete(db, drop)
+        for values in rewrite:
+            await self._update(db, values.pop("id"), values)
+        self.stats["thinned_rows"] += len(drop)
+        logger.debug(f"Thinned chapter {chapter_id}: dropped {len(drop)}, re-based {len(rewrite)} revisions")
+        return len(drop)
+
+    # ─── Database access ──────────────────────────────────────────────────────
+
+    async def _chain(self, db: AsyncSession, chapter_id: UUID) -> Tuple[int, int, int]:
+        """(rows, rows above the newest snapshot, their stored bytes), in one query"""
+        snapshots = aliased(ChapterRevision)
+        newest_snapshot = (
+            select(func.max(snapshots.revision))
+            .where(snapshots.chapter_id == chapter_id, snapshots.kind == SNAPSHOT)
+            .scalar_subquery()
+        )
+        above = ChapterRevision.revision > func.coalesce(newest_snapshot, -1)
+        row = (await db.execute(
+            select(
+                func.count(),
+                func.count().filter(above),
+                func.coalesce(func.sum(func.length(ChapterRevision.data)).filter(above), 0)
+            )
+            .where(ChapterRevision.chapter_id == chapter_id)
+        )).one()
+        return tuple(row)
+
+    async def _insert(self, db: AsyncSession, values: Dict[str, Any]) -> None:
+        # Two racing full saves of the same revision keep the first one's row
+        await db.execute(
+            pg_insert(ChapterRevision).values(**values)
+            .on_conflict_do_nothing(index_elements=["chapter_id", "revision"])
+        )
+
+    async def _update(self, db: AsyncSession, row_id: UUID, values: Dict[str, Any]) -> None:
+        await db.execute(
+            update(ChapterRevision).where(ChapterRevision.id == row_id).values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+    async def _delete(self, db: AsyncSession, row_ids: List[UUID]) -> None:
+        if row_ids:
+            await db.execute(
+                delete(ChapterRevision).where(ChapterRevision.id.in_(row_ids))
+                .execution_options(synchronize_session=False)
+            )
+
+    async def _rows(
+        self,
+        db: AsyncSession,
+        chapter_id: UUID,
+        from_revision: Optional[int] = None,
+        with_data: bool = True
+    ) -> List[Any]:
+        """
+        Rows newest first. With from_revision, only the rows needed to rebuild
+        it: from the nearest snapshot at or above it down to it.
+        """
+        columns = [
+            ChapterRevision.id, ChapterRevision.revision, ChapterRevision.next_revision,
+            ChapterRevision.kind, ChapterRevision.length, ChapterRevision.word_count,
+            ChapterRevision.saved_at, func.length(ChapterRevision.data).label("stored_bytes"),
+        ]
+        if with_data:
+            columns.append(ChapterRevision.data)
+        query = select(*columns).where(ChapterRevision.chapter_id == chapter_id)
+        if from_revision is not None:
+            snapshots = aliased(ChapterRevision)
+            nearest_snapshot = (
+                select(func.min(snapshots.revision))
+                .where(
+                    snapshots.chapter_id == chapter_id,
+                    snapshots.kind == SNAPSHOT,
+                    snapshots.revision >= from_revision
+                )
+                .scalar_subquery()
+            )
+            query = query.where(
+                ChapterRevision.revision >= from_revision,
+                ChapterRevision.revision <= func.coalesce(nearest_snapshot, ChapterRevision.revision)
+            )
+        result = await db.execute(query.order_by(ChapterRevision.revision.desc()))
+        return list(result.all())
+
+    async def _current(self, db: AsyncSession, chapter_id: UUID) -> Optional[Tuple[str, int]]:
+        row = (await db.execute(
+            select(Chapter.content, Chapter.revision).where(Chapter.id == chapter_id)
+        )).one_or_none()
+        return (row.content or "", row.revision) if row is not None else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        written = self.stats["snapshots"] + self.stats["deltas"]
+        return {
+            **self.stats,
+            "avg_row_bytes": round(self.stats["bytes_written"] / written, 1) if written else None,
+            "enabled": settings.revision_history_enabled,
+        }
+
+
+# Global revision store used by ChapterService and the revision routes
+revision_store = RevisionStore()
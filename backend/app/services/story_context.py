@@ -0,0 +1,189 @@
+"""
+Story Context - Per-story snapshot of everything generation setup reads
+Generation routes used to re-query characters, plotlines, the story bible with
+its world rules, token limits and API keys on every call. A snapshot holds all
+of them for one story, built in one pass on its own session and shared by later
+requests until the story's context_version changes. Character, plotline,
+bible, story and user AI settings writes bump that version in their own
+transaction, so every worker sees the change on its next story read.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Tuple, Mapping
+from uuid import UUID
+import asyncio
+import logging
+import time
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.config import settings
+from app.database import get_async_session
+from app.models.story import Story
+from app.models.character import Character
+from app.models.plotline import Plotline, PlotlineStatus
+from app.models.story_bible import StoryBible
+from app.models.user_api_keys import UserApiKeys
+from app.services.token_settings import get_user_token_limits, get_user_api_keys, build_user_ai_config
+
+logger = logging.getLogger(__name__)
+
+_CLOSED_PLOTLINES = (PlotlineStatus.RESOLVED, PlotlineStatus.ABANDONED)
+
+
+@dataclass(frozen=True)
+class StoryContextSnapshot:
+    """
+    Read-only generation context for one story at one context_version.
+    The ORM objects are detached and shared between requests: read them,
+    never modify them.
+    """
+    story_id: UUID
+    author_id: UUID
+    version: int
+    characters: Tuple[Character, ...]  # Most important first, as get_characters_by_story
+    plotlines: Tuple[Plotline, ...]
+    story_bible: Optional[StoryBible]  # world_rules loaded
+    token_limits: Mapping[str, int]
+    api_keys: Tuple[UserApiKeys, ...]
+    built_at: float
+
+    @property
+    def active_plotlines(self) -> Tuple[Plotline, ...]:
+        return tuple(p for p in self.plotlines if p.status not in _CLOSED_PLOTLINES)
+
+    def character(self, character_id: UUID) -> Optional[Character]:
+        return next((c for c in self.characters if c.id == character_id), None)
+
+    def ai_config(self) -> Dict[str, Any]:
+        """The author's provider config (see get_user_ai_config), with the current runtime model"""
+        return build_user_ai_config(self.api_keys)
+
+
+async def _build(story_id: UUID, author_id: UUID, version: int) -> StoryContextSnapshot:
+    """Load a snapshot on a dedicated session, so its objects belong to no request"""
+    async with get_async_session() as session:
+        characters = await session.execute(
+            select(Character).where(Character.story_id == story_id)
+            .order_by(Character.importance.desc(), Character.name)
+        )
+        plotlines = await session.execute(select(Plotline).where(Plotline.story_id == story_id))
+        bible = await session.execute(
+            select(StoryBible).where(StoryBible.story_id == story_id).options(selectinload(StoryBible.world_rules))
+        )
+        snapshot = StoryContextSnapshot(
+            story_id=story_id,
+            author_id=author_id,
+            version=version,
+            characters=tuple(characters.scalars().all()),
+            plotlines=tuple(plotlines.scalars().all()),
+            story_bible=bible.scalar_one_or_none(),
+            token_limits=MappingProxyType(await get_user_token_limits(session, author_id)),
+            api_keys=tuple(await get_user_api_keys(session, author_id)),
+            built_at=time.monotonic(),
+        )
+    return snapshot
+
+
+class StoryContextCache:
+    """
+    LRU of snapshots by story id. A request reads its story row (the one
+    query that remains, and the 404 check) and reuses the snapshot when the
+    row's context_version matches. Concurrent misses for the same story
+    share one build. STORY_CONTEXT_TTL_SECONDS bounds staleness for writes
+    that bypass the version bump.
+    """
+
+    def __init__(self):
+        self._snapshots: "OrderedDict[UUID, StoryContextSnapshot]" = OrderedDict()
+        self._building: Dict[Tuple[UUID, int], asyncio.Task] = {}
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "expired": 0, "builds": 0, "build_ms_total": 0}
+
+    async def load(
+        self,
+        db: AsyncSession,
+        story_id: UUID
+    ) -> Tuple[Optional[Story], Optional[StoryContextSnapshot]]:
+        """The story row from db and its context snapshot, or (None, None) if the story does not exist"""
+        story = (await db.execute(select(Story).where(Story.id == story_id))).scalar_one_or_none()
+        if story is None:
+            return None, None
+        version = story.context_version or 0
+
+        snapshot = self._snapshots.get(story_id)
+        if snapshot is not None and settings.story_context_cache_enabled:
+            if snapshot.version != version or snapshot.author_id != story.author_id:
+                self.stats["stale"] += 1
+            elif time.monotonic() - snapshot.built_at > settings.story_context_ttl_seconds:
+                self.stats["expired"] += 1
+            else:
+                self.stats["hits"] += 1
+                self._snapshots.move_to_end(story_id)
+                return story, snapshot
+        else:
+            self.stats["misses"] += 1
+
+        return story, await self._get_or_build(story_id, story.author_id, version)
+
+    async def _get_or_build(self, story_id: UUID, author_id: UUID, version: int) -> StoryContextSnapshot:
+        key = (story_id, version)
+        task = self._building.get(key)
+        if task is None:
+            # A task of its own, so a client that disconnects does not cancel the build for the others
+            task = asyncio.ensure_future(self._build_and_store(story_id, author_id, version))
+            self._building[key] = task
+            task.add_done_callback(lambda _: self._building.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _build_and_store(self, story_id: UUID, author_id: UUID, version: int) -> StoryContextSnapshot:
+        start = time.monotonic()
+        snapshot = await _build(story_id, author_id, version)
+        self.stats["builds"] += 1
+        self.stats["build_ms_total"] += int((time.monotonic() - start) * 1000)
+
+        current = self._snapshots.get(story_id)
+        # A concurrent request may already have cached a newer version
+        if settings.story_context_cache_enabled and (current is None or current.version <= version):
+            self._snapshots[story_id] = snapshot
+            self._snapshots.move_to_end(story_id)
+            while len(self._snapshots) > settings.story_context_max_stories:
+                self._snapshots.popitem(last=False)
+        return snapshot
+
+    # ─── Invalidation ─────────────────────────────────────────────────────────
+
+    async def bump(self, db: AsyncSession, story_id: UUID) -> None:
+        """Invalidate the story's snapshot; commits (or rolls back) with the caller's write"""
+        await db.execute(
+            update(Story).where(Story.id == story_id)
+            .values(context_version=Story.context_version + 1, updated_at=Story.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+        self._snapshots.pop(story_id, None)
+
+    async def bump_author(self, db: AsyncSession, author_id: UUID) -> None:
+        """Invalidate every story of a user whose token limits or API keys changed"""
+        await db.execute(
+            update(Story).where(Story.author_id == author_id)
+            .values(context_version=Story.context_version + 1, updated_at=Story.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+        for story_id in [k for k, s in self._snapshots.items() if s.author_id == author_id]:
+            self._snapshots.pop(story_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        builds = self.stats["builds"]
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["stale"] + self.stats["expired"]
+        return {
+            **{k: v for k, v in self.stats.items() if k != "build_ms_total"},
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "avg_build_ms": round(self.stats["build_ms_total"] / builds, 1) if builds else None,
+            "stories": len(self._snapshots),
+        }
+
+
+# Global snapshot cache shared by the generation routes
+story_context_cache = StoryContextCache()
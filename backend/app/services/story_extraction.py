@@ -3,19 +3,30 @@ AI-powered story extraction service.
 Analyzes imported text to extract characters, plotlines, themes, and metadata.
 """
 
-import re
 import json
-from typing import Dict, List, Optional
-import httpx
+from typing import Any, Dict, List, Optional
 from app.config import settings
+from app.services.http_client import http_pool, get_timeout
+from app.services.ollama_pool import ollama_pool
+from app.services.llm_scheduler import llm_scheduler, Priority
+from app.services.response_cache import response_cache, make_cache_key
+from app.services.json_repair import extract_json
+from app.services.structured_output import (
+    prune_invalid,
+    structured_output_stats,
+    IMPORT_METADATA_SCHEMA,
+    IMPORT_CHARACTERS_SCHEMA,
+    IMPORT_PLOTLINES_SCHEMA,
+    IMPORT_THEMES_SCHEMA,
+)
 from app.runtime_settings import get_runtime_model_name
 
 
 class StoryExtractor:
     """Extract story elements from imported text using AI."""
     
-    def __init__(self, ollama_url: str = settings.ollama_base_url):
-        self.ollama_url = ollama_url
+    def __init__(self, user_id: Optional[Any] = None):
+        self.user_id = user_id
     
     async def extract_story_elements(self, title: str, content: str, chapters: List[Dict], max_tokens: Optional[int] = None) -> Dict:
         """
@@ -48,24 +59,59 @@ class StoryExtractor:
             'themes': themes
         }
     
-    async def _call_ollama(self, prompt: str, max_tokens: Optional[int] = None) -> str:
-        """Call Ollama API for text generation."""
+    async def _call_ollama(self, prompt: str, max_tokens: Optional[int] = None, schema: Optional[Dict] = None) -> str:
+        """Call Ollama API for text generation; schema constrains the output to matching JSON."""
         max_predict = max_tokens or settings.max_tokens_import_story
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(
-                f"{self.ollama_url}/api/generate",
-                json={
-                    "model": get_runtime_model_name(),
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.3,  # Lower for more consistent extraction
-                        "num_predict": max_predict
-                    }
-                }
+        model = get_runtime_model_name()
+        options = {
+            "temperature": 0.3,  # Lower for more consistent extraction
+            "num_predict": max_predict
+        }
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": False,
+            "options": options,
+            "keep_alive": settings.ollama_keep_alive
+        }
+        if schema is not None:
+            payload["format"] = schema
+        
+        # Re-importing the same file reuses earlier extraction results
+        cache_key = make_cache_key(model, prompt, {**options, "format": schema} if schema else options)
+        if settings.llm_cache_enabled:
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                return cached.get("content", "")
+        
+        client = http_pool.get_client("ollama")
+        async with llm_scheduler.slot(Priority.BATCH, self.user_id):
+            response = await ollama_pool.post(
+                client, "/api/generate", model, self.user_id,
+                raise_for_status=False,
+                json=payload,
+                timeout=get_timeout("ollama.import")
             )
-            result = response.json()
-            return result.get('response', '')
+        result = response.json()
+        text = result.get('response', '')
+        if settings.llm_cache_enabled and response.status_code == 200 and text:
+            await response_cache.set(cache_key, model, {"content": text, "model": model})
+        return text
+    
+    def _parse_structured(self, response: str, schema: Dict, call_site: str) -> Optional[Any]:
+        """Parse schema-constrained output; the tolerant scan only runs if direct parsing fails."""
+        try:
+            data = json.loads(response)
+            outcome = "parsed"
+        except json.JSONDecodeError:
+            data = extract_json(response, "[" if schema.get("type") == "array" else "{")
+            outcome = "repaired" if data is not None else "unparseable"
+        if data is not None:
+            data, errors = prune_invalid(data, schema)
+            if errors:
+                outcome = "invalid" if data is None else "partial"
+        structured_output_stats.record(call_site, outcome)
+        return data
     
     async def _extract_metadata(self, title: str, content: str, chapters: List[Dict], max_tokens: Optional[int] = None) -> Dict:
         """Extract story metadata (genre, tone, logline, etc.)."""
@@ -92,17 +138,10 @@ Extract the following and respond ONLY with valid JSON (no other text):
 
 JSON:"""
         
-        response = await self._call_ollama(prompt, max_tokens)
-        
-        # Try to parse JSON from response
-        try:
-            # Extract JSON from response (might have extra text)
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                metadata = json.loads(json_match.group())
-                return metadata
-        except:
-            pass
+        response = await self._call_ollama(prompt, max_tokens, IMPORT_METADATA_SCHEMA)
+        metadata = self._parse_structured(response, IMPORT_METADATA_SCHEMA, "import_metadata")
+        if metadata is not None:
+            return metadata
         
         # Fallback if parsing fails
         return {
@@ -144,18 +183,9 @@ Respond ONLY with valid JSON array (no other text):
 
 JSON:"""
         
-        response = await self._call_ollama(prompt, max_tokens)
-        
-        # Try to parse JSON
-        try:
-            json_match = re.search(r'\[.*\]', response, re.DOTALL)
-            if json_match:
-                characters = json.loads(json_match.group())
-                return characters
-        except:
-            pass
-        
-        return []
+        response = await self._call_ollama(prompt, max_tokens, IMPORT_CHARACTERS_SCHEMA)
+        characters = self._parse_structured(response, IMPORT_CHARACTERS_SCHEMA, "import_characters")
+        return characters if characters is not None else []
     
     async def _extract_plotlines(self, content: str, chapters: List[Dict], max_tokens: Optional[int] = None) -> List[Dict]:
         """Extract main plotlines/story threads."""
@@ -191,18 +221,9 @@ Respond ONLY with valid JSON array (no other text):
 
 JSON:"""
         
-        response = await self._call_ollama(prompt, max_tokens)
-        
-        # Try to parse JSON
-        try:
-            json_match = re.search(r'\[.*\]', response, re.DOTALL)
-            if json_match:
-                plotlines = json.loads(json_match.group())
-                return plotlines
-        except:
-            pass
-        
-        return []
+        response = await self._call_ollama(prompt, max_tokens, IMPORT_PLOTLINES_SCHEMA)
+        plotlines = self._parse_structured(response, IMPORT_PLOTLINES_SCHEMA, "import_plotlines")
+        return plotlines if plotlines is not None else []
     
     async def _extract_themes(self, content: str, max_tokens: Optional[int] = None) -> List[str]:
         """Extract main themes from the story."""
@@ -221,15 +242,6 @@ Respond ONLY with a JSON array of theme strings (no other text):
 
 JSON:"""
         
-        response = await self._call_ollama(prompt, max_tokens)
-        
-        # Try to parse JSON
-        try:
-            json_match = re.search(r'\[.*\]', response, re.DOTALL)
-            if json_match:
-                themes = json.loads(json_match.group())
-                return themes
-        except:
-            pass
-        
-        return []
+        response = await self._call_ollama(prompt, max_tokens, IMPORT_THEMES_SCHEMA)
+        themes = self._parse_structured(response, IMPORT_THEMES_SCHEMA, "import_themes")
+        return themes if themes is not None else []
@@ -1,12 +1,14 @@
 """
 Story Service - Business logic for story management
 """
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from uuid import UUID
 from datetime import datetime
+import time
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select, update, func
+from sqlalchemy.orm import selectinload, undefer
+from sqlalchemy.orm.attributes import set_committed_value
 
 from app.models.story import Story, StoryGenre, StoryTone, StoryStatus
 from app.models.chapter import Chapter
@@ -15,6 +17,48 @@ from app.models.plotline import Plotline
 from app.models.story_bible import StoryBible
 
 
+class StoryLanguageCache:
+    """
+    Story language by story id, for word counting on chapter saves. An
+    editing session saves the same chapter every few seconds; the story is
+    read once instead of on every save. update_story drops the entry when the
+    language changes, and entries expire after ttl_seconds so a change made
+    by another worker is picked up.
+    """
+
+    def __init__(self, ttl_seconds: float = 300.0, max_stories: int = 5000):
+        self.ttl_seconds = ttl_seconds
+        self.max_stories = max_stories
+        self._languages: Dict[UUID, Tuple[str, float]] = {}
+        self.stats = {"hits": 0, "misses": 0}
+
+    async def get(self, db: AsyncSession, story_id: UUID) -> str:
+        cached = self._languages.get(story_id)
+        if cached is not None and time.monotonic() - cached[1] < self.ttl_seconds:
+            self.stats["hits"] += 1
+            return cached[0]
+        self.stats["misses"] += 1
+        result = await db.execute(select(Story.language).where(Story.id == story_id))
+        language = result.scalar_one_or_none() or "English"
+        self.put(story_id, language)
+        return language
+
+    def put(self, story_id: UUID, language: Optional[str]) -> None:
+        if len(self._languages) >= self.max_stories:
+            self._languages.clear()
+        self._languages[story_id] = (language or "English", time.monotonic())
+
+    def invalidate(self, story_id: UUID) -> None:
+        self._languages.pop(story_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "stories": len(self._languages)}
+
+
+# Global story language cache shared by the chapter write paths
+story_languages = StoryLanguageCache()
+
+
 class StoryService:
     """Service for managing stories"""
     
@@ -104,9 +148,16 @@ class StoryService:
         if not story:
             return None
         
+        old_language = story.language
         for key, value in updates.items():
             if hasattr(story, key):
                 setattr(story, key, value)
+        if "language" in updates:
+            story_languages.invalidate(story_id)
+            if story.language != old_language:
+                # Chapter counts are in the old language's unit (words vs characters)
+                total = await self.recount_words(db, story_id, story.language or "English")
+                set_committed_value(story, "word_count", total)
         
         story.updated_at = datetime.utcnow()
         await db.flush()
@@ -122,19 +173,58 @@ class StoryService:
         await db.flush()
         return True
     
+    async def recount_words(self, db: AsyncSession, story_id: UUID, language: str) -> int:
+        """
+        Count every chapter of the story again in language and recompute the
+        story total. The chapter rows are locked, so saves running meanwhile
+        apply their deltas to the recounted values. Returns the new total.
+        """
+        result = await db.execute(
+            select(Chapter)
+            .where(Chapter.story_id == story_id)
+            .options(undefer(Chapter.content))
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+        for chapter in result.scalars().all():
+            if chapter.content:
+                chapter.calculate_word_count(language)
+            else:
+                chapter.word_count = 0
+        await db.flush()
+        return await self.update_word_count(db, story_id)
+    
     async def update_word_count(self, db: AsyncSession, story_id: UUID) -> int:
-        """Recalculate and update story word count"""
-        # Sum word counts from all chapters
-        query = select(func.sum(Chapter.word_count)).where(Chapter.story_id == story_id)
-        result = await db.execute(query)
-        total = result.scalar() or 0
-        
-        await self.update_story(db, story_id, {
-            "word_count": total,
-            "last_written_at": datetime.utcnow()
-        })
-        
-        return total
+        """
+        Recount the story word count from its chapters. Chapter writes keep it
+        current with adjust_word_count; this is for repairing a drifted total.
+        """
+        total = (
+            select(func.coalesce(func.sum(Chapter.word_count), 0))
+            .where(Chapter.story_id == story_id)
+            .scalar_subquery()
+        )
+        result = await db.execute(
+            update(Story)
+            .where(Story.id == story_id)
+            .values(word_count=total)
+            .returning(Story.word_count)
+            .execution_options(synchronize_session=False)
+        )
+        return result.scalar_one_or_none() or 0
+    
+    async def adjust_word_count(self, db: AsyncSession, story_id: UUID, delta: int) -> None:
+        """
+        Move the story word count by a chapter's change in one atomic UPDATE,
+        so concurrent saves of different chapters never lose each other's
+        counts. Story objects already in the session are not updated.
+        """
+        await db.execute(
+            update(Story)
+            .where(Story.id == story_id)
+            .values(word_count=func.coalesce(Story.word_count, 0) + delta, last_written_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
     
     async def get_story_stats(self, db: AsyncSession, story_id: UUID) -> Dict[str, Any]:
         """Get comprehensive story statistics"""
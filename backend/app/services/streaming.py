@@ -0,0 +1,187 @@
+"""
+Streaming helpers - Shared plumbing for Server-Sent Event generation endpoints
+Detects clients that went away mid-stream so upstream model work is stopped
+instead of running to num_predict for nobody, and encodes token streams into
+coalesced, typed SSE frames.
+"""
+from typing import Any, AsyncIterator, Optional, TypeVar
+import asyncio
+import json
+import logging
+import time
+
+from fastapi import Request
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ClientDisconnected(Exception):
+    """The HTTP client closed the connection before the stream finished"""
+
+
+async def iterate_until_disconnect(
+    request: Request,
+    source: AsyncIterator[T],
+    poll_interval: Optional[float] = None
+) -> AsyncIterator[T]:
+    """
+    Yield items from source while the client is still connected.
+
+    The client is polled at most every poll_interval seconds, whether or not
+    items are arriving. On disconnect the pending read is cancelled, which
+    unwinds the source generator (closing its upstream HTTP stream so the model
+    server stops generating), and ClientDisconnected is raised.
+    """
+    interval = poll_interval if poll_interval is not None else settings.stream_disconnect_poll_seconds
+    iterator = source.__aiter__()
+    pending: Optional[asyncio.Future] = None
+    last_check = time.monotonic()
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            done, _ = await asyncio.wait({pending}, timeout=interval)
+
+            if time.monotonic() - last_check >= interval:
+                last_check = time.monotonic()
+                if await request.is_disconnected():
+                    raise ClientDisconnected()
+
+            if not done:
+                continue
+            try:
+                item = pending.result()
+            except StopAsyncIteration:
+                pending = None
+                return
+            pending = None
+            yield item
+    finally:
+        if pending is not None and not pending.done():
+            # Cancelling the read throws CancelledError into the source generator,
+            # which exits its `async with client.stream(...)` and drops the upstream connection
+            pending.cancel()
+        else:
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                try:
+                    await aclose()
+                except Exception:
+                    pass
+
+
+class SSEEncoder:
+    """
+    Encodes a token stream as Server-Sent Events.
+
+    Tokens are coalesced into one frame per time window (or sooner once the
+    buffer reaches max_bytes), and a heartbeat comment is sent whenever the
+    stream has been idle for heartbeat_seconds (e.g. while queued for a slot).
+
+    Protocol "events" sends typed events with JSON payloads:
+        event: token   data: {"text": "..."}
+        event: usage   data: {...stream stats...}
+        event: done    data: {...}
+        event: error   data: {"message": "..."}
+    Protocol "legacy" (the default, STREAM_SSE_PROTOCOL) keeps the original untyped frames (`data: <text>`,
+    `data: [DONE]`, `data: [ERROR] ...`), with multi-line text split across
+    data lines so framing stays intact.
+    """
+
+    HEARTBEAT = ": keep-alive\n\n"
+
+    def __init__(
+        self,
+        protocol: Optional[str] = None,
+        window_ms: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        heartbeat_seconds: Optional[float] = None
+    ):
+        self.protocol = protocol or settings.stream_sse_protocol
+        window = settings.sse_coalesce_window_ms if window_ms is None else window_ms
+        self.window = window / 1000
+        self.max_bytes = settings.sse_coalesce_max_bytes if max_bytes is None else max_bytes
+        self.heartbeat = settings.sse_heartbeat_seconds if heartbeat_seconds is None else heartbeat_seconds
+        self.frames_sent = 0
+        self.tokens_seen = 0
+
+    def event(self, name: str, data: Any) -> str:
+        """Encode one event; returns "" for events the legacy protocol has no frame for"""
+        if self.protocol == "legacy":
+            if name == "token":
+                text = data["text"] if isinstance(data, dict) else str(data)
+                return "".join(f"data: {line}\n" for line in text.split("\n")) + "\n"
+            if name == "done":
+                return "data: [DONE]\n\n"
+            if name == "error":
+                message = data.get("message", "") if isinstance(data, dict) else str(data)
+                return f"data: [ERROR] {message}\n\n"
+            return ""
+        payload = json.dumps(data, ensure_ascii=False, default=str)
+        return f"event: {name}\ndata: {payload}\n\n"
+
+    async def encode_tokens(self, tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Yield coalesced token frames and heartbeats until tokens is exhausted"""
+        iterator = tokens.__aiter__()
+        pending: Optional[asyncio.Future] = None
+        buffer = []
+        buffered_bytes = 0
+        first_buffered_at = 0.0
+        last_sent = time.monotonic()
+
+        def flush() -> str:
+            nonlocal buffer, buffered_bytes
+            frame = self.event("token", {"text": "".join(buffer)})
+            buffer = []
+            buffered_bytes = 0
+            self.frames_sent += 1
+            return frame
+
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+                now = time.monotonic()
+                if buffer:
+                    timeout = max(0.0, first_buffered_at + self.window - now)
+                else:
+                    timeout = max(0.0, last_sent + self.heartbeat - now)
+                done, _ = await asyncio.wait({pending}, timeout=timeout)
+
+                if done:
+                    try:
+                        token = pending.result()
+                    except StopAsyncIteration:
+                        pending = None
+                        break
+                    pending = None
+                    if not token:
+                        continue
+                    self.tokens_seen += 1
+                    if not buffer:
+                        first_buffered_at = time.monotonic()
+                    buffer.append(token)
+                    buffered_bytes += len(token.encode("utf-8"))
+                    if buffered_bytes < self.max_bytes and self.window > 0:
+                        continue
+
+                yield flush() if buffer else self.HEARTBEAT
+                last_sent = time.monotonic()
+
+            if buffer:
+                yield flush()
+        finally:
+            if pending is not None and not pending.done():
+                pending.cancel()
+            else:
+                aclose = getattr(iterator, "aclose", None)
+                if aclose is not None:
+                    try:
+                        await aclose()
+                    except Exception:
+                        pass
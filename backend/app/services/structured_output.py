@@ -0,0 +1,258 @@
+"""
+Structured Output - JSON schemas for model calls that must return data
+Schemas are sent to Ollama as `format` (grammar-constrained decoding) and to
+external providers through their native JSON modes, so the response parses on
+the first attempt instead of going through regex repair and retry calls.
+Each schema requires only the keys its callers cannot do without, and
+prune_invalid keeps the valid part of an object that is partly wrong (or
+truncated and repaired). Parse and validation failures are counted per call site.
+"""
+from typing import Optional, List, Dict, Any, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _obj(properties: Dict[str, Any], required: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Object schema; required defaults to every property, required=[] makes them all optional"""
+    return {"type": "object", "properties": properties, "required": list(properties) if required is None else required}
+
+
+def _arr(items: Dict[str, Any]) -> Dict[str, Any]:
+    return {"type": "array", "items": items}
+
+
+_STR = {"type": "string"}
+_NULLABLE_STR = {"type": ["string", "null"]}
+_STR_LIST = _arr(_STR)
+_LOCATION = _obj({"name": _STR, "description": _STR, "importance": _STR}, required=["name", "description"])
+_WORLD_RULE = _obj(
+    {"category": _STR, "title": _STR, "description": _STR, "importance": {"type": "integer"}},
+    required=["title", "description"]
+)
+_GLOSSARY_TERM = _obj({"term": _STR, "definition": _STR}, required=["term"])
+
+STORY_BIBLE_SIMPLE_SCHEMA = _obj({
+    "world_description": _STR,
+    "world_type": _STR,
+    "time_period": _STR,
+    "central_themes": _STR_LIST,
+    "quick_facts": _STR_LIST,
+    "primary_locations": _arr(_LOCATION),
+}, required=["world_description"])
+
+STORY_BIBLE_SCHEMA = _obj({
+    "world_name": _NULLABLE_STR,
+    "world_description": _STR,
+    "world_type": _STR,
+    "time_period": _STR,
+    "primary_locations": _arr(_LOCATION),
+    "magic_system": _NULLABLE_STR,
+    "magic_rules": _STR_LIST,
+    "magic_limitations": _STR_LIST,
+    "technology_level": _STR,
+    "societies": _arr(_obj({"name": _STR, "description": _STR, "customs": _STR_LIST}, required=["name"])),
+    "world_rules": _arr(_WORLD_RULE),
+    "central_themes": _STR_LIST,
+    "recurring_motifs": _STR_LIST,
+    "glossary": _arr(_GLOSSARY_TERM),
+    "tone_guidelines": _STR,
+    "quick_facts": _STR_LIST,
+}, required=["world_description"])
+
+STORY_BIBLE_UPDATE_SCHEMA = _obj({
+    "new_locations": _arr(_LOCATION),
+    "new_world_rules": _arr(_WORLD_RULE),
+    "new_glossary_terms": _arr(_GLOSSARY_TERM),
+    "new_themes": _STR_LIST,
+    "new_quick_facts": _STR_LIST,
+}, required=[])
+
+CHARACTER_EXTRACTION_SCHEMA = _obj({
+    "characters": _arr(_obj({
+        "name": _STR,
+        "full_name": _NULLABLE_STR,
+        "role": _STR,  # Free-form: the characters route maps role names onto CharacterRole
+        "age": _NULLABLE_STR,
+        "gender": _NULLABLE_STR,
+        "species": _STR,
+        "occupation": _NULLABLE_STR,
+        "physical_description": _STR,
+        "personality_summary": _STR,
+        "personality_traits": _STR_LIST,
+        "backstory": _NULLABLE_STR,
+        "motivation": _STR,
+        "speaking_style": _STR,
+        "relationships": _STR,
+        "distinguishing_features": _STR_LIST,
+    }, required=["name", "role"])),
+    "total_found": {"type": "integer"},
+}, required=["characters"])
+
+GRAMMAR_CHECK_SCHEMA = _obj({
+    "overall_quality": {"type": "integer"},
+    "summary": _STR,
+    "issues": _arr(_obj({
+        "type": {"type": "string", "enum": [
+            "grammar", "spelling", "punctuation", "style", "word_choice", "clarity"
+        ]},
+        "severity": {"type": "string", "enum": ["low", "medium", "high"]},
+        "description": _STR,
+        "location": _STR,
+        "suggestion": _STR,
+    }, required=["type", "description"])),
+    "strengths": _STR_LIST,
+}, required=["issues"])
+
+BRANCH_SCHEMA = _obj({"title": _STR, "description": _STR, "preview": _STR}, required=["preview"])
+
+IMPORT_METADATA_SCHEMA = _obj({
+    "genre": _STR,
+    "subgenres": _STR_LIST,
+    "tone": _STR,
+    "setting": _STR,
+    "time_period": _STR,
+    "target_audience": _STR,
+    "logline": _STR,
+}, required=["genre"])
+
+IMPORT_CHARACTERS_SCHEMA = _arr(_obj(
+    {"name": _STR, "role": _STR, "description": _STR, "arc": _STR}, required=["name"]
+))
+
+IMPORT_PLOTLINES_SCHEMA = _arr(_obj(
+    {"title": _STR, "type": _STR, "description": _STR, "status": _STR}, required=["title"]
+))
+
+IMPORT_THEMES_SCHEMA = _STR_LIST
+
+
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+def _value_errors(data: Any, schema: Dict[str, Any], path: str) -> List[str]:
+    """type and enum problems of data itself, not of its properties or items"""
+    expected = schema.get("type")
+    if expected is not None:
+        types = expected if isinstance(expected, list) else [expected]
+        python_types = tuple(t for name in types for t in (
+            _JSON_TYPES[name] if isinstance(_JSON_TYPES[name], tuple) else (_JSON_TYPES[name],)
+        ))
+        # bool is an int subclass, but not a JSON integer
+        if isinstance(data, bool) and "boolean" not in types:
+            python_types = ()
+        if not isinstance(data, python_types):
+            return [f"{path}: expected {'/'.join(types)}, got {type(data).__name__}"]
+
+    if "enum" in schema and data not in schema["enum"]:
+        return [f"{path}: {data!r} is not one of {schema['enum']}"]
+    return []
+
+
+def validate_json(data: Any, schema: Dict[str, Any], path: str = "$") -> List[str]:
+    """
+    Check data against the subset of JSON Schema used above (type, properties,
+    required, items, enum). Returns a list of problems; empty means valid.
+    Unknown properties are allowed, matching how callers read the result.
+    """
+    errors = _value_errors(data, schema, path)
+    if errors:
+        return errors
+
+    if isinstance(data, dict):
+        for key in schema.get("required", []):
+            if key not in data:
+                errors.append(f"{path}: missing required property '{key}'")
+        for key, subschema in schema.get("properties", {}).items():
+            if key in data:
+                errors.extend(validate_json(data[key], subschema, f"{path}.{key}"))
+    elif isinstance(data, list) and "items" in schema:
+        for index, item in enumerate(data):
+            errors.extend(validate_json(item, schema["items"], f"{path}[{index}]"))
+    return errors
+
+
+def prune_invalid(data: Any, schema: Dict[str, Any], path: str = "$") -> Tuple[Optional[Any], List[str]]:
+    """
+    Keep the part of data that matches schema: invalid array items and invalid
+    optional properties are dropped. Returns (data, problems); data is None
+    when nothing usable is left (wrong type, or a required property missing
+    or invalid).
+    """
+    errors = _value_errors(data, schema, path)
+    if errors:
+        return None, errors
+
+    if isinstance(data, dict):
+        required = schema.get("required", [])
+        for key in required:
+            if key not in data:
+                errors.append(f"{path}: missing required property '{key}'")
+        if errors:
+            return None, errors
+        kept = dict(data)
+        for key, subschema in schema.get("properties", {}).items():
+            if key not in data:
+                continue
+            value, problems = prune_invalid(data[key], subschema, f"{path}.{key}")
+            errors.extend(problems)
+            if problems and value is None:
+                if key in required:
+                    return None, errors
+                del kept[key]
+            else:
+                kept[key] = value
+        return kept, errors
+
+    if isinstance(data, list) and "items" in schema:
+        kept = []
+        for index, item in enumerate(data):
+            value, problems = prune_invalid(item, schema["items"], f"{path}[{index}]")
+            errors.extend(problems)
+            if not (problems and value is None):
+                kept.append(value)
+        return kept, errors
+    return data, errors
+
+
+class StructuredOutputStats:
+    """Per-call-site counters for structured generations"""
+
+    def __init__(self):
+        self._sites: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, call_site: str, outcome: str, provider: str = "ollama", cache_hit: bool = False) -> None:
+        """outcome is one of: parsed, repaired, partial (invalid parts dropped), invalid, unparseable, failed"""
+        site = self._sites.setdefault(call_site, {
+            "calls": 0, "parsed": 0, "repaired": 0, "partial": 0, "invalid": 0,
+            "unparseable": 0, "failed": 0, "cache_hits": 0, "providers": {},
+        })
+        site["calls"] += 1
+        site[outcome] += 1
+        site["cache_hits"] += int(cache_hit)
+        site["providers"][provider] = site["providers"].get(provider, 0) + 1
+        if outcome in ("invalid", "unparseable"):
+            logger.warning(f"Structured output {outcome} at {call_site} ({site[outcome]}/{site['calls']} calls)")
+
+    def get_stats(self) -> Dict[str, Any]:
+        report = {}
+        for name, site in self._sites.items():
+            generated = site["calls"] - site["failed"]
+            failures = site["invalid"] + site["unparseable"]
+            report[name] = {
+                **site,
+                "parse_failure_rate": round(failures / generated, 3) if generated else 0.0,
+            }
+        return report
+
+
+# Global stats instance
+structured_output_stats = StructuredOutputStats()
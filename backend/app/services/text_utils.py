@@ -61,12 +61,28 @@ def get_reading_time(word_count: int, language: str = "English") -> int:
     Returns:
         Estimated reading time in minutes
     """
+    return max(1, word_count // reading_speed(language))
+
+
+def reading_speed(language: str = "English") -> int:
+    """Words (or characters for character-based languages) read per minute"""
     if language in ["Chinese", "Japanese", "Korean", "Thai", "Lao", "Khmer", "Telugu", "Malayalam", "Kannada", "Tamil"]:
         # For character-based languages, average reading speed is ~500 chars/min
-        return max(1, word_count // 500)
+        return 500
     else:
         # For word-based languages, average reading speed is ~200 words/min
-        return max(1, word_count // 200)
+        return 200
+
+
+def continues_word(text: str, language: str = "English") -> bool:
+    """
+    Whether text appended directly (no separator) after a word would extend
+    that word instead of starting a new one, so the two counts do not add up.
+    """
+    if not text or text[0].isspace():
+        return False
+    # count_words counts characters for these, so counts are always additive
+    return language not in ["Chinese", "Japanese", "Korean", "Thai", "Lao", "Khmer"]
 
 
 def detect_language_from_text(text: str) -> Optional[str]:
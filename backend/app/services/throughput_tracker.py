@@ -0,0 +1,136 @@
+"""
+Throughput Tracker - Measured generation speed per model
+Ollama reports eval_count/eval_duration (and the prompt equivalents) with every
+completed response. Those timings are folded into per-model moving averages so
+a generation can be sized to a latency budget instead of a static max_tokens:
+at ~9 tok/s on CPU, 900 tokens is over 100 s, well past most proxy timeouts.
+"""
+from typing import Optional, Dict, Any
+import logging
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_NS = 1_000_000_000
+
+
+class _ModelThroughput:
+    __slots__ = ("samples", "decode_tps", "prompt_tps", "overhead_seconds",
+                 "deadline_calls", "deadline_met", "abs_error_seconds")
+
+    def __init__(self):
+        self.samples = 0
+        self.decode_tps: Optional[float] = None
+        self.prompt_tps: Optional[float] = None
+        self.overhead_seconds: Optional[float] = None  # Load + setup time outside prompt/eval
+        self.deadline_calls = 0
+        self.deadline_met = 0
+        self.abs_error_seconds = 0.0
+
+
+def _ewma(current: Optional[float], sample: float, alpha: float) -> float:
+    return sample if current is None else current + alpha * (sample - current)
+
+
+class ThroughputTracker:
+    """
+    Per-model exponentially weighted averages of decode speed, prompt
+    evaluation speed and fixed per-call overhead, plus how well deadline
+    plans matched the real duration.
+    """
+
+    def __init__(self):
+        self._models: Dict[str, _ModelThroughput] = {}
+
+    def _model(self, model: str) -> _ModelThroughput:
+        entry = self._models.get(model)
+        if entry is None:
+            entry = self._models[model] = _ModelThroughput()
+        return entry
+
+    def record(self, model: str, data: Dict[str, Any]) -> None:
+        """Fold the timing fields of a completed Ollama response into the averages"""
+        eval_count = data.get("eval_count") or 0
+        eval_duration = data.get("eval_duration") or 0
+        if not model or eval_count <= 0 or eval_duration <= 0:
+            return
+        alpha = settings.throughput_ewma_alpha
+        entry = self._model(model)
+        entry.samples += 1
+        entry.decode_tps = _ewma(entry.decode_tps, eval_count / (eval_duration / _NS), alpha)
+
+        prompt_count = data.get("prompt_eval_count") or 0
+        prompt_duration = data.get("prompt_eval_duration") or 0
+        if prompt_count > 0 and prompt_duration > 0:
+            entry.prompt_tps = _ewma(entry.prompt_tps, prompt_count / (prompt_duration / _NS), alpha)
+
+        total = data.get("total_duration") or 0
+        if total > 0:
+            overhead = max(0.0, (total - prompt_duration - eval_duration) / _NS)
+            entry.overhead_seconds = _ewma(entry.overhead_seconds, overhead, alpha)
+
+    def plan(
+        self,
+        model: str,
+        deadline_seconds: float,
+        prompt_tokens: int,
+        max_tokens: int
+    ) -> Dict[str, Any]:
+        """
+        Choose num_predict so prompt evaluation plus generation fits in
+        deadline_seconds: the time left once the call has its scheduler slot
+        (the caller subtracts what it spent queued).
+        Uses configured defaults until the model has enough samples.
+        """
+        entry = self._models.get(model)
+        calibrated = entry is not None and entry.samples >= settings.throughput_min_samples
+        decode_tps = entry.decode_tps if calibrated else settings.throughput_default_tokens_per_second
+        prompt_tps = (entry.prompt_tps if calibrated and entry.prompt_tps
+                      else settings.throughput_default_prompt_tokens_per_second)
+        overhead = entry.overhead_seconds if calibrated and entry.overhead_seconds is not None else 0.0
+
+        fixed_seconds = overhead + prompt_tokens / prompt_tps
+        budget = (deadline_seconds - fixed_seconds) * settings.deadline_safety_factor
+        num_predict = int(budget * decode_tps)
+        num_predict = max(min(settings.deadline_min_tokens, max_tokens), min(num_predict, max_tokens))
+        return {
+            "deadline_seconds": deadline_seconds,
+            "requested_max_tokens": max_tokens,
+            "num_predict": num_predict,
+            "predicted_seconds": round(fixed_seconds + num_predict / decode_tps, 2),
+            "tokens_per_second": round(decode_tps, 2),
+            "calibrated": calibrated,
+        }
+
+    def record_deadline(self, model: str, plan: Dict[str, Any], actual_seconds: float) -> None:
+        """Compare a plan with the measured duration"""
+        entry = self._model(model)
+        entry.deadline_calls += 1
+        entry.deadline_met += int(actual_seconds <= plan["deadline_seconds"])
+        entry.abs_error_seconds += abs(actual_seconds - plan["predicted_seconds"])
+        if actual_seconds > plan["deadline_seconds"]:
+            logger.info(
+                f"Deadline missed for {model}: {actual_seconds:.1f}s actual vs "
+                f"{plan['predicted_seconds']}s predicted ({plan['deadline_seconds']}s budget)"
+            )
+
+    def get_stats(self) -> Dict[str, Any]:
+        report = {}
+        for model, entry in self._models.items():
+            report[model] = {
+                "samples": entry.samples,
+                "tokens_per_second": round(entry.decode_tps, 2) if entry.decode_tps else None,
+                "prompt_tokens_per_second": round(entry.prompt_tps, 2) if entry.prompt_tps else None,
+                "overhead_seconds": round(entry.overhead_seconds, 3) if entry.overhead_seconds is not None else None,
+                "deadline_calls": entry.deadline_calls,
+                "deadline_met_rate": round(entry.deadline_met / entry.deadline_calls, 3) if entry.deadline_calls else None,
+                "mean_prediction_error_seconds": (
+                    round(entry.abs_error_seconds / entry.deadline_calls, 2) if entry.deadline_calls else None
+                ),
+            }
+        return report
+
+
+# Global tracker instance
+throughput_tracker = ThroughputTracker()
@@ -1,7 +1,7 @@
 """
 Token settings helpers - per-user overrides with defaults
 """
-from typing import Dict, Optional, Any
+from typing import Dict, Optional, Any, List, Iterable
 from uuid import UUID
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
@@ -64,27 +64,41 @@ async def get_user_ai_config(db: AsyncSession, user_id: UUID) -> Dict[str, Any]:
         "provider": "ollama" | "openai" | "anthropic" | "gemini",
         "api_key": str | None,
         "model": str,
+        "fallbacks": [configs of the same shape, in PROVIDER_FALLBACK_ORDER],
     }
     """
-    result = await db.execute(
-        select(UserApiKeys).where(
-            UserApiKeys.user_id == user_id,
-            UserApiKeys.is_active == True,
-        )
-    )
-    active_key = result.scalar_one_or_none()
-
-    if active_key:
-        from app.services.external_ai_service import DEFAULT_MODELS
-        model = active_key.preferred_model or DEFAULT_MODELS.get(active_key.provider, "")
+    return build_user_ai_config(await get_user_api_keys(db, user_id))
+
+
+async def get_user_api_keys(db: AsyncSession, user_id: UUID) -> List[UserApiKeys]:
+    result = await db.execute(select(UserApiKeys).where(UserApiKeys.user_id == user_id))
+    return list(result.scalars().all())
+
+
+def build_user_ai_config(api_keys: Iterable[UserApiKeys]) -> Dict[str, Any]:
+    """get_user_ai_config from already loaded key rows; a new dict on every call"""
+    from app.services.external_ai_service import DEFAULT_MODELS
+
+    keys = {key.provider: key for key in api_keys}
+
+    def provider_config(provider: str) -> Optional[Dict[str, Any]]:
+        if provider == "ollama":
+            return {"provider": "ollama", "api_key": None, "model": get_runtime_model_name()}
+        key = keys.get(provider)
+        if key is None or not key.api_key:
+            return None  # No key stored for this provider
         return {
-            "provider": active_key.provider,
-            "api_key": active_key.api_key,
-            "model": model,
+            "provider": provider,
+            "api_key": key.api_key,
+            "model": key.preferred_model or DEFAULT_MODELS.get(provider, ""),
         }
 
-    return {
-        "provider": "ollama",
-        "api_key": None,
-        "model": get_runtime_model_name(),
-    }
+    active = next((key.provider for key in keys.values() if key.is_active), "ollama")
+    config = provider_config(active) or provider_config("ollama")
+    config["fallbacks"] = [
+        fallback for fallback in (
+            provider_config(provider) for provider in settings.provider_fallback_order
+            if provider != config["provider"]
+        ) if fallback is not None
+    ]
+    return config
@@ -0,0 +1,189 @@
+"""
+Benchmark: tolerant JSON extraction on 10-50 KB model outputs
+Compares app.services.json_repair.extract_json (and incremental feeding)
+with the regex/multi-pass recovery it replaced, on well-formed, fenced,
+trailing-comma, truncated and unclosed outputs.
+
+Run from backend/:
+    python -m benchmarks.bench_json_extract
+"""
+from typing import Optional, Dict, Any, Callable, List
+import json
+import random
+import re
+import time
+
+from app.services.json_repair import extract_json, TolerantJSONParser
+
+
+# ─── Previous implementation (GeminiService._parse_json_from_text) ────────────
+
+def legacy_parse_json_from_text(text: str) -> Optional[Dict[str, Any]]:
+    cleaned = text.strip()
+
+    def try_load(candidate: str) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            return None
+
+    def fix_and_load(candidate: str) -> Optional[Dict[str, Any]]:
+        fixed = re.sub(r",\s*([}\]])", r"\1", candidate)
+        result = try_load(fixed)
+        if result is not None:
+            return result
+        return legacy_recover_truncated_json(fixed)
+
+    direct = try_load(cleaned)
+    if direct is not None:
+        return direct
+    stripped = re.sub(r"^```(?:json)?\s*", "", cleaned, flags=re.IGNORECASE)
+    stripped = re.sub(r"\s*```$", "", stripped).strip()
+    direct2 = try_load(stripped)
+    if direct2 is not None:
+        return direct2
+    match = re.search(r"\{.*\}", stripped, re.DOTALL)
+    if not match:
+        match = re.search(r"\{.*\}", cleaned, re.DOTALL)
+    if not match:
+        return None
+    return fix_and_load(match.group(0))
+
+
+def legacy_recover_truncated_json(text: str) -> Optional[Dict[str, Any]]:
+    stack = []
+    in_string = False
+    escape_next = False
+    last_safe_pos = 0
+    for i, ch in enumerate(text):
+        if escape_next:
+            escape_next = False
+            continue
+        if ch == '\\' and in_string:
+            escape_next = True
+            continue
+        if ch == '"':
+            in_string = not in_string
+            continue
+        if in_string:
+            continue
+        if ch in ('{', '['):
+            stack.append(ch)
+        elif ch in ('}', ']'):
+            if stack:
+                stack.pop()
+            if not stack:
+                last_safe_pos = i + 1
+    if last_safe_pos > 0:
+        candidate = re.sub(r",\s*([}\]])", r"\1", text[:last_safe_pos])
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            pass
+    if not stack:
+        return None
+    truncated = text.rstrip()
+    truncated = re.sub(r',\s*$', '', truncated)
+    truncated = re.sub(r'"[^"]*$', '', truncated)
+    truncated = re.sub(r',\s*$', '', truncated)
+    truncated = re.sub(r':\s*$', '', truncated)
+    truncated = truncated.rstrip()
+    closers = {'[': ']', '{': '}'}
+    candidate = truncated + ''.join(closers[ch] for ch in reversed(stack))
+    candidate = re.sub(r",\s*([}\]])", r"\1", candidate)
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        return None
+
+
+# ─── Synthetic model outputs ──────────────────────────────────────────────────
+
+WORDS = ("the storm rolled over the harbour while Mara counted the lanterns "
+         "that still burned on the far shore and wondered who had lit them").split()
+
+
+def _sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+
+def make_bible(rng: random.Random, target_bytes: int) -> Dict[str, Any]:
+    bible = {
+        "world_name": "Aldermere",
+        "world_description": _sentence(rng, 40),
+        "primary_locations": [],
+        "world_rules": [],
+        "glossary": [],
+        "quick_facts": [],
+    }
+    while len(json.dumps(bible)) < target_bytes:
+        bible["primary_locations"].append({"name": _sentence(rng, 2), "description": _sentence(rng, 30),
+                                           "importance": rng.choice(["high", "medium", "low"])})
+        bible["world_rules"].append({"category": "magic", "title": _sentence(rng, 3),
+                                     "description": _sentence(rng, 25), "importance": rng.randint(1, 10)})
+        bible["glossary"].append({"term": _sentence(rng, 1), "definition": _sentence(rng, 15)})
+        bible["quick_facts"].append(_sentence(rng, 12))
+    return bible
+
+
+def variants(data: Dict[str, Any]) -> Dict[str, str]:
+    pretty = json.dumps(data, indent=2, ensure_ascii=False)
+    trailing = re.sub(r'(\]|\}|")\n', r'\1,\n', pretty)
+    return {
+        "clean": pretty,
+        "fenced+prose": f"Here is the Story Bible you asked for:\n```json\n{pretty}\n```\nLet me know if you need changes!",
+        "trailing commas": trailing,
+        "truncated": pretty[: int(len(pretty) * 0.83)],
+        # Output cut off before any object closed: the greedy regex retries from every "{"
+        "unclosed": pretty.replace("}", ""),
+    }
+
+
+def bench(fn: Callable[[str], Any], text: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(text)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def incremental(text: str, chunk: int = 16, snapshot_every: int = 0) -> Any:
+    """Feed text as streamed tokens; optionally snapshot every N chunks"""
+    parser = TolerantJSONParser("{")
+    for index, offset in enumerate(range(0, len(text), chunk)):
+        parser.feed(text[offset:offset + chunk])
+        if snapshot_every and index % snapshot_every == 0:
+            parser.snapshot()
+    return parser.snapshot()
+
+
+def main() -> None:
+    rng = random.Random(7)
+    repeat = 20
+    rows: List[str] = []
+    header = f"{'size':>6} {'variant':<16} {'legacy ms':>10} {'extract ms':>11} {'stream ms':>10}  recovered (legacy/new)"
+    print(header)
+    print("-" * len(header))
+    for size_kb in (10, 20, 50):
+        data = make_bible(rng, size_kb * 1024)
+        for name, text in variants(data).items():
+            legacy_ms = bench(legacy_parse_json_from_text, text, repeat)
+            new_ms = bench(lambda t: extract_json(t, "{"), text, repeat)
+            stream_ms = bench(lambda t: incremental(t, snapshot_every=64), text, max(1, repeat // 4))
+            old_result = legacy_parse_json_from_text(text)
+            new_result = extract_json(text, "{")
+
+            def summary(result: Any) -> str:
+                if not isinstance(result, dict):
+                    return "none"
+                return f"{len(result.get('world_rules', []))} rules"
+
+            rows.append(
+                f"{size_kb:>4}KB {name:<16} {legacy_ms:>10.2f} {new_ms:>11.2f} {stream_ms:>10.2f}  "
+                f"{summary(old_result)}/{summary(new_result)}"
+            )
+            print(rows[-1])
+    print("\nstream ms: incremental feed in 16-char chunks with a snapshot every 64 chunks")
+
+
+if __name__ == "__main__":
+    main()
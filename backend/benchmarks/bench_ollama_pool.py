@@ -0,0 +1,81 @@
+"""
+Benchmark: Ollama node pool against local stub servers
+Starts stub nodes (benchmarks/ollama_stub.py), sends concurrent generations
+for several stories through ollama_pool.post(), and reports per-node load,
+sticky routing hits, and what happens when one node goes down.
+
+Run from backend/:
+    python -m benchmarks.bench_ollama_pool
+"""
+from collections import Counter, defaultdict
+import asyncio
+import time
+
+import httpx
+
+from app.services.ollama_pool import OllamaPool, set_story_affinity
+from benchmarks.ollama_stub import start_stub
+
+MODEL = "qwen2.5:7b"
+PORTS = (11561, 11562, 11563)
+
+
+async def generate(pool: OllamaPool, client: httpx.AsyncClient, story: str, served: dict) -> None:
+    set_story_affinity(story)
+    response = await pool.post(
+        client, "/api/generate", MODEL,
+        json={"model": MODEL, "prompt": f"continue {story}", "stream": False, "options": {"num_predict": 16}},
+    )
+    served[story].append(str(response.request.url).rsplit("/api/", 1)[0])
+
+
+async def run_wave(pool: OllamaPool, client: httpx.AsyncClient, stories: int, per_story: int) -> dict:
+    served = defaultdict(list)
+
+    async def story_task(story: str) -> None:
+        for _ in range(per_story):
+            try:
+                await generate(pool, client, story, served)
+            except httpx.HTTPError:
+                served[story].append("error")
+
+    start = time.perf_counter()
+    # Each story runs in its own task, so its affinity is its own
+    await asyncio.gather(*(asyncio.create_task(story_task(f"story-{i}")) for i in range(stories)))
+    served["_elapsed"] = time.perf_counter() - start
+    return served
+
+
+def report(title: str, served: dict) -> None:
+    elapsed = served.pop("_elapsed")
+    per_node = Counter(url for urls in served.values() for url in urls)
+    sticky = sum(Counter(urls).most_common(1)[0][1] for urls in served.values())
+    total = sum(len(urls) for urls in served.values())
+    print(f"\n{title} ({total} requests in {elapsed:.2f}s)")
+    for url, count in sorted(per_node.items()):
+        print(f"  {url:<28} {count:>4}")
+    print(f"  requests on each story's most used node: {sticky / total:.0%}")
+
+
+async def main() -> None:
+    stubs = [start_stub(port, [MODEL], tokens_per_second=400) for port in PORTS]
+    # A fourth node lacks the model: routing must skip it
+    stubs.append(start_stub(11564, ["other-model"], name="no-model"))
+    pool = OllamaPool([f"http://127.0.0.1:{p}" for p in (*PORTS, 11564)], node_models={})
+    async with httpx.AsyncClient(timeout=10) as client:
+        await pool.check_all()
+        report("3 nodes with the model, 1 without", await run_wave(pool, client, stories=12, per_story=8))
+
+    stubs[0].shutdown()
+    stubs[0].server_close()
+    # A fresh client, so no kept-alive connection to the stopped node survives
+    async with httpx.AsyncClient(timeout=10) as client:
+        report("first node down", await run_wave(pool, client, stories=12, per_story=8))
+        down = pool.get_stats()[f"http://127.0.0.1:{PORTS[0]}"]
+        print(f"  down node: failures={down['failures']} ejected_seconds={down['ejected_seconds']}")
+    for stub in stubs[1:]:
+        stub.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
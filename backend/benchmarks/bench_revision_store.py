@@ -0,0 +1,239 @@
+"""
+Benchmark: chapter revision history over a simulated 8-hour editing session
+Drives app.services.revision_store.RevisionStore (its database access
+swapped for an in-memory table) with an auto-save every 5 seconds: typing
+near the end, typo fixes, sentence rewrites, paragraph deletions and
+generated continuations appended in SQL. Reports history size and bytes
+written against the edit volume, compared with keeping a full copy (plain
+and zlib) per save, and checks that every kept revision rebuilds exactly.
+
+Run from backend/:
+    python -m benchmarks.bench_revision_store
+"""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+import asyncio
+import hashlib
+import random
+import re
+import time
+import uuid
+import zlib
+
+from app.config import settings
+from app.services.content_patch import changed_span
+from app.services.revision_store import RevisionStore, SNAPSHOT
+
+SESSION_HOURS = 8
+SAVE_INTERVAL_SECONDS = 5
+CHAPTER_ID = uuid.uuid4()
+
+WORDS = (
+    "the a of and to in was she he it that her his with as had for on at but not they were "
+    "light dark river stone voice hand door night morning city silence memory letter storm "
+    "whispered turned waited remembered walked looked answered followed opened closed "
+    "slowly quietly again almost never always suddenly finally only still"
+).split()
+
+
+class MemoryRevisionStore(RevisionStore):
+    """RevisionStore over a list instead of the chapter_revisions table"""
+
+    def __init__(self):
+        super().__init__()
+        self.table: Dict[int, SimpleNamespace] = {}  # By revision
+        self.current = ("", 0)
+        self.writes = {"insert": 0, "update": 0, "delete": 0}
+        self.clock: Optional[datetime] = None
+        self._next_thin: Optional[datetime] = None
+
+    def _sorted(self) -> List[SimpleNamespace]:
+        return [self.table[revision] for revision in sorted(self.table, reverse=True)]
+
+    def _by_id(self, row_id) -> SimpleNamespace:
+        return next(r for r in self.table.values() if r.id == row_id)
+
+    async def _chain(self, db, chapter_id):
+        rows = self._sorted()
+        above = next((i for i, r in enumerate(rows) if r.kind == SNAPSHOT), len(rows))
+        return len(rows), above, sum(r.stored_bytes for r in rows[:above])
+
+    async def _insert(self, db, values):
+        if values["revision"] in self.table:
+            return
+        row = SimpleNamespace(id=uuid.uuid4(), **values)
+        row.stored_bytes = len(row.data)
+        self.table[row.revision] = row
+        self.writes["insert"] += 1
+
+    async def _update(self, db, row_id, values):
+        row = self._by_id(row_id)
+        for key, value in values.items():
+            setattr(row, key, value)
+        row.stored_bytes = len(row.data)
+        self.writes["update"] += 1
+
+    async def _delete(self, db, row_ids):
+        for row_id in row_ids:
+            del self.table[self._by_id(row_id).revision]
+        self.writes["delete"] += len(row_ids)
+
+    async def _rows(self, db, chapter_id, from_revision=None, with_data=True):
+        rows = self._sorted()
+        if from_revision is not None:
+            snapshots = [r.revision for r in rows if r.kind == SNAPSHOT and r.revision >= from_revision]
+            top = min(snapshots) if snapshots else None
+            rows = [r for r in rows if r.revision >= from_revision and (top is None or r.revision <= top)]
+        return rows
+
+    async def _current(self, db, chapter_id):
+        return self.current
+
+    async def _maybe_thin(self, db, chapter_id, current_text, current_revision):
+        # Same schedule as the real store, on the simulated clock
+        if self._next_thin is None or self.clock >= self._next_thin:
+            self._next_thin = self.clock + timedelta(seconds=settings.revision_thin_interval_seconds)
+            await self.thin(db, chapter_id, current_text, current_revision, now=self.clock)
+
+
+def paragraph(rng: random.Random, words: int) -> str:
+    return "<p>" + " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + ".</p>"
+
+
+def edit(rng: random.Random, text: str) -> (str, Optional[str]):
+    """
+    One auto-save interval of a writer at about 40 words per minute with
+    pauses; returns (new text, appended text if it was a generated continuation)
+    """
+    roll = rng.random()
+    if roll < 0.05 or not text:
+        return text + paragraph(rng, rng.randint(5, 15)), None  # New paragraph
+    if roll < 0.50:
+        # Typing: words inserted at the end of the last paragraph, sometimes elsewhere
+        cursor = text.rfind("</p>") if rng.random() < 0.85 else text.find(" ", rng.randrange(len(text)))
+        cursor = cursor if cursor > 0 else len(text)
+        words = " " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 7)))
+        return text[:cursor] + words + text[cursor:], None
+    if roll < 0.65:
+        # Typo fixes: a few characters replaced near the cursor
+        pos = max(0, len(text) - rng.randint(5, 400))
+        return text[:pos] + rng.choice(WORDS) + text[pos + rng.randint(1, 8):], None
+    if roll < 0.70:
+        # Rewriting a sentence somewhere in the chapter
+        pos = rng.randrange(len(text))
+        end = min(len(text), pos + rng.randint(60, 300))
+        return text[:pos] + " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 50))) + text[end:], None
+    if roll < 0.99:
+        return text, None  # Pause: nothing to save
+    if roll < 0.995 and text.count("</p>") > 3:
+        # Deleting a paragraph
+        start = rng.choice([m.start() for m in re.finditer("<p>", text)])
+        end = text.find("</p>", start) + 4
+        return text[:start] + text[end:], None
+    appended = "".join(paragraph(rng, rng.randint(30, 80)) for _ in range(rng.randint(3, 5)))
+    return text + appended, appended  # Generated continuation, appended in SQL
+
+
+async def run_session(label: str, overrides: Dict) -> Dict:
+    saved = {key: getattr(settings, key) for key in overrides}
+    for key, value in overrides.items():
+        setattr(settings, key, value)
+    try:
+        return await _run_session(label)
+    finally:
+        for key, value in saved.items():
+            setattr(settings, key, value)
+
+
+async def _run_session(label: str) -> Dict:
+    rng = random.Random(7)
+    store = MemoryRevisionStore()
+    start = datetime(2026, 1, 1, 9, 0)
+    text, revision, saved_at = "", 0, start
+    digests = {}
+    edit_volume = full_copy = full_copy_zlib = saves = 0
+    record_seconds = 0.0
+
+    ticks = SESSION_HOURS * 3600 // SAVE_INTERVAL_SECONDS
+    for tick in range(1, ticks + 1):
+        now = start + timedelta(seconds=tick * SAVE_INTERVAL_SECONDS)
+        new_text, appended = edit(rng, text)
+        if new_text == text:
+            continue
+        saves += 1
+        span_start, old_end, new_end = changed_span(text, new_text)
+        edit_volume += len(text[span_start:old_end].encode()) + len(new_text[span_start:new_end].encode())
+        full_copy += len(text.encode())
+        if saves % 10 == 0:
+            # Estimated from every 10th save; compressing every copy dominates the run time
+            full_copy_zlib += 10 * len(zlib.compress(text.encode(), settings.revision_compression_level))
+        digests[revision] = hashlib.md5(text.encode()).hexdigest()
+
+        store.clock = now
+        store.current = (new_text, revision + 1)
+        began = time.perf_counter()
+        if appended is not None:
+            await store.record_append(None, CHAPTER_ID, revision, revision + 1, len(text), len(new_text), saved_at)
+        else:
+            await store.record(None, CHAPTER_ID, revision, revision + 1, text, new_text, saved_at)
+        record_seconds += time.perf_counter() - began
+        text, revision, saved_at = new_text, revision + 1, now
+
+    # Every kept revision must rebuild to exactly the text it had
+    rows = store._sorted()
+    began = time.perf_counter()
+    broken = 0
+    for row in rows:
+        rebuilt = await store.get_text(None, CHAPTER_ID, row.revision)
+        if rebuilt is None or hashlib.md5(rebuilt.encode()).hexdigest() != digests[row.revision]:
+            broken += 1
+    rebuild_ms = (time.perf_counter() - began) * 1000 / max(len(rows), 1)
+
+    stored = sum(r.stored_bytes for r in rows)
+    written = store.stats["bytes_written"]
+    writes = store.writes["insert"] + store.writes["update"] + store.writes["delete"]
+    return {
+        "label": label,
+        "saves": saves,
+        "final_kb": len(text.encode()) / 1024,
+        "edit_volume_kb": edit_volume / 1024,
+        "full_copy_kb": full_copy / 1024,
+        "full_copy_zlib_kb": full_copy_zlib / 1024,
+        "stored_kb": stored / 1024,
+        "written_kb": written / 1024,
+        "write_amplification": written / edit_volume,
+        "rows": len(rows),
+        "snapshots": sum(1 for r in rows if r.kind == SNAPSHOT),
+        "row_writes_per_save": writes / saves,
+        "record_ms": record_seconds * 1000 / saves,
+        "rebuild_ms": rebuild_ms,
+        "broken": broken,
+    }
+
+
+async def main() -> None:
+    results = [
+        await run_session("every save kept", {"revision_coalesce_seconds": 0, "revision_thinning": []}),
+        await run_session("coalesced, no thinning", {"revision_thinning": []}),
+        await run_session("coalesced + thinned (defaults)", {}),
+    ]
+    first = results[0]
+    print(f"\n{SESSION_HOURS}h session, auto-save every {SAVE_INTERVAL_SECONDS}s: "
+          f"{first['saves']} saves, final chapter {first['final_kb']:.0f} KB, "
+          f"edit volume {first['edit_volume_kb']:.0f} KB")
+    print(f"Full copy per save: {first['full_copy_kb'] / 1024:.1f} MB plain, "
+          f"{first['full_copy_zlib_kb'] / 1024:.1f} MB zlib\n")
+    header = (f"{'policy':<32}{'rows':>6}{'snaps':>7}{'stored KB':>11}{'written KB':>12}"
+              f"{'write amp':>11}{'writes/save':>13}{'record ms':>11}{'rebuild ms':>12}{'broken':>8}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['label']:<32}{r['rows']:>6}{r['snapshots']:>7}{r['stored_kb']:>11.1f}{r['written_kb']:>12.1f}"
+              f"{r['write_amplification']:>11.2f}{r['row_writes_per_save']:>13.2f}{r['record_ms']:>11.3f}"
+              f"{r['rebuild_ms']:>12.3f}{r['broken']:>8}")
+    print("\nwrite amp = history bytes written / bytes of text inserted and removed by the saves")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
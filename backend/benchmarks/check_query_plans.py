@@ -0,0 +1,119 @@
+"""
+Query plan check: the hot queries must not scan a table sequentially
+Runs EXPLAIN (FORMAT JSON) on the queries behind the request paths (per
+story, per chapter, per author, per user) and on the lookups Postgres does
+for every foreign key when a parent row is deleted. Sequential scans are
+disabled for the session so that small or empty tables do not hide a missing
+index: the planner only falls back to a Seq Scan when no index fits. Exits 1
+if any plan has one.
+
+Run from backend/ against a migrated database (alembic upgrade head):
+    python -m benchmarks.check_query_plans
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+import asyncio
+import json
+import sys
+import uuid
+
+from sqlalchemy import select, update, delete, tuple_
+from sqlalchemy.orm import undefer
+
+from app.database import Base, engine
+from app.models import (
+    Story, Chapter, ChapterRevision, Character, Plotline, StoryEmbedding, GeneratedImage,
+    GenerationHistory, GenerationDraft, DraftStatus, UserAiSettings, UserApiKeys,
+)
+
+ID = uuid.uuid4()
+SINCE = datetime(2026, 1, 1)
+
+
+def hot_queries() -> List[Tuple[str, object]]:
+    """The statements the services and routes run, with a placeholder id"""
+    return [
+        ("StoryService.get_stories_by_author",
+         select(Story).where(Story.author_id == ID).order_by(Story.updated_at.desc())),
+        ("ChapterService.get_chapters_by_story",
+         select(Chapter).where(Chapter.story_id == ID).order_by(Chapter.order)),
+        ("ChapterService.list_chapters_page",
+         select(Chapter).where(Chapter.story_id == ID, tuple_(Chapter.order, Chapter.id) > tuple_(5, ID))
+         .order_by(Chapter.order, Chapter.id).limit(50)),
+        ("ChapterService.get_chapter_context previous chapters",
+         select(Chapter).where(Chapter.story_id == ID, Chapter.order < 5)
+         .order_by(Chapter.order.desc()).limit(2).options(undefer(Chapter.content))),
+        ("CharacterService.get_characters_by_story",
+         select(Character).where(Character.story_id == ID).order_by(Character.importance.desc(), Character.name)),
+        ("plotlines by story",
+         select(Plotline).where(Plotline.story_id == ID).order_by(Plotline.importance.desc())),
+        ("MemoryService._get_chapter_vectors",
+         select(StoryEmbedding.content, StoryEmbedding.embedding)
+         .where(StoryEmbedding.chapter_id == ID, StoryEmbedding.embedding_model == "nomic-embed-text")),
+        ("MemoryService._clear_chapter_embeddings",
+         delete(StoryEmbedding).where(StoryEmbedding.chapter_id == ID)),
+        ("image gallery",
+         select(GeneratedImage).where(GeneratedImage.story_id == ID)
+         .order_by(GeneratedImage.created_at.desc()).limit(50)),
+        ("RevisionStore.list_revisions",
+         select(ChapterRevision.revision).where(ChapterRevision.chapter_id == ID)
+         .order_by(ChapterRevision.revision.desc())),
+        ("generation analytics by story",
+         select(GenerationHistory.model_used)
+         .where(GenerationHistory.created_at >= SINCE, GenerationHistory.story_id == ID)),
+        ("generation analytics by user",
+         select(GenerationHistory.model_used)
+         .where(GenerationHistory.created_at >= SINCE, GenerationHistory.user_id == ID)),
+        ("stale draft sweep",
+         update(GenerationDraft)
+         .where(GenerationDraft.status == DraftStatus.STREAMING,
+                GenerationDraft.updated_at < SINCE + timedelta(minutes=5))
+         .values(status=DraftStatus.INTERRUPTED)),
+        ("user AI settings", select(UserAiSettings).where(UserAiSettings.user_id == ID)),
+        ("user API keys", select(UserApiKeys).where(UserApiKeys.user_id == ID)),
+    ]
+
+
+def foreign_key_lookups() -> List[Tuple[str, object]]:
+    """What deleting a parent row looks up in each child table"""
+    lookups = []
+    for table in Base.metadata.sorted_tables:
+        for fk in table.foreign_keys:
+            lookups.append((
+                f"ON DELETE {table.name}.{fk.parent.name}",
+                select(fk.parent).where(fk.parent == ID)
+            ))
+    return lookups
+
+
+def seq_scans(node: Dict) -> List[str]:
+    """Tables a plan (or any of its sub-plans) scans sequentially"""
+    found = [node["Relation Name"]] if node.get("Node Type") == "Seq Scan" else []
+    for child in node.get("Plans", []):
+        found += seq_scans(child)
+    return found
+
+
+async def main() -> int:
+    checks = hot_queries() + foreign_key_lookups()
+    failures = 0
+    async with engine.connect() as conn:
+        await conn.exec_driver_sql("SET enable_seqscan = off")
+        width = max(len(name) for name, _ in checks)
+        for name, statement in checks:
+            sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+            plan = (await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scanned = seq_scans(plan[0]["Plan"])
+            failures += bool(scanned)
+            verdict = f"SEQ SCAN on {', '.join(scanned)}" if scanned else "ok"
+            print(f"{name:<{width}}  {verdict}")
+        await conn.rollback()
+    await engine.dispose()
+    print(f"\n{len(checks) - failures}/{len(checks)} queries use an index")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
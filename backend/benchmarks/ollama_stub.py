@@ -0,0 +1,166 @@
+"""
+Stub Ollama servers for exercising the node pool without real models
+Each stub answers /api/tags, /api/ps, /api/generate, /api/chat (streaming or
+not) and /api/embeddings, generates at a fixed token rate and reports the
+same timing fields as Ollama. Responses name the serving node, so routing is
+visible in generated text.
+
+Run from backend/:
+    python -m benchmarks.ollama_stub --port 11501 --port 11502 --models qwen2.5:7b nomic-embed-text:latest
+then point the API at them:
+    OLLAMA_NODES='["http://127.0.0.1:11501", "http://127.0.0.1:11502"]'
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Optional
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+
+
+class StubState:
+    def __init__(self, name: str, models: List[str], tokens_per_second: float, fail_rate: float):
+        self.name = name
+        self.models = set(models)
+        self.tokens_per_second = tokens_per_second
+        self.fail_rate = fail_rate
+        self.loaded = set()
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def has(self, model: str) -> bool:
+        return model in self.models or f"{model}:latest" in self.models
+
+
+def make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _json(self, status: int, body: dict) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                self._json(200, {"models": [{"name": m} for m in sorted(state.models)]})
+            elif self.path == "/api/ps":
+                self._json(200, {"models": [{"name": m, "size_vram": 0, "expires_at": None} for m in sorted(state.loaded)]})
+            else:
+                self._json(404, {"error": "not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            model = body.get("model", "")
+            with state.lock:
+                state.requests += 1
+            if not state.has(model):
+                self._json(404, {"error": f"model '{model}' not found"})
+                return
+            if random.random() < state.fail_rate:
+                self._json(500, {"error": "stub failure"})
+                return
+            state.loaded.add(model)
+
+            if self.path == "/api/embeddings":
+                digest = hashlib.sha256(body.get("prompt", "").encode("utf-8")).digest()
+                self._json(200, {"embedding": [b / 255 for b in digest] * 24})
+                return
+            if self.path not in ("/api/generate", "/api/chat"):
+                self._json(404, {"error": "not found"})
+                return
+
+            prompt = body.get("prompt") if self.path == "/api/generate" else json.dumps(body.get("messages", []))
+            if not prompt:
+                self._json(200, {"model": model, "response": "", "done": True})  # Load request
+                return
+            num_predict = min(int(body.get("options", {}).get("num_predict", 32)), 64)
+            words = [f"{state.name}-{i}" for i in range(num_predict)]
+            self._generate(body, model, prompt, words)
+
+        def _generate(self, body: dict, model: str, prompt: str, words: List[str]) -> None:
+            is_chat = self.path == "/api/chat"
+            delay = 1 / state.tokens_per_second
+            start = time.monotonic_ns()
+
+            def frame(text: str, done: bool) -> dict:
+                item = {"model": model, "done": done}
+                if is_chat:
+                    item["message"] = {"role": "assistant", "content": text}
+                else:
+                    item["response"] = text
+                if done:
+                    elapsed = time.monotonic_ns() - start
+                    item.update(
+                        eval_count=len(words), eval_duration=max(1, elapsed),
+                        prompt_eval_count=len(prompt) // 4, prompt_eval_duration=1_000_000,
+                        total_duration=elapsed + 1_000_000,
+                    )
+                return item
+
+            if not body.get("stream", True):
+                time.sleep(delay * len(words))
+                self._json(200, frame(" ".join(words), True))
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for index, word in enumerate(words):
+                time.sleep(delay)
+                self._chunk(frame(word + " ", False))
+            self._chunk(frame("", True))
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _chunk(self, item: dict) -> None:
+            data = (json.dumps(item) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def start_stub(
+    port: int,
+    models: List[str],
+    tokens_per_second: float = 200.0,
+    fail_rate: float = 0.0,
+    name: Optional[str] = None
+) -> ThreadingHTTPServer:
+    """Start a stub on 127.0.0.1:port in a daemon thread; call .shutdown() to stop it"""
+    state = StubState(name or f"node{port}", models, tokens_per_second, fail_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, action="append", required=True)
+    parser.add_argument("--models", nargs="+", default=["qwen2.5:7b", "nomic-embed-text:latest"])
+    parser.add_argument("--tokens-per-second", type=float, default=20.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    servers = [start_stub(p, args.models, args.tokens_per_second, args.fail_rate) for p in args.port]
+    print(f"Stub Ollama nodes on ports {', '.join(map(str, args.port))}; Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
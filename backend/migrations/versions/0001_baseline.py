@@ -0,0 +1,39 @@
+"""Baseline schema
+
+Databases created by init_db before migrations existed start here; the
+columns the old add_language_column.py and add_missing_column.py scripts
+added are added if they are still missing. On an empty database every
+table is created as the models define it, and the later revisions find
+their changes already in place.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.database import Base
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if not op.get_context().as_sql and not sa.inspect(bind).has_table("stories"):
+        Base.metadata.create_all(bind)
+        return
+
+    op.execute("ALTER TABLE stories ADD COLUMN IF NOT EXISTS language VARCHAR(50) DEFAULT 'English'")
+    op.execute("UPDATE stories SET language = 'English' WHERE language IS NULL")
+
+    op.execute("ALTER TABLE characters ADD COLUMN IF NOT EXISTS image_generation_seed INTEGER")
+    op.execute("ALTER TABLE characters ADD COLUMN IF NOT EXISTS visual_style VARCHAR(100)")
+    op.execute("ALTER TABLE characters ADD COLUMN IF NOT EXISTS reference_images JSONB DEFAULT '[]'::jsonb")
+
+
+def downgrade() -> None:
+    pass  # The baseline is where history starts
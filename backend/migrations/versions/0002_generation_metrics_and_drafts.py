@@ -0,0 +1,78 @@
+"""Generation history metrics and streamed generation drafts
+
+generation_history records every LLM call (story_id and generation_type
+become optional), with provider, timing, token and cache columns.
+generation_drafts is the write-behind buffer for streamed generations.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+HISTORY_COLUMNS = [
+    ("user_id", "UUID"),
+    ("call_site", "VARCHAR(200)"),
+    ("provider", "VARCHAR(50)"),
+    ("queue_time_ms", "INTEGER"),
+    ("time_to_first_token_ms", "INTEGER"),
+    ("prompt_tokens", "INTEGER"),
+    ("completion_tokens", "INTEGER"),
+    ("streamed", "BOOLEAN"),
+    ("cache_hit", "BOOLEAN"),
+    ("cancelled", "BOOLEAN"),
+]
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE generation_history ALTER COLUMN story_id DROP NOT NULL")
+    op.execute("ALTER TABLE generation_history ALTER COLUMN generation_type DROP NOT NULL")
+    for name, sql_type in HISTORY_COLUMNS:
+        op.execute(f"ALTER TABLE generation_history ADD COLUMN IF NOT EXISTS {name} {sql_type}")
+    op.create_index("ix_generation_history_user_id", "generation_history", ["user_id"], if_not_exists=True)
+    op.create_index("ix_generation_history_created_at", "generation_history", ["created_at"], if_not_exists=True)
+
+    op.execute("""
+        DO $$ BEGIN
+            CREATE TYPE draftstatus AS ENUM ('STREAMING', 'FINALIZED', 'FAILED', 'ABANDONED', 'INTERRUPTED');
+        EXCEPTION WHEN duplicate_object THEN NULL;
+        END $$
+    """)
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS generation_drafts (
+            id UUID NOT NULL,
+            story_id UUID NOT NULL,
+            chapter_id UUID NOT NULL,
+            user_id UUID,
+            status draftstatus NOT NULL,
+            content TEXT NOT NULL,
+            token_count INTEGER,
+            model_used VARCHAR(100),
+            error_message TEXT,
+            created_at TIMESTAMP WITHOUT TIME ZONE,
+            updated_at TIMESTAMP WITHOUT TIME ZONE,
+            finalized_at TIMESTAMP WITHOUT TIME ZONE,
+            CONSTRAINT pk_generation_drafts PRIMARY KEY (id),
+            CONSTRAINT fk_generation_drafts_story_id_stories FOREIGN KEY (story_id)
+                REFERENCES stories (id) ON DELETE CASCADE,
+            CONSTRAINT fk_generation_drafts_chapter_id_chapters FOREIGN KEY (chapter_id)
+                REFERENCES chapters (id) ON DELETE CASCADE,
+            CONSTRAINT fk_generation_drafts_user_id_users FOREIGN KEY (user_id)
+                REFERENCES users (id) ON DELETE SET NULL
+        )
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS generation_drafts")
+    op.execute("DROP TYPE IF EXISTS draftstatus")
+    op.drop_index("ix_generation_history_created_at", "generation_history", if_exists=True)
+    op.drop_index("ix_generation_history_user_id", "generation_history", if_exists=True)
+    for name, _ in reversed(HISTORY_COLUMNS):
+        op.execute(f"ALTER TABLE generation_history DROP COLUMN IF EXISTS {name}")
+    # story_id and generation_type stay nullable: rows written since may not have them
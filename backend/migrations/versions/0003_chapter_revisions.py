@@ -0,0 +1,45 @@
+"""Story context version and chapter revisions
+
+stories.context_version invalidates cached generation context.
+chapters.revision numbers content writes so auto-save patches can name
+their base; chapter_revisions keeps the compressed history.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE stories ADD COLUMN IF NOT EXISTS context_version INTEGER NOT NULL DEFAULT 0")
+    op.execute("ALTER TABLE chapters ADD COLUMN IF NOT EXISTS revision INTEGER NOT NULL DEFAULT 0")
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS chapter_revisions (
+            id UUID NOT NULL,
+            chapter_id UUID NOT NULL,
+            revision INTEGER NOT NULL,
+            next_revision INTEGER,
+            kind VARCHAR(10) NOT NULL,
+            data BYTEA NOT NULL,
+            length INTEGER NOT NULL,
+            word_count INTEGER,
+            saved_at TIMESTAMP WITHOUT TIME ZONE,
+            created_at TIMESTAMP WITHOUT TIME ZONE,
+            CONSTRAINT pk_chapter_revisions PRIMARY KEY (id),
+            CONSTRAINT uq_chapter_revision UNIQUE (chapter_id, revision),
+            CONSTRAINT fk_chapter_revisions_chapter_id_chapters FOREIGN KEY (chapter_id)
+                REFERENCES chapters (id) ON DELETE CASCADE
+        )
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS chapter_revisions")
+    op.execute("ALTER TABLE chapters DROP COLUMN IF EXISTS revision")
+    op.execute("ALTER TABLE stories DROP COLUMN IF EXISTS context_version")
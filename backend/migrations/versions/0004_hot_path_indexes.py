@@ -0,0 +1,52 @@
+"""Indexes for the hot query paths and foreign keys
+
+Per-story lists (chapters, characters, plotlines, embeddings, images,
+generation history), the author's library ordered by updated_at, embedding
+cleanup by chapter, and the foreign keys whose ON DELETE actions would
+otherwise scan the child table. The composites also serve ORDER BY ... DESC
+by scanning backward. benchmarks/check_query_plans.py checks that the
+queries use them.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_stories_author_updated", "stories", ["author_id", "updated_at"]),
+    ("ix_chapters_story_order", "chapters", ["story_id", "order"]),
+    ("ix_chapters_pov_character_id", "chapters", ["pov_character_id"]),
+    ("ix_characters_story_id", "characters", ["story_id"]),
+    ("ix_plotlines_story_id", "plotlines", ["story_id"]),
+    ("ix_story_embeddings_story_id", "story_embeddings", ["story_id"]),
+    ("ix_story_embeddings_chapter_id", "story_embeddings", ["chapter_id"]),
+    ("ix_character_embeddings_character_id", "character_embeddings", ["character_id"]),
+    ("ix_generated_images_story_created", "generated_images", ["story_id", "created_at"]),
+    ("ix_generated_images_character_id", "generated_images", ["character_id"]),
+    ("ix_world_rules_story_bible_id", "world_rules", ["story_bible_id"]),
+    ("ix_generation_history_story_created", "generation_history", ["story_id", "created_at"]),
+    ("ix_generation_history_chapter_id", "generation_history", ["chapter_id"]),
+    ("ix_generation_drafts_story_id", "generation_drafts", ["story_id"]),
+    ("ix_generation_drafts_chapter_id", "generation_drafts", ["chapter_id"]),
+    ("ix_generation_drafts_user_id", "generation_drafts", ["user_id"]),
+    ("ix_generation_drafts_status_updated", "generation_drafts", ["status", "updated_at"]),
+    ("ix_ai_sessions_story_id", "ai_sessions", ["story_id"]),
+    ("ix_ai_sessions_user_id", "ai_sessions", ["user_id"]),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+    op.execute("ANALYZE")  # Fresh statistics so the planner picks the new indexes
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table, if_exists=True)
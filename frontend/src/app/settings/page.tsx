@@ -181,7 +181,11 @@ export default function SettingsPage() {
       setModelLoading(true);
       const result = await api.updateCurrentModel(model);
       setCurrentModel(result.current_model);
-      showMessage('success', `AI model switched to ${result.current_model}.`);
+      if (result.pending_model) {
+        showMessage('success', `Loading ${result.pending_model}; it replaces ${result.current_model} once loaded.`);
+      } else {
+        showMessage('success', `AI model switched to ${result.current_model}.`);
+      }
     } catch (error: any) {
       showMessage('error', error.response?.data?.detail || 'Failed to update AI model');
     } finally {